@@ -0,0 +1,102 @@
+"""Change detection between runs: full raster diff against checksummed block skipping.
+
+A synthetic NDVI COG is the previous run; the next run changes a few fields. Stages:
+- full_diff: read the archived and the new raster whole and classify the difference;
+- baseline: features/change.py's first run (hash every block, snapshot the raster);
+- unchanged: the same raster again, every block skipped on its checksum;
+- sparse_change: --changed-pct of the blocks altered, only those read back and diffed.
+
+Usage (from repo root):
+    python -m benchmarks.bench_change --size 8192 --block 512 --changed-pct 2
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from .harness import BenchRecorder, add_common_args, finish, parse_size
+
+CRS = "EPSG:32643"
+
+
+def _full_diff(prev_path: str, new_path: str) -> int:
+    import rasterio
+
+    from src.features.change import CHANGE_THRESHOLDS, classify_change
+
+    with rasterio.open(prev_path) as a, rasterio.open(new_path) as b:
+        return int((classify_change(b.read(1) - a.read(1), CHANGE_THRESHOLDS["ndvi"]) != 0).sum())
+
+
+def run_suite(workdir: str, shape: tuple[int, int] = (4096, 4096), block: int = 512, changed_pct: float = 2.0, repeat: int = 1) -> BenchRecorder:
+    from rasterio.transform import from_origin
+
+    from src.features.change import detect_changes
+    from src.utils.rasters import write_cog
+
+    rec = BenchRecorder("change", {"height": shape[0], "width": shape[1], "block": block, "changed_pct": changed_pct}, repeat=repeat)
+    h, w = shape
+    transform = from_origin(380000.0, 1720000.0, 10.0, 10.0)
+    rng = np.random.default_rng(0)
+    ndvi = (0.4 + 0.3 * np.sin(np.arange(w)[None, :] / 53) * np.cos(np.arange(h)[:, None] / 71)).astype(np.float32)
+    prev_path, path = os.path.join(workdir, "ndvi_prev.tif"), os.path.join(workdir, "ndvi.tif")
+    write_cog(ndvi, prev_path, CRS, transform)
+    shutil.copyfile(prev_path, path)
+    out = os.path.join(workdir, "change")
+
+    # One field (a 64 px square) cleared in a random sample of blocks
+    nby, nbx = -(-h // block), -(-w // block)
+    picks = rng.choice(nby * nbx, size=max(1, int(nby * nbx * changed_pct / 100)), replace=False)
+    for b in picks:
+        r, c = (b // nbx) * block, (b % nbx) * block
+        ndvi[r:r + 64, c:c + 64] -= 0.3
+    new_path = os.path.join(workdir, "ndvi_new.tif")
+    write_cog(ndvi, new_path, CRS, transform)
+    del ndvi
+
+    rec.run("full_diff", lambda: _full_diff(prev_path, new_path))
+
+    rec.run("baseline", lambda: (shutil.rmtree(out, ignore_errors=True), detect_changes({"ndvi": path}, out, block=block)))
+    res = rec.run("unchanged", lambda: detect_changes({"ndvi": path}, out, block=block))
+    rec.stages[-1].extra["blocks_changed"] = res["layers"]["ndvi"]["blocks_changed"]
+
+    # Each repeat starts from a fresh baseline of the previous run (untimed)
+    runs = []
+    for _ in range(repeat):
+        shutil.rmtree(out, ignore_errors=True)
+        shutil.copyfile(prev_path, path)
+        detect_changes({"ndvi": path}, out, block=block)
+        shutil.copyfile(new_path, path)
+        t0 = time.perf_counter()
+        res = detect_changes({"ndvi": path}, out, block=block)
+        runs.append(time.perf_counter() - t0)
+    layer = res["layers"]["ndvi"]
+    rec.add("sparse_change", runs, blocks=layer["blocks"], blocks_changed=layer["blocks_changed"], change_tif_kb=os.path.getsize(layer["path"]) / 1024)
+    return rec
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark block-checksum change detection between runs")
+    ap.add_argument("--size", default="4096", help="Scene size: N or HxW pixels")
+    ap.add_argument("--block", type=int, default=512)
+    ap.add_argument("--changed-pct", type=float, default=2.0, help="Share of blocks changed between runs")
+    ap.add_argument("--repeat", type=int, default=1)
+    add_common_args(ap, "bench_change.json")
+    args = ap.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="satgov-change-")
+    try:
+        rec = run_suite(workdir, shape=parse_size(args.size), block=args.block, changed_pct=args.changed_pct, repeat=args.repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return finish(rec, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Cold-start import benchmark for the API server.
+
+Each run imports the target module in a fresh interpreter (``python -X importtime``) so
+nothing is cached in sys.modules. Reports wall time, the self-reported cumulative
+import time and which heavy modules were pulled in.
+
+Usage (from repo root):
+    python -m benchmarks.bench_import --repeat 5 --out bench_import.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from .harness import BenchRecorder, add_common_args, finish
+
+# Modules that must not load until a request actually needs them
+HEAVY_MODULES = (
+    "geopandas",
+    "xarray",
+    "sklearn",
+    "joblib",
+    "rasterio",
+    "matplotlib",
+    "pandas",
+    "shapely",
+    "pyproj",
+)
+
+DEFAULT_TARGETS = ("src.api.server",)
+
+_PROBE = (
+    "import importlib, json, sys; importlib.import_module(sys.argv[1]); "
+    "print(json.dumps(sorted(m for m in sys.modules if '.' not in m)))"
+)
+
+
+def _repo_root() -> str:
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def import_once(module: str, python: str = sys.executable) -> dict:
+    """Import module in a fresh interpreter; return wall seconds, importtime total and heavy modules."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = _repo_root() + os.pathsep + env.get("PYTHONPATH", "")
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", _PROBE, module],
+        capture_output=True,
+        text=True,
+        cwd=_repo_root(),
+        env=env,
+    )
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    loaded = json.loads(proc.stdout.strip().splitlines()[-1])
+    return {
+        "wall_s": wall,
+        "import_s": _importtime_total(proc.stderr, module),
+        "heavy": [m for m in HEAVY_MODULES if m in loaded],
+    }
+
+
+def _importtime_total(stderr: str, module: str) -> float:
+    """Cumulative microseconds reported by -X importtime for the top-level target, in seconds."""
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line.split("|")
+        if len(parts) < 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].strip()
+        # Top-level entries have no leading indentation in the name column
+        if name == module.split(".")[0] or name == module:
+            total = max(total, int(parts[1].strip()))
+    return total / 1e6
+
+
+def run_suite(targets: tuple[str, ...] = DEFAULT_TARGETS, repeat: int = 3) -> BenchRecorder:
+    rec = BenchRecorder("import", {"targets": list(targets)}, repeat=repeat)
+    for module in targets:
+        samples = [import_once(module) for _ in range(max(1, repeat))]
+        rec.add(
+            f"import:{module}",
+            [s["wall_s"] for s in samples],
+            import_s=min(s["import_s"] for s in samples),
+            heavy=samples[-1]["heavy"],
+        )
+    return rec
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark cold import time of API modules")
+    ap.add_argument("--target", action="append", default=None, help="Module to import (repeatable)")
+    ap.add_argument("--repeat", type=int, default=3)
+    add_common_args(ap, "bench_import.json")
+    args = ap.parse_args(argv)
+
+    rec = run_suite(tuple(args.target or DEFAULT_TARGETS), repeat=args.repeat)
+    return finish(rec, args, width=32)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
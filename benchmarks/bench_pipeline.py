@@ -0,0 +1,264 @@
+"""End-to-end pipeline benchmark on scalable synthetic scenes.
+
+Usage (from repo root):
+    python -m benchmarks.bench_pipeline --size 1024 --parcels 4096 --zooms 8-12 \
+        --out bench_results.json --baseline benchmarks/baselines/pipeline.json
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from .harness import BenchRecorder, add_common_args, finish, parse_size, parse_zooms
+
+DEFAULT_AOI = os.path.join("data", "aoi", "goa_demo.geojson")
+DEFAULT_BOUNDS = (73.90, 15.30, 74.10, 15.50)
+
+
+def parcel_grid_for(n_parcels: int) -> tuple[int, int]:
+    n = max(1, int(math.ceil(math.sqrt(n_parcels))))
+    return n, n
+
+
+def _percentile_ms(samples: list[float], q: float) -> float:
+    return float(np.percentile(np.asarray(samples) * 1000.0, q)) if samples else 0.0
+
+
+def run_suite(
+    workdir: str,
+    shape: tuple[int, int] = (256, 256),
+    n_parcels: int = 64,
+    zooms: list[int] | None = None,
+    repeat: int = 1,
+    serve_requests: int = 200,
+    aoi_path: str = DEFAULT_AOI,
+    tile_output: str = "dir",
+    tile_format: str = "png",
+    query_points: int = 5000,
+) -> BenchRecorder:
+    """Run every pipeline stage against a synthetic scene under workdir and time it."""
+    import mercantile
+    from src.config import settings
+    from src.ingest.preprocess import preprocess_to_interim
+    from src.features.s2_indices import compute_s2_indices
+    from src.features.s1_features import compute_s1_features
+    from src.features.dem_features import compute_dem_features
+    from src.features.featurize import aggregate_to_parcels, save_features
+    from src.models.irrigate_clf import train_or_load, predict
+    from src.models.water_anomaly import score_water_anomaly
+    from src.pipeline import synthetic_parcel_geoms, synthetic_parcel_ids
+    from src.utils.rasters import write_geotiff
+    from src.utils.tiles import generate_xyz_tiles_from_geotiff
+
+    zooms = zooms or [8, 9, 10]
+    n_x, n_y = parcel_grid_for(n_parcels)
+    params = {
+        "height": shape[0],
+        "width": shape[1],
+        "parcels": n_x * n_y,
+        "zooms": zooms,
+        "serve_requests": serve_requests,
+        "tile_output": tile_output,
+        "tile_format": tile_format,
+        "query_points": query_points,
+    }
+    rec = BenchRecorder("pipeline", params, repeat=repeat)
+
+    # The src modules (and the API app) read the global settings; point them at workdir for the run only
+    old_data_dir = settings.data_dir
+    settings.data_dir = workdir
+    try:
+        interim_dir = settings.interim_dir
+        features_dir = settings.features_dir
+        models_dir = settings.models_dir
+        tiles_dir = settings.tiles_dir
+        bounds = DEFAULT_BOUNDS
+        if os.path.exists(aoi_path):
+            try:
+                from src.utils.geoutils import read_aoi, bbox_xyxy
+                bounds = bbox_xyxy(read_aoi(aoi_path).to_crs(4326))
+            except Exception:
+                pass
+
+        interim_nc = rec.run("scene", lambda: preprocess_to_interim(aoi_path, settings.raw_dir, interim_dir, shape=shape))
+
+        def _indices() -> dict[str, str]:
+            out = compute_s2_indices(interim_nc, os.path.join(interim_dir, "s2"))
+            out.update(compute_s1_features(os.path.join(interim_dir, "s1"), shape=shape))
+            compute_dem_features(os.path.join(interim_dir, "dem"), shape=shape)
+            return out
+
+        paths = rec.run("indices", _indices)
+        rasters = {name: np.load(paths[name]) for name in ("ndvi", "ndwi", "vv_vh")}
+        parcel_ids = synthetic_parcel_ids(shape[0], shape[1], n_x=n_x, n_y=n_y)
+
+        feats_df = rec.run("zonal_stats", lambda: aggregate_to_parcels(parcel_ids, rasters))
+        features_csv = save_features(feats_df, os.path.join(features_dir, "features.csv"))
+
+        def _train() -> str:
+            # train_or_load short-circuits on an existing model; time a cold train every run
+            model_file = os.path.join(models_dir, "irrigate_clf.pkl")
+            if os.path.exists(model_file):
+                os.remove(model_file)
+            return train_or_load(features_csv, models_dir)
+
+        model_path = rec.run("train", _train)
+        pred_df = rec.run("predict", lambda: score_water_anomaly(predict(model_path, features_csv)))
+
+        from src.api.parcel_lookup import ParcelLookup
+        from src.utils.colstore import write_columnar
+
+        rec.run("publish_predictions", lambda: write_columnar(pred_df, settings.predictions_store_dir))
+        lookup = ParcelLookup(settings.predictions_store_dir)
+        lookup.refresh(force=True)
+        all_ids = pred_df["id"].to_numpy()
+        probe = np.random.default_rng(0).choice(all_ids, size=min(2000, len(all_ids) * 10))
+
+        def _lookups() -> None:
+            for pid in probe.tolist():
+                lookup.get(pid)
+
+        rec.run("parcel_lookup", _lookups)
+        rec.stages[-1].extra["us_per_lookup"] = rec.stages[-1].best / len(probe) * 1e6
+        rec.run("parcel_lookup_batch", lambda: lookup.get_many(probe.tolist()))
+        rec.stages[-1].extra["ids"] = len(probe)
+
+        from src.utils.vector_tiles import ParcelTileSource
+
+        synthetic_parcel_geoms(bounds, shape[0], shape[1], n_x=n_x, n_y=n_y).to_file(settings.parcels_path, driver="GPKG")
+        mvt_tiles = list(mercantile.tiles(*bounds, zooms))
+        mvt_source = ParcelTileSource(settings.parcels_path, settings.predictions_store_dir, cache_size=len(mvt_tiles))
+        mvt_bytes = [0]
+
+        def _mvt_cold() -> None:
+            mvt_source.refresh(force=True)  # reloads parcels and empties the tile cache
+            mvt_bytes[0] = sum(len(mvt_source.tile(t.z, t.x, t.y)) for t in mvt_tiles)
+
+        rec.run("mvt_render", _mvt_cold)
+        rec.stages[-1].extra.update({"tiles": len(mvt_tiles), "bytes": mvt_bytes[0], "ms_per_tile": rec.stages[-1].best / max(1, len(mvt_tiles)) * 1000})
+        rec.run("mvt_cached", lambda: [mvt_source.tile(t.z, t.x, t.y) for t in mvt_tiles])
+        rec.stages[-1].extra["us_per_tile"] = rec.stages[-1].best / max(1, len(mvt_tiles)) * 1e6
+
+        for name in ("ndvi", "ndwi", "vv_vh"):
+            write_geotiff(rasters[name], settings.query_rasters[name], bounds)
+        ndvi_tif = settings.query_rasters["ndvi"]
+
+        from src.api.point_query import PointQuery
+
+        engine = PointQuery(settings.parcels_path, settings.query_rasters)
+        engine.refresh(force=True)
+        rng = np.random.default_rng(1)
+        q_lons = rng.uniform(bounds[0], bounds[2], size=query_points)
+        q_lats = rng.uniform(bounds[1], bounds[3], size=query_points)
+        single: list[float] = []
+
+        def _point_queries() -> None:
+            single.clear()
+            for lon, lat in zip(q_lons[:500].tolist(), q_lats[:500].tolist()):
+                t0 = time.perf_counter()
+                engine.points([lon], [lat])
+                single.append(time.perf_counter() - t0)
+
+        rec.run("point_query", _point_queries)
+        rec.stages[-1].extra.update({"queries": len(single), "p50_ms": _percentile_ms(single, 50), "p95_ms": _percentile_ms(single, 95)})
+        rec.run("point_query_batch", lambda: engine.points(q_lons, q_lats))
+        rec.stages[-1].extra.update({"points": query_points, "us_per_point": rec.stages[-1].best / max(1, query_points) * 1e6})
+
+        def _tiles() -> dict:
+            shutil.rmtree(os.path.join(tiles_dir, "ndvi"), ignore_errors=True)
+            return generate_xyz_tiles_from_geotiff(
+                ndvi_tif, "ndvi", tiles_dir, bounds, zooms, cmap="RdYlGn", vmin=-0.2, vmax=0.8,
+                output=tile_output, fmt=tile_format,
+            )
+
+        tiling = rec.run("tiling", _tiles)
+        ext = "webp" if tile_format == "webp" else "png"
+        tile_urls = [f"/tiles/ndvi/{t.z}/{t.x}/{t.y}.{ext}" for t in mercantile.tiles(*bounds, zooms)]
+        rec.stages[-1].extra.update({k: tiling[k] for k in ("tiles", "unique", "skipped_nodata", "bytes", "avg_bytes", "encode_s")})
+
+        try:
+            from fastapi.testclient import TestClient
+            from src.api.server import app
+        except Exception as e:  # fastapi/httpx not installed
+            print(f"skipping tile_serving: {e}", file=sys.stderr)
+            return rec
+
+        client = TestClient(app)
+        body = {"points": np.column_stack([q_lons, q_lats]).tolist()}
+        rec.run("api_point_batch", lambda: client.post("/query/points", json=body).raise_for_status())
+        rec.stages[-1].extra["points"] = query_points
+        # Mix hits with misses so the miss path is measured too
+        misses = [f"/tiles/ndvi/{zooms[-1]}/0/{i}.{ext}" for i in range(max(1, len(tile_urls) // 4))]
+        urls = (tile_urls + misses) or misses
+        latencies: list[float] = []
+        served = [0]
+
+        def _serve() -> None:
+            for i in range(serve_requests):
+                url = urls[i % len(urls)]
+                t0 = time.perf_counter()
+                r = client.get(url)
+                latencies.append(time.perf_counter() - t0)
+                served[0] += len(r.content)
+                if r.status_code >= 500:
+                    raise RuntimeError(f"{url} -> {r.status_code}")
+
+        rec.run("tile_serving", _serve)
+        rec.stages[-1].extra.update({
+            "requests": len(latencies),
+            "p50_ms": _percentile_ms(latencies, 50),
+            "p95_ms": _percentile_ms(latencies, 95),
+            "hit_urls": len(tile_urls),
+            "miss_urls": len(misses),
+            "bytes_served": served[0],
+        })
+        return rec
+    finally:
+        settings.data_dir = old_data_dir
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark pipeline stages on synthetic scenes")
+    ap.add_argument("--size", default="256", help="Scene size: N or HxW pixels")
+    ap.add_argument("--parcels", type=int, default=64, help="Approximate number of synthetic parcels")
+    ap.add_argument("--zooms", default="8-10", help="Zoom range, e.g. 8-12 or 8,10")
+    ap.add_argument("--repeat", type=int, default=1, help="Runs per stage (best and median are reported)")
+    ap.add_argument("--serve-requests", type=int, default=200, help="Tile requests issued in tile_serving")
+    ap.add_argument("--query-points", type=int, default=5000, help="Points per batch in point_query_batch/api_point_batch")
+    ap.add_argument("--aoi", default=DEFAULT_AOI)
+    ap.add_argument("--tile-output", default="dir", choices=["dir", "mbtiles"], help="Tile storage mode")
+    ap.add_argument("--tile-format", default="png", choices=["png", "png8", "webp"], help="Tile encoding")
+    ap.add_argument("--workdir", default=None, help="Scratch data dir (default: temp dir, removed afterwards)")
+    add_common_args(ap, "bench_results.json")
+    args = ap.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="satgov-bench-")
+    try:
+        rec = run_suite(
+            workdir,
+            shape=parse_size(args.size),
+            n_parcels=args.parcels,
+            zooms=parse_zooms(args.zooms),
+            repeat=args.repeat,
+            serve_requests=args.serve_requests,
+            aoi_path=args.aoi,
+            tile_output=args.tile_output,
+            tile_format=args.tile_format,
+            query_points=args.query_points,
+        )
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return finish(rec, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
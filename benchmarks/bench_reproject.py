@@ -0,0 +1,218 @@
+"""Reprojection benchmark: per-band GDAL warps vs one shared ReprojectionPlan.
+
+Two workloads on synthetic rasters:
+- bands: a UTM scene warped onto a ~10 m EPSG:4326 grid, band by band with
+  rasterio.warp.reproject vs one plan built once and applied to every band (the STAC fallback);
+- tiles: several layers on one grid cut into EPSG:3857 XYZ tiles, one WarpedVRT per layer vs
+  one plan per tile shared by all layers (the tiler), cold and with the plans cached on disk,
+  and from COG copies of the layers, where coarse zooms read overview pixels instead of
+  decimating the full-resolution blocks.
+Encoding is left out so the stages time only the warp.
+
+Usage (from repo root):
+    python -m benchmarks.bench_reproject --size 4096 --bands 4 --layers 3 --zooms 10-13
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+from .harness import BenchRecorder, add_common_args, finish, parse_size, parse_zooms
+
+SRC_CRS = "EPSG:32643"
+# UTM zone 43N origin near Goa; 10 m pixels like the S2 visible/NIR bands
+ORIGIN = (380000.0, 1720000.0)
+RES = 10.0
+
+
+def _scene(shape: tuple[int, int], n: int) -> list[np.ndarray]:
+    h, w = shape
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+    return [(np.sin(xx / (31.0 + 7 * i)) * np.cos(yy / (47.0 + 5 * i)) * 1000 + 2000).astype(np.float32) for i in range(n)]
+
+
+def _write(path: str, arr: np.ndarray, transform) -> str:
+    import rasterio
+
+    profile = {
+        "driver": "GTiff", "width": arr.shape[1], "height": arr.shape[0], "count": 1, "dtype": "float32",
+        "crs": SRC_CRS, "transform": transform, "nodata": np.nan, "tiled": True, "blockxsize": 256, "blockysize": 256,
+    }
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(arr, 1)
+    return path
+
+
+def _warpedvrt_tiles(paths: list[str], bounds, zooms: list[int], tile_size: int) -> int:
+    """The tiler before plans: one WarpedVRT per layer, each tile read through it."""
+    import mercantile
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.errors import WindowError
+    from rasterio.vrt import WarpedVRT
+    from rasterio.windows import Window, from_bounds
+
+    from src.utils.tiles import tile_bounds_mercator
+
+    n = 0
+    for path in paths:
+        with rasterio.open(path) as src, WarpedVRT(src, crs="EPSG:3857", resampling=Resampling.bilinear, nodata=np.nan, dtype="float32") as vrt:
+            for tile in mercantile.tiles(*bounds, zooms):
+                west, south, east, north = tile_bounds_mercator(tile.x, tile.y, tile.z)
+                out = np.full((tile_size, tile_size), np.nan, dtype=np.float32)
+                window = from_bounds(west, south, east, north, transform=vrt.transform)
+                try:
+                    inter = window.intersection(Window(0, 0, vrt.width, vrt.height))
+                except WindowError:
+                    continue
+                sx, sy = tile_size / window.width, tile_size / window.height
+                c0 = int(round((inter.col_off - window.col_off) * sx))
+                r0 = int(round((inter.row_off - window.row_off) * sy))
+                c1 = min(tile_size, int(round((inter.col_off + inter.width - window.col_off) * sx)))
+                r1 = min(tile_size, int(round((inter.row_off + inter.height - window.row_off) * sy)))
+                if c1 > c0 and r1 > r0:
+                    out[r0:r1, c0:c1] = vrt.read(1, window=inter, out_shape=(r1 - r0, c1 - c0), resampling=Resampling.bilinear)
+                n += 1
+    return n
+
+
+def _plan_tiles(paths: list[str], bounds, zooms: list[int], tile_size: int, pack_path: str | None) -> int:
+    """The tiler with plans: one plan per tile (from the pack when cached) applied to every layer."""
+    import mercantile
+    import rasterio
+
+    from src.utils.reproject import PlanPack
+    from src.utils.tiles import tile_plan
+
+    srcs = [rasterio.open(p) for p in paths]
+    pack = PlanPack(pack_path)
+    n = 0
+    try:
+        for tile in mercantile.tiles(*bounds, zooms):
+            plan = pack.get(f"{tile.z}/{tile.x}/{tile.y}", lambda: tile_plan(srcs[0], tile.x, tile.y, tile.z, tile_size))
+            for src in srcs:
+                part, window = plan.read(src)
+                if part is not None:
+                    plan.apply(part, window)
+                n += 1
+    finally:
+        for src in srcs:
+            src.close()
+    pack.save()
+    return n
+
+
+def run_suite(
+    workdir: str,
+    shape: tuple[int, int] = (2048, 2048),
+    bands: int = 4,
+    layers: int = 3,
+    zooms: list[int] | None = None,
+    tile_size: int = 256,
+    repeat: int = 1,
+) -> BenchRecorder:
+    import rasterio
+    from rasterio.transform import from_bounds, from_origin
+    from rasterio.warp import Resampling, reproject, transform_bounds
+
+    from src.utils.reproject import ReprojectionPlan, get_plan
+
+    zooms = zooms or [10, 11, 12]
+    rec = BenchRecorder("reproject", {"height": shape[0], "width": shape[1], "bands": bands, "layers": layers, "zooms": zooms, "tile_size": tile_size}, repeat=repeat)
+    src_transform = from_origin(ORIGIN[0], ORIGIN[1], RES, RES)
+    arrays = _scene(shape, max(bands, layers))
+    paths = [_write(os.path.join(workdir, f"band{i}.tif"), a, src_transform) for i, a in enumerate(arrays)]
+
+    # bands: the STAC fallback grid, ~10 m in EPSG:4326 over the scene interior
+    h, w = shape
+    west, south, east, north = transform_bounds(SRC_CRS, "EPSG:4326", ORIGIN[0], ORIGIN[1] - h * RES, ORIGIN[0] + w * RES, ORIGIN[1])
+    pad_x, pad_y = (east - west) * 0.05, (north - south) * 0.05
+    west, south, east, north = west + pad_x, south + pad_y, east - pad_x, north - pad_y
+    res = 0.00009
+    dst_shape = (int((north - south) / res), int((east - west) / res))
+    dst_transform = from_bounds(west, south, east, north, dst_shape[1], dst_shape[0])
+
+    def _gdal_bands() -> list[np.ndarray]:
+        out = []
+        for path in paths[:bands]:
+            dst = np.full(dst_shape, np.nan, dtype=np.float32)
+            with rasterio.open(path) as src:
+                reproject(rasterio.band(src, 1), dst, dst_transform=dst_transform, dst_crs="EPSG:4326", dst_nodata=np.nan, resampling=Resampling.bilinear)
+            out.append(dst)
+        return out
+
+    ref = rec.run("bands_gdal", _gdal_bands)
+    rec.stages[-1].extra["dst_pixels"] = dst_shape[0] * dst_shape[1]
+    plan = rec.run("plan_build", lambda: ReprojectionPlan.build(SRC_CRS, src_transform, shape, "EPSG:4326", dst_transform, dst_shape))
+    rec.stages[-1].extra["lattice"] = [int(plan.lattice[0].size), int(plan.lattice[1].size)]
+
+    def _plan_bands() -> list[np.ndarray]:
+        # Fresh plan each run so index preparation is timed too
+        p = ReprojectionPlan(plan.src_shape, plan.dst_shape, plan.lattice)
+        out = []
+        for path in paths[:bands]:
+            with rasterio.open(path) as src:
+                part, window = p.read(src)
+            out.append(p.apply(part, window))
+        return out
+
+    got = rec.run("bands_plan", _plan_bands)
+    diff = max(float(np.nanmax(np.abs(a - b))) for a, b in zip(ref, got))
+    rec.stages[-1].extra.update({"max_abs_diff_vs_gdal": diff, "value_range": float(np.ptp(arrays[0]))})
+
+    cache_dir = os.path.join(workdir, "plans")
+    get_plan(SRC_CRS, src_transform, shape, "EPSG:4326", dst_transform, dst_shape, cache_dir=cache_dir)
+
+    def _load_cached():
+        from src.utils import reproject as rp
+
+        rp._memo.clear()
+        return get_plan(SRC_CRS, src_transform, shape, "EPSG:4326", dst_transform, dst_shape, cache_dir=cache_dir)
+
+    rec.run("plan_load_cached", _load_cached)
+
+    # tiles: every layer of the scene cut into XYZ tiles
+    lon_lat = transform_bounds(SRC_CRS, "EPSG:4326", ORIGIN[0], ORIGIN[1] - h * RES, ORIGIN[0] + w * RES, ORIGIN[1])
+    tile_paths = paths[:layers]
+    n = rec.run("tiles_warpedvrt", lambda: _warpedvrt_tiles(tile_paths, lon_lat, zooms, tile_size))
+    rec.stages[-1].extra["layer_tiles"] = n
+    rec.run("tiles_plan", lambda: _plan_tiles(tile_paths, lon_lat, zooms, tile_size, None))
+    pack_path = os.path.join(workdir, "tiles.npz")
+    _plan_tiles(tile_paths, lon_lat, zooms, tile_size, pack_path)
+    rec.run("tiles_plan_cached", lambda: _plan_tiles(tile_paths, lon_lat, zooms, tile_size, pack_path))
+    rec.stages[-1].extra["pack_bytes"] = os.path.getsize(pack_path)
+
+    from src.utils.rasters import to_cog
+
+    cog_paths = [to_cog(p, p.replace(".tif", ".cog.tif")) for p in tile_paths]
+    rec.run("tiles_plan_cog", lambda: _plan_tiles(cog_paths, lon_lat, zooms, tile_size, pack_path))
+    with rasterio.open(cog_paths[0]) as src:
+        rec.stages[-1].extra["overviews"] = src.overviews(1)
+    return rec
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark shared reprojection plans against per-band warps")
+    ap.add_argument("--size", default="2048", help="Scene size: N or HxW pixels")
+    ap.add_argument("--bands", type=int, default=4, help="Bands warped onto one grid")
+    ap.add_argument("--layers", type=int, default=3, help="Tile layers sharing one grid")
+    ap.add_argument("--zooms", default="10-12")
+    ap.add_argument("--repeat", type=int, default=1)
+    add_common_args(ap, "bench_reproject.json")
+    args = ap.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="satgov-reproject-")
+    try:
+        rec = run_suite(workdir, shape=parse_size(args.size), bands=args.bands, layers=args.layers, zooms=parse_zooms(args.zooms), repeat=args.repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return finish(rec, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
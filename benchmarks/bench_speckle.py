@@ -0,0 +1,113 @@
+"""Sentinel-1 speckle filtering: summed-area-table Lee / refined Lee against a naive window filter.
+
+A synthetic GRD-sized scene (linear power: smooth fields with sharp edges, times gamma
+speckle at the GRDH equivalent number of looks) is written to a tiled GeoTIFF in strips.
+Stages:
+- naive_lee / lee_crop: per-pixel 7x7 window statistics (sliding_window_view) against
+  features/radar.py on the same crop, with their largest difference;
+- lee_size_N: the box-filter Lee at several window sizes (cost should not grow with N);
+- scene_lee / scene_refined_lee: despeckle_geotiff over the whole scene, block by block,
+  with one thread and with --workers threads, reported as Mpx/s.
+
+Usage (from repo root):
+    python -m benchmarks.bench_speckle --size 16700x25000 --workers 4
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+from .harness import BenchRecorder, add_common_args, finish, parse_size
+
+# One Sentinel-1 IW GRDH scene is about 25000 x 16700 pixels at 10 m
+GRD_SIZE = "16700x25000"
+CRS = "EPSG:32643"
+
+
+def _scene(path: str, shape: tuple[int, int], strip: int = 512) -> None:
+    import rasterio
+    from rasterio.transform import from_origin
+    from rasterio.windows import Window
+
+    from src.features.radar import DEFAULT_ENL
+    from src.utils.rasters import tiled_profile
+
+    h, w = shape
+    rng = np.random.default_rng(0)
+    profile = tiled_profile({"width": w, "height": h, "crs": CRS, "transform": from_origin(380000.0, 1720000.0, 10.0, 10.0)})
+    with rasterio.open(path, "w", **profile) as dst:
+        for r0 in range(0, h, strip):
+            yy, xx = np.mgrid[r0:min(h, r0 + strip), 0:w]
+            # Field-like patches of different brightness plus a smooth trend
+            clean = 0.03 + 0.02 * np.sin(xx / 150) + 0.1 * (((xx // 200) + (yy // 200)) % 3 == 0)
+            noisy = clean * rng.gamma(DEFAULT_ENL, 1.0 / DEFAULT_ENL, clean.shape)
+            dst.write(noisy.astype(np.float32), 1, window=Window(0, r0, w, len(yy)))
+
+
+def naive_lee(img: np.ndarray, size: int = 7, enl: float = 4.4) -> np.ndarray:
+    """Lee with the window statistics taken pixel by pixel over explicit windows."""
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    r = size // 2
+    win = sliding_window_view(np.pad(img, r, constant_values=np.nan), (size, size))
+    with np.errstate(invalid="ignore"):
+        mean = np.nanmean(win, axis=(-2, -1))
+        var = np.nanvar(win, axis=(-2, -1))
+    cu2 = 1.0 / enl
+    var_x = np.maximum((var - mean * mean * cu2) / (1.0 + cu2), 0.0)
+    k = np.where(var > 0, var_x / np.where(var > 0, var, 1.0), 0.0)
+    return (mean + k * (img - mean)).astype(np.float32)
+
+
+def run_suite(workdir: str, shape: tuple[int, int] = (4096, 4096), crop: int = 1024, workers: int = 2, block: int = 1024, repeat: int = 1) -> BenchRecorder:
+    import rasterio
+    from rasterio.windows import Window
+
+    from src.features.radar import despeckle, despeckle_geotiff
+
+    rec = BenchRecorder("speckle", {"height": shape[0], "width": shape[1], "crop": crop, "workers": workers, "block": block}, repeat=repeat)
+    src = os.path.join(workdir, "grd_vv.tif")
+    rec.run("scene", lambda: _scene(src, shape))
+    with rasterio.open(src) as ds:
+        sub = ds.read(1, window=Window(0, 0, min(crop, shape[1]), min(crop, shape[0])))
+
+    ref = rec.run("naive_lee", lambda: naive_lee(sub))
+    out = rec.run("lee_crop", lambda: despeckle(sub, "lee", workers=1))
+    rec.stages[-1].extra.update({"max_abs_diff": float(np.nanmax(np.abs(out - ref))), "speedup": rec.stages[-2].best / max(rec.stages[-1].best, 1e-9)})
+    for size in (5, 11, 21):
+        rec.run(f"lee_size_{size}", lambda: despeckle(sub, "lee", size=size, workers=1))
+
+    mpx = shape[0] * shape[1] / 1e6
+    dst = os.path.join(workdir, "grd_vv_filtered.tif")
+    for method in ("lee", "refined_lee"):
+        for n in sorted({1, workers}):
+            rec.run(f"scene_{method}_w{n}", lambda: despeckle_geotiff(src, dst, method, block=block, workers=n))
+            rec.stages[-1].extra["mpx_per_s"] = mpx / max(rec.stages[-1].best, 1e-9)
+    return rec
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark block-wise Lee / refined Lee speckle filtering")
+    ap.add_argument("--size", default=GRD_SIZE, help="Scene size: N or HxW pixels (default: one IW GRDH scene)")
+    ap.add_argument("--crop", type=int, default=1024, help="Crop side for the naive comparison and window sizes")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--block", type=int, default=1024)
+    ap.add_argument("--repeat", type=int, default=1)
+    add_common_args(ap, "bench_speckle.json")
+    args = ap.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="satgov-speckle-")
+    try:
+        rec = run_suite(workdir, shape=parse_size(args.size), crop=args.crop, workers=args.workers, block=args.block, repeat=args.repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return finish(rec, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
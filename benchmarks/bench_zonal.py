@@ -0,0 +1,172 @@
+"""Zonal statistics: whole rasters in memory vs windowed mergeable sketches.
+
+A synthetic scene (ndvi and lst COGs) is split into square parcels, given either as an id
+raster or as polygons. Stages:
+- exact_in_memory: read every raster whole and group pixels by parcel with one sort
+  (the shard path), exact percentiles per parcel;
+- windowed_ids / windowed_polygons: features/zonal.py walking 1024 px windows;
+- windowed_workers: the same split over worker processes, sketches merged;
+- merge_saved: two half-scene sketches saved to .npz, loaded and merged.
+Each stage reports its peak traced allocation (tracemalloc, a separate untimed run) and the
+windowed stages the largest percentile error against the exact path next to its bound.
+
+Usage (from repo root):
+    python -m benchmarks.bench_zonal --size 8192 --parcel-px 20 --workers 4
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+from .harness import BenchRecorder, add_common_args, finish, parse_size
+
+CRS = "EPSG:32643"
+ORIGIN = (380000.0, 1720000.0)
+RES = 10.0
+
+
+def _peak_mb(fn) -> float:
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def _scene(workdir: str, shape: tuple[int, int], parcel_px: int):
+    """(raster paths, id raster path, parcels GeoDataFrame) for a synthetic scene."""
+    import geopandas as gpd
+    import rasterio
+    import shapely
+    from rasterio.transform import from_origin
+    from rasterio.windows import Window
+
+    from src.utils.rasters import tiled_profile, write_cog
+
+    h, w = shape
+    transform = from_origin(ORIGIN[0], ORIGIN[1], RES, RES)
+    rng = np.random.default_rng(0)
+    paths = {"ndvi": os.path.join(workdir, "ndvi.tif"), "lst": os.path.join(workdir, "lst.tif")}
+    ids_path = os.path.join(workdir, "ids.tif")
+    nx, ny = -(-w // parcel_px), -(-h // parcel_px)
+    profile = {**tiled_profile({"width": w, "height": h, "crs": CRS, "transform": transform}), "dtype": "int32", "nodata": -1, "predictor": 2}
+    # Row strips keep scene generation itself within a bounded footprint
+    ndvi = np.empty(shape, dtype=np.float32)
+    with rasterio.open(ids_path, "w", **profile) as dst:
+        for r0 in range(0, h, 1024):
+            yy, xx = np.mgrid[r0:min(h, r0 + 1024), 0:w]
+            ndvi[r0:r0 + len(yy)] = 0.4 + 0.3 * np.sin(xx / 53) * np.cos(yy / 71) + rng.normal(0, 0.05, yy.shape)
+            ids = (yy // parcel_px) * nx + xx // parcel_px
+            dst.write(ids.astype(np.int32), 1, window=Window(0, r0, w, len(yy)))
+    write_cog(ndvi, paths["ndvi"], CRS, transform)
+    write_cog(300 + 20 * ndvi, paths["lst"], CRS, transform)
+    del ndvi
+
+    i = np.arange(nx * ny)
+    x0 = ORIGIN[0] + (i % nx) * parcel_px * RES
+    y0 = ORIGIN[1] - (i // nx) * parcel_px * RES
+    geoms = shapely.box(x0, y0 - parcel_px * RES, x0 + parcel_px * RES, y0)
+    parcels = gpd.GeoDataFrame({"id": i}, geometry=geoms, crs=CRS)
+    return paths, ids_path, parcels
+
+
+def _exact(paths: dict[str, str], ids_path: str):
+    """Whole rasters in memory, grouped with one sort; exact percentiles per parcel."""
+    import pandas as pd
+    import rasterio
+
+    from src.features.featurize import group_parcel_pixels, grouped_parcel_rows
+
+    with rasterio.open(ids_path) as src:
+        ids = src.read(1)
+    rasters = {}
+    for name, path in paths.items():
+        with rasterio.open(path) as src:
+            rasters[name] = src.read(1)
+    return pd.DataFrame(grouped_parcel_rows(*group_parcel_pixels(ids, rasters, np.unique(ids[ids >= 0]))))
+
+
+def run_suite(workdir: str, shape: tuple[int, int] = (2048, 2048), parcel_px: int = 20, workers: int = 2, block: int = 1024, repeat: int = 1) -> BenchRecorder:
+    import rasterio
+    from rasterio.windows import Window
+
+    from src.features.zonal import DEFAULT_BINS, VALUE_RANGES, ZonalSketch, zonal_stats_windowed
+
+    rec = BenchRecorder("zonal", {"height": shape[0], "width": shape[1], "parcel_px": parcel_px, "workers": workers, "block": block}, repeat=repeat)
+    paths, ids_path, parcels = _scene(workdir, shape, parcel_px)
+
+    exact = rec.run("exact_in_memory", lambda: _exact(paths, ids_path))
+    rec.stages[-1].extra.update({"parcels": len(exact), "peak_mb": _peak_mb(lambda: _exact(paths, ids_path))})
+
+    def _errors(df) -> dict[str, float]:
+        assert list(df["id"]) == list(exact["id"])
+        out = {}
+        for name in paths:
+            err = max(float(np.nanmax(np.abs(df[f"{name}_{q}"] - exact[f"{name}_{q}"]))) for q in ("p50", "p90"))
+            lo, hi = VALUE_RANGES[name]
+            out[f"{name}_pct_err"] = err
+            out[f"{name}_pct_bound"] = (hi - lo) / DEFAULT_BINS
+            out[f"{name}_mean_err"] = float(np.nanmax(np.abs(df[f"{name}_mean"] - exact[f"{name}_mean"])))
+        return out
+
+    by_ids = lambda: zonal_stats_windowed(paths, id_raster=ids_path, block=block)  # noqa: E731
+    df = rec.run("windowed_ids", by_ids)
+    rec.stages[-1].extra.update({**_errors(df), "peak_mb": _peak_mb(by_ids)})
+
+    by_polygons = lambda: zonal_stats_windowed(paths, parcels=parcels, block=block)  # noqa: E731
+    df = rec.run("windowed_polygons", by_polygons)
+    rec.stages[-1].extra.update(_errors(df))
+
+    df = rec.run("windowed_workers", lambda: zonal_stats_windowed(paths, id_raster=ids_path, block=block, workers=workers))
+    rec.stages[-1].extra.update(_errors(df))
+
+    # Two halves of the AOI sketched separately (as two machines would), saved, then merged
+    h = shape[0]
+    for part, (r0, r1) in enumerate(((0, h // 2), (h // 2, h))):
+        sk = ZonalSketch({n: VALUE_RANGES[n] for n in paths})
+        with rasterio.open(ids_path) as ids_src:
+            srcs = {n: rasterio.open(p) for n, p in paths.items()}
+            for row in range(r0, r1, block):
+                win = Window(0, row, shape[1], min(block, r1 - row))
+                sk.update(ids_src.read(1, window=win), {n: s.read(1, window=win) for n, s in srcs.items()})
+            for s in srcs.values():
+                s.close()
+        sk.save(os.path.join(workdir, f"half{part}.npz"))
+
+    def _merge_saved():
+        a, b = (ZonalSketch.load(os.path.join(workdir, f"half{p}.npz")) for p in (0, 1))
+        return a.merge([b]).to_frame()
+
+    df = rec.run("merge_saved", _merge_saved)
+    rec.stages[-1].extra.update(_errors(df))
+    rec.stages[-1].extra["sketch_mb"] = sum(os.path.getsize(os.path.join(workdir, f"half{p}.npz")) for p in (0, 1)) / 2**20
+    return rec
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark windowed zonal sketches against in-memory zonal stats")
+    ap.add_argument("--size", default="2048", help="Scene size: N or HxW pixels")
+    ap.add_argument("--parcel-px", type=int, default=20, help="Parcel side in pixels")
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--block", type=int, default=1024)
+    ap.add_argument("--repeat", type=int, default=1)
+    add_common_args(ap, "bench_zonal.json")
+    args = ap.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="satgov-zonal-")
+    try:
+        rec = run_suite(workdir, shape=parse_size(args.size), parcel_px=args.parcel_px, workers=args.workers, block=args.block, repeat=args.repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return finish(rec, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable
+
+
+def parse_size(value: str) -> tuple[int, int]:
+    """'512' -> (512, 512); '512x1024' -> (512, 1024) as (height, width)."""
+    if "x" in value.lower():
+        h, w = value.lower().split("x", 1)
+        return int(h), int(w)
+    return int(value), int(value)
+
+
+def parse_zooms(value: str) -> list[int]:
+    """'8-12' -> [8..12]; '8,10' -> [8, 10]."""
+    if "-" in value:
+        lo, hi = value.split("-", 1)
+        return list(range(int(lo), int(hi) + 1))
+    return [int(z) for z in value.split(",") if z.strip()]
+
+
+@dataclass
+class StageResult:
+    name: str
+    runs: list[float]
+    extra: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def best(self) -> float:
+        return min(self.runs)
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.runs)
+
+    def to_dict(self) -> dict[str, Any]:
+        d = asdict(self)
+        d["best"] = self.best
+        d["median"] = self.median
+        return d
+
+
+class BenchRecorder:
+    """Times named stages and serializes the results to JSON."""
+
+    def __init__(self, suite: str, params: dict[str, Any], repeat: int = 1):
+        self.suite = suite
+        self.params = params
+        self.repeat = max(1, int(repeat))
+        self.stages: list[StageResult] = []
+
+    def run(self, name: str, fn: Callable[[], Any], repeat: int | None = None, **extra: Any) -> Any:
+        """Call fn `repeat` times, record wall-clock seconds, and return the last result."""
+        runs: list[float] = []
+        result = None
+        for _ in range(repeat or self.repeat):
+            t0 = time.perf_counter()
+            result = fn()
+            runs.append(time.perf_counter() - t0)
+        self.stages.append(StageResult(name=name, runs=runs, extra=dict(extra)))
+        return result
+
+    def add(self, name: str, seconds: float | list[float], **extra: Any) -> None:
+        runs = list(seconds) if isinstance(seconds, (list, tuple)) else [float(seconds)]
+        self.stages.append(StageResult(name=name, runs=runs, extra=dict(extra)))
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "suite": self.suite,
+            "params": self.params,
+            "env": environment_info(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "stages": {s.name: s.to_dict() for s in self.stages},
+        }
+
+    def save(self, path: str) -> str:
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+        return path
+
+
+def environment_info() -> dict[str, Any]:
+    import numpy as np
+
+    info: dict[str, Any] = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+    }
+    try:
+        info["git"] = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        info["git"] = None
+    return info
+
+
+def load_results(path: str) -> dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any], tolerance: float = 0.25, metric: str = "best") -> list[dict[str, Any]]:
+    """Compare stage timings against a baseline result file.
+    A stage is a regression when current/baseline exceeds 1 + tolerance and an improvement
+    when it drops below 1 - tolerance. Stages missing on either side are reported as such.
+    """
+    rows: list[dict[str, Any]] = []
+    cur_stages = current.get("stages", {})
+    base_stages = baseline.get("stages", {})
+    for name in sorted(set(cur_stages) | set(base_stages)):
+        cur = cur_stages.get(name)
+        base = base_stages.get(name)
+        if cur is None or base is None:
+            rows.append({"stage": name, "status": "missing_current" if cur is None else "missing_baseline"})
+            continue
+        c, b = float(cur[metric]), float(base[metric])
+        ratio = c / b if b > 0 else float("inf")
+        if ratio > 1.0 + tolerance:
+            status = "regression"
+        elif ratio < 1.0 - tolerance:
+            status = "improvement"
+        else:
+            status = "ok"
+        rows.append({"stage": name, "current": c, "baseline": b, "ratio": ratio, "status": status})
+    return rows
+
+
+def format_comparison(rows: list[dict[str, Any]], params_match: bool = True) -> str:
+    lines = []
+    if not params_match:
+        lines.append("WARNING: benchmark params differ from baseline; ratios are not comparable")
+    lines.append(f"{'stage':<24}{'baseline_s':>12}{'current_s':>12}{'ratio':>8}  status")
+    for r in rows:
+        if "ratio" in r:
+            lines.append(f"{r['stage']:<24}{r['baseline']:>12.4f}{r['current']:>12.4f}{r['ratio']:>8.2f}  {r['status']}")
+        else:
+            lines.append(f"{r['stage']:<24}{'-':>12}{'-':>12}{'-':>8}  {r['status']}")
+    return "\n".join(lines)
+
+
+def add_common_args(ap: argparse.ArgumentParser, out: str) -> None:
+    """The output and baseline options every benchmark takes; `finish` acts on them."""
+    ap.add_argument("--out", default=out, help="Where to write JSON results")
+    ap.add_argument("--baseline", default=None, help="Baseline JSON to compare against")
+    ap.add_argument("--save-baseline", action="store_true", help="Also write results to --baseline")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown fraction before flagging")
+    ap.add_argument("--fail-on-regression", action="store_true")
+
+
+def finish(rec: BenchRecorder, args: argparse.Namespace, width: int = 24) -> int:
+    """Write and print the results, compare them with or save them as --baseline; returns the exit status."""
+    rec.save(args.out)
+    current = rec.to_dict()
+    for name, stage in current["stages"].items():
+        print(f"{name:<{width}}{stage['best']:>10.4f}s  {stage['extra'] or ''}")
+    print(f"Wrote {args.out}")
+
+    status = 0
+    if args.baseline and os.path.exists(args.baseline) and not args.save_baseline:
+        baseline = load_results(args.baseline)
+        rows = compare(current, baseline, tolerance=args.tolerance)
+        print(format_comparison(rows, params_match=baseline.get("params") == current["params"]))
+        if args.fail_on_regression and any(r["status"] == "regression" for r in rows):
+            status = 1
+    if args.baseline and args.save_baseline:
+        rec.save(args.baseline)
+        print(f"Saved baseline {args.baseline}")
+    return status
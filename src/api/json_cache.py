@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from typing import Any, Optional
+
+
+class JsonFileCache:
+    """Keeps a JSON file parsed in memory, reloading when its mtime changes.
+
+    The file is stat'ed at most once per `recheck_s`, so request handlers can call get()
+    on every request; writers should replace the file atomically (write tmp + os.replace).
+    """
+
+    def __init__(self, path: str, recheck_s: float = 1.0):
+        self.path = path
+        self.recheck_s = recheck_s
+        self._data: Optional[Any] = None
+        self._mtime: Optional[int] = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, force: bool = False) -> Optional[Any]:
+        now = time.monotonic()
+        if not force and now - self._checked < self.recheck_s:
+            return self._data
+        self._checked = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            self._data, self._mtime = None, None
+            return None
+        if force or mtime != self._mtime:
+            with self._lock:
+                with open(self.path) as f:
+                    self._data = json.load(f)
+                self._mtime = mtime
+        return self._data
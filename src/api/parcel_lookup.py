@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, Iterable, Optional
+
+from ..utils.colstore import CURRENT, ColumnarSnapshot, current_snapshot
+
+
+class ParcelLookup:
+    """Serves parcel rows from the latest published predictions snapshot.
+
+    The snapshot is memory-mapped and ids are binary-searched, so a lookup touches one
+    row per column. The CURRENT pointer is re-checked at most once per `recheck_s`; a new
+    run swaps in its snapshot with a single reference assignment, so in-flight requests
+    keep reading the previous one.
+    """
+
+    def __init__(self, root: str, recheck_s: float = 1.0):
+        self.root = root
+        self.recheck_s = recheck_s
+        self._snap: Optional[ColumnarSnapshot] = None
+        self._pointer_mtime: Optional[int] = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, force: bool = False) -> Optional[ColumnarSnapshot]:
+        now = time.monotonic()
+        if not force and now - self._checked < self.recheck_s:
+            return self._snap
+        self._checked = now
+        try:
+            mtime = os.stat(os.path.join(self.root, CURRENT)).st_mtime_ns
+        except FileNotFoundError:
+            self._snap, self._pointer_mtime = None, None
+            return None
+        if mtime != self._pointer_mtime or force:
+            with self._lock:
+                path = current_snapshot(self.root)
+                if path is not None and (self._snap is None or self._snap.path != path):
+                    self._snap = ColumnarSnapshot(path)
+                self._pointer_mtime = mtime
+        return self._snap
+
+    def get(self, pid: int) -> Optional[dict[str, Any]]:
+        snap = self.refresh()
+        if snap is None:
+            return None
+        row = snap.row_offset(pid)
+        return _parcel_payload(snap.record(row)) if row >= 0 else None
+
+    def get_many(self, ids: Iterable[int]) -> tuple[list[dict[str, Any]], list[int]]:
+        ids = [int(i) for i in ids]
+        snap = self.refresh()
+        if snap is None:
+            return [], ids
+        rows = snap.rows_for(ids)
+        hit = rows >= 0
+        found = [_parcel_payload(rec) for rec in snap.records(rows[hit])]
+        missing = [pid for pid, ok in zip(ids, hit.tolist()) if not ok]
+        return found, missing
+
+
+def _parcel_payload(rec: dict[str, Any]) -> dict[str, Any]:
+    probs = {k[len("prob_"):]: v for k, v in rec.items() if k.startswith("prob_")}
+    features = {k: v for k, v in rec.items() if not k.startswith(("prob_", "water_")) and k not in ("id", "label")}
+    payload: dict[str, Any] = {
+        "id": rec["id"],
+        "features": features,
+        "probs": probs,
+        "class": max(probs, key=probs.get) if probs else None,
+        "water_flag": rec.get("water_flag"),
+        "water_anom": rec.get("water_anom"),
+    }
+    # Neighbour and history z-scores behind water_anom, when the snapshot has them
+    for k in ("water_z_local", "water_z_hist"):
+        if k in rec:
+            payload[k] = rec[k]
+    if "label" in rec:
+        payload["label"] = rec["label"]
+    return payload
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional, Sequence
+
+import numpy as np
+
+
+class _RasterSampler:
+    """Point sampling from one GeoTIFF through windowed reads aligned to its internal blocks.
+
+    The dataset stays open; points are grouped into chunks of whole blocks (thin strips
+    are stacked to about `chunk_pixels`) so a batch reads each touched chunk once, and
+    the last `cache_blocks` decoded chunks are kept in an LRU.
+    """
+
+    def __init__(self, path: str, cache_blocks: int = 256, chunk_pixels: int = 65536):
+        import rasterio
+
+        self.path = path
+        self.mtime = os.stat(path).st_mtime_ns
+        self.ds = rasterio.open(path)
+        block_h, self.block_w = self.ds.block_shapes[0]
+        self.block_h = block_h * max(1, chunk_pixels // (block_h * self.block_w))
+        self.nodata = self.ds.nodata
+        self.is_wgs84 = self.ds.crs is None or self.ds.crs.to_epsg() == 4326
+        self.cache_blocks = cache_blocks
+        self._blocks: OrderedDict[tuple[int, int], np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        # In-flight PointQuery calls using this sampler, and whether a refresh replaced it;
+        # both guarded by the owning PointQuery's lock
+        self.users = 0
+        self.retired = False
+
+    def close(self) -> None:
+        self.ds.close()
+        self._blocks.clear()
+
+    def _to_dataset_crs(self, lons: np.ndarray, lats: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        if self.is_wgs84:
+            return lons, lats
+        from rasterio.warp import transform
+
+        xs, ys = transform("EPSG:4326", self.ds.crs, lons, lats)
+        return np.asarray(xs), np.asarray(ys)
+
+    def _block(self, br: int, bc: int) -> np.ndarray:
+        from rasterio.windows import Window
+
+        key = (br, bc)
+        arr = self._blocks.get(key)
+        if arr is not None:
+            self._blocks.move_to_end(key)
+            return arr
+        col0, row0 = bc * self.block_w, br * self.block_h
+        window = Window(col0, row0, min(self.block_w, self.ds.width - col0), min(self.block_h, self.ds.height - row0))
+        arr = self.ds.read(1, window=window).astype(np.float32)
+        if self.nodata is not None and not np.isnan(self.nodata):
+            arr[arr == self.nodata] = np.nan
+        self._blocks[key] = arr
+        while len(self._blocks) > self.cache_blocks:
+            self._blocks.popitem(last=False)
+        return arr
+
+    def sample(self, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+        xs, ys = self._to_dataset_crs(lons, lats)
+        inv = ~self.ds.transform
+        cols = np.floor(inv.a * xs + inv.b * ys + inv.c).astype(np.int64)
+        rows = np.floor(inv.d * xs + inv.e * ys + inv.f).astype(np.int64)
+        out = np.full(len(rows), np.nan, dtype=np.float32)
+        inside = np.flatnonzero((rows >= 0) & (rows < self.ds.height) & (cols >= 0) & (cols < self.ds.width))
+        if not len(inside):
+            return out
+        r, c = rows[inside], cols[inside]
+        block_ids = (r // self.block_h) * ((self.ds.width + self.block_w - 1) // self.block_w) + c // self.block_w
+        order = np.argsort(block_ids, kind="stable")
+        uniq, first = np.unique(block_ids[order], return_index=True)
+        bounds = np.append(first, len(order))
+        with self._lock:
+            for k in range(len(uniq)):
+                sel = order[bounds[k]:bounds[k + 1]]
+                br, bc = int(r[sel[0]] // self.block_h), int(c[sel[0]] // self.block_w)
+                arr = self._block(br, bc)
+                out[inside[sel]] = arr[r[sel] - br * self.block_h, c[sel] - bc * self.block_w]
+        return out
+
+    def window_stats(self, bbox: Sequence[float], max_pixels: int = 1024 * 1024) -> dict[str, Any]:
+        """min/max/mean/count over the pixels inside a lon/lat bbox (decimated read if large).
+
+        Large boxes are read from the finest internal overview that fits in max_pixels, so
+        mean comes from averaged overview pixels and only overview blocks are decoded.
+        """
+        from rasterio.errors import WindowError
+        from rasterio.warp import transform_bounds
+        from rasterio.windows import Window, from_bounds
+
+        from ..utils.rasters import overview_factor, overview_window
+
+        b = bbox if self.is_wgs84 else transform_bounds("EPSG:4326", self.ds.crs, *bbox)
+        try:
+            window = from_bounds(*b, transform=self.ds.transform).round_offsets().round_lengths()
+            window = window.intersection(Window(0, 0, self.ds.width, self.ds.height))
+        except WindowError:  # no overlap
+            return {"count": 0, "min": None, "max": None, "mean": None}
+        scale = max(1.0, (window.width * window.height / max_pixels) ** 0.5)
+        ovr = overview_factor(self.ds, scale, coarser=True) if scale > 1 else 1
+        if ovr > 1 and ovr >= scale:
+            window, out_shape = overview_window(self.ds, window, ovr)
+        else:
+            out_shape = (max(1, int(window.height / scale)), max(1, int(window.width / scale)))
+        with self._lock:
+            arr = self.ds.read(1, window=window, out_shape=out_shape, masked=True).astype(np.float32).filled(np.nan)
+        valid = arr[np.isfinite(arr)]
+        if not valid.size:
+            return {"count": 0, "min": None, "max": None, "mean": None}
+        return {"count": int(valid.size), "min": float(valid.min()), "max": float(valid.max()), "mean": float(valid.mean())}
+
+
+class PointQuery:
+    """Answers "what is at this coordinate" for single points, batches and bboxes.
+
+    Parcel polygons (parcels.gpkg, EPSG:4326) are held in an STRtree so a batch of points
+    resolves to parcel ids with one bulk query; index rasters are sampled through
+    `_RasterSampler`. Parcels and rasters are reloaded when their files change, checked
+    at most once per `recheck_s`.
+    """
+
+    def __init__(self, parcels_path: str, rasters: dict[str, str], recheck_s: float = 1.0):
+        self.parcels_path = parcels_path
+        self.rasters = rasters
+        self.recheck_s = recheck_s
+        self._checked = 0.0
+        self._parcels_mtime: Optional[int] = None
+        # (STRtree, ids) swapped as one reference so readers never mix generations
+        self._parcels: Optional[tuple[Any, np.ndarray]] = None
+        self._samplers: dict[str, _RasterSampler] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._checked < self.recheck_s:
+            return
+        with self._lock:
+            self._checked = now
+            self._refresh_parcels()
+            self._refresh_rasters()
+
+    def _refresh_parcels(self) -> None:
+        try:
+            mtime = os.stat(self.parcels_path).st_mtime_ns
+        except FileNotFoundError:
+            self._parcels, self._parcels_mtime = None, None
+            return
+        if mtime == self._parcels_mtime:
+            return
+        import geopandas as gpd
+        import shapely
+
+        gdf = gpd.read_file(self.parcels_path)
+        gdf = gdf.set_crs(4326) if gdf.crs is None else gdf.to_crs(4326)
+        tree = shapely.STRtree(np.asarray(gdf.geometry.values, dtype=object))
+        self._parcels = (tree, gdf["id"].to_numpy(dtype=np.int64))
+        self._parcels_mtime = mtime
+
+    def _refresh_rasters(self) -> None:
+        samplers: dict[str, _RasterSampler] = {}
+        for name, path in self.rasters.items():
+            current = self._samplers.get(name)
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            samplers[name] = current if current is not None and current.mtime == mtime else _RasterSampler(path)
+        # Replaced samplers close now, or when the last in-flight reader releases them
+        for old in self._samplers.values():
+            if all(old is not s for s in samplers.values()):
+                old.retired = True
+                if not old.users:
+                    old.close()
+        self._samplers = samplers
+
+    @contextmanager
+    def _samplers_in_use(self) -> Iterator[dict[str, _RasterSampler]]:
+        """The current samplers, kept open until the caller is done even if a refresh replaces them."""
+        with self._lock:
+            samplers = self._samplers
+            for s in samplers.values():
+                s.users += 1
+        try:
+            yield samplers
+        finally:
+            with self._lock:
+                for s in samplers.values():
+                    s.users -= 1
+                    if s.retired and not s.users:
+                        s.close()
+
+    def parcel_ids(self, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+        """Parcel id containing each point (-1 outside every parcel; lowest id on shared edges)."""
+        out = np.full(len(lons), -1, dtype=np.int64)
+        parcels = self._parcels
+        if parcels is None or not len(lons):
+            return out
+        import shapely
+
+        tree, all_ids = parcels
+        pt_idx, parcel_idx = tree.query(shapely.points(lons, lats), predicate="intersects")
+        if len(pt_idx):
+            ids = all_ids[parcel_idx]
+            # Sort so the first hit per point is the lowest parcel id
+            order = np.lexsort((ids, pt_idx))
+            pt_sorted = pt_idx[order]
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = pt_sorted[1:] != pt_sorted[:-1]
+            out[pt_sorted[first]] = ids[order][first]
+        return out
+
+    def points(self, lons: Sequence[float], lats: Sequence[float]) -> dict[str, Any]:
+        """Columnar results: {"parcel_id": int64 array, "values": {raster: float32 array}}."""
+        self.refresh()
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        with self._samplers_in_use() as samplers:
+            values = {name: s.sample(lons, lats) for name, s in samplers.items()}
+        return {"parcel_id": self.parcel_ids(lons, lats), "values": values}
+
+    def bbox(self, bbox: Sequence[float], limit: int = 1000) -> dict[str, Any]:
+        self.refresh()
+        parcels: list[int] = []
+        total = 0
+        if self._parcels is not None:
+            import shapely
+
+            tree, all_ids = self._parcels
+            ids = np.sort(all_ids[tree.query(shapely.box(*bbox), predicate="intersects")])
+            total = int(len(ids))
+            parcels = ids[:limit].tolist()
+        with self._samplers_in_use() as samplers:
+            stats = {name: s.window_stats(bbox) for name, s in samplers.items()}
+        return {"parcels": parcels, "parcel_count": total, "truncated": total > len(parcels), "stats": stats}
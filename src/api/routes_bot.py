@@ -7,12 +7,29 @@ from fastapi.responses import JSONResponse
 router = APIRouter()
 
 
+def _parse_latlon(text: str) -> tuple[float, float] | None:
+    parts = text.replace(",", " ").split()
+    if len(parts) != 2:
+        return None
+    try:
+        lat, lon = float(parts[0]), float(parts[1])
+    except ValueError:
+        return None
+    if -90 <= lat <= 90 and -180 <= lon <= 180:
+        return lat, lon
+    return None
+
+
 @router.post("/bot")
 async def bot(text: str = Form("")):
-    # Echo-style stub: interpret text as village or parcel id
+    # Interpret text as "lat,lon", a parcel id or a village name
     t = text.strip()
     info = {}
-    if t.isdigit():
+    latlon = _parse_latlon(t)
+    if latlon is not None:
+        lat, lon = latlon
+        info = {"type": "point", "lat": lat, "lon": lon, "query": f"/query/point?lat={lat}&lon={lon}"}
+    elif t.isdigit():
         info = {"type": "parcel", "id": int(t), "report": f"/report/parcel/{t}"}
     else:
         info = {"type": "village", "name": t, "report": f"/report/village/{t}"}
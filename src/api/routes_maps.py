@@ -1,40 +1,158 @@
 from __future__ import annotations
 
 import os
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, Response
 
 from ..config import settings
-from ..utils.viz import save_blank_tile
+from ..utils.mbtiles import MBTilesRegistry, archive_path
+from ..utils.tile_formats import MVT_MEDIA_TYPE, media_type_for
+from .json_cache import JsonFileCache
+from .tile_index import TileIndex, empty_png
 
 
 router = APIRouter()
 
+tile_index = TileIndex(max_entries=settings.tile_index_max, negative_size=settings.tile_negative_cache)
+tile_archives = MBTilesRegistry()
+# One vector tile source per (parcels file, predictions store); built on first /mvt request
+_parcel_sources: dict = {}
+# One manifest cache per path (settings.data_dir can change, e.g. in tests)
+_manifest_caches: dict = {}
+# Process-wide serving counters (approximate under concurrency), exposed at /tiles/stats
+tile_stats = {"requests": 0, "hits": 0, "misses": 0, "not_modified": 0, "bytes_served": 0}
 
-@router.get("/tiles/{layer}/{z}/{x}/{y}.png")
-def get_tile(layer: str, z: int, x: int, y: int):
-    path = os.path.join(settings.tiles_dir, layer, str(z), str(x), f"{y}.png")
-    if not os.path.exists(path):
-        # create a blank placeholder tile on demand
-        save_blank_tile(path, size=settings.tile_size, text=f"{layer} {z}/{x}/{y}")
-    return FileResponse(path, media_type="image/png")
+
+def _not_modified(request: Request, etag: str, mtime: float | None) -> bool:
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        return inm.strip() == "*" or etag in [t.strip() for t in inm.split(",")]
+    ims = request.headers.get("if-modified-since")
+    if ims and mtime is not None:
+        try:
+            return int(mtime) <= parsedate_to_datetime(ims).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _empty_tile(request: Request) -> Response:
+    tile_stats["misses"] += 1
+    if settings.empty_tile == "204":
+        return Response(status_code=204)
+    etag = f'"empty-{settings.tile_size}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={settings.tile_cache_max_age}"}
+    if _not_modified(request, etag, None):
+        tile_stats["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+    body = empty_png(settings.tile_size)
+    tile_stats["bytes_served"] += len(body)
+    return Response(body, media_type="image/png", headers=headers)
+
+
+@router.get("/tiles/stats")
+def get_tile_stats():
+    return JSONResponse(dict(tile_stats))
+
+
+@router.get("/tiles/{layer}/{z}/{x}/{y}.{ext}")
+def get_tile(layer: str, z: int, x: int, y: int, ext: str, request: Request):
+    if layer.startswith(".") or ext not in ("png", "webp"):
+        raise HTTPException(status_code=404, detail="Unknown layer")
+    tile_stats["requests"] += 1
+    headers = {"Cache-Control": f"public, max-age={settings.tile_cache_max_age}"}
+    # Packed archive ({layer}.mbtiles) takes precedence over loose files
+    archive = tile_archives.get(archive_path(settings.tiles_dir, layer))
+    if archive is not None:
+        found = archive.get(z, x, y)
+        if found is None:
+            return _empty_tile(request)
+        data, tile_id = found
+        tile_stats["hits"] += 1
+        headers["ETag"] = f'"{tile_id}"'
+        if _not_modified(request, headers["ETag"], None):
+            tile_stats["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+        tile_stats["bytes_served"] += len(data)
+        return Response(data, media_type=media_type_for(archive.metadata.get("format", "png")), headers=headers)
+    hit = tile_index.lookup(os.path.join(settings.tiles_dir, layer), z, x, y, ext=ext)
+    if hit is None:
+        # Never render or write placeholders for misses; serve the shared empty tile
+        return _empty_tile(request)
+    path, st = hit
+    tile_stats["hits"] += 1
+    etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    headers["ETag"] = etag
+    headers["Last-Modified"] = formatdate(st.st_mtime, usegmt=True)
+    if _not_modified(request, etag, st.st_mtime):
+        tile_stats["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+    tile_stats["bytes_served"] += st.st_size
+    # Passing the cached stat skips the per-request os.stat; servers that implement the
+    # ASGI pathsend extension send the file zero-copy
+    return FileResponse(path, media_type=media_type_for(ext), headers=headers, stat_result=st)
+
+
+def parcel_tile_source():
+    key = (settings.parcels_path, settings.predictions_store_dir)
+    source = _parcel_sources.get(key)
+    if source is None:
+        # shapely/geopandas-backed; imported on first vector tile request rather than at startup
+        from ..utils.vector_tiles import ParcelTileSource
+
+        source = _parcel_sources.setdefault(key, ParcelTileSource(*key, cache_size=settings.mvt_cache_tiles))
+    return source
+
+
+@router.get("/mvt/{layer}/{z}/{x}/{y}.pbf")
+def get_vector_tile(layer: str, z: int, x: int, y: int, request: Request):
+    if layer != "parcels":
+        raise HTTPException(status_code=404, detail="Unknown vector layer")
+    headers = {"Cache-Control": f"public, max-age={settings.tile_cache_max_age}"}
+    # Pre-generated tiles first (pipeline MVT_PREGEN_ZOOMS), then render on demand. They sit
+    # under the etag of the parcels and predictions they were made from, so edits bypass them
+    source = parcel_tile_source()
+    etag = source.disk_etag()
+    hit = tile_index.lookup(os.path.join(settings.mvt_dir, layer, etag), z, x, y, ext="pbf") if etag else None
+    if hit is not None:
+        path, st = hit
+        headers["ETag"] = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+        if _not_modified(request, headers["ETag"], st.st_mtime):
+            return Response(status_code=304, headers=headers)
+        return FileResponse(path, media_type=MVT_MEDIA_TYPE, headers=headers, stat_result=st)
+    body = source.tile(z, x, y)
+    if body is None:
+        raise HTTPException(status_code=404, detail="No parcels published. Run /ingest first.")
+    headers["ETag"] = f'"{source.etag}-{z}-{x}-{y}"'
+    if _not_modified(request, headers["ETag"], None):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=MVT_MEDIA_TYPE, headers=headers)
+
+
+def run_manifest() -> JsonFileCache:
+    """The last run's manifest (pipeline RunManifest), kept parsed in memory."""
+    path = settings.manifest_path
+    cache = _manifest_caches.get(path)
+    if cache is None:
+        cache = _manifest_caches.setdefault(path, JsonFileCache(path))
+    return cache
+
+
+@router.get("/layers")
+def get_layers():
+    # Layer catalog of the last run: kinds, URLs, zooms, bounds, value ranges, timings
+    manifest = run_manifest().get()
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="No run published. Run /ingest first.")
+    return JSONResponse(manifest)
 
 
 @router.get("/overlay/{layer}")
 def get_overlay(layer: str):
-    # Provide overlay image URL and AOI bounds for ImageOverlay demo
-    img_path = os.path.join(settings.tiles_dir, "overlays", f"{layer}.png")
-    if not os.path.exists(img_path):
+    # Overlay image URL and AOI bounds for the ImageOverlay demo, from the manifest in memory
+    manifest = run_manifest().get() or {}
+    url = manifest.get("layers", {}).get(layer, {}).get("overlay")
+    if url is None:
         raise HTTPException(status_code=404, detail="Overlay not found. Run /ingest first.")
-    # Read bounds from features/predictions json if present, else use Goa demo bbox
-    # For simplicity, use demo AOI bbox
-    aoi_path = os.path.join(settings.aoi_dir, "goa_demo.geojson")
-    try:
-        import geopandas as gpd
-        gdf = gpd.read_file(aoi_path).to_crs(4326)
-        minx, miny, maxx, maxy = gdf.total_bounds
-        bounds = [[miny, minx], [maxy, maxx]]
-    except Exception:
-        bounds = [[15.30, 73.90], [15.50, 74.10]]
-    url = f"/static/tiles/overlays/{layer}.png"
-    return JSONResponse({"url": url, "bounds": bounds})
+    return JSONResponse({"url": url, "bounds": manifest["overlay_bounds"]})
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, Body, HTTPException, Query
+from fastapi.responses import JSONResponse
+
+from ..config import settings
+
+
+router = APIRouter()
+
+# One query engine per (parcels file, interim dir); settings.data_dir can change in tests/benchmarks
+_engines: dict = {}
+
+# Upper bounds per request
+MAX_QUERY_POINTS = 10000
+MAX_BBOX_PARCELS = 10000
+
+
+def point_query():
+    key = (settings.parcels_path, settings.interim_dir)
+    engine = _engines.get(key)
+    if engine is None:
+        # shapely/rasterio-backed; imported on the first query rather than at startup
+        from .point_query import PointQuery
+
+        engine = _engines.setdefault(key, PointQuery(settings.parcels_path, settings.query_rasters))
+    return engine
+
+
+def _results(lons: list[float], lats: list[float]) -> list[dict]:
+    out = point_query().points(lons, lats)
+    pids = out["parcel_id"].tolist()
+    values = {name: [None if v != v else v for v in arr.tolist()] for name, arr in out["values"].items()}
+    return [
+        {
+            "lon": lon,
+            "lat": lat,
+            "parcel_id": pid if pid >= 0 else None,
+            "values": {name: col[i] for name, col in values.items()},
+        }
+        for i, (lon, lat, pid) in enumerate(zip(lons, lats, pids))
+    ]
+
+
+@router.get("/query/point")
+def query_point(lat: float = Query(..., ge=-90, le=90), lon: float = Query(..., ge=-180, le=180)):
+    result = _results([lon], [lat])[0]
+    if result["parcel_id"] is not None:
+        result["report"] = f"/report/parcel/{result['parcel_id']}"
+    return JSONResponse(result)
+
+
+@router.post("/query/points")
+def query_points(points: list[list[float]] = Body(..., embed=True)):
+    # points: [[lon, lat], ...]
+    if len(points) > MAX_QUERY_POINTS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_QUERY_POINTS} points per request")
+    if any(len(p) != 2 for p in points):
+        raise HTTPException(status_code=422, detail="Each point must be [lon, lat]")
+    lons = [p[0] for p in points]
+    lats = [p[1] for p in points]
+    return JSONResponse({"results": _results(lons, lats)})
+
+
+@router.get("/query/bbox")
+def query_bbox(bbox: str = Query(..., description="minlon,minlat,maxlon,maxlat"), limit: int = Query(1000, ge=0, le=MAX_BBOX_PARCELS)):
+    try:
+        minx, miny, maxx, maxy = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=422, detail="bbox must be minlon,minlat,maxlon,maxlat")
+    if minx > maxx or miny > maxy:
+        raise HTTPException(status_code=422, detail="bbox min must not exceed max")
+    return JSONResponse({"bbox": [minx, miny, maxx, maxy], **point_query().bbox((minx, miny, maxx, maxy), limit=limit)})
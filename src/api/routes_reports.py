@@ -2,35 +2,68 @@ from __future__ import annotations
 
 import os
 import json
-from fastapi import APIRouter
+from fastapi import APIRouter, Body, HTTPException
 from fastapi.responses import JSONResponse, FileResponse
 
 from ..config import settings
-from ..utils.viz import save_blank_tile
+from .json_cache import JsonFileCache
 
 
 router = APIRouter()
 
+# One lookup per store directory (settings.data_dir can change, e.g. in tests/benchmarks)
+_lookups: dict = {}
+_rollup_caches: dict = {}
+
+# Upper bound on ids per batch request
+MAX_BATCH_IDS = 10000
+
+
+def parcel_lookup():
+    root = settings.predictions_store_dir
+    lookup = _lookups.get(root)
+    if lookup is None:
+        # numpy-backed; imported on first report request rather than at startup
+        from .parcel_lookup import ParcelLookup
+
+        lookup = _lookups.setdefault(root, ParcelLookup(root))
+    return lookup
+
+
+def village_rollups() -> JsonFileCache:
+    path = settings.village_rollups_path
+    cache = _rollup_caches.get(path)
+    if cache is None:
+        cache = _rollup_caches.setdefault(path, JsonFileCache(path))
+    return cache
+
+
+def _summary_png() -> str | None:
+    path = os.path.join(settings.tiles_dir, "reports", "summary.png")
+    return path if os.path.exists(path) else None
+
 
 @router.get("/report/parcel/{pid}")
 def report_parcel(pid: int):
-    # Mock report: return a PNG path and dummy metrics
-    img_path = os.path.join(settings.tiles_dir, "reports", f"parcel_{pid}.png")
-    if not os.path.exists(img_path):
-        save_blank_tile(img_path, text=f"Parcel {pid}")
-    payload = {"png": img_path, "metrics": {"id": pid, "ndvi": 0.5, "ndwi": 0.1}}
-    return JSONResponse(payload)
+    metrics = parcel_lookup().get(pid)
+    if metrics is None:
+        raise HTTPException(status_code=404, detail=f"Parcel {pid} not found in latest predictions. Run /ingest first.")
+    return JSONResponse({"png": _summary_png(), "metrics": metrics})
+
+
+@router.post("/report/parcels")
+def report_parcels(ids: list[int] = Body(..., embed=True)):
+    if len(ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_IDS} ids per request")
+    found, missing = parcel_lookup().get_many(ids)
+    return JSONResponse({"parcels": found, "missing": missing})
 
 
 @router.get("/report/village/{name}")
 def report_village(name: str):
-    img_path = os.path.join(settings.tiles_dir, "reports", f"village_{name}.png")
-    csv_path = os.path.join(settings.features_dir, f"actions_{name}.csv")
-    if not os.path.exists(img_path):
-        save_blank_tile(img_path, text=f"Village {name}")
-    if not os.path.exists(csv_path):
-        os.makedirs(os.path.dirname(csv_path), exist_ok=True)
-        with open(csv_path, "w") as f:
-            f.write("id,lat,lon,type,score,reason,date\n")
-    return JSONResponse({"png": img_path, "csv": csv_path})
-
+    # Precomputed by the pipeline rollup stage; served from memory
+    rollups = village_rollups().get() or {}
+    summary = rollups.get(name)
+    if summary is None:
+        raise HTTPException(status_code=404, detail=f"Village {name} not found in latest rollups. Run /ingest first.")
+    return JSONResponse({"png": _summary_png(), "csv": summary["csv"], "summary": summary})
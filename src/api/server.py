@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import os
+from contextlib import asynccontextmanager
 from datetime import datetime
 from fastapi import FastAPI, UploadFile, Form
 from fastapi.responses import JSONResponse, FileResponse, RedirectResponse, Response
@@ -8,16 +9,24 @@ from fastapi.staticfiles import StaticFiles
 
 from ..config import settings
 from ..utils.io import ensure_dir
-from .routes_maps import router as maps_router
+from .routes_maps import router as maps_router, run_manifest, tile_index, tile_archives
 from .routes_reports import router as reports_router
 from .routes_bot import router as bot_router
-from ..pipeline import run_offline_pipeline, run_stac_pipeline
+from .routes_query import router as query_router
 
 
-app = FastAPI(title="SatGov MVP")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Parse the last run's manifest once, before the first /layers or /overlay request
+    run_manifest().get(force=True)
+    yield
+
+
+app = FastAPI(title="SatGov MVP", lifespan=lifespan)
 app.include_router(maps_router)
 app.include_router(reports_router)
 app.include_router(bot_router)
+app.include_router(query_router)
 
 
 @app.get("/health")
@@ -27,11 +36,18 @@ def health():
 
 @app.post("/ingest")
 async def ingest(aoi_path: str = Form(...), start: str = Form(...), end: str = Form(...), source: str = Form("offline")):
-    # Run offline synthetic pipeline or real STAC pipeline
+    # Run offline synthetic pipeline or real STAC pipeline.
+    # Imported here so the heavy geo/ML stack only loads on the first ingest, not at startup.
+    from ..pipeline import run_offline_pipeline, run_stac_pipeline
+
     if source == "stac":
         result = run_stac_pipeline(aoi_path=aoi_path, start=start, end=end)
     else:
         result = run_offline_pipeline(aoi_path=aoi_path, start=start, end=end)
+    # New tiles were written; drop cached layer indexes and remembered misses
+    tile_index.invalidate()
+    tile_archives.invalidate()
+    run_manifest().get(force=True)
     return JSONResponse({"status": "ok", **result})
 
 
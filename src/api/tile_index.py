@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from ..utils.io import LAYER_VERSION_MARKER
+
+TileKey = Tuple[int, int, int]
+TileHit = Tuple[str, os.stat_result]
+
+
+@lru_cache(maxsize=8)
+def empty_png(size: int = 256) -> bytes:
+    """Fully transparent RGBA PNG, built with zlib only so the tile route never loads PIL."""
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    raw = (b"\x00" + b"\x00" * (size * 4)) * size
+    ihdr = struct.pack(">IIBBBBB", size, size, 8, 6, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", ihdr) + chunk(b"IDAT", zlib.compress(raw, 9)) + chunk(b"IEND", b"")
+
+
+class _Layer:
+    __slots__ = ("tiles", "complete", "version", "checked")
+
+    def __init__(self) -> None:
+        # (z, x, y) -> stat_result, or None until the tile is first served
+        self.tiles: dict[TileKey, Optional[os.stat_result]] = {}
+        self.complete = False
+        self.version: Optional[int] = None
+        self.checked = 0.0
+
+
+class TileIndex:
+    """In-memory index of the tiles present on disk, one entry per layer directory.
+
+    A layer is scanned once and then answered from memory; it is rescanned when the
+    layer's version marker (or the directory itself) changes, checked at most once per
+    `recheck_s`. Layers with more than `max_entries` tiles are not held in memory and
+    fall back to a stat per request, with misses remembered in a bounded LRU for
+    `negative_ttl` seconds.
+    """
+
+    def __init__(self, max_entries: int = 1_000_000, negative_size: int = 100_000, recheck_s: float = 1.0, negative_ttl: float = 30.0):
+        self.max_entries = max_entries
+        self.negative_size = negative_size
+        self.recheck_s = recheck_s
+        self.negative_ttl = negative_ttl
+        self._layers: dict[str, _Layer] = {}
+        self._negative: OrderedDict[tuple[str, int, int, int], float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def invalidate(self, layer_dir: str | None = None) -> None:
+        with self._lock:
+            if layer_dir is None:
+                self._layers.clear()
+                self._negative.clear()
+            else:
+                self._layers.pop(layer_dir, None)
+                for k in [k for k in self._negative if k[0] == layer_dir]:
+                    del self._negative[k]
+
+    def lookup(self, layer_dir: str, z: int, x: int, y: int, ext: str = "png") -> Optional[TileHit]:
+        layer = self._layer(layer_dir)
+        path = os.path.join(layer_dir, str(z), str(x), f"{y}.{ext}")
+        if layer is not None and layer.complete:
+            key = (z, x, y)
+            if key not in layer.tiles:
+                return None
+            st = layer.tiles[key]
+            if st is None:
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    return None
+                layer.tiles[key] = st
+            return path, st
+        return self._lookup_uncached(layer_dir, z, x, y, path)
+
+    def _lookup_uncached(self, layer_dir: str, z: int, x: int, y: int, path: str) -> Optional[TileHit]:
+        nkey = (layer_dir, z, x, y)
+        now = time.monotonic()
+        with self._lock:
+            expires = self._negative.get(nkey)
+            if expires is not None:
+                if expires > now:
+                    self._negative.move_to_end(nkey)
+                    return None
+                del self._negative[nkey]
+        try:
+            return path, os.stat(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._negative[nkey] = now + self.negative_ttl
+                while len(self._negative) > self.negative_size:
+                    self._negative.popitem(last=False)
+            return None
+
+    def _layer(self, layer_dir: str) -> Optional[_Layer]:
+        now = time.monotonic()
+        layer = self._layers.get(layer_dir)
+        if layer is not None and now - layer.checked < self.recheck_s:
+            return layer
+        version = _layer_version(layer_dir)
+        if layer is not None and version == layer.version:
+            layer.checked = now
+            return layer
+        with self._lock:
+            layer = _Layer()
+            layer.version = version
+            layer.checked = now
+            # A missing layer directory is an empty, complete index
+            layer.complete = version is None or _scan(layer_dir, layer.tiles, self.max_entries)
+            if not layer.complete:
+                layer.tiles.clear()
+            # Version changed, so any remembered misses may now exist
+            for k in [k for k in self._negative if k[0] == layer_dir]:
+                del self._negative[k]
+            self._layers[layer_dir] = layer
+        return layer
+
+
+def _layer_version(layer_dir: str) -> Optional[int]:
+    for p in (os.path.join(layer_dir, LAYER_VERSION_MARKER), layer_dir):
+        try:
+            return os.stat(p).st_mtime_ns
+        except FileNotFoundError:
+            continue
+    return None
+
+
+def _scan(layer_dir: str, out: dict[TileKey, Optional[os.stat_result]], max_entries: int) -> bool:
+    """Fill out with the z/x/y.* tiles under layer_dir; False if it exceeds max_entries."""
+    for zd in os.scandir(layer_dir):
+        if not (zd.is_dir() and zd.name.isdigit()):
+            continue
+        z = int(zd.name)
+        for xd in os.scandir(zd.path):
+            if not (xd.is_dir() and xd.name.isdigit()):
+                continue
+            x = int(xd.name)
+            for f in os.scandir(xd.path):
+                stem, _, _ext = f.name.partition(".")
+                if stem.isdigit():
+                    out[(z, x, int(stem))] = None
+                    if len(out) > max_entries:
+                        return False
+    return True
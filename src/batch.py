@@ -0,0 +1,152 @@
+"""Multi-AOI batch ingest: one isolated run directory per AOI, run in worker processes.
+
+Usage (from repo root):
+    python -m src.batch jobs.json --workers 4 --runs-dir data/runs --shared-dir data/shared
+
+jobs.json is a list of {"aoi": path, "start": "YYYY-MM-DD", "end": "YYYY-MM-DD", "name": optional};
+a CSV with the same column names also works.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from typing import Any, Optional
+
+from .config import settings
+from .utils.io import ensure_dir
+
+
+@dataclass
+class BatchJob:
+    aoi: str
+    start: str
+    end: str
+    name: str = ""
+
+    @property
+    def run_name(self) -> str:
+        stem = self.name or os.path.splitext(os.path.basename(self.aoi))[0]
+        return re.sub(r"[^A-Za-z0-9_.-]+", "_", f"{stem}_{self.start}_{self.end}")
+
+
+def load_jobs(path: str) -> list[BatchJob]:
+    if path.lower().endswith(".csv"):
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path) as f:
+            rows = json.load(f)
+    jobs = [BatchJob(aoi=r["aoi"], start=r["start"], end=r["end"], name=r.get("name") or "") for r in rows]
+    names = [j.run_name for j in jobs]
+    dupes = sorted({n for n in names if names.count(n) > 1})
+    if dupes:
+        raise ValueError(f"Duplicate run names (set a distinct `name`): {', '.join(dupes)}")
+    return jobs
+
+
+def _run_job(job: BatchJob, run_dir: str, shared_dir: str, villages: str, source: str, options: dict[str, Any]) -> dict[str, Any]:
+    """Worker entry point: point this process's settings at the run dir and run one AOI."""
+    settings.data_dir = run_dir
+    settings.shared_dir = shared_dir
+    settings.villages_file = villages
+    from .pipeline import run_offline_pipeline, run_stac_pipeline
+
+    t0 = time.perf_counter()
+    summary: dict[str, Any] = {"name": job.run_name, "aoi": job.aoi, "run_dir": run_dir, "pid": os.getpid()}
+    try:
+        if source == "stac":
+            result = run_stac_pipeline(aoi_path=job.aoi, start=job.start, end=job.end)
+            ok = result.get("status") == "ok"
+        else:
+            result = run_offline_pipeline(aoi_path=job.aoi, start=job.start, end=job.end, **options)
+            ok = True
+        summary.update({"status": "ok" if ok else "failed", "result": result})
+    except Exception as e:  # one bad AOI must not take down the batch
+        summary.update({"status": "failed", "error": f"{type(e).__name__}: {e}"})
+    summary["seconds"] = time.perf_counter() - t0
+    return summary
+
+
+def run_batch(
+    jobs: list[BatchJob],
+    runs_dir: Optional[str] = None,
+    shared_dir: Optional[str] = None,
+    workers: int = 2,
+    source: str = "offline",
+    options: Optional[dict[str, Any]] = None,
+) -> dict[str, Any]:
+    """Run jobs in parallel worker processes and write runs_dir/batch_report.json.
+
+    Each job writes only to runs_dir/<run_name> (features, predictions, tiles, stores);
+    STAC search results, downloaded assets and the trained model live under shared_dir
+    and are reused by every run. Workers are spawned, not forked, so no GDAL/thread
+    state leaks in from the parent.
+    """
+    runs_dir = os.path.abspath(runs_dir or settings.runs_dir)
+    shared_dir = os.path.abspath(shared_dir or settings.shared_dir or os.path.join(settings.data_dir, "shared"))
+    # Village polygons come from the shared data dir, not each run's own
+    villages = os.path.abspath(settings.villages_path)
+    ensure_dir(runs_dir)
+    ensure_dir(shared_dir)
+    options = options or {}
+    t0 = time.perf_counter()
+    runs: list[dict[str, Any]] = []
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max(1, workers), mp_context=ctx) as pool:
+        futures = {
+            pool.submit(_run_job, job, os.path.join(runs_dir, job.run_name), shared_dir, villages, source, options): job
+            for job in jobs
+        }
+        for fut in as_completed(futures):
+            summary = fut.result()
+            runs.append(summary)
+            print(f"{summary['status']:>6}  {summary['name']}  {summary['seconds']:.1f}s", file=sys.stderr)
+    wall = time.perf_counter() - t0
+    ok = sum(1 for r in runs if r["status"] == "ok")
+    runs.sort(key=lambda r: r["name"])
+    report = {
+        "jobs": len(jobs),
+        "ok": ok,
+        "failed": len(jobs) - ok,
+        "workers": workers,
+        "source": source,
+        "wall_s": wall,
+        "aois_per_hour": ok / wall * 3600.0 if wall > 0 else 0.0,
+        "mean_run_s": sum(r["seconds"] for r in runs) / len(runs) if runs else 0.0,
+        "runs_dir": runs_dir,
+        "shared_dir": shared_dir,
+        "runs": runs,
+        "job_specs": [asdict(j) for j in jobs],
+    }
+    with open(os.path.join(runs_dir, "batch_report.json"), "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    return report
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Run the pipeline for many AOIs in parallel")
+    ap.add_argument("jobs", help="JSON or CSV list of aoi/start/end[/name]")
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    ap.add_argument("--runs-dir", default=None, help="Parent of the per-AOI run dirs (default: DATA_DIR/runs)")
+    ap.add_argument("--shared-dir", default=None, help="Shared STAC/download/model cache (default: SHARED_DIR or DATA_DIR/shared)")
+    ap.add_argument("--source", default="offline", choices=["offline", "stac"])
+    ap.add_argument("--size", type=int, default=256, help="Offline synthetic scene size (pixels)")
+    args = ap.parse_args(argv)
+
+    options = {"shape": (args.size, args.size)} if args.source == "offline" else {}
+    report = run_batch(load_jobs(args.jobs), args.runs_dir, args.shared_dir, args.workers, args.source, options)
+    print(f"{report['ok']}/{report['jobs']} AOIs in {report['wall_s']:.1f}s with {report['workers']} workers "
+          f"-> {report['aois_per_hour']:.1f} AOIs/hour (report: {os.path.join(report['runs_dir'], 'batch_report.json')})")
+    return 0 if report["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,8 +5,40 @@ from dataclasses import dataclass
 @dataclass
 class Settings:
     data_dir: str = os.getenv("DATA_DIR", "data")
+    # Read-mostly artifacts shared between runs (STAC results, downloads, trained model); empty = under data_dir
+    shared_dir: str = os.getenv("SHARED_DIR", "")
     log_level: str = os.getenv("LOG_LEVEL", "INFO")
     tile_size: int = int(os.getenv("TILE_SIZE", "256"))
+    # Missing tiles: "png" serves one shared transparent tile, "204" returns No Content
+    empty_tile: str = os.getenv("EMPTY_TILE", "png")
+    tile_cache_max_age: int = int(os.getenv("TILE_CACHE_MAX_AGE", "3600"))
+    tile_index_max: int = int(os.getenv("TILE_INDEX_MAX", "1000000"))
+    tile_negative_cache: int = int(os.getenv("TILE_NEGATIVE_CACHE", "100000"))
+    # Tile generator output: "dir" (one PNG per tile) or "mbtiles" (one archive per layer)
+    tile_output: str = os.getenv("TILE_OUTPUT", "dir")
+    # Tile encoding: "png" (RGBA), "png8" (palette) or "webp"
+    tile_format: str = os.getenv("TILE_FORMAT", "png")
+    # Parcel vector tiles: rendered tiles kept in memory, and zooms pre-generated by the pipeline (e.g. "10-14")
+    mvt_cache_tiles: int = int(os.getenv("MVT_CACHE_TILES", "4096"))
+    mvt_pregen_zooms: str = os.getenv("MVT_PREGEN_ZOOMS", "")
+    # Elevation GeoTIFF for slope/aspect/TPI (empty = no terrain layers)
+    dem_path: str = os.getenv("DEM_PATH", "")
+    # Sharded runs: work queue URL (redis://... or sqlite:///path); empty = SQLite file in the plan dir
+    shard_queue: str = os.getenv("SHARD_QUEUE", "")
+    # Zonal stats: 0 = whole rasters in memory; N = walk the index rasters in N x N windows with
+    # mergeable per-parcel sketches (features/zonal.py), over ZONAL_WORKERS processes
+    zonal_block: int = int(os.getenv("ZONAL_BLOCK", "0"))
+    zonal_workers: int = int(os.getenv("ZONAL_WORKERS", "1"))
+    # Sentinel-1 speckle filter applied to linear VV/VH before dB: "refined_lee", "lee" or "none"
+    s1_speckle: str = os.getenv("S1_SPECKLE", "refined_lee")
+    # Change detection against the previous run: layers compared (comma-separated, empty = off),
+    # block size of the checksummed comparison, and zooms of the change-only tile layers
+    change_layers: str = os.getenv("CHANGE_LAYERS", "ndvi,ndwi")
+    change_block: int = int(os.getenv("CHANGE_BLOCK", "512"))
+    change_zooms: str = os.getenv("CHANGE_ZOOMS", "8-12")
+    # Village polygons for rollups; empty = aoi/villages.geojson under data_dir. Batch runs pin it
+    # before moving data_dir to a run dir, so every run reads the shared file
+    villages_file: str = os.getenv("VILLAGES_PATH", "")
 
     @property
     def aoi_dir(self) -> str:
@@ -14,7 +46,12 @@ class Settings:
 
     @property
     def raw_dir(self) -> str:
-        return os.path.join(self.data_dir, "raw")
+        return os.path.join(self.shared_dir or self.data_dir, "raw")
+
+    @property
+    def stac_cache_dir(self) -> str:
+        # Cached STAC search results (item JSON), keyed by query
+        return os.path.join(self.raw_dir, "stac")
 
     @property
     def interim_dir(self) -> str:
@@ -24,17 +61,98 @@ class Settings:
     def features_dir(self) -> str:
         return os.path.join(self.data_dir, "features")
 
+    @property
+    def predictions_store_dir(self) -> str:
+        # Columnar, memory-mappable snapshot of the latest predictions (see utils/colstore.py)
+        return os.path.join(self.features_dir, "predictions_store")
+
+    @property
+    def parcels_path(self) -> str:
+        # Parcel polygons (id + geometry) for the latest run
+        return os.path.join(self.features_dir, "parcels.gpkg")
+
+    @property
+    def village_rollups_path(self) -> str:
+        # Written by features/rollup.py (ROLLUP_JSON under features_dir)
+        return os.path.join(self.features_dir, "village_rollups.json")
+
+    @property
+    def water_history_path(self) -> str:
+        # Rolling per-parcel MNDWI history behind the water anomaly baselines (models/water_anomaly.py)
+        return os.path.join(self.features_dir, "water_history.npz")
+
+    @property
+    def water_neighbors_path(self) -> str:
+        # k-nearest parcel table, rebuilt only when the parcel layout changes
+        return os.path.join(self.features_dir, "water_neighbors.npz")
+
+    @property
+    def villages_path(self) -> str:
+        # Optional village polygons with a `name` property; the AOI is used when absent
+        return self.villages_file or os.path.join(self.aoi_dir, "villages.geojson")
+
+    @property
+    def query_rasters(self) -> dict[str, str]:
+        # Georeferenced index rasters sampled by the /query endpoints (same names as the STAC pipeline)
+        return {
+            "ndvi": os.path.join(self.interim_dir, "ndvi.tif"),
+            "ndwi": os.path.join(self.interim_dir, "ndwi.tif"),
+            "mndwi": os.path.join(self.interim_dir, "mndwi.tif"),
+            "vv_vh": os.path.join(self.interim_dir, "s1_ratio.tif"),
+            "lst": os.path.join(self.interim_dir, "lst.tif"),
+        }
+
+    @property
+    def manifest_path(self) -> str:
+        # What the latest run published (layers, zooms, bounds, stats, timings); see src/manifest.py
+        return os.path.join(self.data_dir, "manifest.json")
+
+    @property
+    def change_dir(self) -> str:
+        # Change rasters and transition tables vs the previous run, plus its snapshot (see features/change.py)
+        return os.path.join(self.data_dir, "change")
+
+    @property
+    def terrain_cache_dir(self) -> str:
+        # Terrain layers keyed by DEM checksum (see features/terrain.py); shared like downloads
+        return os.path.join(self.raw_dir, "terrain")
+
+    @property
+    def lst_cache_dir(self) -> str:
+        # Landsat temperature resampled to a run's S2 grid, keyed by scene and grid (features/landsat_lst.py)
+        return os.path.join(self.raw_dir, "lst")
+
+    @property
+    def reproject_cache_dir(self) -> str:
+        # Reprojection plans keyed by (source grid, target grid), reused across runs (utils/reproject.py)
+        return os.path.join(self.raw_dir, "reproject")
+
     @property
     def labels_dir(self) -> str:
         return os.path.join(self.data_dir, "labels")
 
     @property
     def models_dir(self) -> str:
-        return os.path.join(self.data_dir, "models")
+        return os.path.join(self.shared_dir or self.data_dir, "models")
+
+    @property
+    def runs_dir(self) -> str:
+        # Batch ingest: one isolated data dir per AOI run (see src/batch.py)
+        return os.path.join(self.data_dir, "runs")
+
+    @property
+    def shards_dir(self) -> str:
+        # Sharded runs: one plan dir (plan, queue, per-shard outputs) per AOI (see src/shards.py)
+        return os.path.join(self.data_dir, "shards")
 
     @property
     def tiles_dir(self) -> str:
         return os.path.join(self.data_dir, "tiles")
 
+    @property
+    def mvt_dir(self) -> str:
+        # Pre-generated vector tiles: mvt/{layer}/{z}/{x}/{y}.pbf
+        return os.path.join(self.tiles_dir, "mvt")
+
 
 settings = Settings()
@@ -0,0 +1,345 @@
+"""Change detection between pipeline runs, streamed block by block.
+
+Every run overwrites the index rasters, so the previous run is kept as a snapshot under
+`<out_dir>/state`: a copy of each tracked raster, a checksum per block and the predicted
+class of every parcel. A new run is compared with it in one pass over the new raster:
+
+- each block is hashed; blocks whose hash matches the snapshot are unchanged and are neither
+  decoded nor diffed. For local tiled GeoTIFFs (the COGs written here) the hash covers the
+  block's compressed tile bytes, read straight from the file, so an unchanged run reads
+  each tile once without decompressing it and does not copy the snapshot. Other rasters
+  are hashed on their pixels;
+- changed blocks are diffed and classified (CHANGE_CLASSES) into `<layer>_change.tif`, an
+  int8 COG with 0 as nodata: "no change" and "not observed in both runs" are both 0, so
+  the file stays small and renders directly as a change-only tile layer;
+- parcels in changed blocks get a count of their changed pixels;
+- the predicted class of each parcel is compared with the previous run (transitions.csv).
+
+If the grid or block size changed, the run becomes the new baseline and nothing is compared.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+from typing import Any, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from ..utils.io import atomic_write, ensure_dir
+
+# |new - previous| from which a pixel counts as changed (class +-1); twice this is class +-2
+CHANGE_THRESHOLDS: dict[str, float] = {"ndvi": 0.1, "ndwi": 0.1, "mndwi": 0.1, "vv_vh": 1.5, "lst": 2.0}
+CHANGE_CLASSES = {-2: "strong_decrease", -1: "decrease", 1: "increase", 2: "strong_increase"}
+DEFAULT_BLOCK = 512
+STATE_DIR = "state"
+PARCEL_STATE = "parcel_classes.npz"
+TRANSITIONS_CSV = "transitions.csv"
+SUMMARY_JSON = "change_summary.json"
+
+
+def classify_change(delta: np.ndarray, threshold: float) -> np.ndarray:
+    """int8 change class per pixel: +-1 from threshold, +-2 from twice it, 0 otherwise (and for NaN)."""
+    mag = np.abs(delta)
+    with np.errstate(invalid="ignore"):
+        cls = (mag >= threshold).astype(np.int8) + (mag >= 2 * threshold).astype(np.int8)
+        return np.where(delta < 0, -cls, cls).astype(np.int8)
+
+
+def _digest(h) -> np.uint64:
+    return np.uint64(int.from_bytes(h.digest(), "little"))
+
+
+def _pixel_hash(arr: np.ndarray) -> np.uint64:
+    return _digest(hashlib.blake2b(np.ascontiguousarray(arr).tobytes(), digest_size=8))
+
+
+class _TileHasher:
+    """Hashes a block from the compressed bytes of the GeoTIFF tiles inside it.
+
+    Identical bytes under the same codec decode to identical pixels, so equal hashes mean an
+    unchanged block. `codec` (compression, predictor, tile size) is stored with the hashes:
+    hashes are only compared between runs written the same way.
+    """
+
+    def __init__(self, src, path: str, block: int):
+        self.src = src
+        self.f = None
+        self.tile = src.block_shapes[0]
+        if src.driver != "GTiff" or not os.path.isfile(path) or block % self.tile[0] or block % self.tile[1]:
+            return
+        if src.get_tag_item("BLOCK_OFFSET_0_0", "TIFF", bidx=1) is None:
+            return
+        self.f = open(path, "rb")
+
+    @property
+    def codec(self) -> str:
+        if self.f is None:
+            return json.dumps(["pixels", self.src.dtypes[0]])
+        return json.dumps(["tiles", self.src.dtypes[0], list(self.tile), self.src.tags(ns="IMAGE_STRUCTURE")], sort_keys=True)
+
+    def __call__(self, window) -> Optional[np.uint64]:
+        if self.f is None:
+            return None
+        th, tw = self.tile
+        h = hashlib.blake2b(digest_size=8)
+        row, col = int(window.row_off), int(window.col_off)
+        for ty in range(row // th, -(-(row + int(window.height)) // th)):
+            for tx in range(col // tw, -(-(col + int(window.width)) // tw)):
+                offset = int(self.src.get_tag_item(f"BLOCK_OFFSET_{tx}_{ty}", "TIFF", bidx=1) or 0)
+                size = int(self.src.get_tag_item(f"BLOCK_SIZE_{tx}_{ty}", "TIFF", bidx=1) or 0)
+                self.f.seek(offset)
+                h.update(size.to_bytes(8, "little"))
+                h.update(self.f.read(size))
+        return _digest(h)
+
+    def close(self) -> None:
+        if self.f is not None:
+            self.f.close()
+
+
+def _read(ds, window) -> np.ndarray:
+    arr = ds.read(1, window=window, out_dtype="float32")
+    if ds.nodata is not None and not np.isnan(ds.nodata):
+        arr[arr == np.float32(ds.nodata)] = np.nan
+    return arr
+
+
+def _copy_atomic(src: str, dst: str) -> None:
+    with atomic_write(dst) as tmp:
+        shutil.copyfile(src, tmp)
+
+
+def detect_layer_change(
+    name: str,
+    raster_path: str,
+    out_dir: str,
+    threshold: float,
+    block: int = DEFAULT_BLOCK,
+    rasterizer=None,
+) -> dict[str, Any]:
+    """Compare one layer with its snapshot, write `<name>_change.tif` and update the snapshot.
+
+    rasterizer: a zonal.ParcelRasterizer on this raster's CRS, for per-parcel changed pixels.
+    Returns stats plus `windows_lonlat` (bounds of the changed blocks) and `parcel_px`
+    (parcel ids and changed pixel counts).
+    """
+    import rasterio
+    from affine import Affine
+    from rasterio.warp import transform_bounds
+
+    from ..utils.rasters import block_windows, grid_key, tiled_profile, to_cog
+
+    state_dir = ensure_dir(os.path.join(out_dir, STATE_DIR))
+    snapshot = os.path.join(state_dir, f"{name}.tif")
+    sums_path = os.path.join(state_dir, f"{name}.blocks.npz")
+    out_path = os.path.join(out_dir, f"{name}_change.tif")
+    scratch = f"{out_path}.blocks.tif"
+
+    prev = None
+    if os.path.exists(sums_path) and os.path.exists(snapshot):
+        with np.load(sums_path) as z:
+            prev = {"grid": str(z["grid"]), "block": int(z["block"]), "codec": str(z["codec"]), "hashes": z["hashes"]}
+
+    pixels = np.zeros(5, dtype=np.int64)  # classes -2..2
+    windows_lonlat, parcel_ids, parcel_px = [], [], []
+    with rasterio.open(raster_path) as src:
+        grid = grid_key(src)
+        windows = list(block_windows(src.width, src.height, block))
+        compared = prev is not None and prev["grid"] == grid and prev["block"] == block and len(prev["hashes"]) == len(windows)
+        hasher = _TileHasher(src, raster_path, block)
+        # Hashes written by another codec say nothing: then every block is diffed
+        same_codec = compared and prev["codec"] == hasher.codec
+        hashes = np.zeros(len(windows), dtype=np.uint64)
+        changed = np.zeros(len(windows), dtype=bool)
+        profile = {**tiled_profile(src.profile), "dtype": "int8", "nodata": 0, "predictor": 2}
+        old = rasterio.open(snapshot) if compared else None
+        try:
+            with rasterio.open(scratch, "w", **profile) as dst:
+                for i, window in enumerate(windows):
+                    raw = hasher(window)
+                    new = _read(src, window) if raw is None else None
+                    hashes[i] = raw if raw is not None else _pixel_hash(new)
+                    if not compared or (same_codec and hashes[i] == prev["hashes"][i]):
+                        continue
+                    changed[i] = True
+                    if new is None:
+                        new = _read(src, window)
+                    cls = classify_change(new - _read(old, window), threshold)
+                    pixels += np.bincount(cls.ravel() + 2, minlength=5)
+                    if not cls.any():
+                        continue
+                    # Blocks never written read back as nodata (0), so only blocks with changes are stored
+                    dst.write(cls, 1, window=window)
+                    col, row = int(window.col_off), int(window.row_off)
+                    transform = src.transform @ Affine.translation(col, row)
+                    (x0, x1), (y0, y1) = zip(transform @ (0, 0), transform @ (window.width, window.height))
+                    box = (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+                    windows_lonlat.append(transform_bounds(src.crs, "EPSG:4326", *box) if src.crs else box)
+                    if rasterizer is not None:
+                        ids = rasterizer.ids(transform, int(window.width), int(window.height))
+                        if ids is not None:
+                            hit = ids[(cls != 0) & (ids >= 0)]
+                            if len(hit):
+                                u, n = np.unique(hit, return_counts=True)
+                                parcel_ids.append(u)
+                                parcel_px.append(n)
+            to_cog(scratch, out_path, resampling="nearest")
+        finally:
+            hasher.close()
+            if old is not None:
+                old.close()
+            if os.path.exists(scratch):
+                os.remove(scratch)
+        codec = hasher.codec
+
+    # Unchanged run: the snapshot already holds these values
+    if not compared or changed.any():
+        _copy_atomic(raster_path, snapshot)
+    with atomic_write(sums_path, ".npz") as tmp:
+        np.savez(tmp, grid=grid, block=block, codec=codec, hashes=hashes)
+
+    ids = np.concatenate(parcel_ids) if parcel_ids else np.empty(0, dtype=np.int64)
+    px = np.concatenate(parcel_px) if parcel_px else np.empty(0, dtype=np.int64)
+    if len(ids):
+        ids, inv = np.unique(ids, return_inverse=True)
+        px = np.bincount(inv, weights=px).astype(np.int64)
+    return {
+        "layer": name,
+        "status": "compared" if compared else "baseline",
+        "path": out_path,
+        "threshold": threshold,
+        "blocks": len(windows),
+        "blocks_changed": int(changed.sum()),
+        "pixels": {CHANGE_CLASSES[c]: int(pixels[c + 2]) for c in CHANGE_CLASSES},
+        "windows_lonlat": windows_lonlat,
+        "parcel_px": (ids, px),
+    }
+
+
+def parcel_classes(pred_df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """(ids, predicted class name) per parcel: the class with the highest prob_* column."""
+    prob_cols = sorted(c for c in pred_df.columns if c.startswith("prob_"))
+    ids = pred_df["id"].to_numpy(dtype=np.int64)
+    if not prob_cols:
+        return ids, np.full(len(ids), "", dtype=object)
+    names = np.array([c[len("prob_"):] for c in prob_cols], dtype=object)
+    return ids, names[pred_df[prob_cols].fillna(0.0).to_numpy().argmax(axis=1)]
+
+
+def class_transitions(pred_df: pd.DataFrame, state_path: str) -> pd.DataFrame:
+    """id, class_prev, class_new, changed against the classes saved at state_path, which are then replaced.
+
+    Parcels new to this run have an empty class_prev and do not count as changed.
+    """
+    ids, new = parcel_classes(pred_df)
+    prev = np.full(len(ids), "", dtype=object)
+    if os.path.exists(state_path):
+        with np.load(state_path, allow_pickle=False) as z:
+            old_ids, old_cls = z["ids"], z["classes"].astype(object)
+        if len(old_ids):
+            order = np.argsort(old_ids)
+            old_ids, old_cls = old_ids[order], old_cls[order]
+            pos = np.clip(np.searchsorted(old_ids, ids), 0, len(old_ids) - 1)
+            hit = old_ids[pos] == ids
+            prev[hit] = old_cls[pos[hit]]
+    with atomic_write(state_path, ".npz") as tmp:
+        np.savez(tmp, ids=ids, classes=new.astype(str))
+    return pd.DataFrame({"id": ids, "class_prev": prev, "class_new": new, "changed": (prev != "") & (prev != new)})
+
+
+def detect_changes(
+    raster_paths: dict[str, str],
+    out_dir: str,
+    pred_df: Optional[pd.DataFrame] = None,
+    parcels=None,
+    block: int = DEFAULT_BLOCK,
+    thresholds: Optional[dict[str, float]] = None,
+) -> dict[str, Any]:
+    """Change rasters for each layer and, with predictions or parcels, transitions.csv.
+
+    transitions.csv has one row per parcel: class_prev / class_new / changed (with pred_df)
+    and `<layer>_changed_px` (with parcels). change_summary.json records per-layer block
+    and pixel counts and the class transition counts. Returns the summary, with the
+    changed-block bounds per layer under "windows_lonlat" (not saved).
+    """
+    import rasterio
+
+    from .zonal import ParcelRasterizer
+
+    thresholds = {**CHANGE_THRESHOLDS, **(thresholds or {})}
+    missing = [n for n in raster_paths if n not in thresholds]
+    if missing:
+        raise ValueError(f"No change threshold for layers {missing}; pass thresholds={{name: t}}")
+    ensure_dir(out_dir)
+    rasterizer = None
+    if parcels is not None and raster_paths:
+        with rasterio.open(next(iter(raster_paths.values()))) as src:
+            rasterizer = ParcelRasterizer(ParcelRasterizer.pack(parcels, src.crs))
+
+    layers = {name: detect_layer_change(name, path, out_dir, thresholds[name], block, rasterizer) for name, path in raster_paths.items()}
+
+    table = None
+    if pred_df is not None:
+        table = class_transitions(pred_df, os.path.join(out_dir, STATE_DIR, PARCEL_STATE))
+    elif parcels is not None:
+        table = pd.DataFrame({"id": parcels["id"].to_numpy(dtype=np.int64)})
+    transitions: dict[str, int] = {}
+    if table is not None:
+        for name, res in layers.items():
+            ids, px = res["parcel_px"]
+            table[f"{name}_changed_px"] = pd.Series(px, index=ids).reindex(table["id"].to_numpy()).fillna(0).astype(np.int64).to_numpy()
+        if "changed" in table:
+            moved = table[table["changed"]]
+            transitions = {f"{a}->{b}": int(n) for (a, b), n in moved.groupby(["class_prev", "class_new"]).size().items()}
+        path = os.path.join(out_dir, TRANSITIONS_CSV)
+        with atomic_write(path) as tmp:
+            table.to_csv(tmp, index=False)
+
+    summary = {
+        "layers": {name: {k: v for k, v in res.items() if k not in ("windows_lonlat", "parcel_px")} for name, res in layers.items()},
+        "transitions": transitions,
+        "parcels_changed": int(table["changed"].sum()) if table is not None and "changed" in table else 0,
+    }
+    path = os.path.join(out_dir, SUMMARY_JSON)
+    with atomic_write(path) as tmp, open(tmp, "w") as f:
+        json.dump(summary, f, indent=2)
+    return {**summary, "windows_lonlat": {name: res["windows_lonlat"] for name, res in layers.items()}}
+
+
+def changed_tiles(windows_lonlat: Sequence[Sequence[float]], zooms: Sequence[int]) -> list[tuple[int, int, int]]:
+    """(z, x, y) of every XYZ tile touching one of the changed blocks."""
+    import mercantile
+
+    tiles = set()
+    for west, south, east, north in windows_lonlat:
+        tiles.update((t.z, t.x, t.y) for t in mercantile.tiles(west, south, east, north, list(zooms)))
+    return sorted(tiles)
+
+
+def render_change_tiles(
+    result: dict[str, Any],
+    tiles_root: str,
+    aoi_bounds_latlon: Sequence[float],
+    zooms: Sequence[int],
+    output: str = "dir",
+    fmt: str = "png",
+    plan_cache_dir: Optional[str] = None,
+) -> dict[str, dict]:
+    """`<layer>_change` tile layers rendered only over changed blocks; the previous run's tiles are dropped."""
+    from ..utils.tiles import generate_xyz_tile_layers
+
+    stats = {}
+    for name, res in result["layers"].items():
+        layer = f"{name}_change"
+        if output == "dir":
+            shutil.rmtree(os.path.join(tiles_root, layer), ignore_errors=True)
+        # Classes, not values: nearest keeps them whole and isolated pixels off the nodata halo
+        spec = {"raster_path": res["path"], "layer": layer, "cmap": "RdYlGn", "vmin": -2, "vmax": 2, "resampling": "nearest"}
+        stats[layer] = generate_xyz_tile_layers(
+            [spec], tiles_root, aoi_bounds_latlon, zooms, output=output, fmt=fmt, plan_cache_dir=plan_cache_dir,
+            tiles=changed_tiles(result["windows_lonlat"][name], zooms),
+        )[layer]
+    return stats
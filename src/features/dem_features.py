@@ -1,26 +1,38 @@
 from __future__ import annotations
 
 import os
+from typing import Optional
+
 import numpy as np
 
 from ..utils.io import ensure_dir
+from .terrain import horn_slope_aspect
+
 
+def compute_dem_features(
+    out_dir: str,
+    shape: tuple[int, int] = (256, 256),
+    dem_path: Optional[str] = None,
+    like: Optional[str] = None,
+) -> dict[str, str]:
+    """Terrain layers. With dem_path: slope/aspect/TPI GeoTIFFs from the DEM (aligned to the
+    `like` raster's grid if given, see terrain.compute_terrain). Without: a synthetic
+    elevation plane of `shape` and its slope/aspect as .npy."""
+    if dem_path:
+        from .terrain import compute_terrain
 
-def compute_dem_features(out_dir: str, shape: tuple[int, int] = (256, 256)) -> dict[str, str]:
+        return compute_terrain(dem_path, out_dir, like=like)
     ensure_dir(out_dir)
     h, w = shape
     x = np.linspace(0, 1, w)
     y = np.linspace(0, 1, h)
     xx, yy = np.meshgrid(x, y)
     z = (100 + 10 * xx + 5 * yy).astype(np.float32)
-    dzdx = np.gradient(z, axis=1)
-    dzdy = np.gradient(z, axis=0)
-    slope = np.hypot(dzdx, dzdy).astype(np.float32)
-    aspect = np.arctan2(dzdy, dzdx).astype(np.float32)
+    # Unit pixels; edge-replicated so the output keeps the input shape
+    slope, aspect = horn_slope_aspect(np.pad(z, 1, mode="edge"), 1.0, 1.0)
     out = {}
     for name, arr in {"elev": z, "slope": slope, "aspect": aspect}.items():
         path = os.path.join(out_dir, f"{name}.npy")
         np.save(path, arr)
         out[name] = path
     return out
-
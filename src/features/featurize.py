@@ -16,23 +16,49 @@ def aggregate_to_parcels(parcel_ids: np.ndarray, rasters: Dict[str, np.ndarray])
     rows = []
     for pid in ids:
         mask = parcel_ids == pid
-        row = {"id": int(pid)}
-        for name, arr in rasters.items():
-            vals = arr[mask]
-            if vals.size == 0:
-                row[f"{name}_p50"] = np.nan
-                row[f"{name}_p90"] = np.nan
-                row[f"{name}_mean"] = np.nan
-                row[f"{name}_std"] = np.nan
-            else:
-                row[f"{name}_p50"] = float(np.nanpercentile(vals, 50))
-                row[f"{name}_p90"] = float(np.nanpercentile(vals, 90))
-                row[f"{name}_mean"] = float(np.nanmean(vals))
-                row[f"{name}_std"] = float(np.nanstd(vals))
-        rows.append(row)
+        rows.append(parcel_row(int(pid), {name: arr[mask] for name, arr in rasters.items()}))
     return pd.DataFrame(rows).sort_values("id").reset_index(drop=True)
 
 
+def parcel_row(pid: int, values: Dict[str, np.ndarray]) -> dict:
+    """Feature row for one parcel from the pixel values of each raster inside it."""
+    row = {"id": pid}
+    for name, vals in values.items():
+        if vals.size == 0:
+            row[f"{name}_p50"] = np.nan
+            row[f"{name}_p90"] = np.nan
+            row[f"{name}_mean"] = np.nan
+            row[f"{name}_std"] = np.nan
+        else:
+            row[f"{name}_p50"] = float(np.nanpercentile(vals, 50))
+            row[f"{name}_p90"] = float(np.nanpercentile(vals, 90))
+            row[f"{name}_mean"] = float(np.nanmean(vals))
+            row[f"{name}_std"] = float(np.nanstd(vals))
+    return row
+
+
+def group_parcel_pixels(pids: np.ndarray, rasters: Dict[str, np.ndarray], keep: np.ndarray):
+    """Pixel values of the parcels in `keep`, grouped by parcel id in one sort.
+
+    Returns (ids, counts, {raster: float32 values ordered by id}) for grouped_parcel_rows.
+    """
+    flat = pids.ravel()
+    sel = np.flatnonzero(np.isin(flat, keep))
+    order = np.argsort(flat[sel], kind="stable")
+    sel = sel[order]
+    ids, counts = np.unique(flat[sel], return_counts=True)
+    return ids, counts, {name: arr.ravel()[sel].astype(np.float32) for name, arr in rasters.items()}
+
+
+def grouped_parcel_rows(ids: np.ndarray, counts: np.ndarray, values: Dict[str, np.ndarray]) -> list[dict]:
+    """parcel_row for every parcel of a group_parcel_pixels result."""
+    bounds = np.concatenate([[0], np.cumsum(counts)])
+    return [
+        parcel_row(int(pid), {name: v[bounds[i]:bounds[i + 1]] for name, v in values.items()})
+        for i, pid in enumerate(ids.tolist())
+    ]
+
+
 def save_features(df: pd.DataFrame, out_path: str) -> str:
     ensure_dir(os.path.dirname(out_path) or ".")
     df.to_csv(out_path, index=False)
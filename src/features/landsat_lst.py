@@ -1,9 +1,23 @@
 from __future__ import annotations
 
+import hashlib
+import json
 import os
+import shutil
+from typing import Optional
+
 import numpy as np
 
-from ..utils.io import ensure_dir
+from ..utils.io import atomic_write, ensure_dir
+
+# Landsat Collection 2 Level-2 surface temperature (ST_B10, STAC asset "lwir11"): K = DN * scale + offset
+L2_ST_SCALE = 0.00341802
+L2_ST_OFFSET = 149.0
+# Landsat 8 TIRS band 10 Collection 2 Level-1 calibration (RADIANCE_MULT/ADD, K1/K2 from the MTL)
+L8_B10 = {"ml": 3.3420e-4, "al": 0.1, "k1": 774.8853, "k2": 1321.0789}
+# Band 10 effective wavelength (m) and h*c/k_B (m K) for the emissivity correction
+_LAMBDA = 10.895e-6
+_RHO = 1.438e-2
 
 
 def compute_lst_proxy(out_dir: str, shape: tuple[int, int] = (256, 256)) -> str:
@@ -17,3 +31,111 @@ def compute_lst_proxy(out_dir: str, shape: tuple[int, int] = (256, 256)) -> str:
     np.save(path, lst)
     return path
 
+
+def brightness_temperature(dn: np.ndarray, ml: float, al: float, k1: float, k2: float) -> np.ndarray:
+    """At-sensor brightness temperature (K) from Level-1 thermal DNs: L = ML*DN + AL, BT = K2 / ln(K1/L + 1)."""
+    radiance = ml * dn.astype(np.float32) + al
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bt = k2 / np.log(k1 / radiance + 1.0)
+    return np.where(radiance > 0, bt, np.nan).astype(np.float32)
+
+
+def ndvi_emissivity(ndvi: np.ndarray) -> np.ndarray:
+    """Land surface emissivity from NDVI (threshold method): water 0.991, bare soil 0.973,
+    mixed pixels 0.004 * Pv + 0.986 with Pv the squared scaled NDVI between 0.2 and 0.5."""
+    pv = np.clip((ndvi - 0.2) / 0.3, 0.0, 1.0) ** 2
+    eps = np.where(ndvi < 0.0, 0.991, np.where(ndvi < 0.2, 0.973, 0.004 * pv + 0.986))
+    return eps.astype(np.float32)
+
+
+def lst_from_bt(bt: np.ndarray, emissivity: np.ndarray) -> np.ndarray:
+    """Single-channel LST (K): BT / (1 + (lambda * BT / rho) * ln(emissivity))."""
+    return (bt / (1.0 + (_LAMBDA * bt / _RHO) * np.log(emissivity))).astype(np.float32)
+
+
+def _source_key(href: str) -> str:
+    # Scene assets are immutable; local files also key on size and mtime
+    if os.path.exists(href):
+        st = os.stat(href)
+        return f"{os.path.abspath(href)}:{st.st_size}:{st.st_mtime_ns}"
+    return href
+
+
+def compute_lst(
+    href: str,
+    like: str,
+    out_path: str,
+    mode: str = "st",
+    calibration: Optional[dict[str, float]] = None,
+    ndvi_path: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+) -> str:
+    """Land surface temperature (K) from a Landsat thermal COG on the grid of the `like` raster.
+
+    mode="st": Collection 2 Level-2 surface temperature DNs (already emissivity corrected).
+    mode="bt": Level-1 band 10 DNs -> brightness temperature with `calibration` (default
+    L8_B10), corrected to LST with NDVI-based emissivity when ndvi_path (same grid as like)
+    is given.
+
+    Only the window under the target grid is read. The temperature resampled to the target
+    grid is cached per (scene, mode, grid) under cache_dir, and the reprojection plan per
+    (scene grid, target grid) under cache_dir/plans, so repeat runs over the same AOI skip the read and the warp.
+    """
+    import rasterio
+
+    from ..config import settings
+    from ..utils.rasters import cog_options, grid_key, write_cog
+    from ..utils.reproject import dataset_plan
+
+    if mode not in ("st", "bt"):
+        raise ValueError(f"Unknown LST mode: {mode}")
+    calibration = calibration or L8_B10
+    cache_dir = ensure_dir(cache_dir or settings.lst_cache_dir)
+    with rasterio.open(like) as ref:
+        dst_crs, dst_transform, dst_shape = ref.crs, ref.transform, ref.shape
+        profile = {
+            "driver": "GTiff", "width": ref.width, "height": ref.height, "count": 1, "dtype": "float32",
+            "crs": ref.crs, "transform": ref.transform, "nodata": np.nan, **cog_options(),
+        }
+        grid = grid_key(ref)
+    key = hashlib.sha1(json.dumps([_source_key(href), mode, calibration if mode == "bt" else None, grid]).encode()).hexdigest()[:16]
+    cached = os.path.join(cache_dir, f"{key}.tif")
+
+    if not os.path.exists(cached):
+        with rasterio.open(href) as src:
+            plan = dataset_plan(src, dst_crs, dst_transform, dst_shape, cache_dir=os.path.join(cache_dir, "plans"))
+            # Nearest keeps Level-2 fill (0) from being averaged into valid pixels
+            dn, window = plan.read(src, resampling="nearest")
+        if dn is None:
+            raise ValueError(f"Thermal scene {href} does not overlap {like}")
+        # Level-2 products use 0 as fill even where the nodata tag is missing
+        dn[dn == 0] = np.nan
+        if mode == "st":
+            temp = dn * L2_ST_SCALE + L2_ST_OFFSET
+        else:
+            temp = brightness_temperature(dn, **calibration)
+        grid_temp = plan.apply(temp, window)
+        with atomic_write(cached) as tmp, rasterio.open(tmp, "w", **profile) as dst:
+            dst.write(grid_temp, 1)
+
+    if mode == "bt" and ndvi_path:
+        with rasterio.open(cached) as src, rasterio.open(ndvi_path) as nd:
+            lst = lst_from_bt(src.read(1), ndvi_emissivity(nd.read(1).astype(np.float32)))
+        write_cog(lst, out_path, dst_crs, dst_transform)
+    else:
+        with atomic_write(out_path) as tmp:
+            shutil.copyfile(cached, tmp)
+    return out_path
+
+
+def pick_thermal_asset(items: list[dict]) -> Optional[str]:
+    """href of the thermal band of the least cloudy Landsat STAC item (Level-2 "lwir11")."""
+    best = None
+    for it in items:
+        href = (it.get("assets", {}).get("lwir11") or {}).get("href")
+        if href is None:
+            continue
+        cloud = it.get("properties", {}).get("eo:cloud_cover", 100.0)
+        if best is None or cloud < best[0]:
+            best = (cloud, href)
+    return best[1] if best else None
@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+from datetime import date as _date
+from typing import Any
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+
+from ..utils.geoutils import get_utm_crs_for_gdf
+from ..utils.io import atomic_write, ensure_dir
+
+ROLLUP_JSON = "village_rollups.json"
+STATE_NPZ = "village_rollup_state.npz"
+ACTIONS_DIR = "actions"
+ACTION_COLUMNS = ["id", "lat", "lon", "type", "score", "reason", "date"]
+
+# Action types in priority order (lower sorts first)
+_ACTION_WATER = 0
+_ACTION_FALLOW = 1
+_ACTION_NAMES = {_ACTION_WATER: "water_anomaly", _ACTION_FALLOW: "fallow_check"}
+_ACTION_REASONS = {_ACTION_WATER: "Water index anomaly", _ACTION_FALLOW: "Predicted fallow"}
+
+
+def load_villages(villages_path: str | None, aoi_path: str | None = None) -> gpd.GeoDataFrame:
+    """Village polygons with a `name` column; falls back to the AOI features themselves."""
+    path = villages_path if villages_path and os.path.exists(villages_path) else aoi_path
+    if path is None:
+        raise FileNotFoundError("No villages or AOI file to roll up against")
+    gdf = gpd.read_file(path)
+    if gdf.crs is None:
+        gdf.set_crs(epsg=4326, inplace=True)
+    raw = gdf["name"].tolist() if "name" in gdf.columns else [None] * len(gdf)
+    gdf["name"] = [str(n) if n else f"village_{i}" for i, n in enumerate(raw)]
+    return gdf[["name", "geometry"]].reset_index(drop=True)
+
+
+def assign_parcels_to_villages(parcels: gpd.GeoDataFrame, villages: gpd.GeoDataFrame) -> np.ndarray:
+    """Bulk spatial join: village row index per parcel (-1 outside every village).
+
+    One STRtree over the village polygons is queried with all parcel representative
+    points at once, so each parcel lands in exactly one village even on shared borders.
+    """
+    from shapely import STRtree
+
+    if len(parcels) == 0 or len(villages) == 0:
+        return np.full(len(parcels), -1, dtype=np.int32)
+    villages = villages.to_crs(parcels.crs)
+    tree = STRtree(np.asarray(villages.geometry.values))
+    pts = np.asarray(parcels.geometry.representative_point().values)
+    parcel_idx, village_idx = tree.query(pts, predicate="within")
+    out = np.full(len(parcels), -1, dtype=np.int32)
+    # Several matches only on overlapping villages: keep the lowest village index
+    order = np.lexsort((village_idx, parcel_idx))
+    first = np.unique(parcel_idx[order], return_index=True)[1]
+    out[parcel_idx[order][first]] = village_idx[order][first]
+    return out
+
+
+def _geom_fingerprint(gdf: gpd.GeoDataFrame, id_col: str = "id") -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(gdf[id_col].to_numpy(dtype=np.int64)).tobytes())
+    h.update(np.ascontiguousarray(gdf.geometry.bounds.to_numpy(dtype=np.float64)).tobytes())
+    if "name" in gdf.columns:
+        h.update("\x00".join(gdf["name"].astype(str)).encode())
+    return h.hexdigest()
+
+
+def _parcel_geometry_table(parcels: gpd.GeoDataFrame, villages: gpd.GeoDataFrame) -> pd.DataFrame:
+    village = assign_parcels_to_villages(parcels, villages)
+    area_ha = parcels.to_crs(get_utm_crs_for_gdf(parcels)).area.to_numpy() / 1e4
+    pts = parcels.geometry.representative_point().to_crs(4326)
+    return pd.DataFrame({
+        "id": parcels["id"].to_numpy(dtype=np.int64),
+        "village": village,
+        "area_ha": area_ha,
+        "lat": pts.y.to_numpy(),
+        "lon": pts.x.to_numpy(),
+    })
+
+
+def _prediction_table(pred_df: pd.DataFrame, classes: list[str]) -> pd.DataFrame:
+    prob_cols = [f"prob_{c}" for c in classes]
+    probs = pred_df.reindex(columns=prob_cols).fillna(0.0).to_numpy(dtype=np.float64)
+    cls = probs.argmax(axis=1).astype(np.int16) if len(classes) else np.zeros(len(pred_df), dtype=np.int16)
+    flag = pred_df["water_flag"].to_numpy(dtype=bool) if "water_flag" in pred_df else np.zeros(len(pred_df), dtype=bool)
+    anom = pred_df["water_anom"].to_numpy(dtype=np.float64) if "water_anom" in pred_df else np.zeros(len(pred_df))
+    hash_cols = prob_cols + [c for c in ("water_flag", "water_anom") if c in pred_df]
+    row_hash = pd.util.hash_pandas_object(pred_df[hash_cols], index=False).to_numpy() if hash_cols else np.zeros(len(pred_df), dtype=np.uint64)
+    fallow_i = classes.index("fallow") if "fallow" in classes else -1
+    action = np.full(len(pred_df), -1, dtype=np.int8)
+    score = np.zeros(len(pred_df))
+    if fallow_i >= 0:
+        is_fallow = cls == fallow_i
+        action[is_fallow] = _ACTION_FALLOW
+        score[is_fallow] = probs[is_fallow, fallow_i]
+    action[flag] = _ACTION_WATER
+    score[flag] = anom[flag]
+    return pd.DataFrame({
+        "id": pred_df["id"].to_numpy(dtype=np.int64),
+        "cls": cls,
+        "flag": flag,
+        "action": action,
+        "score": score,
+        "row_hash": row_hash,
+    })
+
+
+def _village_sums(tab: pd.DataFrame, n_villages: int, n_classes: int, sign: float = 1.0) -> dict[str, np.ndarray]:
+    v = tab["village"].to_numpy()
+    # Parcels without a prediction keep their village for later runs but do not count
+    inside = (v >= 0) & tab["predicted"].to_numpy()
+    v = v[inside]
+    area = tab["area_ha"].to_numpy()[inside] * sign
+    cls = tab["cls"].to_numpy()[inside].astype(np.int64)
+    return {
+        "count": np.bincount(v, minlength=n_villages) * sign,
+        "area": np.bincount(v, weights=area, minlength=n_villages),
+        "class_area": np.bincount(v * n_classes + cls, weights=area, minlength=n_villages * n_classes).reshape(n_villages, n_classes),
+        "anomalies": np.bincount(v, weights=tab["flag"].to_numpy()[inside].astype(np.float64), minlength=n_villages) * sign,
+    }
+
+
+def _village_actions(tab: pd.DataFrame, run_date: str, top_n: int) -> list[dict[str, Any]]:
+    acts = tab[tab["action"] >= 0]
+    if acts.empty:
+        return []
+    acts = acts.sort_values(["action", "score"], ascending=[True, False]).head(top_n)
+    return [
+        {
+            "id": int(r.id),
+            "lat": round(float(r.lat), 6),
+            "lon": round(float(r.lon), 6),
+            "type": _ACTION_NAMES[int(r.action)],
+            "score": round(float(r.score), 4),
+            "reason": _ACTION_REASONS[int(r.action)],
+            "date": run_date,
+        }
+        for r in acts.itertuples(index=False)
+    ]
+
+
+def _slug(name: str) -> str:
+    """File-name-safe village name; names that needed changing get a hash so they stay unique."""
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "_", name).strip("_")
+    if slug == name:
+        return slug
+    return f"{slug or 'village'}_{hashlib.sha1(name.encode()).hexdigest()[:8]}"
+
+
+def _merge_tables(geo: pd.DataFrame, pred: pd.DataFrame) -> pd.DataFrame:
+    """Outer join of parcel geometry and predictions: every parcel keeps its village, and
+    predictions without geometry sit outside every village."""
+    # Nullable so the join neither turns the 64-bit row hashes into float64 nor flags into objects
+    pred = pred.astype({"row_hash": "UInt64", "flag": "boolean"})
+    tab = geo.merge(pred, on="id", how="outer", indicator=True)
+    tab["predicted"] = tab.pop("_merge") != "left_only"
+    fill = {"village": -1, "area_ha": 0.0, "cls": 0, "flag": False, "action": -1, "score": 0.0, "row_hash": 0}
+    tab = tab.fillna(fill)
+    dtypes = {"village": np.int32, "cls": np.int16, "flag": bool, "action": np.int8, "row_hash": np.uint64}
+    return tab.astype(dtypes)
+
+
+def _write_actions_csv(path: str, actions: list[dict[str, Any]]) -> None:
+    with atomic_write(path) as tmp:
+        pd.DataFrame(actions, columns=ACTION_COLUMNS).to_csv(tmp, index=False)
+
+
+def update_village_rollups(
+    pred_df: pd.DataFrame,
+    parcels: gpd.GeoDataFrame,
+    villages: gpd.GeoDataFrame,
+    out_dir: str,
+    run_date: str | None = None,
+    top_n: int = 50,
+) -> dict[str, Any]:
+    """Assign parcels to villages and (re)compute per-village aggregates.
+
+    Writes `village_rollups.json` (name -> summary + ranked actions, loaded by the API)
+    and `actions/actions_{slug}.csv`. Per-parcel contributions are kept in
+    `village_rollup_state.npz`. When parcel/village geometry and classes are unchanged,
+    only parcels whose predictions changed (by row hash) are subtracted and re-added,
+    and only the affected villages' action lists and CSVs are rebuilt.
+    Returns {"villages", "changed_parcels", "changed_villages", "incremental"}.
+    """
+    ensure_dir(out_dir)
+    actions_dir = ensure_dir(os.path.join(out_dir, ACTIONS_DIR))
+    run_date = run_date or _date.today().isoformat()
+    classes = sorted(c[len("prob_"):] for c in pred_df.columns if c.startswith("prob_"))
+    names = villages["name"].tolist()
+    n_v, n_c = len(names), max(len(classes), 1)
+    geom_fp = _geom_fingerprint(parcels) + _geom_fingerprint(villages.reset_index().rename(columns={"index": "id"}))
+    state_path = os.path.join(out_dir, STATE_NPZ)
+    json_path = os.path.join(out_dir, ROLLUP_JSON)
+
+    prev = _load_state(state_path)
+    incremental = (
+        prev is not None
+        and prev["geom_fp"] == geom_fp
+        and prev["classes"] == classes
+        and prev["names"] == names
+        and "predicted" in prev["table"]
+        and os.path.exists(json_path)
+    )
+
+    if incremental:
+        geo = prev["table"][["id", "village", "area_ha", "lat", "lon"]]
+    else:
+        geo = _parcel_geometry_table(parcels, villages)
+    tab = _merge_tables(geo, _prediction_table(pred_df, classes))
+
+    if incremental:
+        old = prev["table"]
+        old_h = pd.Series(old["row_hash"].to_numpy(), index=old["id"].to_numpy())
+        new_h = pd.Series(tab["row_hash"].to_numpy(), index=tab["id"].to_numpy())
+        common = old_h.index.intersection(new_h.index)
+        differs = old_h.loc[common].to_numpy() != new_h.loc[common].to_numpy()
+        changed_ids = np.concatenate([
+            common.to_numpy()[differs],
+            old_h.index.difference(new_h.index).to_numpy(),
+            new_h.index.difference(old_h.index).to_numpy(),
+        ])
+        old_changed = old[old["id"].isin(changed_ids)]
+        new_changed = tab[tab["id"].isin(changed_ids)]
+        sums = prev["sums"]
+        minus = _village_sums(old_changed, n_v, n_c, sign=-1.0)
+        plus = _village_sums(new_changed, n_v, n_c)
+        sums = {k: sums[k] + minus[k] + plus[k] for k in sums}
+        touched = np.union1d(old_changed["village"].to_numpy(), new_changed["village"].to_numpy())
+        touched = touched[touched >= 0]
+        with open(json_path) as f:
+            rollups = json.load(f)
+    else:
+        changed_ids = tab.loc[tab["predicted"], "id"].to_numpy()
+        sums = _village_sums(tab, n_v, n_c)
+        touched = np.arange(n_v)
+        rollups = {}
+
+    # One pass over the parcels of the touched villages
+    by_village = dict(tuple(tab[tab["village"].isin(touched) & tab["predicted"]].groupby("village")))
+    for vi in touched.tolist():
+        name = names[vi]
+        area = float(sums["area"][vi])
+        class_area = {c: round(float(sums["class_area"][vi, ci]), 4) for ci, c in enumerate(classes)}
+        csv_path = os.path.join(actions_dir, f"actions_{_slug(name)}.csv")
+        actions = _village_actions(by_village.get(vi, tab.iloc[:0]), run_date, top_n)
+        _write_actions_csv(csv_path, actions)
+        rollups[name] = {
+            "name": name,
+            "parcels": int(round(sums["count"][vi])),
+            "area_ha": round(area, 4),
+            "class_area_ha": class_area,
+            "class_share": {c: (round(a / area, 4) if area > 0 else 0.0) for c, a in class_area.items()},
+            "anomalies": int(round(sums["anomalies"][vi])),
+            "actions": actions,
+            "csv": csv_path,
+            "updated": run_date,
+        }
+
+    with atomic_write(json_path) as tmp, open(tmp, "w") as f:
+        json.dump(rollups, f)
+    _save_state(state_path, tab, sums, geom_fp, classes, names)
+    return {
+        "villages": n_v,
+        "changed_parcels": int(len(changed_ids)),
+        "changed_villages": int(len(touched)),
+        "incremental": bool(incremental),
+        "path": json_path,
+    }
+
+
+def _save_state(path: str, tab: pd.DataFrame, sums: dict[str, np.ndarray], geom_fp: str, classes: list[str], names: list[str]) -> None:
+    with atomic_write(path, ".npz") as tmp:
+        np.savez(
+            tmp,
+            meta=np.array(json.dumps({"geom_fp": geom_fp, "classes": classes, "names": names})),
+            **{f"t_{c}": tab[c].to_numpy() for c in tab.columns},
+            **{f"s_{k}": v for k, v in sums.items()},
+        )
+
+
+def _load_state(path: str) -> dict[str, Any] | None:
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as z:
+            meta = json.loads(str(z["meta"]))
+            table = pd.DataFrame({k[2:]: z[k] for k in z.files if k.startswith("t_")})
+            sums = {k[2:]: z[k] for k in z.files if k.startswith("s_")}
+    except Exception:
+        return None
+    return {**meta, "table": table, "sums": sums}
@@ -4,21 +4,35 @@ import os
 import numpy as np
 
 from ..utils.io import ensure_dir
+from .radar import DEFAULT_ENL, despeckle, ratio_db, to_db
 
 
-def compute_s1_features(out_dir: str, shape: tuple[int, int] = (256, 256)) -> dict[str, str]:
+def synthetic_backscatter(xx: np.ndarray, yy: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Synthetic speckle-free VV and VH (linear power) and VV/VH (dB) at normalized (0-1) coordinates."""
+    vv = (0.1 + 0.05 * np.sin(4 * np.pi * xx)).astype(np.float32)
+    vh = (0.05 + 0.03 * np.cos(4 * np.pi * yy)).astype(np.float32)
+    return vv, vh, ratio_db(vv, vh)
+
+
+def compute_s1_features(out_dir: str, shape: tuple[int, int] = (256, 256), speckle: str = "refined_lee", seed: int = 0) -> dict[str, str]:
+    """VV and VH in dB and the VV/VH ratio in dB, from speckled linear backscatter.
+
+    Speckle is simulated as unit-mean gamma noise with the GRD's equivalent number of looks and
+    filtered (speckle="none" skips it) in linear power, before the dB conversion.
+    """
     ensure_dir(out_dir)
     h, w = shape
     x = np.linspace(0, 1, w)
     y = np.linspace(0, 1, h)
     xx, yy = np.meshgrid(x, y)
-    vv = (0.1 + 0.05 * np.sin(4 * np.pi * xx)).astype(np.float32)
-    vh = (0.05 + 0.03 * np.cos(4 * np.pi * yy)).astype(np.float32)
-    ratio = np.divide(vv, np.maximum(vh, 1e-3)).astype(np.float32)
+    vv, vh, _ = synthetic_backscatter(xx, yy)
+    rng = np.random.default_rng(seed)
+    vv, vh = (a * rng.gamma(DEFAULT_ENL, 1.0 / DEFAULT_ENL, a.shape).astype(np.float32) for a in (vv, vh))
+    if speckle != "none":
+        vv, vh = despeckle(vv, speckle), despeckle(vh, speckle)
     outputs: dict[str, str] = {}
-    for name, arr in {"vv": vv, "vh": vh, "vv_vh": ratio}.items():
+    for name, arr in {"vv": to_db(vv), "vh": to_db(vh), "vv_vh": ratio_db(vv, vh)}.items():
         path = os.path.join(out_dir, f"{name}.npy")
         np.save(path, arr)
         outputs[name] = path
     return outputs
-
@@ -18,7 +18,9 @@ def compute_s2_indices(interim_nc: str, out_dir: str) -> dict[str, str]:
     ndvi_arr = ndvi(nir, red)
     evi_arr = evi(nir, red, blue)
     ndwi_arr = ndwi(green, nir)
-    mndwi_arr = mndwi(green, red)  # placeholder swir1 not present; use red as stand-in
+    # SWIR1 (B11); scenes without it fall back to red as a stand-in
+    swir1 = ds["B11"].values if "B11" in ds else red
+    mndwi_arr = mndwi(green, swir1)
     # Save as small npy for simplicity
     outputs: dict[str, str] = {}
     for name, arr in {"ndvi": ndvi_arr, "evi": evi_arr, "ndwi": ndwi_arr, "mndwi": mndwi_arr}.items():
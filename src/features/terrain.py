@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+from typing import Optional
+
+import numpy as np
+
+from ..utils.io import atomic_write, ensure_dir, file_lock
+from ..utils.rasters import box_sum, grid_key, map_blocks, write_cog
+
+TERRAIN_LAYERS = ("slope", "aspect", "tpi")
+# Bump when the kernels change so cached terrain is recomputed
+_CACHE_VERSION = 2
+# Aspect is circular, so its overviews pick pixels instead of averaging them
+_OVERVIEW_RESAMPLING = {"slope": "average", "aspect": "nearest", "tpi": "average"}
+# Metres per degree (latitude; longitude at the equator) for geographic DEMs
+_M_PER_DEG_LAT = 110574.0
+_M_PER_DEG_LON = 111320.0
+
+
+def horn_slope_aspect(z: np.ndarray, xres, yres) -> tuple[np.ndarray, np.ndarray]:
+    """Slope (degrees) and aspect (degrees clockwise from north, NaN where flat) by Horn's method.
+
+    z carries a 1-pixel halo, so the output is 2 pixels smaller on each axis. xres/yres are
+    the pixel size in metres (xres may be a column vector for geographic DEMs). NaN
+    neighbours are replaced by the centre value; a NaN centre stays NaN.
+    """
+    e = z[1:-1, 1:-1]
+
+    def nb(r: int, c: int) -> np.ndarray:
+        v = z[r:r + e.shape[0], c:c + e.shape[1]]
+        return np.where(np.isnan(v), e, v)
+
+    a, b, c = nb(0, 0), nb(0, 1), nb(0, 2)
+    d, f = nb(1, 0), nb(1, 2)
+    g, h, i = nb(2, 0), nb(2, 1), nb(2, 2)
+    dzdx = ((c + 2 * f + i) - (a + 2 * d + g)) / (8 * xres)
+    dzdy = ((g + 2 * h + i) - (a + 2 * b + c)) / (8 * yres)
+    slope = np.degrees(np.arctan(np.hypot(dzdx, dzdy)))
+    aspect = np.mod(90.0 - np.degrees(np.arctan2(dzdy, -dzdx)), 360.0)
+    aspect[(dzdx == 0) & (dzdy == 0)] = np.nan
+    return slope.astype(np.float32), aspect.astype(np.float32)
+
+
+def topographic_position(z: np.ndarray, r: int) -> np.ndarray:
+    """TPI: elevation minus the mean of its (2r+1)^2 neighbourhood (centre excluded, NaN skipped).
+
+    z carries an r-pixel halo; box sums come from integral images so any radius is O(pixels).
+    """
+    valid = ~np.isnan(z)
+    sums = box_sum(np.where(valid, z, 0.0), r)
+    counts = box_sum(valid.astype(np.float32), r)
+    e = z[r:-r, r:-r]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (sums - np.nan_to_num(e)) / (counts - valid[r:-r, r:-r])
+    return (e - mean).astype(np.float32)
+
+
+def _pixel_size(ds, window) -> tuple[np.ndarray | float, float]:
+    """(xres, yres) in metres for the rows of window; geographic DEMs scale x by cos(latitude)."""
+    t = ds.transform
+    if ds.crs is not None and ds.crs.is_geographic:
+        rows = window.row_off + np.arange(window.height) + 0.5
+        lat = np.radians(t.f + rows * t.e)
+        return (abs(t.a) * _M_PER_DEG_LON * np.cos(lat))[:, None], abs(t.e) * _M_PER_DEG_LAT
+    return abs(t.a), abs(t.e)
+
+
+def _compute_native(dem_path: str, out_paths: dict[str, str], tpi_radius: int, block: int, workers: Optional[int]) -> None:
+    """Terrain on the DEM's own grid, block by block on a thread pool.
+
+    Each block is read with a halo of max(1, tpi_radius) pixels so kernels at block seams see
+    the same neighbours as anywhere else; map_blocks handles the threads and the COG output.
+    """
+    halo = max(1, tpi_radius)
+
+    def work(z, ds, window) -> dict[str, np.ndarray]:
+        xres, yres = _pixel_size(ds, window)
+        core = z[halo - 1:z.shape[0] - halo + 1, halo - 1:z.shape[1] - halo + 1]
+        slope, aspect = horn_slope_aspect(core, xres, yres)
+        return {"slope": slope, "aspect": aspect, "tpi": topographic_position(z, halo)}
+
+    map_blocks(dem_path, out_paths, work, halo=halo, block=block, workers=workers, resampling=_OVERVIEW_RESAMPLING)
+
+
+def _align(src_paths: dict[str, str], like: str, out_paths: dict[str, str], cache_dir: str) -> None:
+    """Warp terrain layers onto the grid of the `like` raster (e.g. the S2 index grid).
+
+    The layers share the DEM grid, so one reprojection plan serves all three.
+    """
+    import rasterio
+
+    from ..utils.reproject import dataset_plan
+
+    with rasterio.open(like) as ref:
+        crs, transform, shape = ref.crs, ref.transform, ref.shape
+    for name, path in src_paths.items():
+        # Aspect is circular: averaging 359 and 1 degrees must not give 180
+        method = "nearest" if name == "aspect" else "bilinear"
+        with rasterio.open(path) as src:
+            plan = dataset_plan(src, crs, transform, shape, cache_dir=cache_dir)
+            part, window = plan.read(src, resampling=method)
+        out = np.full(shape, np.nan, dtype=np.float32) if part is None else plan.apply(part, window, method=method)
+        write_cog(out, out_paths[name], crs, transform, resampling=_OVERVIEW_RESAMPLING[name])
+
+
+def file_checksum(path: str, cache_dir: str) -> str:
+    """sha1 of the file's bytes, remembered per (path, size, mtime) so an unchanged DEM is hashed once."""
+    memo_path = os.path.join(cache_dir, "checksums.json")
+    st = os.stat(path)
+    key = os.path.abspath(path)
+    stamp = [st.st_size, st.st_mtime_ns]
+    try:
+        with open(memo_path) as f:
+            memo = json.load(f)
+    except (FileNotFoundError, ValueError):
+        memo = {}
+    entry = memo.get(key)
+    if entry and entry["stamp"] == stamp:
+        return entry["sha1"]
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    memo[key] = {"stamp": stamp, "sha1": h.hexdigest()}
+    with atomic_write(memo_path) as tmp, open(tmp, "w") as f:
+        json.dump(memo, f)
+    return memo[key]["sha1"]
+
+
+def _grid_key(like: str) -> str:
+    import rasterio
+
+    with rasterio.open(like) as ref:
+        return grid_key(ref)
+
+
+def _publish(paths: dict[str, str], out_dir: str) -> dict[str, str]:
+    """Hard-link (or copy) cached layers into out_dir/<layer>.tif."""
+    ensure_dir(out_dir)
+    out: dict[str, str] = {}
+    for name, path in paths.items():
+        dst = os.path.join(out_dir, f"{name}.tif")
+        if os.path.exists(dst):
+            os.remove(dst)
+        try:
+            os.link(path, dst)
+        except OSError:
+            shutil.copyfile(path, dst)
+        out[name] = dst
+    return out
+
+
+def compute_terrain(
+    dem_path: str,
+    out_dir: str,
+    like: Optional[str] = None,
+    tpi_radius: int = 5,
+    block: int = 1024,
+    workers: Optional[int] = None,
+    cache_dir: Optional[str] = None,
+) -> dict[str, str]:
+    """Slope, aspect and TPI GeoTIFFs for a DEM, optionally warped onto the grid of `like`.
+
+    Terrain does not change between runs, so results are cached under cache_dir by DEM
+    checksum and TPI radius (plus the target grid for aligned layers) and only linked into
+    out_dir on later runs. Block size and worker count do not change the result.
+    """
+    from ..config import settings
+
+    if tpi_radius < 1:
+        raise ValueError("tpi_radius must be at least 1 pixel")
+    cache_dir = ensure_dir(cache_dir or settings.terrain_cache_dir)
+    key = hashlib.sha1(f"{file_checksum(dem_path, cache_dir)}:{tpi_radius}:{_CACHE_VERSION}".encode()).hexdigest()[:16]
+    native_dir = os.path.join(cache_dir, key)
+    native = {name: os.path.join(native_dir, f"{name}.tif") for name in TERRAIN_LAYERS}
+    target_dir = native_dir if like is None else os.path.join(native_dir, f"grid-{_grid_key(like)}")
+    target = {name: os.path.join(target_dir, f"{name}.tif") for name in TERRAIN_LAYERS}
+    if not all(os.path.exists(p) for p in target.values()):
+        # Concurrent runs on the same DEM: one computes, the others wait and reuse
+        with file_lock(os.path.join(cache_dir, f"{key}.lock")):
+            if not all(os.path.exists(p) for p in native.values()):
+                tmp_dir = ensure_dir(f"{native_dir}.{os.getpid()}.tmp")
+                try:
+                    _compute_native(dem_path, {n: os.path.join(tmp_dir, f"{n}.tif") for n in TERRAIN_LAYERS}, tpi_radius, block, workers)
+                    shutil.rmtree(native_dir, ignore_errors=True)
+                    os.rename(tmp_dir, native_dir)
+                finally:
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+            if like is not None and not all(os.path.exists(p) for p in target.values()):
+                tmp_dir = ensure_dir(f"{target_dir}.{os.getpid()}.tmp")
+                try:
+                    _align(native, like, {n: os.path.join(tmp_dir, f"{n}.tif") for n in TERRAIN_LAYERS}, os.path.join(cache_dir, "plans"))
+                    shutil.rmtree(target_dir, ignore_errors=True)
+                    os.rename(tmp_dir, target_dir)
+                finally:
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+    return _publish(target, out_dir)
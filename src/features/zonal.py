@@ -0,0 +1,368 @@
+"""Out-of-core zonal statistics: per-parcel sketches built window by window and merged.
+
+`aggregate_to_parcels` needs every raster and the parcel id raster in memory. Here the
+rasters are walked in windows and each window folds into a `ZonalSketch`, a per-parcel
+summary that merges exactly across windows, worker processes or saved files:
+
+- count, sum and sum of squares (of values minus the centre of the layer's range, which
+  keeps the variance well conditioned for e.g. LST in Kelvin) give mean and std exactly;
+- min and max;
+- a histogram over fixed bins of the layer's value range (VALUE_RANGES), stored sparsely as
+  (parcel, bin) -> count, so a parcel costs only the bins its values fall in.
+
+Percentile error: p50/p90 are read off the histogram, treating each bin's values as evenly
+spread and clamping to the parcel's min/max. Every order statistic lands in the bin of the
+true one, so for values inside the range the error is at most one bin width,
+(hi - lo) / bins: 2/512 ~ 0.004 for the indices, 0.2 K for LST with the defaults. Values
+outside the range are counted in the edge bins, so their percentiles are only bounded by
+the parcel's min/max. Mean and std match the in-memory path up to float64 rounding.
+
+Memory: one window of every raster (block x block pixels) plus the sketch, which is
+O(parcels x distinct bins per parcel) and never more than O(parcels x bins).
+"""
+from __future__ import annotations
+
+from typing import Any, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from ..utils.io import atomic_write
+
+DEFAULT_BINS = 512
+# (lo, hi) of each layer's histogram; percentiles are exact to (hi - lo) / bins inside it
+VALUE_RANGES: dict[str, tuple[float, float]] = {
+    "ndvi": (-1.0, 1.0),
+    "ndwi": (-1.0, 1.0),
+    "mndwi": (-1.0, 1.0),
+    # VV/VH in dB (VV dB - VH dB) in both pipelines
+    "vv_vh": (-10.0, 20.0),
+    "lst": (250.0, 350.0),
+}
+# Pending window sketches are folded in once they hold this many entries (or as many as the sketch)
+_COMPACT_MIN = 1 << 20
+# Columns of ZonalSketch.moments
+_N, _S1, _S2, _MIN, _MAX = range(5)
+
+
+class ZonalSketch:
+    """Mergeable per-parcel statistics for a set of layers (see module docstring).
+
+    update() folds in one window of pixels; merge() combines sketches built elsewhere.
+    Merging is exact, so any split of the pixels into windows or workers gives the
+    same result.
+    """
+
+    def __init__(self, ranges: dict[str, tuple[float, float]], bins: int = DEFAULT_BINS):
+        self.ranges = {name: (float(lo), float(hi)) for name, (lo, hi) in ranges.items()}
+        self.bins = int(bins)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.moments = {name: np.empty((0, 5)) for name in self.ranges}
+        # Sorted keys id * bins + bin, and their pixel counts
+        self.hist = {name: (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)) for name in self.ranges}
+        self._pending: list[ZonalSketch] = []
+
+    @classmethod
+    def from_pixels(cls, ids: np.ndarray, values: dict[str, np.ndarray], ranges: dict[str, tuple[float, float]], bins: int = DEFAULT_BINS) -> "ZonalSketch":
+        """Sketch of one window: ids (parcel id per pixel, -1 for none) and each layer's values."""
+        sk = cls(ranges, bins)
+        flat = np.asarray(ids).ravel()
+        keep = flat >= 0
+        if not keep.any():
+            return sk
+        if int(flat.max()) >= np.iinfo(np.int64).max // sk.bins:
+            raise ValueError("Parcel ids too large for the histogram keys")
+        pid = flat[keep].astype(np.int64)
+        lo_id, hi_id = int(pid.min()), int(pid.max())
+        if hi_id - lo_id < 4 * len(pid):
+            # Ids in a window are usually a compact range: a lookup table avoids sorting the pixels
+            present = np.bincount(pid - lo_id, minlength=hi_id - lo_id + 1) > 0
+            uniq = np.flatnonzero(present) + lo_id
+            inv = (np.cumsum(present) - 1)[pid - lo_id]
+        else:
+            uniq, inv = np.unique(pid, return_inverse=True)
+        n = len(uniq)
+        sk.ids = uniq.astype(np.int64)
+        for name, (lo, hi) in sk.ranges.items():
+            v = np.asarray(values[name]).ravel()[keep].astype(np.float64)
+            ok = np.isfinite(v)
+            vi, v = inv[ok], v[ok]
+            d = v - 0.5 * (lo + hi)
+            m = np.empty((n, 5))
+            m[:, _N] = np.bincount(vi, minlength=n)
+            m[:, _S1] = np.bincount(vi, weights=d, minlength=n)
+            m[:, _S2] = np.bincount(vi, weights=d * d, minlength=n)
+            m[:, _MIN] = np.inf
+            m[:, _MAX] = -np.inf
+            np.minimum.at(m[:, _MIN], vi, v)
+            np.maximum.at(m[:, _MAX], vi, v)
+            sk.moments[name] = m
+
+            b = np.clip(np.floor((v - lo) * (sk.bins / (hi - lo))), 0, sk.bins - 1).astype(np.int64)
+            local = vi.astype(np.int64) * sk.bins + b
+            if n * sk.bins <= 8 * max(1, len(local)):
+                counts = np.bincount(local, minlength=n * sk.bins)
+                nz = np.flatnonzero(counts)
+                sk.hist[name] = (uniq[nz // sk.bins] * sk.bins + nz % sk.bins, counts[nz])
+            else:
+                lk, lc = np.unique(local, return_counts=True)
+                sk.hist[name] = (uniq[lk // sk.bins] * sk.bins + lk % sk.bins, lc)
+        return sk
+
+    def update(self, ids: np.ndarray, values: dict[str, np.ndarray]) -> None:
+        self.merge([ZonalSketch.from_pixels(ids, values, self.ranges, self.bins)], defer=True)
+
+    def merge(self, others: Sequence["ZonalSketch"], defer: bool = False) -> "ZonalSketch":
+        """Fold other sketches (same layers, ranges and bins) into this one.
+
+        With defer=True small sketches are queued and folded in batches, so walking many
+        windows costs O(total entries x log) rather than a full merge per window.
+        """
+        for other in others:
+            if other.ranges != self.ranges or other.bins != self.bins:
+                raise ValueError("Cannot merge sketches with different layers, ranges or bins")
+            self._pending.extend(other._pending)
+            other._pending = []
+            self._pending.append(other)
+        if not defer or self._pending_size() > max(_COMPACT_MIN, self._size()):
+            self._compact()
+        return self
+
+    def _size(self) -> int:
+        return len(self.ids) + sum(len(k) for k, _ in self.hist.values())
+
+    def _pending_size(self) -> int:
+        return sum(p._size() for p in self._pending)
+
+    def _compact(self) -> None:
+        parts = [self] + [p for p in self._pending if len(p.ids)]
+        self._pending = []
+        if len(parts) == 1:
+            return
+        ids = np.concatenate([p.ids for p in parts])
+        order = np.argsort(ids, kind="stable")
+        ids = ids[order]
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        for name in self.ranges:
+            m = np.concatenate([p.moments[name] for p in parts])[order]
+            merged = np.empty((len(starts), 5))
+            merged[:, :_MIN] = np.add.reduceat(m[:, :_MIN], starts, axis=0)
+            merged[:, _MIN] = np.fmin.reduceat(m[:, _MIN], starts)
+            merged[:, _MAX] = np.fmax.reduceat(m[:, _MAX], starts)
+            self.moments[name] = merged
+            keys, inv = np.unique(np.concatenate([p.hist[name][0] for p in parts]), return_inverse=True)
+            counts = np.bincount(inv, weights=np.concatenate([p.hist[name][1] for p in parts]), minlength=len(keys))
+            self.hist[name] = (keys, counts.astype(np.int64))
+        self.ids = ids[starts]
+
+    def percentiles(self, name: str, qs: Sequence[float]) -> np.ndarray:
+        """(len(ids), len(qs)) percentiles (0-100) of one layer, linear interpolation like np.nanpercentile."""
+        self._compact()
+        lo, hi = self.ranges[name]
+        width = (hi - lo) / self.bins
+        m = self.moments[name]
+        n = m[:, _N].astype(np.int64)
+        keys, counts = self.hist[name]
+        out = np.full((len(self.ids), len(qs)), np.nan)
+        has = n > 0
+        if not has.any():
+            return out
+        cum = np.cumsum(counts)
+        first = np.searchsorted(keys, self.ids[has] * self.bins)
+        offset = np.where(first > 0, cum[np.maximum(first - 1, 0)], 0)
+        nh = n[has]
+        vmin, vmax = m[has, _MIN], m[has, _MAX]
+
+        def order_stat(i: np.ndarray) -> np.ndarray:
+            # i-th smallest value (0-based) of each parcel: its bin, spread evenly within the bin
+            e = np.searchsorted(cum, offset + i, side="right")
+            before = cum[e] - counts[e]
+            frac = (offset + i - before + 0.5) / counts[e]
+            return np.clip(lo + (keys[e] % self.bins + frac) * width, vmin, vmax)
+
+        for j, q in enumerate(qs):
+            pos = (nh - 1) * (q / 100.0)
+            k = np.floor(pos).astype(np.int64)
+            a = order_stat(k)
+            b = order_stat(np.minimum(k + 1, nh - 1))
+            out[has, j] = a + (pos - k) * (b - a)
+        return out
+
+    def to_frame(self) -> pd.DataFrame:
+        """Feature rows in the layout of aggregate_to_parcels: id, then <layer>_p50/p90/mean/std."""
+        self._compact()
+        cols: dict[str, Any] = {"id": self.ids}
+        for name, (lo, hi) in self.ranges.items():
+            m = self.moments[name]
+            n = m[:, _N]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean_d = m[:, _S1] / n
+                var = np.maximum(m[:, _S2] / n - mean_d * mean_d, 0.0)
+            p = self.percentiles(name, (50, 90))
+            cols[f"{name}_p50"] = p[:, 0]
+            cols[f"{name}_p90"] = p[:, 1]
+            cols[f"{name}_mean"] = np.where(n > 0, mean_d + 0.5 * (lo + hi), np.nan)
+            cols[f"{name}_std"] = np.where(n > 0, np.sqrt(var), np.nan)
+        return pd.DataFrame(cols)
+
+    def save(self, path: str) -> None:
+        self._compact()
+        arrays: dict[str, np.ndarray] = {"ids": self.ids, "bins": np.asarray(self.bins), "names": np.asarray(list(self.ranges), dtype=str)}
+        for name, rng in self.ranges.items():
+            arrays[f"{name}:range"] = np.asarray(rng)
+            arrays[f"{name}:moments"] = self.moments[name]
+            arrays[f"{name}:keys"], arrays[f"{name}:counts"] = self.hist[name]
+        with atomic_write(path, ".npz") as tmp:
+            np.savez(tmp, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "ZonalSketch":
+        with np.load(path) as z:
+            names = [str(n) for n in z["names"]]
+            sk = cls({name: tuple(z[f"{name}:range"].tolist()) for name in names}, int(z["bins"]))
+            sk.ids = z["ids"]
+            for name in names:
+                sk.moments[name] = z[f"{name}:moments"]
+                sk.hist[name] = (z[f"{name}:keys"], z[f"{name}:counts"])
+        return sk
+
+
+def _layer_ranges(names: Sequence[str], ranges: Optional[dict[str, tuple[float, float]]]) -> dict[str, tuple[float, float]]:
+    ranges = {**VALUE_RANGES, **(ranges or {})}
+    missing = [n for n in names if n not in ranges]
+    if missing:
+        raise ValueError(f"No value range for layers {missing}; pass ranges={{name: (lo, hi)}}")
+    return {n: ranges[n] for n in names}
+
+
+class ParcelRasterizer:
+    """Parcel ids of any window of a raster grid, from polygons packed as (WKB array, ids).
+
+    Polygons are kept in an STRtree and only those touching a window are burned, by pixel
+    centre like rasterio.features.rasterize. The packed form pickles cheaply to workers.
+    """
+
+    def __init__(self, parcels: tuple[np.ndarray, np.ndarray]):
+        import shapely
+
+        self.geoms = shapely.from_wkb(parcels[0])
+        self.parcel_ids = parcels[1]
+        self.tree = shapely.STRtree(self.geoms)
+
+    @staticmethod
+    def pack(parcels, crs=None) -> tuple[np.ndarray, np.ndarray]:
+        """(WKB, ids) of a GeoDataFrame with an `id` column, reprojected to crs when given."""
+        import shapely
+
+        p = parcels.to_crs(crs) if crs is not None else parcels
+        return shapely.to_wkb(np.asarray(p.geometry.values)), p["id"].to_numpy(dtype=np.int64)
+
+    def ids(self, transform, width: int, height: int) -> Optional[np.ndarray]:
+        """int64 parcel id per pixel (-1 outside parcels) of a window with this transform; None if no parcel touches it."""
+        import shapely
+        from rasterio.features import rasterize
+
+        (x0, x1), (y0, y1) = zip(transform @ (0, 0), transform @ (width, height))
+        hits = self.tree.query(shapely.box(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)))
+        if not len(hits):
+            return None
+        index = rasterize(zip(self.geoms[hits], range(len(hits))), out_shape=(height, width), transform=transform, fill=-1, dtype="int32")
+        return np.where(index >= 0, self.parcel_ids[hits][np.maximum(index, 0)], -1)
+
+
+def _sketch_windows(
+    raster_paths: dict[str, str],
+    windows: list[tuple[int, int, int, int]],
+    ranges: dict[str, tuple[float, float]],
+    bins: int,
+    parcels: Optional[tuple[np.ndarray, np.ndarray]],
+    id_raster: Optional[str],
+) -> ZonalSketch:
+    """One worker: sketch of the given (col, row, width, height) windows."""
+    import rasterio
+    from affine import Affine
+    from rasterio.windows import Window
+
+    sketch = ZonalSketch(ranges, bins)
+    srcs = {name: rasterio.open(path) for name, path in raster_paths.items()}
+    id_src = rasterio.open(id_raster) if id_raster else None
+    try:
+        ref = next(iter(srcs.values()))
+        rasterizer = ParcelRasterizer(parcels) if parcels is not None else None
+        for col, row, width, height in windows:
+            window = Window(col, row, width, height)
+            if id_src is not None:
+                ids = id_src.read(1, window=window).astype(np.int64)
+            else:
+                ids = rasterizer.ids(ref.transform @ Affine.translation(col, row), width, height)
+            if ids is None or not (ids >= 0).any():
+                continue
+            values = {}
+            for name, src in srcs.items():
+                v = src.read(1, window=window, out_dtype="float32")
+                if src.nodata is not None and not np.isnan(src.nodata):
+                    v[v == np.float32(src.nodata)] = np.nan
+                values[name] = v
+            sketch.update(ids, values)
+    finally:
+        for src in srcs.values():
+            src.close()
+        if id_src is not None:
+            id_src.close()
+    sketch._compact()
+    return sketch
+
+
+def zonal_sketch(
+    raster_paths: dict[str, str],
+    parcels=None,
+    id_raster: Optional[str] = None,
+    ranges: Optional[dict[str, tuple[float, float]]] = None,
+    bins: int = DEFAULT_BINS,
+    block: int = 1024,
+    workers: int = 1,
+) -> ZonalSketch:
+    """Sketch of every parcel over rasters that share one grid, read window by window.
+
+    Parcels come either as polygons (GeoDataFrame with an `id` column, rasterized per
+    window by pixel centre like rasterio.features.rasterize) or as an id raster on the same
+    grid (-1 = no parcel). With workers > 1 the windows are split into contiguous row
+    bands, one per process, and the workers' sketches are merged.
+    """
+    import rasterio
+
+    from ..utils.rasters import block_windows, grid_key
+
+    if (parcels is None) == (id_raster is None):
+        raise ValueError("Pass exactly one of parcels or id_raster")
+    ranges = _layer_ranges(list(raster_paths), ranges)
+    paths = list(raster_paths.values()) + ([id_raster] if id_raster else [])
+    grids = set()
+    for path in paths:
+        with rasterio.open(path) as src:
+            grids.add(grid_key(src))
+            crs, width, height = src.crs, src.width, src.height
+    if len(grids) > 1:
+        raise ValueError("Zonal rasters must share one grid")
+    packed = None
+    if parcels is not None:
+        packed = ParcelRasterizer.pack(parcels, crs)
+    windows = [(int(w.col_off), int(w.row_off), int(w.width), int(w.height)) for w in block_windows(width, height, block)]
+    workers = max(1, min(workers, len(windows)))
+    if workers == 1:
+        return _sketch_windows(raster_paths, windows, ranges, bins, packed, id_raster)
+
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Contiguous row bands keep most parcels inside one worker, which keeps the sketches small
+    step = -(-len(windows) // workers)
+    chunks = [windows[i:i + step] for i in range(0, len(windows), step)]
+    with ProcessPoolExecutor(max_workers=len(chunks), mp_context=multiprocessing.get_context("spawn")) as pool:
+        parts = list(pool.map(_sketch_windows, *zip(*[(raster_paths, c, ranges, bins, packed, id_raster) for c in chunks])))
+    return parts[0].merge(parts[1:])
+
+
+def zonal_stats_windowed(raster_paths: dict[str, str], parcels=None, id_raster: Optional[str] = None, **kwargs) -> pd.DataFrame:
+    """Out-of-core aggregate_to_parcels over GeoTIFFs: the same columns, from a ZonalSketch."""
+    return zonal_sketch(raster_paths, parcels=parcels, id_raster=id_raster, **kwargs).to_frame()
@@ -5,7 +5,7 @@ from typing import List
 import requests
 
 from .stac_search import STACItem
-from ..utils.io import ensure_dir
+from ..utils.io import atomic_write, ensure_dir
 
 
 def download_assets(items: List[STACItem], out_dir: str) -> List[str]:
@@ -16,10 +16,14 @@ def download_assets(items: List[STACItem], out_dir: str) -> List[str]:
         os.makedirs(item_dir, exist_ok=True)
         for name, href in it.assets.items():
             fname = os.path.join(item_dir, f"{name}.tif")
+            if os.path.exists(fname):
+                # Already fetched (out_dir may be a cache shared between runs)
+                paths.append(fname)
+                continue
             try:
-                with requests.get(href, stream=True, timeout=60) as r:
+                with atomic_write(fname) as tmp, requests.get(href, stream=True, timeout=60) as r:
                     r.raise_for_status()
-                    with open(fname, "wb") as f:
+                    with open(tmp, "wb") as f:
                         for chunk in r.iter_content(chunk_size=8192):
                             if chunk:
                                 f.write(chunk)
@@ -9,11 +9,19 @@ import xarray as xr
 from ..utils.io import ensure_dir
 
 
-def synthetic_scene(width: int = 256, height: int = 256, bands: Dict[str, float] | None = None) -> xr.Dataset:
+def synthetic_scene(
+    width: int = 256,
+    height: int = 256,
+    bands: Dict[str, float] | None = None,
+    x: np.ndarray | None = None,
+    y: np.ndarray | None = None,
+) -> xr.Dataset:
+    """x/y are the normalized (0-1 across the AOI) column/row coordinates; shards pass their
+    slice of the AOI-wide axes so neighbouring shards line up."""
     if bands is None:
-        bands = {"B02": 0.1, "B03": 0.15, "B04": 0.2, "B08": 0.6, "SCL": 5}
-    y = np.linspace(0, 1, height)
-    x = np.linspace(0, 1, width)
+        bands = {"B02": 0.1, "B03": 0.15, "B04": 0.2, "B08": 0.6, "B11": 0.25, "SCL": 5}
+    y = np.linspace(0, 1, height) if y is None else y
+    x = np.linspace(0, 1, width) if x is None else x
     xx, yy = np.meshgrid(x, y)
     data_vars = {}
     for b, base in bands.items():
@@ -23,11 +31,12 @@ def synthetic_scene(width: int = 256, height: int = 256, bands: Dict[str, float]
     return ds
 
 
-def preprocess_to_interim(aoi_path: str, raw_dir: str, interim_dir: str) -> str:
-    # Offline synthetic dataset
+def preprocess_to_interim(aoi_path: str, raw_dir: str, interim_dir: str, shape: tuple[int, int] = (256, 256)) -> str:
+    # Offline synthetic dataset; shape is (height, width)
     ensure_dir(interim_dir)
     out_nc = os.path.join(interim_dir, "synthetic_s2.nc")
-    ds = synthetic_scene()
+    h, w = shape
+    ds = synthetic_scene(width=w, height=h)
     ds.to_netcdf(out_nc)
     return out_nc
 
@@ -1,11 +1,18 @@
 from __future__ import annotations
 
+import hashlib
+import json
+import os
 from dataclasses import dataclass
 from typing import List, Dict, Any, Optional
 import geopandas as gpd
 from shapely.geometry import mapping
 from pystac_client import Client
 
+from ..utils.io import atomic_write
+
+STAC_URL = "https://earth-search.aws.element84.com/v1"
+
 
 @dataclass
 class STACItem:
@@ -20,36 +27,56 @@ def _pick(keys: set[str], candidates: list[str]) -> Optional[str]:
     return None
 
 
-def search_s2(aoi_geojson_path: str, start: str, end: str, limit: int = 2) -> List[STACItem]:
+def cached_items(collection: str, geom: Dict[str, Any], start: str, end: str, limit: int, cache_dir: Optional[str] = None) -> List[Dict[str, Any]]:
+    """STAC item dicts for a search, cached as JSON under cache_dir keyed by the query.
+
+    Runs over the same AOI/period (e.g. a batch ingest with a shared cache) hit the
+    catalog once.
+    """
+    key = json.dumps([STAC_URL, collection, geom, start, end, limit], sort_keys=True)
+    path = None
+    if cache_dir:
+        path = os.path.join(cache_dir, f"{collection}-{hashlib.sha1(key.encode()).hexdigest()[:16]}.json")
+        if os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+    client = Client.open(STAC_URL)
+    search = client.search(collections=[collection], intersects=geom, datetime=f"{start}/{end}")
+    items = [it.to_dict() for it in list(search.get_items())[:limit]]
+    if path is not None:
+        with atomic_write(path) as tmp, open(tmp, "w") as f:
+            json.dump(items, f)
+    return items
+
+
+def search_s2(aoi_geojson_path: str, start: str, end: str, limit: int = 2, cache_dir: Optional[str] = None) -> List[STACItem]:
     gdf = gpd.read_file(aoi_geojson_path).to_crs(4326)
     geom = mapping(gdf.iloc[0].geometry)
-    client = Client.open("https://earth-search.aws.element84.com/v1")
-    search = client.search(collections=["sentinel-2-l2a"], intersects=geom, datetime=f"{start}/{end}")
     items = []
-    for it in list(search.get_items())[:limit]:
-        keys = set(it.assets.keys())
+    for it in cached_items("sentinel-2-l2a", geom, start, end, limit, cache_dir):
+        hrefs = {k: v["href"] for k, v in it["assets"].items()}
+        keys = set(hrefs)
         name_map = {
             "blue": _pick(keys, ["B02", "blue", "B2", "coastal" ]),
             "green": _pick(keys, ["B03", "green", "B3" ]),
             "red": _pick(keys, ["B04", "red", "B4" ]),
             "nir": _pick(keys, ["B08", "nir", "B8", "B08_10m", "B8A" ]),
+            "swir16": _pick(keys, ["B11", "swir16"]),
             "scl": _pick(keys, ["SCL", "scl"]),
         }
         assets: Dict[str, str] = {}
         for norm, orig in name_map.items():
-            if orig and orig in it.assets:
-                assets[norm] = it.assets[orig].href
-        items.append(STACItem(id=it.id, assets=assets))
+            if orig and orig in hrefs:
+                assets[norm] = hrefs[orig]
+        items.append(STACItem(id=it["id"], assets=assets))
     return items
 
 
-def search_s1(aoi_geojson_path: str, start: str, end: str, limit: int = 2) -> List[STACItem]:
+def search_s1(aoi_geojson_path: str, start: str, end: str, limit: int = 2, cache_dir: Optional[str] = None) -> List[STACItem]:
     gdf = gpd.read_file(aoi_geojson_path).to_crs(4326)
     geom = mapping(gdf.iloc[0].geometry)
-    client = Client.open("https://earth-search.aws.element84.com/v1")
-    search = client.search(collections=["sentinel-1-grd"], intersects=geom, datetime=f"{start}/{end}")
     items = []
-    for it in list(search.get_items())[:limit]:
-        assets = {k: v.href for k, v in it.assets.items() if k.lower() in {"vv", "vh"}}
-        items.append(STACItem(id=it.id, assets=assets))
+    for it in cached_items("sentinel-1-grd", geom, start, end, limit, cache_dir):
+        assets = {k: v["href"] for k, v in it["assets"].items() if k.lower() in {"vv", "vh"}}
+        items.append(STACItem(id=it["id"], assets=assets))
     return items
@@ -0,0 +1,98 @@
+"""Run manifest: what a pipeline run published, so the API can serve it from memory.
+
+The pipeline writes `manifest.json` (settings.manifest_path) at the end of every run:
+
+- run: source, AOI, dates, creation time and per-stage timings;
+- bounds (lon/lat minx, miny, maxx, maxy) and Leaflet overlay_bounds ([[s, w], [n, e]]);
+- layers: per layer its kind ("xyz" tiles, "mvt" vector tiles or "raster" for query-only
+  rasters), tile URL template, zoom range, tile count and bytes, colormap and stretch,
+  overlay image URL, and global statistics of its raster (min/max/mean/std exact from GDAL,
+  percentiles from one decimated read that uses the COG overviews).
+
+The API keeps it parsed (api/json_cache.py) and reloads it on /ingest or when the file
+changes, so /layers and /overlay never touch a raster or a vector file per request.
+"""
+from __future__ import annotations
+
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Iterator, Optional, Sequence
+
+import numpy as np
+
+from .utils.io import atomic_write
+from .utils.tile_formats import tile_ext
+
+MANIFEST_VERSION = 1
+# Percentiles recorded per raster, from a read of at most STATS_MAX_PIXELS
+STATS_PERCENTILES = (2, 50, 98)
+STATS_MAX_PIXELS = 1024 * 1024
+
+
+def raster_stats(path: str, percentiles: Sequence[float] = STATS_PERCENTILES, max_pixels: int = STATS_MAX_PIXELS) -> dict[str, Any]:
+    """Global statistics of band 1: exact min/max/mean/std, approximate percentiles, valid share."""
+    import rasterio
+
+    # No .aux.xml next to the rasters for the statistics GDAL computes
+    with rasterio.Env(GDAL_PAM_ENABLED="NO"), rasterio.open(path) as src:
+        scale = max(1.0, (src.width * src.height / max_pixels) ** 0.5)
+        out_shape = (max(1, int(src.height / scale)), max(1, int(src.width / scale)))
+        arr = src.read(1, out_shape=out_shape, masked=True).astype(np.float32).filled(np.nan)
+        valid = np.isfinite(arr)
+        out: dict[str, Any] = {"valid_fraction": float(valid.mean())}
+        if not valid.any():
+            return out
+        st = src.stats(indexes=1, approx=False)[0]
+        out.update({"min": st.min, "max": st.max, "mean": st.mean, "std": st.std})
+        out.update({f"p{q:g}": float(v) for q, v in zip(percentiles, np.percentile(arr[valid], percentiles))})
+    return out
+
+
+class RunManifest:
+    """Collects a run's layers and stage timings, then writes them atomically."""
+
+    def __init__(self, source: str, aoi_path: str, start: str, end: str, bounds: Sequence[float]):
+        minx, miny, maxx, maxy = (float(b) for b in bounds)
+        self.data: dict[str, Any] = {
+            "version": MANIFEST_VERSION,
+            "run": {"source": source, "aoi": aoi_path, "start": start, "end": end, "timings_s": {}},
+            "bounds": [minx, miny, maxx, maxy],
+            "overlay_bounds": [[miny, minx], [maxy, maxx]],
+            "layers": {},
+        }
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            timings = self.data["run"]["timings_s"]
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - t0
+
+    def add_layer(self, name: str, kind: str = "xyz", raster_path: Optional[str] = None, zooms: Optional[Sequence[int]] = None, tile_stats: Optional[dict] = None, fmt: str = "png", **info: Any) -> dict:
+        """Record a layer; with raster_path its global statistics, with tile_stats (from the tiler) its tile count."""
+        layer: dict[str, Any] = {"kind": kind, "bounds": self.data["bounds"], **info}
+        if kind == "xyz":
+            layer["url"] = f"/tiles/{name}/{{z}}/{{x}}/{{y}}.{tile_ext(fmt)}"
+        if zooms:
+            layer["minzoom"], layer["maxzoom"] = int(min(zooms)), int(max(zooms))
+        if tile_stats is not None:
+            layer["tiles"] = int(tile_stats.get("tiles", 0))
+            layer["tile_bytes"] = int(tile_stats.get("bytes", 0))
+        if raster_path and os.path.exists(raster_path):
+            layer["stats"] = raster_stats(raster_path)
+        self.data["layers"][name] = {**self.data["layers"].get(name, {}), **layer}
+        return layer
+
+    def save(self, path: str) -> str:
+        run = self.data["run"]
+        run["timings_s"]["total"] = time.perf_counter() - self._t0
+        run["created"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        with atomic_write(path) as tmp, open(tmp, "w") as f:
+            json.dump(self.data, f, indent=2)
+        return path
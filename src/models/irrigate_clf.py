@@ -8,7 +8,7 @@ from sklearn.ensemble import GradientBoostingClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report
 
-from ..utils.io import ensure_dir
+from ..utils.io import atomic_write, ensure_dir, file_lock
 
 
 FEATURES = [
@@ -16,6 +16,9 @@ FEATURES = [
     "ndwi_p50", "ndwi_p90", "ndwi_mean", "ndwi_std",
     "vv_vh_p50", "vv_vh_p90", "vv_vh_mean", "vv_vh_std",
 ]
+# Bump when a feature's definition or units change; models saved under another schema are retrained.
+# 2: vv_vh is the VV - VH difference in dB (was the linear VV/VH ratio)
+FEATURE_SCHEMA = 2
 
 
 def weak_labels(df: pd.DataFrame) -> pd.Series:
@@ -29,8 +32,22 @@ def weak_labels(df: pd.DataFrame) -> pd.Series:
 def train_or_load(features_csv: str, model_dir: str) -> str:
     ensure_dir(model_dir)
     model_path = os.path.join(model_dir, "irrigate_clf.pkl")
-    if os.path.exists(model_path):
+    if _is_current(model_path):
         return model_path
+    # model_dir may be shared by concurrent runs: the first one trains, the others wait and load
+    with file_lock(model_path + ".lock"):
+        if not _is_current(model_path):
+            _train(features_csv, model_path)
+    return model_path
+
+
+def _is_current(model_path: str) -> bool:
+    if not os.path.exists(model_path):
+        return False
+    return joblib.load(model_path).get("schema") == FEATURE_SCHEMA
+
+
+def _train(features_csv: str, model_path: str) -> None:
     df = pd.read_csv(features_csv)
     if "label" not in df.columns:
         df["label"] = weak_labels(df)
@@ -42,8 +59,8 @@ def train_or_load(features_csv: str, model_dir: str) -> str:
     clf = GradientBoostingClassifier(random_state=42)
     clf.fit(X_train, y_train)
     _ = classification_report(y_test, clf.predict(X_test), output_dict=True)
-    joblib.dump({"model": clf, "features": FEATURES}, model_path)
-    return model_path
+    with atomic_write(model_path) as tmp_path:
+        joblib.dump({"model": clf, "features": FEATURES, "schema": FEATURE_SCHEMA}, tmp_path)
 
 
 def predict(model_path: str, features_csv: str) -> pd.DataFrame:
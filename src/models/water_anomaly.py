@@ -1,21 +1,225 @@
 from __future__ import annotations
 
+import hashlib
+import os
+from typing import Optional
+
 import numpy as np
 import pandas as pd
 
+from ..utils.io import atomic_write
+
+# Neighbours each parcel is compared with (itself excluded)
+DEFAULT_K = 16
+# Robust z above which a parcel is flagged (Iglewicz-Hoaglin outlier cutoff for MAD z-scores)
+FLAG_Z = 3.5
+# Floor on the spread (MNDWI units) so uniform neighbourhoods or steady histories do not flag noise
+MIN_SCALE = 0.02
+# Past observations kept per parcel, and how many are needed before the history is scored
+HISTORY_WINDOW = 6
+MIN_HISTORY = 3
+# Fewer valid neighbours than this (e.g. isolated parcels with NaN neighbours) -> no local score
+MIN_NEIGHBORS = 4
+_EARTH_RADIUS_M = 6371008.8
+# Median absolute deviation -> standard deviation for normal data
+_MAD_SD = 1.4826
+
+
+def parcel_centroids(parcels_gdf) -> pd.DataFrame:
+    """Parcel id and centroid as local metres (x, y) for neighbour search.
+
+    Longitude is scaled by cos(latitude) at each parcel, which keeps distances between nearby
+    parcels right anywhere in a state-sized AOI without a projection per zone.
+    """
+    import shapely
+
+    geoms = parcels_gdf.to_crs(4326).geometry.values
+    lon, lat = shapely.get_coordinates(shapely.centroid(np.asarray(geoms))).T
+    return pd.DataFrame({"id": parcels_gdf["id"].to_numpy(), **dict(zip(("x", "y"), lonlat_to_xy(lon, lat)))})
+
+
+def lonlat_to_xy(lon: np.ndarray, lat: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    lat_r = np.radians(lat)
+    return _EARTH_RADIUS_M * np.radians(lon) * np.cos(lat_r), _EARTH_RADIUS_M * lat_r
+
+
+def neighbor_table(xy: np.ndarray, k: int = DEFAULT_K, cache_path: Optional[str] = None) -> np.ndarray:
+    """(n, k) int32 row indices of each point's k nearest other points (KD-tree, batch query).
+
+    Parcels rarely move between runs, so the table is cached at cache_path keyed by the
+    coordinates and k, and rebuilt only when the parcel layout changes.
+    """
+    from scipy.spatial import cKDTree
+
+    xy = np.ascontiguousarray(xy, dtype=np.float64)
+    k = max(0, min(k, len(xy) - 1))
+    key = hashlib.sha1(xy.tobytes() + str(k).encode()).hexdigest()
+    if cache_path and os.path.exists(cache_path):
+        with np.load(cache_path) as z:
+            if str(z["key"]) == key:
+                return z["neighbors"]
+    if k == 0:
+        return np.empty((len(xy), 0), dtype=np.int32)
+    # k + 1 because every point is its own nearest neighbour; workers=-1 spreads the batch over all cores
+    _, idx = cKDTree(xy).query(xy, k=k + 1, workers=-1)
+    own = np.arange(len(xy))[:, None]
+    # Drop self (normally column 0, but exact duplicates may swap places with it)
+    drop = np.where((idx == own).any(axis=1), (idx == own).argmax(axis=1), k)
+    keep = np.ones(idx.shape, dtype=bool)
+    keep[np.arange(len(xy)), drop] = False
+    neighbors = idx[keep].reshape(len(xy), k).astype(np.int32)
+    if cache_path:
+        with atomic_write(cache_path, ".npz") as tmp:
+            np.savez(tmp, key=key, neighbors=neighbors)
+    return neighbors
+
+
+def _row_median(a: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Median of each row ignoring NaN, and the count of valid values (sort-based, no Python loop)."""
+    s = np.sort(a, axis=1)  # NaN sorts last
+    n = np.isfinite(a).sum(axis=1)
+    lo = np.clip((n - 1) // 2, 0, a.shape[1] - 1)
+    hi = np.clip(n // 2, 0, a.shape[1] - 1)
+    rows = np.arange(len(a))
+    med = 0.5 * (s[rows, lo] + s[rows, hi])
+    med[n == 0] = np.nan
+    return med, n
+
+
+def local_robust_z(values: np.ndarray, neighbors: np.ndarray, min_scale: float = MIN_SCALE, min_neighbors: int = MIN_NEIGHBORS) -> np.ndarray:
+    """Robust z of each value against its neighbours: (v - median) / max(1.4826 * MAD, min_scale)."""
+    values = np.asarray(values, dtype=np.float64)
+    if neighbors.shape[1] == 0:
+        return np.full(len(values), np.nan)
+    nb = values[neighbors]
+    med, n = _row_median(nb)
+    mad, _ = _row_median(np.abs(nb - med[:, None]))
+    z = (values - med) / np.maximum(_MAD_SD * mad, min_scale)
+    z[n < min_neighbors] = np.nan
+    return z
 
-def zscore(series: pd.Series) -> pd.Series:
-    mu = series.mean()
-    sd = series.std(ddof=0) or 1.0
-    return (series - mu) / sd
 
+class WaterHistory:
+    """Rolling per-parcel MNDWI history: the last `window` periods, one column per period.
 
-def score_water_anomaly(features_df: pd.DataFrame) -> pd.DataFrame:
+    Re-running a period overwrites its column, so repeated runs over the same dates do not
+    count twice towards the baseline.
+    """
+
+    def __init__(self, ids: np.ndarray | None = None, values: np.ndarray | None = None, periods: list[str] | None = None, window: int = HISTORY_WINDOW):
+        self.ids = np.asarray(ids if ids is not None else [], dtype=np.int64)
+        self.periods = list(periods or [])
+        self.values = np.asarray(values, dtype=np.float32) if values is not None else np.empty((len(self.ids), len(self.periods)), dtype=np.float32)
+        self.window = window
+
+    @classmethod
+    def load(cls, path: str, window: int = HISTORY_WINDOW) -> "WaterHistory":
+        if not os.path.exists(path):
+            return cls(window=window)
+        with np.load(path) as z:
+            return cls(z["ids"], z["values"], [str(p) for p in z["periods"]], window=window)
+
+    def save(self, path: str) -> None:
+        with atomic_write(path, ".npz") as tmp:
+            np.savez(tmp, ids=self.ids, values=self.values, periods=np.asarray(self.periods, dtype=str))
+
+    def _rows(self, ids: np.ndarray) -> np.ndarray:
+        """Row of each id in self.ids, or -1."""
+        if len(self.ids) == 0:
+            return np.full(len(ids), -1, dtype=np.int64)
+        pos = np.clip(np.searchsorted(self.ids, ids), 0, len(self.ids) - 1)
+        return np.where(self.ids[pos] == ids, pos, -1)
+
+    def baseline(self, ids: np.ndarray, exclude: Optional[str] = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Mean, std and count of each parcel's past observations (the `exclude` period left out)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        cols = [i for i, p in enumerate(self.periods) if p != exclude]
+        rows = self._rows(ids)
+        past = np.full((len(ids), len(cols)), np.nan, dtype=np.float64)
+        hit = rows >= 0
+        if cols and hit.any():
+            past[hit] = self.values[rows[hit]][:, cols]
+        count = np.isfinite(past).sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            total = np.nansum(past, axis=1)
+            mean = np.where(count > 0, total / np.maximum(count, 1), np.nan)
+            var = np.nansum((past - mean[:, None]) ** 2, axis=1) / np.maximum(count, 1)
+        return mean, np.sqrt(var), count
+
+    def record(self, ids: np.ndarray, values: np.ndarray, period: str) -> None:
+        ids = np.asarray(ids, dtype=np.int64)
+        new_ids = np.setdiff1d(ids, self.ids)
+        if len(new_ids):
+            merged = np.concatenate([self.ids, new_ids])
+            order = np.argsort(merged, kind="stable")
+            grown = np.full((len(merged), len(self.periods)), np.nan, dtype=np.float32)
+            grown[: len(self.ids)] = self.values
+            self.ids, self.values = merged[order], grown[order]
+        if period in self.periods:
+            col = self.periods.index(period)
+        else:
+            self.periods.append(period)
+            self.values = np.concatenate([self.values, np.full((len(self.ids), 1), np.nan, dtype=np.float32)], axis=1)
+            col = len(self.periods) - 1
+            if len(self.periods) > self.window:
+                drop = len(self.periods) - self.window
+                self.periods = self.periods[drop:]
+                self.values = self.values[:, drop:]
+                col -= drop
+        self.values[self._rows(ids), col] = np.asarray(values, dtype=np.float32)
+
+
+def score_water_anomaly(
+    features_df: pd.DataFrame,
+    centroids: Optional[pd.DataFrame] = None,
+    history: Optional[WaterHistory] = None,
+    period: Optional[str] = None,
+    k: int = DEFAULT_K,
+    threshold: float = FLAG_Z,
+    min_scale: float = MIN_SCALE,
+    neighbor_cache: Optional[str] = None,
+) -> pd.DataFrame:
+    """Flag parcels whose mndwi_mean departs from their spatial neighbours or their own history.
+
+    water_z_local: robust z against the k nearest parcels (centroids: id, x, y in metres, see
+    parcel_centroids); without centroids, against all parcels. water_z_hist: z against the
+    parcel's rolling history, once it has MIN_HISTORY past periods. water_anom is the larger
+    magnitude of the two (0 when neither can be scored) and water_flag is water_anom > threshold.
+    With a period, the current values are recorded into history (the caller saves it).
+    """
     df = features_df.copy()
-    if "mndwi_mean" in df.columns:
-        df["water_anom"] = zscore(df["mndwi_mean"]).abs()
-    else:
+    if "mndwi_mean" not in df.columns:
         df["water_anom"] = 0.0
-    df["water_flag"] = df["water_anom"] > 1.5
-    return df
+        df["water_flag"] = False
+        return df
+    values = df["mndwi_mean"].to_numpy(dtype=np.float64)
+    ids = df["id"].to_numpy(dtype=np.int64)
 
+    if centroids is not None and len(df) > 1:
+        pos = pd.Series(np.arange(len(centroids)), index=centroids["id"].to_numpy()).reindex(ids).to_numpy()
+        xy = np.column_stack([centroids["x"].to_numpy(), centroids["y"].to_numpy()])[np.nan_to_num(pos, nan=0).astype(np.int64)]
+        # Parcels without a centroid are left out of the tree and get no local score
+        located = ~np.isnan(pos)
+        z_local = np.full(len(df), np.nan)
+        sub = np.flatnonzero(located)
+        z_local[sub] = local_robust_z(values[sub], neighbor_table(xy[sub], k, cache_path=neighbor_cache), min_scale)
+    else:
+        med = np.nanmedian(values) if np.isfinite(values).any() else np.nan
+        mad = np.nanmedian(np.abs(values - med)) if np.isfinite(values).any() else np.nan
+        z_local = (values - med) / max(_MAD_SD * mad, min_scale) if np.isfinite(mad) else np.full(len(df), np.nan)
+
+    z_hist = np.full(len(df), np.nan)
+    if history is not None:
+        mean, sd, count = history.baseline(ids, exclude=period)
+        with np.errstate(invalid="ignore"):
+            z_hist = np.where(count >= MIN_HISTORY, (values - mean) / np.maximum(sd, min_scale), np.nan)
+        if period is not None:
+            history.record(ids, values, period)
+
+    df["water_z_local"] = z_local
+    df["water_z_hist"] = z_hist
+    # fmax ignores NaN, so a parcel scored only one way keeps that score
+    anom = np.nan_to_num(np.fmax(np.abs(z_local), np.abs(z_hist)), nan=0.0)
+    df["water_anom"] = anom
+    df["water_flag"] = anom > threshold
+    return df
@@ -2,21 +2,34 @@ from __future__ import annotations
 
 import os
 import json
+import logging
 import numpy as np
+import pandas as pd
 import geopandas as gpd
 
 from .config import settings
-from .utils.io import ensure_dir
+from .utils.io import ensure_dir, mark_layer_updated
+from .utils.colstore import write_columnar
 from .utils.viz import save_blank_tile, save_png
-from .utils.tiles import generate_xyz_tiles_from_geotiff
+from .utils.rasters import cog_options, write_geotiff
+from .utils.tiles import generate_xyz_tile_layers
+from .utils.vector_tiles import PARCEL_LAYER, ParcelTileSource, parse_zoom_range, pregenerate_parcel_tiles
 from .utils.geoutils import read_aoi, bbox_xyxy
 from .ingest.preprocess import preprocess_to_interim
 from .features.s2_indices import compute_s2_indices
+from .features.radar import despeckle, ratio_db, to_db
 from .features.s1_features import compute_s1_features
 from .features.dem_features import compute_dem_features
+from .features.landsat_lst import compute_lst_proxy
 from .features.featurize import aggregate_to_parcels, save_features
+from .features.zonal import zonal_stats_windowed
+from .features.change import SUMMARY_JSON, detect_changes, render_change_tiles
+from .features.rollup import load_villages, update_village_rollups
+from .manifest import RunManifest
 from .models.irrigate_clf import train_or_load, predict
-from .models.water_anomaly import score_water_anomaly
+from .models.water_anomaly import WaterHistory, parcel_centroids, score_water_anomaly
+
+log = logging.getLogger(__name__)
 
 
 def synthetic_parcel_ids(h: int, w: int, n_x: int = 8, n_y: int = 8) -> np.ndarray:
@@ -34,7 +47,97 @@ def synthetic_parcel_ids(h: int, w: int, n_x: int = 8, n_y: int = 8) -> np.ndarr
     return ids
 
 
-def run_offline_pipeline(aoi_path: str, start: str, end: str) -> dict:
+def synthetic_parcel_geoms(bounds, h: int, w: int, n_x: int = 8, n_y: int = 8) -> gpd.GeoDataFrame:
+    """Polygons (EPSG:4326) matching synthetic_parcel_ids when the scene spans bounds."""
+    from shapely.geometry import box
+
+    minx, miny, maxx, maxy = bounds
+    px, py = (maxx - minx) / w, (maxy - miny) / h
+    sx, sy = w // n_x, h // n_y
+    ids, geoms = [], []
+    pid = 0
+    for j in range(n_y):
+        for i in range(n_x):
+            # Row 0 of the array is the northern edge
+            geoms.append(box(minx + i * sx * px, maxy - (j + 1) * sy * py, minx + (i + 1) * sx * px, maxy - j * sy * py))
+            ids.append(pid)
+            pid += 1
+    return gpd.GeoDataFrame({"id": ids}, geometry=geoms, crs=4326)
+
+
+def publish_parcel_predictions(features_csv: str, parcels_gdf: gpd.GeoDataFrame, aoi_path: str, period: str | None = None, manifest: RunManifest | None = None) -> dict:
+    """Train (or load) the model, score the parcels in features_csv and publish predictions,
+    parcel polygons, village rollups and optionally pre-generated parcel vector tiles.
+    period (e.g. "start/end") labels this run in the per-parcel water history."""
+    model_path = train_or_load(features_csv, settings.models_dir)
+    pred_df = predict(model_path, features_csv)
+    history = WaterHistory.load(settings.water_history_path)
+    pred_df = score_water_anomaly(
+        pred_df, centroids=parcel_centroids(parcels_gdf), history=history, period=period,
+        neighbor_cache=settings.water_neighbors_path,
+    )
+    if period is not None:
+        history.save(settings.water_history_path)
+    pred_csv = os.path.join(settings.features_dir, "predictions.csv")
+    pred_df.to_csv(pred_csv, index=False)
+    # Publish a memory-mappable snapshot for the parcel report API (atomic swap)
+    write_columnar(pred_df, settings.predictions_store_dir)
+
+    parcels_gdf.to_file(settings.parcels_path, driver="GPKG")
+    villages = load_villages(settings.villages_path, aoi_path)
+    rollup = update_village_rollups(pred_df, parcels_gdf, villages, settings.features_dir)
+
+    # Parcel vector tiles are rendered on request; optionally pre-generate some zooms
+    mvt_zooms = parse_zoom_range(settings.mvt_pregen_zooms)
+    if mvt_zooms:
+        source = ParcelTileSource(settings.parcels_path, settings.predictions_store_dir, cache_size=0)
+        pregenerate_parcel_tiles(source, mvt_zooms, os.path.join(settings.mvt_dir, PARCEL_LAYER))
+    if manifest is not None:
+        manifest.add_layer(
+            PARCEL_LAYER, kind="mvt", url=f"/mvt/{PARCEL_LAYER}/{{z}}/{{x}}/{{y}}.pbf", parcels=len(parcels_gdf),
+            pregenerated_zooms=mvt_zooms,
+        )
+    return {"predictions": pred_csv, "model": model_path, "villages": rollup["path"]}
+
+
+def record_tile_layers(manifest: RunManifest, specs: list[dict], stats: dict[str, dict], zooms: list[int]) -> None:
+    """Add tiled layers (specs as given to generate_xyz_tile_layers, stats as returned) to the manifest."""
+    for spec in specs:
+        manifest.add_layer(
+            spec["layer"], raster_path=spec["raster_path"], zooms=zooms, tile_stats=stats.get(spec["layer"]),
+            fmt=settings.tile_format, cmap=spec.get("cmap"), vmin=spec.get("vmin"), vmax=spec.get("vmax"),
+        )
+
+
+def publish_changes(raster_paths: dict[str, str], aoi_bounds, zooms: list[int], pred_df=None, parcels_gdf=None, manifest: RunManifest | None = None) -> dict | None:
+    """Compare the tracked layers (CHANGE_LAYERS) with the previous run and publish `<layer>_change` tiles."""
+    tracked = [n.strip() for n in settings.change_layers.split(",") if n.strip() in raster_paths]
+    paths = {n: raster_paths[n] for n in tracked if os.path.exists(raster_paths[n])}
+    if not paths:
+        return None
+    result = detect_changes(paths, settings.change_dir, pred_df=pred_df, parcels=parcels_gdf, block=settings.change_block)
+    tiles = render_change_tiles(
+        result, settings.tiles_dir, aoi_bounds, zooms, output=settings.tile_output, fmt=settings.tile_format,
+        plan_cache_dir=settings.reproject_cache_dir,
+    )
+    if manifest is not None:
+        for name, res in result["layers"].items():
+            manifest.add_layer(
+                f"{name}_change", raster_path=res["path"], zooms=zooms, tile_stats=tiles[f"{name}_change"], fmt=settings.tile_format,
+                cmap="RdYlGn", vmin=-2, vmax=2, change_of=name, status=res["status"], blocks_changed=res["blocks_changed"], pixels=res["pixels"],
+            )
+    return result
+
+
+def run_offline_pipeline(
+    aoi_path: str,
+    start: str,
+    end: str,
+    shape: tuple[int, int] = (256, 256),
+    parcel_grid: tuple[int, int] = (8, 8),
+) -> dict:
+    """Synthetic offline pipeline. shape is the (height, width) of the synthetic scene and
+    parcel_grid the (n_x, n_y) number of synthetic parcels along each axis."""
     # Prepare dirs
     ensure_dir(settings.raw_dir)
     ensure_dir(settings.interim_dir)
@@ -42,30 +145,58 @@ def run_offline_pipeline(aoi_path: str, start: str, end: str) -> dict:
     ensure_dir(settings.models_dir)
     ensure_dir(settings.tiles_dir)
 
+    # The synthetic scene and parcels are laid over the AOI bbox
+    aoi_gdf = read_aoi(aoi_path)
+    minx, miny, maxx, maxy = bbox_xyxy(aoi_gdf.to_crs(4326))
+    manifest = RunManifest("offline", aoi_path, start, end, (minx, miny, maxx, maxy))
+
     # Preprocess -> synthetic
-    interim_nc = preprocess_to_interim(aoi_path, settings.raw_dir, settings.interim_dir)
+    with manifest.stage("preprocess"):
+        interim_nc = preprocess_to_interim(aoi_path, settings.raw_dir, settings.interim_dir, shape=shape)
 
     # Indices/features
-    s2_paths = compute_s2_indices(interim_nc, os.path.join(settings.interim_dir, "s2"))
-    s1_paths = compute_s1_features(os.path.join(settings.interim_dir, "s1"))
-    dem_paths = compute_dem_features(os.path.join(settings.interim_dir, "dem"))
+    with manifest.stage("indices"):
+        s2_paths = compute_s2_indices(interim_nc, os.path.join(settings.interim_dir, "s2"))
+        s1_paths = compute_s1_features(os.path.join(settings.interim_dir, "s1"), shape=shape, speckle=settings.s1_speckle)
+        dem_paths = compute_dem_features(os.path.join(settings.interim_dir, "dem"), shape=shape)
+        lst_path = compute_lst_proxy(os.path.join(settings.interim_dir, "landsat"), shape=shape)
 
     # Aggregate per synthetic parcels
     ndvi = np.load(s2_paths["ndvi"])  # HxW
     ndwi = np.load(s2_paths["ndwi"])  # HxW
+    mndwi = np.load(s2_paths["mndwi"])  # HxW
     vv_vh = np.load(s1_paths["vv_vh"])  # HxW
+    lst = np.load(lst_path)  # HxW, Kelvin
     h, w = ndvi.shape
-    parcel_ids = synthetic_parcel_ids(h, w)
-    feats_df = aggregate_to_parcels(parcel_ids, {"ndvi": ndvi, "ndwi": ndwi, "vv_vh": vv_vh})
-    features_csv = os.path.join(settings.features_dir, "features.csv")
-    save_features(feats_df, features_csv)
+    layers = {"ndvi": ndvi, "ndwi": ndwi, "mndwi": mndwi, "vv_vh": vv_vh, "lst": lst}
+    parcels_gdf = synthetic_parcel_geoms((minx, miny, maxx, maxy), h, w, n_x=parcel_grid[0], n_y=parcel_grid[1])
 
-    # Train and predict
-    model_path = train_or_load(features_csv, settings.models_dir)
-    pred_df = predict(model_path, features_csv)
-    pred_df = score_water_anomaly(pred_df)
-    pred_csv = os.path.join(settings.features_dir, "predictions.csv")
-    pred_df.to_csv(pred_csv, index=False)
+    # Georeferenced copies of the index rasters for point/bbox queries
+    with manifest.stage("query_rasters"):
+        for name, arr in layers.items():
+            write_geotiff(arr, settings.query_rasters[name], (minx, miny, maxx, maxy))
+
+    with manifest.stage("zonal_stats"):
+        if settings.zonal_block > 0:
+            # Out of core: window by window over the COGs, parcels rasterized per window
+            feats_df = zonal_stats_windowed(
+                {name: settings.query_rasters[name] for name in layers}, parcels=parcels_gdf,
+                block=settings.zonal_block, workers=settings.zonal_workers,
+            )
+        else:
+            parcel_ids = synthetic_parcel_ids(h, w, n_x=parcel_grid[0], n_y=parcel_grid[1])
+            feats_df = aggregate_to_parcels(parcel_ids, layers)
+        features_csv = os.path.join(settings.features_dir, "features.csv")
+        save_features(feats_df, features_csv)
+    with manifest.stage("predictions"):
+        published = publish_parcel_predictions(features_csv, parcels_gdf, aoi_path, period=f"{start}/{end}", manifest=manifest)
+
+    # What changed since the previous run: change rasters, parcel transitions, change-only tiles
+    with manifest.stage("changes"):
+        changes = publish_changes(
+            settings.query_rasters, (minx, miny, maxx, maxy), parse_zoom_range(settings.change_zooms),
+            pred_df=pd.read_csv(published["predictions"]), parcels_gdf=parcels_gdf, manifest=manifest,
+        )
 
     # Simple tiles
     # Render simple demo tiles with distinct colormaps and value ranges
@@ -73,25 +204,31 @@ def run_offline_pipeline(aoi_path: str, start: str, end: str) -> dict:
         "ndvi": {"arr": ndvi, "cmap": "RdYlGn", "vmin": -0.2, "vmax": 0.8},
         "ndwi": {"arr": ndwi, "cmap": "PuBuGn", "vmin": -0.5, "vmax": 0.5},
     }
-    for layer, cfg in render_cfg.items():
-        out = os.path.join(settings.tiles_dir, layer, "0", "0", "0.png")
-        save_png(cfg["arr"], out, vmin=cfg["vmin"], vmax=cfg["vmax"], colormap=cfg["cmap"])  # type: ignore
-
-    # AOI-cropped overlay images for ImageOverlay demo
-    aoi_gdf = read_aoi(aoi_path)
-    minx, miny, maxx, maxy = bbox_xyxy(aoi_gdf)
     overlays_dir = os.path.join(settings.tiles_dir, "overlays")
     os.makedirs(overlays_dir, exist_ok=True)
-    save_png(ndvi, os.path.join(overlays_dir, "ndvi.png"), vmin=-0.2, vmax=0.8, colormap="RdYlGn")
-    save_png(ndwi, os.path.join(overlays_dir, "ndwi.png"), vmin=-0.5, vmax=0.5, colormap="PuBuGn")
+    with manifest.stage("tiles"):
+        for layer, cfg in render_cfg.items():
+            out = os.path.join(settings.tiles_dir, layer, "0", "0", "0.png")
+            save_png(cfg["arr"], out, vmin=cfg["vmin"], vmax=cfg["vmax"], colormap=cfg["cmap"])  # type: ignore
+            mark_layer_updated(os.path.join(settings.tiles_dir, layer))
+            # AOI-cropped overlay images for ImageOverlay demo
+            save_png(cfg["arr"], os.path.join(overlays_dir, f"{layer}.png"), vmin=cfg["vmin"], vmax=cfg["vmax"], colormap=cfg["cmap"])  # type: ignore
+            manifest.add_layer(
+                layer, raster_path=settings.query_rasters[layer], zooms=[0], tile_stats={"tiles": 1, "bytes": os.path.getsize(out)},
+                cmap=cfg["cmap"], vmin=cfg["vmin"], vmax=cfg["vmax"], overlay=f"/static/tiles/overlays/{layer}.png",
+            )
+    for name in ("mndwi", "vv_vh", "lst"):
+        manifest.add_layer(name, kind="raster", raster_path=settings.query_rasters[name])
 
     # Summary report tile
     save_blank_tile(os.path.join(settings.tiles_dir, "reports", "summary.png"), text="Summary")
+    manifest.save(settings.manifest_path)
 
     return {
         "features": features_csv,
-        "predictions": pred_csv,
-        "model": model_path,
+        **published,
+        "changes": os.path.join(settings.change_dir, SUMMARY_JSON) if changes else None,
+        "manifest": settings.manifest_path,
         "overlay_bounds": [[miny, minx], [maxy, maxx]],
     }
 
@@ -102,26 +239,26 @@ def run_stac_pipeline(aoi_path: str, start: str, end: str, limit: int = 2, zooms
     ensure_dir(settings.interim_dir)
     ensure_dir(settings.tiles_dir)
 
-    zooms = zooms or [8, 9, 10, 11, 12]
+    zooms = [8, 9, 10, 11, 12] if zooms is None else zooms
 
     try:
         import geopandas as gpd
         from shapely.geometry import mapping
-        from pystac_client import Client
+        from .ingest.stac_search import cached_items
         import stackstac
         import rioxarray  # noqa: F401
 
         aoi = gpd.read_file(aoi_path).to_crs(4326)
         minx, miny, maxx, maxy = aoi.total_bounds
+        manifest = RunManifest("stac", aoi_path, start, end, aoi.total_bounds)
         geom = mapping(aoi.iloc[0].geometry)
-        client = Client.open("https://earth-search.aws.element84.com/v1")
-        search = client.search(collections=["sentinel-2-l2a"], intersects=geom, datetime=f"{start}/{end}")
-        s2_items = list(search.get_items())[:limit]
+        with manifest.stage("stac_search"):
+            s2_items = cached_items("sentinel-2-l2a", geom, start, end, limit, settings.stac_cache_dir)
         if not s2_items:
             return {"status": "no_items", "message": "No S2 items from STAC search."}
         # Let stackstac pick bounds; then clip to AOI bbox to avoid bounds issues
         # Try common asset key sets for S2
-        assets_try = [["B02", "B03", "B04", "B08"], ["blue", "green", "red", "nir"]]
+        assets_try = [["B02", "B03", "B04", "B08", "B11"], ["blue", "green", "red", "nir", "swir16"], ["B02", "B03", "B04", "B08"], ["blue", "green", "red", "nir"]]
         last_err = None
         stack = None
         for aset in assets_try:
@@ -139,27 +276,69 @@ def run_stac_pipeline(aoi_path: str, start: str, end: str, limit: int = 2, zooms
         except Exception:
             pass
         comp = comp.rio.clip_box(minx=minx, miny=miny, maxx=maxx, maxy=maxy)
-        blue = comp.sel(band="B02").astype("float32") / 10000.0
-        green = comp.sel(band="B03").astype("float32") / 10000.0
-        red = comp.sel(band="B04").astype("float32") / 10000.0
-        nir = comp.sel(band="B08").astype("float32") / 10000.0
+        names = set(comp.band.values.tolist())
+
+        def band(code: str, alias: str):
+            return comp.sel(band=code if code in names else alias).astype("float32") / 10000.0
+
+        blue = band("B02", "blue")
+        green = band("B03", "green")
+        red = band("B04", "red")
+        nir = band("B08", "nir")
         ndvi = (nir - red) / ((nir + red).where((nir + red) != 0, 1))
         ndwi = (green - nir) / ((green + nir).where((green + nir) != 0, 1))
         ndvi = ndvi.rio.write_crs(4326)
         ndwi = ndwi.rio.write_crs(4326)
         ndvi_path = os.path.join(settings.interim_dir, "ndvi.tif")
         ndwi_path = os.path.join(settings.interim_dir, "ndwi.tif")
-        ndvi.rio.to_raster(ndvi_path, compress="deflate")
-        ndwi.rio.to_raster(ndwi_path, compress="deflate")
+        ndvi.rio.write_nodata(np.nan).rio.to_raster(ndvi_path, **cog_options())
+        ndwi.rio.write_nodata(np.nan).rio.to_raster(ndwi_path, **cog_options())
+        # MNDWI needs SWIR1 (B11), which some catalogues do not expose
+        if names & {"B11", "swir16"}:
+            swir1 = band("B11", "swir16")
+            mndwi = ((green - swir1) / ((green + swir1).where((green + swir1) != 0, 1))).rio.write_crs(4326)
+            mndwi.rio.write_nodata(np.nan).rio.to_raster(settings.query_rasters["mndwi"], **cog_options())
+        elif os.path.exists(settings.query_rasters["mndwi"]):
+            os.remove(settings.query_rasters["mndwi"])
 
-        from .utils.tiles import generate_xyz_tiles_from_geotiff
-        generate_xyz_tiles_from_geotiff(ndvi_path, "ndvi", settings.tiles_dir, aoi.total_bounds, zooms, cmap="RdYlGn", vmin=-0.2, vmax=0.8)
-        generate_xyz_tiles_from_geotiff(ndwi_path, "ndwi", settings.tiles_dir, aoi.total_bounds, zooms, cmap="PuBuGn", vmin=-0.5, vmax=0.5)
+        # Landsat surface temperature on the S2 index grid (windowed COG read, cached per scene and grid)
+        try:
+            from .features.landsat_lst import compute_lst, pick_thermal_asset
+
+            thermal = pick_thermal_asset(cached_items("landsat-c2-l2", geom, start, end, limit, settings.stac_cache_dir))
+            if thermal:
+                with manifest.stage("lst"):
+                    lst_path = compute_lst(thermal, like=ndvi_path, out_path=settings.query_rasters["lst"], mode="st")
+                    spec = {"raster_path": lst_path, "layer": "lst", "cmap": "inferno", "vmin": 290, "vmax": 330}
+                    lst_tiles = generate_xyz_tile_layers([spec], settings.tiles_dir, aoi.total_bounds, zooms, output=settings.tile_output, fmt=settings.tile_format, plan_cache_dir=settings.reproject_cache_dir)
+                record_tile_layers(manifest, [spec], lst_tiles, zooms)
+        except Exception as le:
+            log.warning("Land surface temperature failed, run published without the lst layer: %s", le)
+
+        # Terrain from a DEM on the S2 index grid; cached by DEM checksum, so only the first run pays
+        if settings.dem_path and os.path.exists(settings.dem_path):
+            try:
+                compute_dem_features(os.path.join(settings.interim_dir, "dem"), dem_path=settings.dem_path, like=ndvi_path)
+            except Exception as de:
+                log.warning("Terrain from %s failed, run published without terrain layers: %s", settings.dem_path, de)
+
+        # ndvi and ndwi share a grid: one reprojection plan per tile serves both
+        specs = [
+            {"raster_path": ndvi_path, "layer": "ndvi", "cmap": "RdYlGn", "vmin": -0.2, "vmax": 0.8},
+            {"raster_path": ndwi_path, "layer": "ndwi", "cmap": "PuBuGn", "vmin": -0.5, "vmax": 0.5},
+        ]
+        with manifest.stage("tiles"):
+            s2_tiles = generate_xyz_tile_layers(
+                specs, settings.tiles_dir, aoi.total_bounds, zooms, output=settings.tile_output, fmt=settings.tile_format,
+                plan_cache_dir=settings.reproject_cache_dir,
+            )
+        record_tile_layers(manifest, specs, s2_tiles, zooms)
+        if os.path.exists(settings.query_rasters["mndwi"]):
+            manifest.add_layer("mndwi", kind="raster", raster_path=settings.query_rasters["mndwi"])
 
         # Sentinel-1 GRD VV/VH composites and ratio
         try:
-            s1_search = client.search(collections=["sentinel-1-grd"], intersects=geom, datetime=f"{start}/{end}")
-            s1_items = list(s1_search.get_items())[:limit]
+            s1_items = cached_items("sentinel-1-grd", geom, start, end, limit, settings.stac_cache_dir)
             if s1_items:
                 s1_stack = stackstac.stack(s1_items, assets=["VV", "VH"])  # time, band, y, x
                 s1_comp = s1_stack.median(dim="time")
@@ -168,24 +347,45 @@ def run_stac_pipeline(aoi_path: str, start: str, end: str, limit: int = 2, zooms
                 except Exception:
                     pass
                 s1_comp = s1_comp.rio.clip_box(minx=minx, miny=miny, maxx=maxx, maxy=maxy)
-                vv = (10.0 * (s1_comp.sel(band="VV").astype("float32"))).rio.write_crs(4326)
-                vh = (10.0 * (s1_comp.sel(band="VH").astype("float32"))).rio.write_crs(4326)
-                # Ratio in linear units approximated by exp(dB/10); here keep in dB diff as proxy
-                ratio = (vv - vh).rio.write_crs(4326)
+                # GRD assets are linear power: filter speckle there, then convert to dB
+                linear = {}
+                for pol in ("VV", "VH"):
+                    da = s1_comp.sel(band=pol).astype("float32")
+                    if settings.s1_speckle != "none":
+                        da = da.copy(data=despeckle(np.asarray(da.values), settings.s1_speckle))
+                    linear[pol] = da
+                vv = linear["VV"].copy(data=to_db(linear["VV"].values)).rio.write_crs(4326)
+                vh = linear["VH"].copy(data=to_db(linear["VH"].values)).rio.write_crs(4326)
+                ratio = vv.copy(data=ratio_db(linear["VV"].values, linear["VH"].values)).rio.write_crs(4326)
                 vv_path = os.path.join(settings.interim_dir, "s1_vv.tif")
                 vh_path = os.path.join(settings.interim_dir, "s1_vh.tif")
                 ratio_path = os.path.join(settings.interim_dir, "s1_ratio.tif")
-                vv.rio.to_raster(vv_path, compress="deflate")
-                vh.rio.to_raster(vh_path, compress="deflate")
-                ratio.rio.to_raster(ratio_path, compress="deflate")
+                vv.rio.write_nodata(np.nan).rio.to_raster(vv_path, **cog_options())
+                vh.rio.write_nodata(np.nan).rio.to_raster(vh_path, **cog_options())
+                ratio.rio.write_nodata(np.nan).rio.to_raster(ratio_path, **cog_options())
 
-                generate_xyz_tiles_from_geotiff(vv_path, "s1_vv", settings.tiles_dir, aoi.total_bounds, zooms, cmap="Greys", vmin=-25, vmax=0)
-                generate_xyz_tiles_from_geotiff(vh_path, "s1_vh", settings.tiles_dir, aoi.total_bounds, zooms, cmap="Greys", vmin=-30, vmax=-5)
-                generate_xyz_tiles_from_geotiff(ratio_path, "s1_ratio", settings.tiles_dir, aoi.total_bounds, zooms, cmap="Magma", vmin=0, vmax=15)
+                specs = [
+                    {"raster_path": vv_path, "layer": "s1_vv", "cmap": "Greys", "vmin": -25, "vmax": 0},
+                    {"raster_path": vh_path, "layer": "s1_vh", "cmap": "Greys", "vmin": -30, "vmax": -5},
+                    {"raster_path": ratio_path, "layer": "s1_ratio", "cmap": "Magma", "vmin": 0, "vmax": 15},
+                ]
+                with manifest.stage("s1_tiles"):
+                    s1_tiles = generate_xyz_tile_layers(
+                        specs, settings.tiles_dir, aoi.total_bounds, zooms, output=settings.tile_output, fmt=settings.tile_format,
+                        plan_cache_dir=settings.reproject_cache_dir,
+                    )
+                record_tile_layers(manifest, specs, s1_tiles, zooms)
         except Exception:
             pass
 
-        return {"status": "ok", "ndvi": ndvi_path, "ndwi": ndwi_path}
+        # A failed comparison must not discard the finished run (and fall back to re-ingesting)
+        try:
+            with manifest.stage("changes"):
+                publish_changes(settings.query_rasters, aoi.total_bounds, zooms, manifest=manifest)
+        except Exception as ce:
+            log.warning("Change detection failed, run published without change layers: %s", ce)
+        manifest.save(settings.manifest_path)
+        return {"status": "ok", "ndvi": ndvi_path, "ndwi": ndwi_path, "manifest": settings.manifest_path}
     except Exception as e:
         # Fallback: use first S2 item assets directly via rasterio to build a single-scene composite
         try:
@@ -193,12 +393,14 @@ def run_stac_pipeline(aoi_path: str, start: str, end: str, limit: int = 2, zooms
             import geopandas as gpd
             import rasterio
             from rasterio.transform import from_bounds
-            from rasterio.warp import reproject, Resampling
             import numpy as np
 
+            from .utils.reproject import dataset_plan
+
             aoi = gpd.read_file(aoi_path).to_crs(4326)
             minx, miny, maxx, maxy = aoi.total_bounds
-            items = search_s2(aoi_path, start, end, limit=5)
+            manifest = RunManifest("stac_fallback", aoi_path, start, end, aoi.total_bounds)
+            items = search_s2(aoi_path, start, end, limit=5, cache_dir=settings.stac_cache_dir)
             if not items:
                 return {"status": "error", "message": str(e)}
             # Pick first item that has normalized bands
@@ -218,18 +420,13 @@ def run_stac_pipeline(aoi_path: str, start: str, end: str, limit: int = 2, zooms
             dst_crs = "EPSG:4326"
 
             def reproject_band(href: str) -> np.ndarray:
-                dst = np.zeros((height, width), dtype=np.float32)
+                # The 10 m bands share one grid, so the plan is built once and reused from memory
                 with rasterio.open(href) as src:
-                    reproject(
-                        source=rasterio.band(src, 1),
-                        destination=dst,
-                        src_transform=src.transform,
-                        src_crs=src.crs,
-                        dst_transform=dst_transform,
-                        dst_crs=dst_crs,
-                        resampling=Resampling.bilinear,
-                    )
-                return dst
+                    plan = dataset_plan(src, dst_crs, dst_transform, (height, width), cache_dir=settings.reproject_cache_dir)
+                    part, window = plan.read(src)
+                if part is None:
+                    return np.zeros((height, width), dtype=np.float32)
+                return np.nan_to_num(plan.apply(part, window), nan=0.0)
 
             blue = reproject_band(chosen["blue"]) / 10000.0
             green = reproject_band(chosen["green"]) / 10000.0
@@ -237,8 +434,9 @@ def run_stac_pipeline(aoi_path: str, start: str, end: str, limit: int = 2, zooms
             nir = reproject_band(chosen["nir"]) / 10000.0
             ndvi = (nir - red) / np.where((nir + red) != 0, (nir + red), 1)
             ndwi = (green - nir) / np.where((green + nir) != 0, (green + nir), 1)
+            swir1 = reproject_band(chosen["swir16"]) / 10000.0 if "swir16" in chosen else None
 
-            # Write GeoTIFFs
+            # Write COGs
             profile = {
                 "driver": "GTiff",
                 "height": height,
@@ -247,7 +445,8 @@ def run_stac_pipeline(aoi_path: str, start: str, end: str, limit: int = 2, zooms
                 "dtype": "float32",
                 "crs": dst_crs,
                 "transform": dst_transform,
-                "compress": "deflate",
+                "nodata": np.nan,
+                **cog_options(),
             }
             ndvi_path = os.path.join(settings.interim_dir, "ndvi.tif")
             ndwi_path = os.path.join(settings.interim_dir, "ndwi.tif")
@@ -255,10 +454,32 @@ def run_stac_pipeline(aoi_path: str, start: str, end: str, limit: int = 2, zooms
                 dst.write(ndvi.astype(np.float32), 1)
             with rasterio.open(ndwi_path, "w", **profile) as dst:
                 dst.write(ndwi.astype(np.float32), 1)
+            if swir1 is not None:
+                mndwi = (green - swir1) / np.where((green + swir1) != 0, (green + swir1), 1)
+                with rasterio.open(settings.query_rasters["mndwi"], "w", **profile) as dst:
+                    dst.write(mndwi.astype(np.float32), 1)
+            elif os.path.exists(settings.query_rasters["mndwi"]):
+                os.remove(settings.query_rasters["mndwi"])
 
             # Tiles
-            generate_xyz_tiles_from_geotiff(ndvi_path, "ndvi", settings.tiles_dir, (minx, miny, maxx, maxy), zooms, cmap="RdYlGn", vmin=-0.2, vmax=0.8)
-            generate_xyz_tiles_from_geotiff(ndwi_path, "ndwi", settings.tiles_dir, (minx, miny, maxx, maxy), zooms, cmap="PuBuGn", vmin=-0.5, vmax=0.5)
-            return {"status": "ok", "ndvi": ndvi_path, "ndwi": ndwi_path, "fallback": True}
+            specs = [
+                {"raster_path": ndvi_path, "layer": "ndvi", "cmap": "RdYlGn", "vmin": -0.2, "vmax": 0.8},
+                {"raster_path": ndwi_path, "layer": "ndwi", "cmap": "PuBuGn", "vmin": -0.5, "vmax": 0.5},
+            ]
+            with manifest.stage("tiles"):
+                s2_tiles = generate_xyz_tile_layers(
+                    specs, settings.tiles_dir, (minx, miny, maxx, maxy), zooms, output=settings.tile_output, fmt=settings.tile_format,
+                    plan_cache_dir=settings.reproject_cache_dir,
+                )
+            record_tile_layers(manifest, specs, s2_tiles, zooms)
+            if swir1 is not None:
+                manifest.add_layer("mndwi", kind="raster", raster_path=settings.query_rasters["mndwi"])
+            try:
+                with manifest.stage("changes"):
+                    publish_changes(settings.query_rasters, (minx, miny, maxx, maxy), zooms, manifest=manifest)
+            except Exception as ce:
+                log.warning("Change detection failed, run published without change layers: %s", ce)
+            manifest.save(settings.manifest_path)
+            return {"status": "ok", "ndvi": ndvi_path, "ndwi": ndwi_path, "fallback": True, "manifest": settings.manifest_path}
         except Exception as e2:
             return {"status": "error", "message": str(e2)}
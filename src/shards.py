@@ -0,0 +1,603 @@
+"""Sharded AOI execution: split a large AOI into tile-aligned shards processed by independent workers.
+
+Usage (from repo root):
+    # one machine, N local worker processes
+    python -m src.shards run data/aoi/state.geojson --start 2024-11-01 --end 2025-03-31 --workers 4
+
+    # several machines sharing the plan dir (and a Redis queue)
+    python -m src.shards plan data/aoi/state.geojson --start ... --end ... --queue redis://host:6379/0
+    python -m src.shards worker --queue redis://host:6379/0        # on every worker node
+    python -m src.shards merge --plan-dir data/shards/<plan>       # once the queue has drained
+
+Shards are the Web Mercator tiles at `shard_zoom` that touch the AOI. Each shard is rendered
+on its own 3857 pixel grid (`shard_px` square), so shard rasters and every XYZ tile at zoom
+>= shard_zoom fall entirely inside one shard; the merge step places rasters by tile offset,
+copies those tiles and renders only the lower zooms from the mosaic.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import time
+from typing import Any, Optional, Sequence
+
+import numpy as np
+
+from .config import settings
+from .utils.io import atomic_write, ensure_dir
+
+PLAN_FILE = "plan.json"
+SHARD_DONE = "shard.json"
+QUEUE_NAME = "shards"
+# Index rasters per shard; the names match settings.query_rasters
+RASTERS = ("ndvi", "ndwi", "mndwi", "vv_vh")
+# Fixed stretches so tiles rendered by different shards match each other
+TILE_LAYERS = {
+    "ndvi": {"cmap": "RdYlGn", "vmin": -0.2, "vmax": 0.8},
+    "ndwi": {"cmap": "PuBuGn", "vmin": -0.5, "vmax": 0.5},
+}
+
+
+def shard_key(z: int, x: int, y: int) -> str:
+    return f"{z}_{x}_{y}"
+
+
+def _parse_key(key: str) -> tuple[int, int, int]:
+    z, x, y = (int(v) for v in key.split("_"))
+    return z, x, y
+
+
+def load_plan(plan_dir: str) -> dict[str, Any]:
+    with open(os.path.join(plan_dir, PLAN_FILE)) as f:
+        return json.load(f)
+
+
+def default_queue_url(plan_dir: str) -> str:
+    return settings.shard_queue or f"sqlite:///{os.path.abspath(os.path.join(plan_dir, 'queue.db'))}"
+
+
+def plan_shards(
+    aoi_path: str,
+    start: str,
+    end: str,
+    plan_dir: Optional[str] = None,
+    shard_zoom: int = 11,
+    shard_px: int = 256,
+    tile_zooms: Sequence[int] = (8, 9, 10, 11, 12),
+    source: str = "offline",
+    parcels_path: Optional[str] = None,
+    parcel_grid: tuple[int, int] = (8, 8),
+) -> dict[str, Any]:
+    """Write plan_dir/plan.json, the AOI and the parcel layer (EPSG:4326) the workers read.
+
+    parcels_path: existing parcel polygons with an `id` column; without it a parcel_grid
+    (n_x, n_y) of synthetic parcels is laid over the AOI bbox, as in the offline pipeline.
+    """
+    import geopandas as gpd
+    import mercantile
+    from shapely.geometry import box
+
+    from .batch import BatchJob
+    from .pipeline import synthetic_parcel_geoms
+    from .utils.geoutils import read_aoi
+
+    plan_dir = os.path.abspath(plan_dir or os.path.join(settings.shards_dir, BatchJob(aoi_path, start, end).run_name))
+    ensure_dir(plan_dir)
+    aoi = read_aoi(aoi_path).to_crs(4326)
+    aoi_geom = aoi.union_all()
+    minx, miny, maxx, maxy = (float(v) for v in aoi.total_bounds)
+    tiles = [t for t in mercantile.tiles(minx, miny, maxx, maxy, [shard_zoom]) if box(*mercantile.bounds(t)).intersects(aoi_geom)]
+    if not tiles:
+        raise ValueError(f"AOI {aoi_path} covers no zoom-{shard_zoom} tiles")
+    aoi.to_file(os.path.join(plan_dir, "aoi.geojson"), driver="GeoJSON")
+
+    if parcels_path:
+        parcels = gpd.read_file(parcels_path)
+        parcels = parcels.set_crs(4326) if parcels.crs is None else parcels.to_crs(4326)
+        parcels = parcels[["id", "geometry"]]
+    else:
+        n_x, n_y = parcel_grid
+        parcels = synthetic_parcel_geoms((minx, miny, maxx, maxy), n_y, n_x, n_x=n_x, n_y=n_y)
+    parcels.to_file(os.path.join(plan_dir, "parcels.gpkg"), driver="GPKG")
+
+    left, top = mercantile.xy(minx, maxy)
+    right, bottom = mercantile.xy(maxx, miny)
+    xs = [t.x for t in tiles]
+    ys = [t.y for t in tiles]
+    plan = {
+        "aoi": os.path.join(plan_dir, "aoi.geojson"),
+        "start": start,
+        "end": end,
+        "source": source,
+        "shard_zoom": shard_zoom,
+        "shard_px": shard_px,
+        "tile_zooms": sorted(int(z) for z in tile_zooms),
+        "tile_format": settings.tile_format,
+        "aoi_bounds": [minx, miny, maxx, maxy],
+        "aoi_bounds_3857": [left, bottom, right, top],
+        "grid": {"x0": min(xs), "y0": min(ys), "nx": max(xs) - min(xs) + 1, "ny": max(ys) - min(ys) + 1},
+        "shards": [shard_key(t.z, t.x, t.y) for t in tiles],
+        "parcels": len(parcels),
+        "shared_dir": os.path.abspath(settings.shared_dir or os.path.join(plan_dir, "shared")),
+    }
+    with atomic_write(os.path.join(plan_dir, PLAN_FILE)) as tmp, open(tmp, "w") as f:
+        json.dump(plan, f, indent=2)
+    return {**plan, "plan_dir": plan_dir}
+
+
+def enqueue_shards(plan_dir: str, queue_url: Optional[str] = None) -> int:
+    """Put every shard of the plan that is not already queued; returns how many were added."""
+    from .utils.workqueue import open_queue
+
+    plan_dir = os.path.abspath(plan_dir)
+    plan = load_plan(plan_dir)
+    name = os.path.basename(plan_dir)
+    q = open_queue(queue_url or default_queue_url(plan_dir), name=QUEUE_NAME)
+    try:
+        return sum(q.put(f"{name}/{key}", {"plan_dir": plan_dir, "shard": key}) for key in plan["shards"])
+    finally:
+        q.close()
+
+
+def _shard_grid(plan: dict[str, Any], key: str):
+    """(3857 bounds, lon/lat bounds, affine transform) of a shard's pixel grid."""
+    import mercantile
+    from rasterio.transform import from_origin
+
+    z, x, y = _parse_key(key)
+    b = mercantile.xy_bounds(x, y, z)
+    res = (b.right - b.left) / plan["shard_px"]
+    return (b.left, b.bottom, b.right, b.top), tuple(mercantile.bounds(x, y, z)), from_origin(b.left, b.top, res, res)
+
+
+def _offline_rasters(plan: dict[str, Any], bounds: Sequence[float]) -> dict[str, np.ndarray]:
+    """Synthetic scene sampled on the shard grid, continuous across shard edges."""
+    from .features.s1_features import synthetic_backscatter
+    from .ingest.preprocess import synthetic_scene
+    from .utils.indices import mndwi, ndvi, ndwi
+
+    n = plan["shard_px"]
+    left, bottom, right, top = bounds
+    a_left, a_bottom, a_right, a_top = plan["aoi_bounds_3857"]
+    res = (right - left) / n
+    centers = (np.arange(n) + 0.5) * res
+    # Normalized over the whole AOI, row 0 at the north edge, as in the unsharded scene
+    xn = (left + centers - a_left) / (a_right - a_left)
+    yn = (a_top - (top - centers)) / (a_top - a_bottom)
+    ds = synthetic_scene(width=n, height=n, x=xn, y=yn)
+    green, red, nir, swir1 = (ds[b].values for b in ("B03", "B04", "B08", "B11"))
+    _, _, vv_vh = synthetic_backscatter(*np.meshgrid(xn, yn))
+    return {"ndvi": ndvi(nir, red), "ndwi": ndwi(green, nir), "mndwi": mndwi(green, swir1), "vv_vh": vv_vh}
+
+
+def _stac_rasters(plan: dict[str, Any], key: str, work_dir: str, lonlat_bounds: Sequence[float], transform) -> dict[str, np.ndarray]:
+    """Run the STAC pipeline for the shard footprint and resample its rasters onto the shard grid."""
+    import geopandas as gpd
+    import rasterio
+    from shapely.geometry import box
+
+    from .pipeline import run_stac_pipeline
+    from .utils.reproject import dataset_plan
+
+    aoi = gpd.read_file(plan["aoi"]).to_crs(4326)
+    footprint = box(*lonlat_bounds).intersection(aoi.union_all())
+    shard_aoi = os.path.join(work_dir, "aoi.geojson")
+    gpd.GeoDataFrame({"shard": [key]}, geometry=[footprint], crs=4326).to_file(shard_aoi, driver="GeoJSON")
+    settings.data_dir = os.path.join(work_dir, "run")
+    settings.shared_dir = plan["shared_dir"]
+    result = run_stac_pipeline(aoi_path=shard_aoi, start=plan["start"], end=plan["end"], zooms=[])
+    if result.get("status") != "ok":
+        raise RuntimeError(f"STAC pipeline failed for shard {key}: {result.get('message', result.get('status'))}")
+    n = plan["shard_px"]
+    out: dict[str, np.ndarray] = {}
+    for name, path in settings.query_rasters.items():
+        if not os.path.exists(path):
+            continue
+        # ndvi/ndwi (and lst) share the S2 grid, so one plan serves all of them
+        with rasterio.open(path) as src:
+            grid_plan = dataset_plan(src, "EPSG:3857", transform, (n, n), cache_dir=settings.reproject_cache_dir)
+            part, window = grid_plan.read(src)
+        out[name] = np.full((n, n), np.nan, dtype=np.float32) if part is None else grid_plan.apply(part, window)
+    return out
+
+
+def _shard_parcels(plan_dir: str, bounds: Sequence[float], lonlat_bounds: Sequence[float], transform, rasters: dict[str, np.ndarray], out_dir: str) -> dict[str, int]:
+    """Per-parcel features for parcels inside the shard; raw pixel values for edge parcels.
+
+    A parcel wholly inside the shard gets its final feature row here (features.csv). A
+    parcel crossing the shard boundary only has part of its pixels, so those values go to
+    edge_values.npz and the merge step computes its row from every shard's part.
+    """
+    import geopandas as gpd
+    import pandas as pd
+    import shapely
+    from rasterio.features import rasterize
+
+    from .features.featurize import group_parcel_pixels, grouped_parcel_rows
+
+    parcels = gpd.read_file(os.path.join(plan_dir, "parcels.gpkg"), bbox=tuple(lonlat_bounds))
+    if not len(parcels):
+        return {"interior": 0, "edge": 0}
+    merc = parcels.to_crs(3857)
+    ids = merc["id"].to_numpy(dtype=np.int64)
+    geoms = np.asarray(merc.geometry.values, dtype=object)
+    interior = shapely.covered_by(geoms, shapely.box(*bounds))
+    n = next(iter(rasters.values())).shape[0]
+    index = rasterize(zip(geoms, range(len(geoms))), out_shape=(n, n), transform=transform, fill=-1, dtype="int32")
+    pids = np.where(index >= 0, ids[np.maximum(index, 0)], -1)
+
+    rows = grouped_parcel_rows(*group_parcel_pixels(pids, rasters, ids[interior]))
+    if rows:
+        pd.DataFrame(rows).to_csv(os.path.join(out_dir, "features.csv"), index=False)
+    edge_ids, counts, values = group_parcel_pixels(pids, rasters, ids[~interior])
+    np.savez(os.path.join(out_dir, "edge_values.npz"), ids=edge_ids, counts=counts, **values)
+    return {"interior": len(rows), "edge": int(len(edge_ids))}
+
+
+def process_shard(plan_dir: str, key: str) -> dict[str, Any]:
+    """Compute one shard into plan_dir/shards/<key>: index rasters, hi-zoom tiles, parcel parts.
+
+    The shard is built in a temporary dir and renamed into place, so a re-run (a retried or
+    expired job) replaces it whole and the merge never sees a partial shard.
+    """
+    from .utils.rasters import write_geotiff
+    from .utils.tiles import generate_xyz_tile_layers
+
+    t0 = time.perf_counter()
+    plan = load_plan(plan_dir)
+    bounds, lonlat_bounds, transform = _shard_grid(plan, key)
+    final_dir = os.path.join(plan_dir, "shards", key)
+    work_dir = ensure_dir(f"{final_dir}.tmp-{os.getpid()}")
+    try:
+        if plan["source"] == "stac":
+            rasters = _stac_rasters(plan, key, work_dir, lonlat_bounds, transform)
+        else:
+            rasters = _offline_rasters(plan, bounds)
+        for name, arr in rasters.items():
+            write_geotiff(arr, os.path.join(work_dir, f"{name}.tif"), bounds, crs="EPSG:3857")
+
+        # Tiles at zoom >= shard_zoom nest inside this shard; inset so edge neighbours are not enumerated
+        z = plan["shard_zoom"]
+        hi_zooms = [zz for zz in plan["tile_zooms"] if zz >= z]
+        eps = 1e-9
+        inset = (lonlat_bounds[0] + eps, lonlat_bounds[1] + eps, lonlat_bounds[2] - eps, lonlat_bounds[3] - eps)
+        specs = [{"raster_path": os.path.join(work_dir, f"{layer}.tif"), "layer": layer, **style} for layer, style in TILE_LAYERS.items() if layer in rasters]
+        tiles = 0
+        if hi_zooms and specs:
+            # All layers of a shard share its grid, so they share one reprojection plan per tile
+            stats = generate_xyz_tile_layers(specs, os.path.join(work_dir, "tiles"), inset, hi_zooms, fmt=plan["tile_format"])
+            tiles = sum(st["tiles"] for st in stats.values())
+
+        parcels = _shard_parcels(plan_dir, bounds, lonlat_bounds, transform, rasters, work_dir)
+        summary = {"shard": key, "rasters": sorted(rasters), "tiles": tiles, **parcels, "seconds": time.perf_counter() - t0}
+        with open(os.path.join(work_dir, SHARD_DONE), "w") as f:
+            json.dump(summary, f, indent=2)
+        shutil.rmtree(final_dir, ignore_errors=True)
+        os.rename(work_dir, final_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return summary
+
+
+def run_worker(
+    queue_url: str,
+    worker_id: Optional[str] = None,
+    poll_s: float = 1.0,
+    max_jobs: Optional[int] = None,
+) -> dict[str, Any]:
+    """Claim and process shard jobs until the queue has no pending or running work left.
+
+    While other workers still hold jobs, this one keeps polling so it can pick up shards
+    whose lease expired (a crashed worker).
+    """
+    from .utils.workqueue import open_queue
+
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    q = open_queue(queue_url, name=QUEUE_NAME)
+    done = failed = 0
+    try:
+        while max_jobs is None or done + failed < max_jobs:
+            job = q.claim(worker_id)
+            if job is None:
+                counts = q.counts()
+                if counts["pending"] == 0 and counts["running"] - counts["stalled"] == 0:
+                    break
+                time.sleep(poll_s)
+                continue
+            try:
+                result = process_shard(job.payload["plan_dir"], job.payload["shard"])
+            except Exception as e:  # the job is retried or marked failed; the worker carries on
+                q.fail(job.id, f"{type(e).__name__}: {e}")
+                failed += 1
+                print(f"failed  {job.id}: {type(e).__name__}: {e}", file=sys.stderr)
+                continue
+            q.complete(job.id, result)
+            done += 1
+            print(f"    ok  {job.id}  {result['seconds']:.1f}s  [{worker_id}]", file=sys.stderr)
+    finally:
+        q.close()
+    return {"worker": worker_id, "done": done, "failed": failed}
+
+
+def _mosaic(plan_dir: str, plan: dict[str, Any], name: str, keys: list[str], out_path: str) -> None:
+    """Place each shard's raster at its tile offset in one COG, a shard at a time."""
+    import mercantile
+    import rasterio
+    from rasterio.transform import from_origin
+    from rasterio.windows import Window
+
+    from .utils.rasters import tiled_profile, to_cog
+
+    n = plan["shard_px"]
+    g = plan["grid"]
+    origin = mercantile.xy_bounds(g["x0"], g["y0"], plan["shard_zoom"])
+    res = (origin.right - origin.left) / n
+    profile = tiled_profile({"width": g["nx"] * n, "height": g["ny"] * n, "crs": "EPSG:3857", "transform": from_origin(origin.left, origin.top, res, res)})
+    ensure_dir(os.path.dirname(out_path))
+    tmp = f"{out_path}.{os.getpid()}.tmp"
+    with rasterio.open(tmp, "w", **profile) as dst:
+        for key in keys:
+            path = os.path.join(plan_dir, "shards", key, f"{name}.tif")
+            if not os.path.exists(path):
+                continue
+            _, x, y = _parse_key(key)
+            with rasterio.open(path) as src:
+                dst.write(src.read(1), 1, window=Window((x - g["x0"]) * n, (y - g["y0"]) * n, n, n))
+    # The low zooms are rendered from this mosaic, so it gets overviews like any interim raster
+    to_cog(tmp, out_path)
+    os.remove(tmp)
+
+
+def _merge_tiles(plan_dir: str, plan: dict[str, Any], keys: list[str]) -> dict[str, int]:
+    """Shard tiles (zoom >= shard_zoom) are copied as-is; lower zooms are rendered from the mosaic."""
+    from .utils.tile_formats import tile_ext
+    from .utils.tiles import generate_xyz_tile_layers, open_tile_sink
+
+    sz = plan["shard_zoom"]
+    lo_zooms = [z for z in plan["tile_zooms"] if z < sz]
+    ext = tile_ext(plan["tile_format"])
+    fmt = ext if settings.tile_output == "dir" else plan["tile_format"]
+    sinks = {layer: open_tile_sink(settings.tiles_dir, layer, output=settings.tile_output, fmt=fmt, bounds=plan["aoi_bounds"]) for layer in TILE_LAYERS}
+    try:
+        for layer, sink in sinks.items():
+            for key in keys:
+                _, sx, sy = _parse_key(key)
+                layer_dir = os.path.join(plan_dir, "shards", key, "tiles", layer)
+                for root, _, files in os.walk(layer_dir):
+                    for fname in files:
+                        if not fname.endswith(f".{ext}"):
+                            continue
+                        z, x = (int(p) for p in os.path.relpath(root, layer_dir).split(os.sep))
+                        y = int(fname.split(".")[0])
+                        # Only tiles nested in this shard (a neighbour's edge tile is that neighbour's)
+                        if x >> (z - sz) != sx or y >> (z - sz) != sy:
+                            continue
+                        with open(os.path.join(root, fname), "rb") as f:
+                            sink.put(z, x, y, f.read())
+        specs = [
+            {"raster_path": settings.query_rasters[layer], "layer": layer, **style}
+            for layer, style in TILE_LAYERS.items() if os.path.exists(settings.query_rasters[layer])
+        ]
+        if lo_zooms and specs:
+            generate_xyz_tile_layers(
+                specs, settings.tiles_dir, plan["aoi_bounds"], lo_zooms, fmt=plan["tile_format"], sinks=sinks,
+                plan_cache_dir=settings.reproject_cache_dir,
+            )
+    except BaseException:
+        for sink in sinks.values():
+            sink.abort()
+        raise
+    for sink in sinks.values():
+        sink.close()
+    return {layer: sink.tiles for layer, sink in sinks.items()}
+
+
+def _merge_features(plan_dir: str, keys: list[str]) -> tuple[Any, int]:
+    """Interior rows from every shard plus one row per edge parcel from all of its parts."""
+    import pandas as pd
+
+    from .features.featurize import group_parcel_pixels, grouped_parcel_rows
+
+    frames = []
+    edge_ids, edge_counts = [], []
+    edge_values: dict[str, list[np.ndarray]] = {}
+    for key in keys:
+        shard_dir = os.path.join(plan_dir, "shards", key)
+        csv = os.path.join(shard_dir, "features.csv")
+        if os.path.exists(csv):
+            frames.append(pd.read_csv(csv))
+        with np.load(os.path.join(shard_dir, "edge_values.npz")) as part:
+            edge_ids.append(part["ids"])
+            edge_counts.append(part["counts"])
+            for name in part.files:
+                if name not in ("ids", "counts"):
+                    edge_values.setdefault(name, []).append(part[name])
+    n_edge = 0
+    if edge_ids:
+        # Repeat each id per pixel, then regroup all parts by id with one stable sort
+        pixel_ids = np.repeat(np.concatenate(edge_ids), np.concatenate(edge_counts))
+        values = {name: np.concatenate(parts) for name, parts in edge_values.items()}
+        ids, counts, grouped = group_parcel_pixels(pixel_ids, values, np.unique(pixel_ids))
+        rows = grouped_parcel_rows(ids, counts, grouped)
+        n_edge = len(rows)
+        if rows:
+            frames.append(pd.DataFrame(rows))
+    if not frames:
+        raise RuntimeError("No parcel features in any shard")
+    return pd.concat(frames, ignore_index=True).sort_values("id").reset_index(drop=True), n_edge
+
+
+def merge_shards(plan_dir: str, partial: bool = False) -> dict[str, Any]:
+    """Assemble finished shards into settings.data_dir as if the AOI had been run in one piece:
+    index rasters (interim/*.tif), tiles, features, predictions, parcels and rollups.
+
+    partial=True merges whatever shards are done instead of failing on missing ones.
+    """
+    import geopandas as gpd
+
+    from .features.featurize import save_features
+    from .manifest import RunManifest
+    from .pipeline import publish_parcel_predictions
+
+    t0 = time.perf_counter()
+    plan_dir = os.path.abspath(plan_dir)
+    plan = load_plan(plan_dir)
+    keys = [k for k in plan["shards"] if os.path.exists(os.path.join(plan_dir, "shards", k, SHARD_DONE))]
+    missing = sorted(set(plan["shards"]) - set(keys))
+    if missing and not partial:
+        raise RuntimeError(f"{len(missing)} of {len(plan['shards'])} shards are not done: {', '.join(missing[:10])}")
+    ensure_dir(settings.features_dir)
+    ensure_dir(settings.interim_dir)
+    ensure_dir(settings.tiles_dir)
+
+    for name in RASTERS:
+        _mosaic(plan_dir, plan, name, keys, settings.query_rasters[name])
+    t_rasters = time.perf_counter()
+    tiles = _merge_tiles(plan_dir, plan, keys)
+    t_tiles = time.perf_counter()
+
+    features, n_edge = _merge_features(plan_dir, keys)
+    features_csv = save_features(features, os.path.join(settings.features_dir, "features.csv"))
+    parcels = gpd.read_file(os.path.join(plan_dir, "parcels.gpkg"))
+    # A merge with shards missing does not cover the period, so it stays out of the water history
+    manifest = RunManifest("sharded", plan["aoi"], plan["start"], plan["end"], plan["aoi_bounds"])
+    published = publish_parcel_predictions(features_csv, parcels, plan["aoi"], period=None if missing else f"{plan['start']}/{plan['end']}", manifest=manifest)
+    for name in RASTERS:
+        if name in TILE_LAYERS:
+            manifest.add_layer(
+                name, raster_path=settings.query_rasters[name], zooms=plan["tile_zooms"], tile_stats={"tiles": tiles[name]},
+                fmt=plan["tile_format"], **TILE_LAYERS[name],
+            )
+        else:
+            manifest.add_layer(name, kind="raster", raster_path=settings.query_rasters[name])
+    manifest.data["run"]["timings_s"].update({"rasters": t_rasters - t0, "tiles": t_tiles - t_rasters})
+    manifest.save(settings.manifest_path)
+    report = {
+        "plan_dir": plan_dir,
+        "data_dir": os.path.abspath(settings.data_dir),
+        "shards": len(keys),
+        "missing": missing,
+        "parcels": int(len(features)),
+        "edge_parcels": n_edge,
+        "tiles": tiles,
+        "features": features_csv,
+        **published,
+        "manifest": settings.manifest_path,
+        "rasters_s": t_rasters - t0,
+        "tiles_s": t_tiles - t_rasters,
+        "total_s": time.perf_counter() - t0,
+    }
+    with open(os.path.join(plan_dir, "merge.json"), "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    return report
+
+
+def run_sharded(
+    aoi_path: str,
+    start: str,
+    end: str,
+    workers: int = 2,
+    plan_dir: Optional[str] = None,
+    queue_url: Optional[str] = None,
+    **plan_options: Any,
+) -> dict[str, Any]:
+    """Plan, run the shards with `workers` local processes and merge into settings.data_dir."""
+    t0 = time.perf_counter()
+    plan = plan_shards(aoi_path, start, end, plan_dir=plan_dir, **plan_options)
+    plan_dir = plan["plan_dir"]
+    queue_url = queue_url or default_queue_url(plan_dir)
+    enqueue_shards(plan_dir, queue_url)
+    ctx = multiprocessing.get_context("spawn")
+    procs = [
+        ctx.Process(target=run_worker, args=(queue_url,), kwargs={"worker_id": f"local-{i}", "poll_s": 0.2})
+        for i in range(max(1, workers))
+    ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    t_shards = time.perf_counter()
+
+    from .utils.workqueue import open_queue
+
+    q = open_queue(queue_url, name=QUEUE_NAME)
+    prefix = f"{os.path.basename(plan_dir)}/"
+    jobs = [j for j in q.jobs() if j["id"].startswith(prefix)]
+    q.close()
+    failed = [j for j in jobs if j["status"] != "done"]
+    report: dict[str, Any] = {
+        "plan_dir": plan_dir,
+        "queue": queue_url,
+        "workers": workers,
+        "shards": len(plan["shards"]),
+        "failed": [{"id": j["id"], "error": j["error"]} for j in failed],
+        "by_worker": {w: sum(1 for j in jobs if j["worker"] == w and j["status"] == "done") for w in sorted({j["worker"] for j in jobs if j["worker"]})},
+        "shards_s": t_shards - t0,
+    }
+    if not failed:
+        report["merge"] = merge_shards(plan_dir)
+    report["wall_s"] = time.perf_counter() - t0
+    with open(os.path.join(plan_dir, "shard_report.json"), "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    return report
+
+
+def main(argv: list[str] | None = None) -> int:
+    from .utils.vector_tiles import parse_zoom_range
+
+    ap = argparse.ArgumentParser(description="Sharded AOI execution")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    def plan_args(p: argparse.ArgumentParser) -> None:
+        p.add_argument("aoi")
+        p.add_argument("--start", required=True)
+        p.add_argument("--end", required=True)
+        p.add_argument("--plan-dir", default=None, help="Default: DATA_DIR/shards/<aoi>_<start>_<end>")
+        p.add_argument("--zoom", type=int, default=11, help="Shard tile zoom")
+        p.add_argument("--shard-px", type=int, default=256, help="Shard raster width/height (pixels)")
+        p.add_argument("--tile-zooms", default="8-12")
+        p.add_argument("--source", default="offline", choices=["offline", "stac"])
+        p.add_argument("--parcels", default=None, help="Parcel polygons with an `id` column (default: synthetic grid)")
+        p.add_argument("--queue", default=None, help="redis://... or sqlite:///path (default: SHARD_QUEUE or <plan-dir>/queue.db)")
+
+    p_plan = sub.add_parser("plan", help="Split the AOI and enqueue its shards")
+    plan_args(p_plan)
+    p_run = sub.add_parser("run", help="Plan, process with local worker processes, merge")
+    plan_args(p_run)
+    p_run.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    p_worker = sub.add_parser("worker", help="Process shards from a queue until it drains")
+    p_worker.add_argument("--queue", required=True)
+    p_worker.add_argument("--max-jobs", type=int, default=None)
+    p_merge = sub.add_parser("merge", help="Assemble finished shards into DATA_DIR")
+    p_merge.add_argument("--plan-dir", required=True)
+    p_merge.add_argument("--partial", action="store_true", help="Merge even if some shards are missing")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "worker":
+        print(json.dumps(run_worker(args.queue, max_jobs=args.max_jobs)))
+        return 0
+    if args.cmd == "merge":
+        print(json.dumps(merge_shards(args.plan_dir, partial=args.partial), indent=2, default=str))
+        return 0
+    options = {
+        "plan_dir": args.plan_dir, "shard_zoom": args.zoom, "shard_px": args.shard_px,
+        "tile_zooms": parse_zoom_range(args.tile_zooms), "source": args.source, "parcels_path": args.parcels,
+    }
+    if args.cmd == "plan":
+        plan = plan_shards(args.aoi, args.start, args.end, **options)
+        added = enqueue_shards(plan["plan_dir"], args.queue)
+        print(f"{len(plan['shards'])} shards ({added} newly queued) in {plan['plan_dir']}")
+        return 0
+    report = run_sharded(args.aoi, args.start, args.end, workers=args.workers, queue_url=args.queue, **options)
+    print(f"{report['shards']} shards with {report['workers']} workers in {report['wall_s']:.1f}s "
+          f"({len(report['failed'])} failed; report: {os.path.join(report['plan_dir'], 'shard_report.json')})")
+    return 0 if not report["failed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
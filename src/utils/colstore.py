@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import time
+from typing import Any
+
+import numpy as np
+
+from .io import ensure_dir
+
+# Pointer file naming the live snapshot directory; replaced atomically on publish
+CURRENT = "CURRENT"
+META = "columns.json"
+
+
+def write_columnar(df, root: str, id_col: str = "id", keep: int = 2) -> str:
+    """Publish a DataFrame as a columnar snapshot of .npy files under root.
+
+    Rows are sorted by id_col so readers can binary-search ids. Numeric and bool columns
+    are stored as-is (bool as uint8); other columns as integer codes (the narrowest unsigned
+    type that fits) plus a category list.
+    The snapshot is written to a fresh directory and then made live by atomically
+    replacing root/CURRENT, so readers never see a partial snapshot. The `keep` newest
+    snapshots are retained; older ones are removed (open mmaps of them stay valid).
+    """
+    ensure_dir(root)
+    df = df.sort_values(id_col).reset_index(drop=True)
+    name = f"snap-{time.time_ns()}"
+    tmp_dir = os.path.join(root, f".{name}.tmp")
+    ensure_dir(tmp_dir)
+    columns: list[dict[str, Any]] = []
+    for col in df.columns:
+        series = df[col]
+        entry: dict[str, Any] = {"name": str(col), "file": f"c{len(columns)}.npy"}
+        if series.dtype == bool:
+            arr = series.to_numpy().astype(np.uint8)
+            entry["kind"] = "bool"
+        elif np.issubdtype(series.dtype, np.number):
+            arr = series.to_numpy()
+            entry["kind"] = "num"
+        else:
+            codes, cats = _factorize(series)
+            arr = codes
+            entry["kind"] = "cat"
+            entry["categories"] = cats
+        np.save(os.path.join(tmp_dir, entry["file"]), np.ascontiguousarray(arr))
+        columns.append(entry)
+    with open(os.path.join(tmp_dir, META), "w") as f:
+        json.dump({"rows": int(len(df)), "id": id_col, "columns": columns}, f)
+    snap_dir = os.path.join(root, name)
+    os.replace(tmp_dir, snap_dir)
+    pointer_tmp = os.path.join(root, f".{CURRENT}.tmp")
+    with open(pointer_tmp, "w") as f:
+        f.write(name)
+    os.replace(pointer_tmp, os.path.join(root, CURRENT))
+    _prune(root, keep)
+    return snap_dir
+
+
+def _factorize(series) -> tuple[np.ndarray, list[str]]:
+    values = series.astype(str).to_numpy()
+    cats, codes = np.unique(values, return_inverse=True)
+    dtype = next(t for t in (np.uint8, np.uint16, np.uint32) if len(cats) <= np.iinfo(t).max + 1)
+    return codes.astype(dtype), [str(c) for c in cats]
+
+
+def _prune(root: str, keep: int) -> None:
+    snaps = sorted(d for d in os.listdir(root) if d.startswith("snap-"))
+    for d in snaps[:-keep] if keep > 0 else snaps:
+        shutil.rmtree(os.path.join(root, d), ignore_errors=True)
+
+
+def current_snapshot(root: str) -> str | None:
+    try:
+        with open(os.path.join(root, CURRENT)) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    path = os.path.join(root, name)
+    return path if os.path.isdir(path) else None
+
+
+class ColumnarSnapshot:
+    """Memory-mapped read access to one snapshot written by write_columnar."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, META)) as f:
+            meta = json.load(f)
+        self.rows: int = meta["rows"]
+        self.id_col: str = meta["id"]
+        self.meta = {c["name"]: c for c in meta["columns"]}
+        self.columns = {c["name"]: np.load(os.path.join(path, c["file"]), mmap_mode="r") for c in meta["columns"]}
+        # Small and hot: keep the sorted id column in RAM for binary search
+        self.ids = np.array(self.columns[self.id_col], dtype=np.int64)
+
+    def rows_for(self, ids) -> np.ndarray:
+        """Row offsets for ids; -1 where an id is not present."""
+        q = np.asarray(ids, dtype=np.int64)
+        if self.rows == 0:
+            return np.full(q.shape, -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.ids, q), self.rows - 1)
+        return np.where(self.ids[pos] == q, pos, -1)
+
+    def row_offset(self, pid: int) -> int:
+        if self.rows == 0:
+            return -1
+        pos = int(np.searchsorted(self.ids, pid))
+        return pos if pos < self.rows and self.ids[pos] == pid else -1
+
+    def value(self, col: str, row: int) -> Any:
+        v = self.columns[col][row]
+        kind = self.meta[col]["kind"]
+        if kind == "cat":
+            return self.meta[col]["categories"][int(v)]
+        if kind == "bool":
+            return bool(v)
+        v = v.item()
+        return None if isinstance(v, float) and v != v else v
+
+    def record(self, row: int) -> dict[str, Any]:
+        return {name: self.value(name, row) for name in self.columns}
+
+    def records(self, rows: np.ndarray) -> list[dict[str, Any]]:
+        """Vectorized record() for many rows: one fancy-index gather per column."""
+        rows = np.asarray(rows, dtype=np.int64)
+        cols: dict[str, list] = {}
+        for name, arr in self.columns.items():
+            kind = self.meta[name]["kind"]
+            vals = arr[rows]
+            if kind == "cat":
+                cats = self.meta[name]["categories"]
+                cols[name] = [cats[int(v)] for v in vals]
+            elif kind == "bool":
+                cols[name] = vals.astype(bool).tolist()
+            else:
+                cols[name] = [None if isinstance(v, float) and v != v else v for v in vals.tolist()]
+        return [dict(zip(cols, vals)) for vals in zip(*cols.values())]
@@ -1,5 +1,10 @@
 import os
-from typing import Optional
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+# Touched when a tile layer finishes writing; the API tile index treats its mtime as the layer version
+LAYER_VERSION_MARKER = ".version"
 
 
 def ensure_dir(path: str) -> str:
@@ -13,9 +18,47 @@ def ensure_parent(path: str) -> None:
         os.makedirs(d, exist_ok=True)
 
 
+@contextmanager
+def atomic_write(path: str, suffix: str = "") -> Iterator[str]:
+    """Yield a temporary path next to `path`; it replaces `path` only if the block succeeds.
+
+    `suffix` ends the temporary name for writers that infer the format from it (e.g. ".npz").
+    """
+    ensure_parent(path)
+    tmp = f"{path}.{os.getpid()}.tmp{suffix}"
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
 def find_first_existing(paths: list[str]) -> Optional[str]:
     for p in paths:
         if os.path.exists(p):
             return p
     return None
 
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """Exclusive inter-process lock on path (flock); a no-op where fcntl is unavailable."""
+    ensure_parent(path)
+    try:
+        import fcntl
+    except ImportError:  # Windows
+        yield
+        return
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def mark_layer_updated(layer_dir: str) -> None:
+    ensure_dir(layer_dir)
+    with open(os.path.join(layer_dir, LAYER_VERSION_MARKER), "w") as f:
+        f.write(str(time.time_ns()))
@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Optional, Sequence, Tuple
+
+from .tile_formats import TILE_FORMATS
+
+# MBTiles 1.3 with the deduplicating map/images layout: identical tiles (empty, uniform
+# ocean, ...) are stored once in `images` and referenced from `map` by content hash.
+_SCHEMA = """
+CREATE TABLE metadata (name TEXT, value TEXT);
+CREATE UNIQUE INDEX metadata_name ON metadata (name);
+CREATE TABLE map (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_id TEXT);
+CREATE UNIQUE INDEX map_index ON map (zoom_level, tile_column, tile_row);
+CREATE TABLE images (tile_data BLOB, tile_id TEXT);
+CREATE UNIQUE INDEX images_id ON images (tile_id);
+CREATE VIEW tiles AS
+    SELECT map.zoom_level AS zoom_level, map.tile_column AS tile_column,
+           map.tile_row AS tile_row, images.tile_data AS tile_data
+    FROM map JOIN images ON images.tile_id = map.tile_id;
+"""
+
+
+def archive_path(tiles_root: str, layer: str) -> str:
+    return os.path.join(tiles_root, f"{layer}.mbtiles")
+
+
+def _tms_row(z: int, y: int) -> int:
+    # MBTiles stores rows bottom-up (TMS); XYZ counts top-down
+    return (1 << z) - 1 - y
+
+
+class MBTilesWriter:
+    """Write tiles into a single MBTiles archive, deduplicating identical tile images.
+
+    Tiles go to `<path>.tmp` and the archive is moved into place on close, so readers
+    never see a half-written file. `replaces`: a directory of loose tiles for the same layer,
+    removed once the archive is in place so a previous run's files cannot be served.
+    """
+
+    def __init__(self, path: str, name: str, fmt: str = "png", bounds: Sequence[float] | None = None, batch: int = 500, replaces: Optional[str] = None):
+        self.path = path
+        self.replaces = replaces
+        self.tmp_path = path + ".tmp"
+        self.batch = batch
+        self.tiles = 0
+        self.unique = 0
+        self._seen: set[str] = set()
+        self._pending_map: list[tuple[int, int, int, str]] = []
+        self._pending_img: list[tuple[bytes, str]] = []
+        self._zooms: set[int] = set()
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        self._conn = sqlite3.connect(self.tmp_path)
+        self._conn.execute("PRAGMA journal_mode=OFF")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.executescript(_SCHEMA)
+        # The metadata names the file type ("png8" is a palette PNG)
+        meta = {"name": name, "format": TILE_FORMATS.get(fmt, (fmt,))[0], "type": "overlay", "version": "1.3"}
+        if bounds is not None:
+            meta["bounds"] = ",".join(f"{b:.6f}" for b in bounds)
+        self._conn.executemany("INSERT INTO metadata (name, value) VALUES (?, ?)", list(meta.items()))
+
+    def put(self, z: int, x: int, y: int, data: bytes) -> None:
+        tile_id = hashlib.md5(data).hexdigest()
+        if tile_id not in self._seen:
+            self._seen.add(tile_id)
+            self._pending_img.append((sqlite3.Binary(data), tile_id))
+            self.unique += 1
+        self._pending_map.append((z, x, _tms_row(z, y), tile_id))
+        self._zooms.add(z)
+        self.tiles += 1
+        if len(self._pending_map) >= self.batch:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._pending_img:
+            self._conn.executemany("INSERT INTO images (tile_data, tile_id) VALUES (?, ?)", self._pending_img)
+        if self._pending_map:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO map (zoom_level, tile_column, tile_row, tile_id) VALUES (?, ?, ?, ?)",
+                self._pending_map,
+            )
+        self._pending_img.clear()
+        self._pending_map.clear()
+
+    def close(self) -> None:
+        if self._conn is None:
+            return
+        self._flush()
+        if self._zooms:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+                [("minzoom", str(min(self._zooms))), ("maxzoom", str(max(self._zooms)))],
+            )
+        self._conn.commit()
+        self._conn.close()
+        self._conn = None
+        os.replace(self.tmp_path, self.path)
+        if self.replaces:
+            shutil.rmtree(self.replaces, ignore_errors=True)
+
+    def abort(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __enter__(self) -> "MBTilesWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class MBTilesReader:
+    """Read-only MBTiles access with one pooled connection per thread and mmap'd pages.
+
+    The archive is reopened when the file is replaced (new inode or mtime), checked at
+    most once per `recheck_s`.
+    """
+
+    def __init__(self, path: str, recheck_s: float = 1.0, mmap_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.recheck_s = recheck_s
+        self.mmap_bytes = mmap_bytes
+        self._local = threading.local()
+        self._generation = self._file_id()
+        self._checked = time.monotonic()
+        self._dedup = None
+        self.metadata = self._read_metadata()
+
+    def _file_id(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    @property
+    def exists(self) -> bool:
+        return self._generation is not None
+
+    def _conn(self) -> sqlite3.Connection:
+        now = time.monotonic()
+        if now - self._checked >= self.recheck_s:
+            self._checked = now
+            gen = self._file_id()
+            if gen != self._generation:
+                self._generation = gen
+                self._dedup = None
+                self.metadata = self._read_metadata()
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "generation", None) != self._generation:
+            if conn is not None:
+                conn.close()
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size={int(self.mmap_bytes)}")
+            self._local.conn = conn
+            self._local.generation = self._generation
+        return conn
+
+    def _read_metadata(self) -> dict[str, str]:
+        if self._generation is None:
+            return {}
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            return dict(conn.execute("SELECT name, value FROM metadata").fetchall())
+        finally:
+            conn.close()
+
+    def get(self, z: int, x: int, y: int) -> Optional[Tuple[bytes, str]]:
+        """Return (tile bytes, content hash) or None if the tile is not in the archive."""
+        if self._generation is None:
+            return None
+        conn = self._conn()
+        if self._dedup is None:
+            self._dedup = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'map' AND type = 'table'").fetchone() is not None
+        row_y = _tms_row(z, y)
+        if self._dedup:
+            row = conn.execute(
+                "SELECT images.tile_data, images.tile_id FROM map JOIN images ON images.tile_id = map.tile_id "
+                "WHERE map.zoom_level = ? AND map.tile_column = ? AND map.tile_row = ?",
+                (z, x, row_y),
+            ).fetchone()
+            return (bytes(row[0]), row[1]) if row else None
+        # Plain `tiles` table from other producers: hash on the fly for the ETag
+        row = conn.execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (z, x, row_y),
+        ).fetchone()
+        if row is None:
+            return None
+        data = bytes(row[0])
+        return data, hashlib.md5(data).hexdigest()
+
+
+class MBTilesRegistry:
+    """Per-layer MBTilesReader cache; notices archives appearing or disappearing."""
+
+    def __init__(self, recheck_s: float = 1.0):
+        self.recheck_s = recheck_s
+        self._readers: dict[str, Tuple[Optional[MBTilesReader], float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> Optional[MBTilesReader]:
+        now = time.monotonic()
+        entry = self._readers.get(path)
+        if entry is not None and now - entry[1] < self.recheck_s:
+            return entry[0]
+        reader = entry[0] if entry is not None else None
+        exists = os.path.exists(path)
+        with self._lock:
+            if not exists:
+                reader = None
+            elif reader is None:
+                reader = MBTilesReader(path, recheck_s=self.recheck_s)
+            self._readers[path] = (reader, now)
+        return reader
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._readers.clear()
@@ -0,0 +1,303 @@
+from __future__ import annotations
+
+import struct
+from typing import Any, Iterable, Mapping, Optional
+
+import numpy as np
+
+# Mapbox Vector Tile 2.1 encoder (protobuf wire format written by hand, no extra deps).
+# Only what the parcel layer needs: polygon features with scalar properties. Geometry
+# and tags for a whole layer are built with array operations over ragged coordinates
+# (the layout of shapely.to_ragged_array), so cost does not grow with per-feature
+# Python work.
+
+DEFAULT_EXTENT = 4096
+
+_POLYGON = 3
+_MOVE_TO_1 = 1 | (1 << 3)
+_LINE_TO = 2
+_CLOSE_PATH_1 = 7 | (1 << 3)
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _key(field: int, wire_type: int) -> bytes:
+    return _varint((field << 3) | wire_type)
+
+
+def _len_field(field: int, payload: bytes) -> bytes:
+    return _key(field, 2) + _varint(len(payload)) + payload
+
+
+def varints(values: np.ndarray) -> tuple[bytes, np.ndarray]:
+    """Varint-encode non-negative ints in one pass: (concatenated bytes, byte offsets).
+
+    offsets has len(values) + 1 entries; value i occupies bytes[offsets[i]:offsets[i+1]].
+    """
+    v = np.asarray(values).astype(np.uint64)
+    nbytes = np.ones(len(v), dtype=np.int64)
+    for k in range(1, 10):
+        more = v >= np.uint64(1 << (7 * k))
+        if not more.any():
+            break
+        nbytes += more
+    width = int(nbytes.max()) if len(v) else 1
+    k = np.arange(width)
+    groups = ((v[:, None] >> (k.astype(np.uint64) * np.uint64(7))) & np.uint64(0x7F)).astype(np.uint8)
+    groups[k[None, :] < nbytes[:, None] - 1] |= 0x80
+    offsets = np.zeros(len(v) + 1, dtype=np.int64)
+    np.cumsum(nbytes, out=offsets[1:])
+    return groups[k[None, :] < nbytes[:, None]].tobytes(), offsets
+
+
+def _zigzag(a: np.ndarray) -> np.ndarray:
+    return (a << 1) ^ (a >> 63)
+
+
+def _encode_value(value: Any) -> bytes:
+    if isinstance(value, (bool, np.bool_)):
+        return _key(7, 0) + _varint(int(bool(value)))
+    if isinstance(value, (int, np.integer)):
+        v = int(value)
+        if v >= 0:
+            return _key(5, 0) + _varint(v)
+        return _key(6, 0) + _varint((v << 1) ^ (v >> 63))
+    if isinstance(value, (float, np.floating)):
+        return _key(3, 1) + struct.pack("<d", float(value))
+    return _len_field(1, str(value).encode("utf-8"))
+
+
+def _exclusive_cumsum(a: np.ndarray) -> np.ndarray:
+    out = np.zeros(len(a), dtype=np.int64)
+    if len(a) > 1:
+        np.cumsum(a[:-1], out=out[1:])
+    return out
+
+
+def polygon_commands(
+    coords: np.ndarray,
+    ring_offsets: np.ndarray,
+    polygon_offsets: np.ndarray,
+    geom_offsets: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Geometry command streams for (multi)polygons already in tile pixel coordinates.
+
+    Vertices are rounded to integers; closing and repeated vertices are dropped; rings
+    that collapse to fewer than 3 points or zero area are removed (with their holes,
+    for an exterior). Exteriors are oriented to positive area (clockwise, y down) and
+    holes to negative, as the spec requires. Returns (uint64 stream, per-geometry
+    [start, end) word offsets); empty ranges mean the geometry vanished at this zoom.
+    """
+    n_geoms = len(geom_offsets) - 1
+    n_polys = len(polygon_offsets) - 1
+    n_rings = len(ring_offsets) - 1
+    ring_len = np.diff(ring_offsets)
+    pts = np.rint(coords[:, :2]).astype(np.int64)
+    ring_of = np.repeat(np.arange(n_rings), ring_len)
+
+    keep = np.ones(len(pts), dtype=bool)
+    keep[ring_offsets[1:][ring_len > 0] - 1] = False  # closing vertex
+    if len(pts) > 1:
+        keep[1:] &= ~((pts[1:] == pts[:-1]).all(axis=1) & (ring_of[1:] == ring_of[:-1]))
+    pts, ring_of = pts[keep], ring_of[keep]
+
+    counts = np.bincount(ring_of, minlength=n_rings)
+    starts = _exclusive_cumsum(counts)
+    # Last vertex rounding onto the first one
+    multi = np.flatnonzero(counts > 1)
+    wrap = multi[(pts[starts[multi] + counts[multi] - 1] == pts[starts[multi]]).all(axis=1)]
+    if len(wrap):
+        keep = np.ones(len(pts), dtype=bool)
+        keep[starts[wrap] + counts[wrap] - 1] = False
+        pts, ring_of = pts[keep], ring_of[keep]
+        counts = np.bincount(ring_of, minlength=n_rings)
+        starts = _exclusive_cumsum(counts)
+
+    # Twice the signed ring area (surveyor's formula); exact in float64 at tile scale
+    local = np.arange(len(pts)) - starts[ring_of]
+    nxt = np.arange(len(pts)) + 1
+    last = local == counts[ring_of] - 1
+    nxt[last] = starts[ring_of[last]]
+    x, y = pts[:, 0], pts[:, 1]
+    area = np.bincount(ring_of, weights=(x * y[nxt] - x[nxt] * y).astype(np.float64), minlength=n_rings)
+
+    poly_of_ring = np.repeat(np.arange(n_polys), np.diff(polygon_offsets))
+    is_ext = np.zeros(n_rings, dtype=bool)
+    is_ext[polygon_offsets[:-1][np.diff(polygon_offsets) > 0]] = True
+    valid = (counts >= 3) & (area != 0)
+    poly_ok = np.zeros(n_polys, dtype=bool)
+    poly_ok[poly_of_ring[is_ext]] = valid[is_ext]
+    valid &= poly_ok[poly_of_ring]
+    flip = (area > 0) != is_ext
+
+    # Gather kept vertices in output order, reversing rings with the wrong winding
+    order = starts[ring_of] + np.where(flip[ring_of], counts[ring_of] - 1 - local, local)
+    sel = valid[ring_of]
+    P, R, L = pts[order][sel], ring_of[sel], local[sel]
+    feat_of_ring = np.repeat(np.arange(n_geoms), np.diff(geom_offsets))[poly_of_ring]
+    F = feat_of_ring[R]
+    D = np.diff(P, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    if len(F):
+        # The cursor restarts at (0, 0) for every feature
+        fstart = np.ones(len(F), dtype=bool)
+        fstart[1:] = F[1:] != F[:-1]
+        D[fstart] = P[fstart]
+    Z = _zigzag(D)
+
+    kept = np.flatnonzero(valid)
+    out_len = 2 * counts[kept] + 3
+    out_start = _exclusive_cumsum(out_len)
+    stream = np.empty(int(out_len.sum()), dtype=np.uint64)
+    stream[out_start] = _MOVE_TO_1
+    stream[out_start + 3] = (_LINE_TO | ((counts[kept] - 1) << 3)).astype(np.uint64)
+    stream[out_start + out_len - 1] = _CLOSE_PATH_1
+    ring_pos = np.full(n_rings, -1, dtype=np.int64)
+    ring_pos[kept] = np.arange(len(kept))
+    at = out_start[ring_pos[R]] + np.where(L == 0, 1, 2 + 2 * L)
+    stream[at] = Z[:, 0]
+    stream[at + 1] = Z[:, 1]
+
+    words = np.bincount(feat_of_ring[kept], weights=out_len, minlength=n_geoms).astype(np.int64)
+    bounds = np.zeros(n_geoms + 1, dtype=np.int64)
+    np.cumsum(words, out=bounds[1:])
+    return stream, bounds
+
+
+def _concat_records(slots: list[tuple[np.ndarray, np.ndarray, np.ndarray]]) -> bytes:
+    """Build n records, each the concatenation of one byte range per slot, in one pass.
+
+    Each slot is (uint8 buffer, per-record start, per-record length) over that buffer.
+    """
+    lengths = np.stack([ln for _, _, ln in slots], axis=1)
+    rec_len = lengths.sum(axis=1)
+    slot_at = (_exclusive_cumsum(rec_len)[:, None] + np.cumsum(lengths, axis=1) - lengths)
+    out = np.empty(int(rec_len.sum()), dtype=np.uint8)
+    for k, (buf, st, ln) in enumerate(slots):
+        total = int(ln.sum())
+        if total == 0:
+            continue
+        within = np.arange(total) - np.repeat(_exclusive_cumsum(ln), ln)
+        out[np.repeat(slot_at[:, k], ln) + within] = buf[np.repeat(st, ln) + within]
+    return out.tobytes()
+
+
+def _const(data: bytes, n: int, present: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    lengths = np.full(n, len(data), dtype=np.int64)
+    if present is not None:
+        lengths[~present] = 0
+    return np.frombuffer(data, dtype=np.uint8), np.zeros(n, dtype=np.int64), lengths
+
+
+def _varint_slot(values: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    data, offsets = varints(values)
+    return np.frombuffer(data, dtype=np.uint8), offsets[:-1], np.diff(offsets)
+
+
+def _value_messages(uniq: np.ndarray) -> bytes:
+    """Layer `values` entries (field 4 Value messages) for one column's distinct values."""
+    n = len(uniq)
+    if uniq.dtype.kind == "b":
+        return _concat_records([_const(b"\x22\x02\x38", n), (uniq.astype(np.uint8), np.arange(n), np.ones(n, dtype=np.int64))])
+    if uniq.dtype.kind == "f":
+        doubles = uniq.astype("<f8").view(np.uint8)
+        return _concat_records([_const(b"\x22\x09\x19", n), (doubles, np.arange(n) * 8, np.full(n, 8, dtype=np.int64))])
+    if uniq.dtype.kind in "iu":
+        v = uniq.astype(np.int64)
+        neg = v < 0
+        encoded = np.where(neg, _zigzag(v), v)
+        body_buf, body_st, body_len = _varint_slot(encoded)
+        heads = np.column_stack([np.full(n, 0x22), body_len + 1, np.where(neg, 0x30, 0x28)]).astype(np.uint8).ravel()
+        return _concat_records([(heads, np.arange(n) * 3, np.full(n, 3, dtype=np.int64)), (body_buf, body_st, body_len)])
+    return b"".join(_len_field(4, _encode_value(v)) for v in uniq.tolist())
+
+
+def _tag_table(properties: Mapping[str, np.ndarray], n: int) -> tuple[np.ndarray, list[str], bytes]:
+    """(n, 2 * ncols) key/value index pairs (-1 where missing), keys, encoded values."""
+    keys: list[str] = []
+    values: list[bytes] = []
+    n_values = 0
+    tags = np.full((n, 2 * len(properties)), -1, dtype=np.int64)
+    for j, (name, col) in enumerate(properties.items()):
+        col = np.ma.asarray(col)
+        missing = np.ma.getmaskarray(col)
+        data = np.ma.getdata(col)
+        if data.dtype.kind == "f":
+            missing = missing | np.isnan(data)
+        present = ~missing
+        if not present.any():
+            continue
+        uniq, inv = np.unique(data[present], return_inverse=True)
+        tags[present, 2 * j] = len(keys)
+        tags[present, 2 * j + 1] = n_values + inv
+        keys.append(name)
+        values.append(_value_messages(uniq))
+        n_values += len(uniq)
+    return tags, keys, b"".join(values)
+
+
+def encode_polygon_layer(
+    name: str,
+    coords: np.ndarray,
+    ring_offsets: np.ndarray,
+    polygon_offsets: np.ndarray,
+    geom_offsets: np.ndarray,
+    ids: Optional[np.ndarray] = None,
+    properties: Optional[Mapping[str, np.ndarray]] = None,
+    extent: int = DEFAULT_EXTENT,
+) -> bytes:
+    """Encode one polygon layer; returns b"" when no feature survives at this zoom.
+
+    properties maps a key to one value per geometry (numpy or masked array); masked
+    entries and NaN are left out of that feature's tags.
+    """
+    n = len(geom_offsets) - 1
+    stream, gbounds = polygon_commands(coords, ring_offsets, polygon_offsets, geom_offsets)
+    alive = np.flatnonzero(np.diff(gbounds) > 0)
+    m = len(alive)
+    if not m:
+        return b""
+    gbytes, goff = varints(stream)
+    tags, keys, values = _tag_table(properties or {}, n)
+    tags = tags[alive]
+    tag_mask = tags >= 0
+    tbytes, toff = varints(tags[tag_mask])
+    tbounds = np.zeros(m + 1, dtype=np.int64)
+    np.cumsum(tag_mask.sum(axis=1), out=tbounds[1:])
+
+    # Feature: [id] [packed tags] type=POLYGON packed geometry
+    geom_st, geom_len = goff[gbounds[alive]], goff[gbounds[alive + 1]] - goff[gbounds[alive]]
+    tag_st, tag_len = toff[tbounds[:-1]], toff[tbounds[1:]] - toff[tbounds[:-1]]
+    has_tags = tag_len > 0
+    tag_len_slot = _varint_slot(tag_len)
+    tag_len_slot[2][~has_tags] = 0
+    slots = []
+    if ids is not None:
+        slots += [_const(_key(1, 0), m), _varint_slot(np.asarray(ids)[alive])]
+    slots += [
+        _const(_key(2, 2), m, has_tags),
+        tag_len_slot,
+        (np.frombuffer(tbytes, dtype=np.uint8), tag_st, tag_len),
+        _const(_key(3, 0) + _varint(_POLYGON) + _key(4, 2), m),
+        _varint_slot(geom_len),
+        (np.frombuffer(gbytes, dtype=np.uint8), geom_st, geom_len),
+    ]
+    feat_len = sum(ln for _, _, ln in slots)
+    features = _concat_records([_const(_key(2, 2), m), _varint_slot(feat_len)] + slots)
+
+    parts = [_key(15, 0) + _varint(2) + _len_field(1, name.encode("utf-8")), features]
+    parts.extend(_len_field(3, k.encode("utf-8")) for k in keys)
+    parts.append(values)
+    parts.append(_key(5, 0) + _varint(extent))
+    return b"".join(parts)
+
+
+def encode_tile(layers: Iterable[bytes]) -> bytes:
+    """Wrap encoded layers into a tile; empty layers are dropped (all empty -> b"")."""
+    return b"".join(_len_field(3, layer) for layer in layers if layer)
@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Sequence, Union
+
+import numpy as np
+
+from .io import atomic_write
+
+
+# Interim rasters are Cloud-Optimized GeoTIFFs: 256 px internal tiles (one XYZ tile), deflate
+# with a predictor, NaN nodata and overviews halving down to a single block
+COG_BLOCK = 256
+
+
+def cog_options(resampling: str = "average") -> dict:
+    """Creation options for rasterio/rioxarray writes through GDAL's COG driver.
+
+    `resampling` builds the overviews: "average" for continuous layers, "nearest" for
+    classes or circular values (aspect).
+    """
+    return {
+        "driver": "COG",
+        "compress": "deflate",
+        "predictor": "YES",  # floating-point predictor for float bands, horizontal for integers
+        "blocksize": COG_BLOCK,
+        "overviews": "AUTO",
+        "overview_resampling": resampling,
+        "BIGTIFF": "IF_SAFER",
+    }
+
+
+def write_geotiff(array: np.ndarray, path: str, bounds: Sequence[float], crs: str = "EPSG:4326") -> str:
+    """Write a single-band float32 COG (NaN nodata) covering bounds (minx, miny, maxx, maxy)."""
+    from rasterio.transform import from_bounds
+
+    h, w = array.shape
+    return write_cog(array, path, crs, from_bounds(*bounds, w, h))
+
+
+def write_cog(array: np.ndarray, path: str, crs, transform, nodata: float = np.nan, resampling: str = "average") -> str:
+    """Write a 2D array as a float32 COG, atomically (tmp file + rename)."""
+    import rasterio
+
+    h, w = array.shape
+    profile = {"width": w, "height": h, "count": 1, "dtype": "float32", "crs": crs, "transform": transform, "nodata": nodata, **cog_options(resampling)}
+    with atomic_write(path) as tmp, rasterio.open(tmp, "w", **profile) as dst:
+        dst.write(array.astype(np.float32, copy=False), 1)
+    return path
+
+
+def tiled_profile(ref_profile: dict) -> dict:
+    """Profile for a tiled scratch GeoTIFF written block by block, later turned into a COG by to_cog."""
+    keep = {k: ref_profile[k] for k in ("width", "height", "crs", "transform") if k in ref_profile}
+    return {
+        "driver": "GTiff", "count": 1, "dtype": "float32", "nodata": np.nan, **keep, "tiled": True,
+        "blockxsize": COG_BLOCK, "blockysize": COG_BLOCK, "compress": "deflate", "predictor": 3, "BIGTIFF": "IF_SAFER",
+    }
+
+
+def to_cog(src_path: str, dst_path: str, resampling: str = "average") -> str:
+    """Copy a GeoTIFF into a COG at dst_path (may equal src_path); GDAL streams it and builds overviews."""
+    from rasterio.shutil import copy
+
+    with atomic_write(dst_path, ".cog") as tmp:
+        copy(src_path, tmp, **cog_options(resampling))
+    return dst_path
+
+
+def overview_factor(ds, decimation: float, band: int = 1, coarser: bool = False) -> int:
+    """The dataset's internal overview factor to serve a read decimated by `decimation`.
+
+    By default the coarsest overview no coarser than the request (1 = full resolution), so
+    no detail is lost; with coarser=True the finest overview at least as coarse, falling
+    back to the coarsest one there is.
+    """
+    factors = [1] + sorted(ds.overviews(band))
+    if coarser:
+        return next((f for f in factors if f >= decimation), factors[-1])
+    return max(f for f in factors if f <= max(1.0, decimation))
+
+
+def overview_window(ds, window, factor: int):
+    """Grow `window` to whole pixels of the overview with `factor`.
+
+    Returns (full-resolution Window, possibly fractional, out_shape). Reading that window
+    with that out_shape returns the overview's own pixels, with no resampling.
+    """
+    from rasterio.windows import Window
+
+    if factor <= 1:
+        return window, (int(window.height), int(window.width))
+    # GDAL overview sizes round up, so an overview pixel spans slightly under `factor` source pixels
+    oh, ow = -(-ds.height // factor), -(-ds.width // factor)
+    fy, fx = ds.height / oh, ds.width / ow
+    r0, c0 = int(window.row_off // fy), int(window.col_off // fx)
+    r1 = min(oh, int(np.ceil((window.row_off + window.height) / fy)))
+    c1 = min(ow, int(np.ceil((window.col_off + window.width) / fx)))
+    return Window(c0 * fx, r0 * fy, (c1 - c0) * fx, (r1 - r0) * fy), (r1 - r0, c1 - c0)
+
+
+def block_windows(width: int, height: int, block: int):
+    """Row-major Windows of at most block x block pixels covering a width x height raster."""
+    from rasterio.windows import Window
+
+    for row in range(0, height, block):
+        for col in range(0, width, block):
+            yield Window(col, row, min(block, width - col), min(block, height - row))
+
+
+def read_with_halo(ds, window, halo: int, band: int = 1) -> np.ndarray:
+    """float32 read of window grown by `halo` pixels on every side.
+
+    Pixels beyond the raster edge and source nodata come back as NaN, so kernels see the
+    same neighbourhood whether a pixel sits at a block seam or in the middle of a block.
+    """
+    from rasterio.windows import Window
+
+    col0, row0 = int(window.col_off) - halo, int(window.row_off) - halo
+    col1, row1 = int(window.col_off + window.width) + halo, int(window.row_off + window.height) + halo
+    c0, r0 = max(col0, 0), max(row0, 0)
+    c1, r1 = min(col1, ds.width), min(row1, ds.height)
+    arr = ds.read(band, window=Window(c0, r0, c1 - c0, r1 - r0)).astype(np.float32)
+    if ds.nodata is not None and not np.isnan(ds.nodata):
+        arr[arr == ds.nodata] = np.nan
+    return np.pad(arr, ((r0 - row0, row1 - r1), (c0 - col0, col1 - c1)), constant_values=np.nan)
+
+
+def map_blocks(
+    src_path: str,
+    out_paths: Union[str, dict[str, str]],
+    fn: Callable,
+    halo: int = 0,
+    block: int = 1024,
+    workers: Optional[int] = None,
+    resampling: Union[str, dict[str, str]] = "average",
+) -> None:
+    """Apply fn to a single-band raster block by block on a thread pool, writing COG(s).
+
+    fn(z, ds, window) gets the block read with `halo` pixels on every side (read_with_halo),
+    the dataset it came from and the block's window; it returns the block's float32 output,
+    or a dict of them keyed like out_paths. Every thread reads through its own dataset handle
+    (GDAL handles are not thread-safe). Blocks land in tiled scratch files, writes serialized,
+    and each becomes a COG (overviews by `resampling`, per output for a dict) once complete.
+    """
+    import rasterio
+
+    single = isinstance(out_paths, str)
+    paths = {"": out_paths} if single else dict(out_paths)
+    local = threading.local()
+    handles = []
+    handles_lock = threading.Lock()
+    write_lock = threading.Lock()
+
+    def dataset():
+        ds = getattr(local, "ds", None)
+        if ds is None:
+            ds = local.ds = rasterio.open(src_path)
+            with handles_lock:
+                handles.append(ds)
+        return ds
+
+    with rasterio.open(src_path) as src:
+        profile = tiled_profile(src.profile)
+        windows = list(block_windows(src.width, src.height, block))
+    scratch = {name: f"{path}.blocks.tif" for name, path in paths.items()}
+    outs = {name: rasterio.open(path, "w", **profile) for name, path in scratch.items()}
+
+    def work(window) -> None:
+        ds = dataset()
+        result = fn(read_with_halo(ds, window, halo), ds, window)
+        result = {"": result} if single else result
+        with write_lock:
+            for name, out in outs.items():
+                out.write(result[name], 1, window=window)
+
+    try:
+        try:
+            with ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 1)) as pool:
+                for _ in pool.map(work, windows):
+                    pass
+        finally:
+            for out in outs.values():
+                out.close()
+            for ds in handles:
+                ds.close()
+        for name, path in scratch.items():
+            to_cog(path, paths[name], resampling=resampling if isinstance(resampling, str) else resampling[name])
+    finally:
+        for path in scratch.values():
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def box_sum(a: np.ndarray, r: int) -> np.ndarray:
+    """Sum over every (2r+1) x (2r+1) window that fits inside `a` (output shrinks by r per side).
+
+    Uses a summed-area table, so the cost is O(pixels) whatever the window size.
+    """
+    k = 2 * r + 1
+    s = np.zeros((a.shape[0] + 1, a.shape[1] + 1), dtype=np.float64)
+    np.cumsum(a, axis=0, dtype=np.float64, out=s[1:, 1:])
+    np.cumsum(s[1:, 1:], axis=1, out=s[1:, 1:])
+    return s[k:, k:] - s[:-k, k:] - s[k:, :-k] + s[:-k, :-k]
+
+
+def grid_key(ds) -> str:
+    """Short stable hash of an open dataset's grid (CRS, transform, size), for cache keys."""
+    import hashlib
+    import json
+
+    sig = [ds.crs.to_wkt() if ds.crs else "", list(ds.transform)[:6], ds.width, ds.height]
+    return hashlib.sha1(json.dumps(sig).encode()).hexdigest()[:16]
@@ -0,0 +1,423 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+
+from .io import atomic_write
+
+# Bump when the plan layout or coordinate convention changes so cached plans are rebuilt
+_PLAN_VERSION = 1
+# Memory for full-grid plans kept per process, lattices plus gather indices (tile plans go
+# through PlanPack instead); the most recent plan is kept whatever its size
+_MEMO_BYTES = 256 * 1024 * 1024
+# Largest tile plan pack on disk; plans used by the latest run are kept first
+PACK_MAX_BYTES = 64 * 1024 * 1024
+_memo: "OrderedDict[str, ReprojectionPlan]" = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def _same_crs(a: Any, b: Any) -> bool:
+    from pyproj import CRS
+
+    return CRS.from_user_input(a) == CRS.from_user_input(b)
+
+
+class ReprojectionPlan:
+    """Pixel mapping from one grid onto another, computed once and applied to any number of bands.
+
+    Source coordinates are transformed exactly on a lattice every `step` destination pixels
+    and interpolated in between (an approximate transformer, like GDAL's): the interpolation
+    error is checked at the lattice cell centres and the lattice refined until it is below
+    `max_error` source pixels. Only the lattice is stored (see save/load); the full-resolution
+    coordinates and the bilinear gather indices are derived from it on first use, and the
+    coordinates are dropped again once the gather indices are built.
+    """
+
+    def __init__(self, src_shape: tuple[int, int], dst_shape: tuple[int, int], lattice: tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray], key: str = ""):
+        self.src_shape = tuple(int(v) for v in src_shape)
+        self.dst_shape = tuple(int(v) for v in dst_shape)
+        # (lattice destination rows, lattice destination cols, source rows, source cols)
+        self.lattice = lattice
+        self.key = key
+        self._coords: Optional[tuple[np.ndarray, np.ndarray]] = None
+        self._gather: Optional[tuple[Any, tuple]] = None
+        self._window: Optional[tuple[Any, int]] = None
+
+    @classmethod
+    def build(
+        cls,
+        src_crs: Any,
+        src_transform,
+        src_shape: tuple[int, int],
+        dst_crs: Any,
+        dst_transform,
+        dst_shape: tuple[int, int],
+        step: int = 16,
+        max_error: float = 0.125,
+    ) -> "ReprojectionPlan":
+        key = plan_key(src_crs, src_transform, src_shape, dst_crs, dst_transform, dst_shape, step, max_error)
+        transformer = None if _same_crs(src_crs, dst_crs) else _transformer(dst_crs, src_crs)
+        h, w = dst_shape
+        step = max(1, int(step))
+        while True:
+            lr, lc = _lattice_axis(h, step), _lattice_axis(w, step)
+            rows, cols = _exact_coords(transformer, src_transform, dst_transform, lr, lc)
+            if step == 1:
+                break
+            # Check the interpolation half-way between lattice points, where its error peaks
+            mr, mc = (lr[:-1] + lr[1:]) // 2, (lc[:-1] + lc[1:]) // 2
+            er, ec = _exact_coords(transformer, src_transform, dst_transform, mr, mc)
+            ir, ic = _interp_lattice(lr, lc, rows, cols, mr, mc)
+            if max(np.nanmax(np.abs(ir - er), initial=0.0), np.nanmax(np.abs(ic - ec), initial=0.0)) <= max_error:
+                break
+            step //= 2
+        return cls(src_shape, dst_shape, (lr, lc, rows, cols), key=key)
+
+    def coords(self) -> tuple[np.ndarray, np.ndarray]:
+        """Fractional source (row, col) of every destination pixel centre (float32, full resolution)."""
+        if self._coords is None:
+            lr, lc, rows, cols = self.lattice
+            h, w = self.dst_shape
+            self._coords = _interp_lattice(lr, lc, rows, cols, np.arange(h), np.arange(w))
+        return self._coords
+
+    def nbytes(self) -> int:
+        """Memory held by the lattice and the derived coordinates and gather indices."""
+        arrays = list(self.lattice) + list(self._coords or ())
+        if self._gather is not None:
+            arrays += [a for a in self._gather[1] if a is not None]
+        return sum(a.nbytes for a in arrays)
+
+    def source_window(self, margin: int = 1):
+        """Smallest rasterio Window of the source holding every mapped pixel (+ margin), or None."""
+        from rasterio.windows import Window
+
+        rows, cols = self.coords()
+        h, w = self.src_shape
+        inside = (rows >= -0.5) & (rows <= h - 0.5) & (cols >= -0.5) & (cols <= w - 0.5)
+        if not inside.any():
+            return None
+        r, c = rows[inside], cols[inside]
+        r0 = max(0, int(np.floor(r.min())) - margin)
+        c0 = max(0, int(np.floor(c.min())) - margin)
+        r1 = min(h, int(np.ceil(r.max())) + 1 + margin)
+        c1 = min(w, int(np.ceil(c.max())) + 1 + margin)
+        return Window(c0, r0, c1 - c0, r1 - r0)
+
+    def decimation(self) -> int:
+        """Whole source pixels per destination pixel (1 when the destination is as fine or finer)."""
+        lr, lc, rows, cols = self.lattice
+        with np.errstate(invalid="ignore"):
+            dx = np.hypot(np.diff(rows, axis=1), np.diff(cols, axis=1)) / np.diff(lc)[None, :]
+            dy = np.hypot(np.diff(rows, axis=0), np.diff(cols, axis=0)) / np.diff(lr)[:, None]
+        per_px = min(np.nanmedian(dx) if dx.size else np.nan, np.nanmedian(dy) if dy.size else np.nan)
+        return max(1, int(per_px)) if np.isfinite(per_px) else 1
+
+    def read(self, src, band: int = 1, resampling: str = "bilinear"):
+        """Read the part of an open dataset this plan needs, decimated when the destination is coarser.
+
+        Returns (float32 array with NaN for nodata, window) for apply(); (None, None) when the
+        destination does not overlap the source. When the source has internal overviews (the
+        interim COGs), a coarser destination reads the matching overview's own pixels: the
+        window is grown to whole overview pixels, so GDAL neither resamples nor touches the
+        full-resolution blocks.
+        """
+        from rasterio.enums import Resampling
+
+        from .rasters import overview_factor, overview_window
+
+        if self._window is None:
+            self._window = (self.source_window(), self.decimation())
+        window, f = self._window
+        if window is None:
+            return None, None
+        ovr = overview_factor(src, f, band)
+        if ovr > 1:
+            window, out_shape = overview_window(src, window, ovr)
+        else:
+            out_shape = (max(1, int(window.height) // f), max(1, int(window.width) // f))
+        arr = src.read(band, window=window, out_shape=out_shape, out_dtype="float32", resampling=Resampling[resampling])
+        nodata = src.nodatavals[band - 1]
+        if nodata is not None and not np.isnan(nodata):
+            arr[arr == np.float32(nodata)] = np.nan
+        return arr, window
+
+    def apply(self, arr: np.ndarray, window=None, method: str = "bilinear") -> np.ndarray:
+        """Remap one band (h, w) or a stack (bands, h, w) onto the destination grid.
+
+        arr covers `window` of the source (the whole source when None), possibly decimated.
+        Destination pixels outside the source, or touching a NaN source pixel, are NaN.
+        The gather indices are kept, so further bands over the same window only pay the gather.
+        """
+        if method not in ("bilinear", "nearest"):
+            raise ValueError(f"Unknown resampling method: {method}")
+        stack = arr if arr.ndim == 3 else arr[None]
+        ah, aw = stack.shape[1:]
+        off = (0, 0, self.src_shape[0], self.src_shape[1]) if window is None else (window.row_off, window.col_off, window.height, window.width)
+        sig = (method, ah, aw) + off
+        if self._gather is None or self._gather[0] != sig:
+            self._gather = (sig, self._indices(method, ah, aw, off))
+            # The gather indices supersede the coordinates; rebuilt from the lattice if needed again
+            self._coords = None
+        inside, idx, weights = self._gather[1]
+        flat = stack.reshape(stack.shape[0], -1).astype(np.float32, copy=False)
+        out = np.full((stack.shape[0], self.dst_shape[0] * self.dst_shape[1]), np.nan, dtype=np.float32)
+        for b in range(flat.shape[0]):
+            if weights is None:
+                acc = flat[b].take(idx)
+            else:
+                acc = flat[b].take(idx[0])
+                acc *= weights[0]
+                for k in range(1, 4):
+                    v = flat[b].take(idx[k])
+                    v *= weights[k]
+                    acc += v
+            if inside is None:
+                out[b] = acc
+            else:
+                out[b, inside] = acc
+        out = out.reshape((stack.shape[0],) + self.dst_shape)
+        return out if arr.ndim == 3 else out[0]
+
+    def _indices(self, method: str, ah: int, aw: int, off: tuple[float, float, float, float]):
+        rows, cols = self.coords()
+        h, w = self.src_shape
+        r_off, c_off, wh, ww = off
+        inside = ((rows >= -0.5) & (rows <= h - 0.5) & (cols >= -0.5) & (cols <= w - 0.5)).ravel()
+        # Full-resolution source coordinates -> coordinates in the (decimated) window array
+        if inside.all():
+            # Destination fully inside the source: skip the masked scatter in apply()
+            r, c, inside = rows.ravel(), cols.ravel(), None
+        else:
+            r, c = rows.ravel()[inside], cols.ravel()[inside]
+        r = (r + np.float32(0.5 - r_off)) * np.float32(ah / wh) - np.float32(0.5)
+        c = (c + np.float32(0.5 - c_off)) * np.float32(aw / ww) - np.float32(0.5)
+        itype = np.int32 if ah * aw < 2**31 else np.int64
+        if method == "nearest":
+            idx = np.clip(np.rint(r), 0, ah - 1).astype(np.int64) * aw + np.clip(np.rint(c), 0, aw - 1).astype(np.int64)
+            return inside, idx.astype(itype), None
+        r0 = np.floor(r)
+        c0 = np.floor(c)
+        fr = (r - r0).astype(np.float32)
+        fc = (c - c0).astype(np.float32)
+        r0 = r0.astype(itype)
+        c0 = c0.astype(itype)
+        # Half a pixel of tolerance at the edges: clamp to the outermost source pixel
+        ra, rb = np.clip(r0, 0, ah - 1), np.clip(r0 + 1, 0, ah - 1)
+        ca, cb = np.clip(c0, 0, aw - 1), np.clip(c0 + 1, 0, aw - 1)
+        idx = np.stack([ra * aw + ca, ra * aw + cb, rb * aw + ca, rb * aw + cb])
+        weights = np.stack([(1 - fr) * (1 - fc), (1 - fr) * fc, fr * (1 - fc), fr * fc])
+        return inside, idx, weights
+
+    def save(self, path: str) -> None:
+        lr, lc, rows, cols = self.lattice
+        with atomic_write(path, ".npz") as tmp:
+            np.savez(tmp, src_shape=self.src_shape, dst_shape=self.dst_shape, lr=lr, lc=lc, rows=rows, cols=cols)
+
+    @classmethod
+    def load(cls, path: str, key: str = "") -> "ReprojectionPlan":
+        with np.load(path) as z:
+            return cls(tuple(z["src_shape"]), tuple(z["dst_shape"]), (z["lr"], z["lc"], z["rows"], z["cols"]), key=key)
+
+
+def plan_key(src_crs: Any, src_transform, src_shape, dst_crs: Any, dst_transform, dst_shape, step: int = 16, max_error: float = 0.125) -> str:
+    sig = json.dumps([
+        _crs_id(src_crs), [round(v, 9) for v in list(src_transform)[:6]], list(src_shape),
+        _crs_id(dst_crs), [round(v, 9) for v in list(dst_transform)[:6]], list(dst_shape), step, max_error, _PLAN_VERSION,
+    ])
+    return hashlib.sha1(sig.encode()).hexdigest()[:16]
+
+
+def get_plan(
+    src_crs: Any,
+    src_transform,
+    src_shape: tuple[int, int],
+    dst_crs: Any,
+    dst_transform,
+    dst_shape: tuple[int, int],
+    cache_dir: Optional[str] = None,
+    step: int = 16,
+    max_error: float = 0.125,
+) -> ReprojectionPlan:
+    """Plan for (source grid, target grid): from memory, else cache_dir/<key>.npz, else built and saved."""
+    key = plan_key(src_crs, src_transform, src_shape, dst_crs, dst_transform, dst_shape, step, max_error)
+    with _memo_lock:
+        plan = _memo.get(key)
+        if plan is not None:
+            _memo.move_to_end(key)
+            _trim_memo()
+            return plan
+    path = os.path.join(cache_dir, f"{key}.npz") if cache_dir else None
+    if path and os.path.exists(path):
+        plan = ReprojectionPlan.load(path, key=key)
+    else:
+        plan = ReprojectionPlan.build(src_crs, src_transform, src_shape, dst_crs, dst_transform, dst_shape, step=step, max_error=max_error)
+        if path:
+            plan.save(path)
+    with _memo_lock:
+        _memo[key] = plan
+        _trim_memo()
+    return plan
+
+
+def _trim_memo() -> None:
+    # Plans grow after they are memoised (coordinates, gather indices), so sizes are re-read here
+    total = sum(p.nbytes() for p in _memo.values())
+    while len(_memo) > 1 and total > _MEMO_BYTES:
+        _, old = _memo.popitem(last=False)
+        total -= old.nbytes()
+
+
+def dataset_plan(src, dst_crs: Any, dst_transform, dst_shape: tuple[int, int], cache_dir: Optional[str] = None) -> ReprojectionPlan:
+    """get_plan for an open rasterio dataset as the source grid."""
+    return get_plan(src.crs, src.transform, src.shape, dst_crs, dst_transform, dst_shape, cache_dir=cache_dir)
+
+
+class PlanPack:
+    """Many small plans over one source grid (e.g. one per map tile) cached together in one .npz.
+
+    Only lattices are stored, a few KB per plan, so a whole tile pyramid fits in one file.
+    Plans are read from the file only when asked for. save() rewrites it when new plans were
+    built: the plans used since opening it first, then older ones while the file stays under
+    max_bytes.
+    """
+
+    _PARTS = ("src_shape", "dst_shape", "lr", "lc", "rows", "cols")
+
+    def __init__(self, path: Optional[str], max_bytes: int = PACK_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._zip: Optional[zipfile.ZipFile] = None
+        # Stored plan id -> bytes in the file; plans built since opening; ids asked for, LRU order
+        self._sizes = _pack_sizes(path) if path and os.path.exists(path) else {}
+        self._new: dict[str, dict] = {}
+        self._used: "OrderedDict[str, None]" = OrderedDict()
+
+    def get(self, plan_id: str, build) -> ReprojectionPlan:
+        self._used[plan_id] = None
+        self._used.move_to_end(plan_id)
+        parts = self._new.get(plan_id)
+        if parts is None and plan_id in self._sizes:
+            parts = self._read(plan_id)
+        if parts is not None:
+            return ReprojectionPlan(tuple(parts["src_shape"]), tuple(parts["dst_shape"]), (parts["lr"], parts["lc"], parts["rows"], parts["cols"]), key=plan_id)
+        plan = build()
+        lr, lc, rows, cols = plan.lattice
+        self._new[plan_id] = {"src_shape": np.asarray(plan.src_shape), "dst_shape": np.asarray(plan.dst_shape), "lr": lr, "lc": lc, "rows": rows, "cols": cols}
+        return plan
+
+    def _read(self, plan_id: str) -> dict:
+        if self._zip is None:
+            self._zip = zipfile.ZipFile(self.path)
+        parts = {}
+        for part in self._PARTS:
+            with self._zip.open(f"{plan_id}:{part}.npy") as f:
+                parts[part] = np.lib.format.read_array(f)
+        return parts
+
+    def _size(self, plan_id: str) -> int:
+        if plan_id in self._sizes:
+            return self._sizes[plan_id]
+        return sum(v.nbytes for v in self._new[plan_id].values())
+
+    def save(self) -> None:
+        if not self.path or not self._new:
+            return
+        order = list(reversed(self._used)) + [p for p in self._sizes if p not in self._used]
+        keep, total = [], 0
+        for plan_id in order:
+            total += self._size(plan_id)
+            if total > self.max_bytes and keep:
+                break
+            keep.append(plan_id)
+        # Streamed one member at a time, the same layout np.savez writes
+        with atomic_write(self.path, ".npz") as tmp:
+            with zipfile.ZipFile(tmp, "w", allowZip64=True) as out:
+                for plan_id in keep:
+                    parts = self._new.get(plan_id) or self._read(plan_id)
+                    for part in self._PARTS:
+                        with out.open(f"{plan_id}:{part}.npy", "w", force_zip64=True) as f:
+                            np.lib.format.write_array(f, np.asarray(parts[part]), allow_pickle=False)
+            self.close()
+        self._sizes = _pack_sizes(self.path)
+        self._new = {}
+
+    def close(self) -> None:
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+
+
+def _pack_sizes(path: str) -> dict[str, int]:
+    """Bytes per plan id in a pack file (members are named "<plan id>:<part>.npy")."""
+    sizes: dict[str, int] = {}
+    with zipfile.ZipFile(path) as zf:
+        for info in zf.infolist():
+            plan_id = info.filename.rsplit(":", 1)[0]
+            sizes[plan_id] = sizes.get(plan_id, 0) + info.file_size
+    return sizes
+
+
+def _crs_id(crs: Any) -> str:
+    from pyproj import CRS
+
+    return CRS.from_user_input(crs).to_wkt()
+
+
+def _transformer(dst_crs: Any, src_crs: Any):
+    from pyproj import Transformer
+
+    return Transformer.from_crs(dst_crs, src_crs, always_xy=True)
+
+
+def _lattice_axis(n: int, step: int) -> np.ndarray:
+    axis = np.arange(0, n, step)
+    return axis if axis[-1] == n - 1 else np.append(axis, n - 1)
+
+
+def _exact_coords(transformer, src_transform, dst_transform, py: np.ndarray, px: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Exact fractional source (row, col) of the destination pixel centres py x px (float64)."""
+    d = dst_transform
+    inv = ~src_transform
+    y_, x_ = py[:, None] + 0.5, px[None, :] + 0.5
+    x = d.a * x_ + d.b * y_ + d.c
+    y = d.d * x_ + d.e * y_ + d.f
+    if transformer is not None:
+        x, y = transformer.transform(x, y)
+        x, y = np.asarray(x), np.asarray(y)
+    cols = inv.a * x + inv.b * y + inv.c - 0.5
+    rows = inv.d * x + inv.e * y + inv.f - 0.5
+    return rows, cols
+
+
+def _interp_lattice(lr: np.ndarray, lc: np.ndarray, rows: np.ndarray, cols: np.ndarray, py: np.ndarray, px: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Bilinear interpolation of lattice coordinates at destination pixels py x px (separable)."""
+
+    def axis_weights(lattice: np.ndarray, at: np.ndarray):
+        if lattice.size == 1:
+            return np.zeros(at.size, dtype=np.int64), np.zeros(at.size)
+        i = np.clip(np.searchsorted(lattice, at, side="right") - 1, 0, lattice.size - 2)
+        t = (at - lattice[i]) / (lattice[i + 1] - lattice[i])
+        return i, t
+
+    def interp(v: np.ndarray) -> np.ndarray:
+        if lr.size > 1:
+            v = v[ir] * (1 - tr)[:, None] + v[np.minimum(ir + 1, lr.size - 1)] * tr[:, None]
+        else:
+            v = np.repeat(v, py.size, axis=0)
+        if lc.size > 1:
+            v = v[:, ic] * (1 - tc) + v[:, np.minimum(ic + 1, lc.size - 1)] * tc
+        else:
+            v = np.repeat(v, px.size, axis=1)
+        return v.astype(np.float32)
+
+    ir, tr = axis_weights(lr, py)
+    ic, tc = axis_weights(lc, px)
+    return interp(rows), interp(cols)
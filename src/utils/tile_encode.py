@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import io
+import time
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from .viz import plt_colormap
+from .tile_formats import TILE_FORMATS
+
+# Palette entries for data values; index 0 is reserved for transparent nodata
+_LEVELS = 255
+
+
+def global_stretch(src, low: float = 2.0, high: float = 98.0, max_pixels: int = 1024 * 1024) -> tuple[float, float]:
+    """Percentile stretch for a whole raster from one decimated read (uses overviews when present)."""
+    scale = max(1.0, (src.width * src.height / max_pixels) ** 0.5)
+    out_shape = (max(1, int(src.height / scale)), max(1, int(src.width / scale)))
+    arr = src.read(1, out_shape=out_shape, masked=True).astype(np.float32).filled(np.nan)
+    if not np.isfinite(arr).any():
+        return 0.0, 1.0
+    vmin, vmax = np.nanpercentile(arr, [low, high])
+    return float(vmin), float(vmax)
+
+
+class TileEncoder:
+    """Colormaps float tiles and encodes them, tracking bytes and encode time.
+
+    NaN pixels and pixels equal to `nodata` (the source's nodata value, e.g. for integer
+    rasters) become transparent (RGBA alpha 0, or palette index 0 for png8), and tiles
+    with no valid pixels are skipped (encode returns None) so they are never written.
+    Formats: "png" (RGBA), "png8" (palette PNG straight from a 255-step colormap LUT, no
+    quantization pass), "webp" (lossy RGBA at `quality`, or lossless when quality >= 100).
+    """
+
+    def __init__(self, cmap: str, vmin: float, vmax: float, fmt: str = "png", quality: int = 85, nodata: Optional[float] = None):
+        if fmt not in TILE_FORMATS:
+            raise ValueError(f"Unknown tile format: {fmt}")
+        if vmax == vmin:
+            vmax = vmin + 1.0
+        self.fmt = fmt
+        self.quality = quality
+        self.nodata = None if nodata is None or np.isnan(nodata) else float(nodata)
+        self.vmin = float(vmin)
+        self.vmax = float(vmax)
+        lut = (plt_colormap(cmap)(np.linspace(0.0, 1.0, _LEVELS)) * 255).astype(np.uint8)
+        # RGBA lookup indexed like the palette: 0 = transparent, 1..255 = colormap steps
+        self._rgba_lut = np.vstack([np.zeros((1, 4), dtype=np.uint8), lut])
+        self._rgba_lut[1:, 3] = 255
+        self._palette = self._rgba_lut[:, :3].reshape(-1).tolist()
+        self.tiles = 0
+        self.skipped = 0
+        self.bytes = 0
+        self.encode_s = 0.0
+
+    def _indices(self, arr: np.ndarray) -> np.ndarray:
+        norm = (arr - self.vmin) / (self.vmax - self.vmin)
+        idx = np.clip(np.nan_to_num(norm, nan=0.0), 0.0, 1.0) * (_LEVELS - 1) + 1.0
+        idx = idx.astype(np.uint8)
+        idx[~np.isfinite(arr)] = 0
+        return idx
+
+    def encode(self, arr: np.ndarray) -> Optional[bytes]:
+        t0 = time.perf_counter()
+        if self.nodata is not None:
+            arr = np.where(arr == np.float32(self.nodata), np.float32(np.nan), arr.astype(np.float32, copy=False))
+        if not np.isfinite(arr).any():
+            self.skipped += 1
+            self.encode_s += time.perf_counter() - t0
+            return None
+        idx = self._indices(arr)
+        buf = io.BytesIO()
+        if self.fmt == "png8":
+            im = Image.fromarray(idx)
+            im.putpalette(self._palette)  # L -> P
+            im.save(buf, format="PNG", optimize=True, transparency=0)
+        else:
+            im = Image.fromarray(self._rgba_lut[idx])
+            if self.fmt == "webp":
+                if self.quality >= 100:
+                    im.save(buf, format="WEBP", lossless=True)
+                else:
+                    im.save(buf, format="WEBP", quality=self.quality)
+            else:
+                im.save(buf, format="PNG")
+        data = buf.getvalue()
+        self.tiles += 1
+        self.bytes += len(data)
+        self.encode_s += time.perf_counter() - t0
+        return data
+
+    def stats(self) -> dict:
+        return {
+            "format": self.fmt,
+            "encoded": self.tiles,
+            "skipped_nodata": self.skipped,
+            "bytes": self.bytes,
+            "avg_bytes": self.bytes / self.tiles if self.tiles else 0.0,
+            "encode_s": self.encode_s,
+            "vmin": self.vmin,
+            "vmax": self.vmax,
+        }
@@ -0,0 +1,20 @@
+# Tile encodings: format name -> (file extension, media type). Dependency-free so the
+# API tile route can import it without pulling in numpy/PIL.
+TILE_FORMATS = {
+    "png": ("png", "image/png"),
+    "png8": ("png", "image/png"),
+    "webp": ("webp", "image/webp"),
+}
+
+# Mapbox Vector Tiles (/mvt routes, utils/mvt.py)
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+
+def tile_ext(fmt: str) -> str:
+    return TILE_FORMATS[fmt][0]
+
+
+def media_type_for(ext_or_fmt: str) -> str:
+    if ext_or_fmt in TILE_FORMATS:
+        return TILE_FORMATS[ext_or_fmt][1]
+    return "image/png"
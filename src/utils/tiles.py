@@ -1,22 +1,160 @@
 from __future__ import annotations
 
 import os
-from typing import Sequence, Tuple
+import shutil
+import time
+from typing import Iterable, Sequence, Tuple
 
 import numpy as np
 import rasterio
-from rasterio.vrt import WarpedVRT
-from rasterio.windows import from_bounds
-from rasterio.enums import Resampling
 import mercantile
 
-from .viz import plt_colormap
-from .io import ensure_dir
+from .io import ensure_dir, mark_layer_updated
+from .mbtiles import MBTilesWriter, archive_path
+from .tile_encode import TileEncoder, global_stretch
+from .tile_formats import tile_ext
+
+
+class DirectoryTileSink:
+    """Writes one file per tile under {tiles_root}/{layer}/{z}/{x}/{y}.{ext}.
+
+    Tiles go to a hidden directory that replaces the layer's on close, so tiles this run no
+    longer writes (e.g. now all nodata) stop serving the previous run's images.
+    """
+
+    def __init__(self, tiles_root: str, layer: str, ext: str = "png"):
+        self.layer_dir = os.path.join(tiles_root, layer)
+        self.tmp_dir = os.path.join(tiles_root, f".{layer}.{os.getpid()}.tmp")
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        self.archive = archive_path(tiles_root, layer)
+        self.path = self.layer_dir
+        self.ext = ext
+        self.tiles = 0
+        self.unique = 0
+
+    def put(self, z: int, x: int, y: int, data: bytes) -> None:
+        tile_path = os.path.join(self.tmp_dir, str(z), str(x), f"{y}.{self.ext}")
+        ensure_dir(os.path.dirname(tile_path))
+        with open(tile_path, "wb") as f:
+            f.write(data)
+        self.tiles += 1
+        self.unique += 1
+
+    def close(self) -> None:
+        mark_layer_updated(self.tmp_dir)
+        old = f"{self.tmp_dir}.old"
+        if os.path.exists(self.layer_dir):
+            os.replace(self.layer_dir, old)
+        os.replace(self.tmp_dir, self.layer_dir)
+        shutil.rmtree(old, ignore_errors=True)
+        # An archive from an earlier TILE_OUTPUT=mbtiles run would take precedence when serving
+        if os.path.exists(self.archive):
+            os.remove(self.archive)
+
+    def abort(self) -> None:
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def open_tile_sink(tiles_root: str, layer: str, output: str = "dir", fmt: str = "png", bounds: Sequence[float] | None = None):
+    """output="dir" writes loose files; output="mbtiles" packs {tiles_root}/{layer}.mbtiles.
+
+    Closing either sink removes the layer's tiles in the other layout.
+    """
+    if output == "mbtiles":
+        return MBTilesWriter(archive_path(tiles_root, layer), name=layer, fmt=fmt, bounds=bounds, replaces=os.path.join(tiles_root, layer))
+    if output == "dir":
+        return DirectoryTileSink(tiles_root, layer, ext=fmt)
+    raise ValueError(f"Unknown tile output: {output}")
 
 
 def tile_bounds_mercator(x: int, y: int, z: int) -> Tuple[float, float, float, float]:
-    bbox = mercantile.bounds(x, y, z)
-    return bbox.west, bbox.south, bbox.east, bbox.north
+    # Web Mercator (EPSG:3857) metres, the grid tiles are reprojected onto
+    bbox = mercantile.xy_bounds(x, y, z)
+    return bbox.left, bbox.bottom, bbox.right, bbox.top
+
+
+def tile_plan(src, x: int, y: int, z: int, tile_size: int):
+    """ReprojectionPlan from the raster's grid onto one EPSG:3857 tile."""
+    from rasterio.transform import from_bounds as transform_from_bounds
+
+    from .reproject import ReprojectionPlan
+
+    west, south, east, north = tile_bounds_mercator(x, y, z)
+    dst_transform = transform_from_bounds(west, south, east, north, tile_size, tile_size)
+    return ReprojectionPlan.build(src.crs, src.transform, src.shape, "EPSG:3857", dst_transform, (tile_size, tile_size))
+
+
+def generate_xyz_tile_layers(
+    layers: Sequence[dict],
+    tiles_root: str,
+    aoi_bounds_latlon: Sequence[float],
+    zooms: Sequence[int],
+    tile_size: int = 256,
+    output: str = "dir",
+    fmt: str = "png",
+    stretch: str = "global",
+    quality: int = 85,
+    sinks: dict | None = None,
+    plan_cache_dir: str | None = None,
+    tiles: Iterable[Tuple[int, int, int]] | None = None,
+) -> dict[str, dict]:
+    """Generate XYZ tiles for several single-band GeoTIFFs in one pass.
+
+    layers: dicts with raster_path, layer and optionally cmap, vmin, vmax and resampling
+    ("bilinear", default, or "nearest" for categorical rasters). Layers on the same
+    grid share one reprojection plan per tile, so the EPSG:3857 warp is computed once and
+    applied to each of them. With plan_cache_dir the tile plans of each source grid are kept
+    in one file there and reused by later runs. sinks: already open sinks by layer name, closed
+    by the caller. tiles: (z, x, y) to render instead of every tile of `zooms` covering the
+    AOI, e.g. only those over changed blocks. Other arguments as in
+    generate_xyz_tiles_from_geotiff. Returns {layer: stats}.
+    """
+    from .rasters import grid_key
+    from .reproject import PlanPack
+
+    sinks = dict(sinks or {})
+    tiles = sorted(set(tiles)) if tiles is not None else None
+    owned = []
+    for spec in layers:
+        if spec["layer"] not in sinks:
+            sinks[spec["layer"]] = open_tile_sink(tiles_root, spec["layer"], output=output, fmt=tile_ext(fmt) if output == "dir" else fmt, bounds=aoi_bounds_latlon)
+            owned.append(spec["layer"])
+    t0 = time.perf_counter()
+    stats: dict[str, dict] = {}
+    datasets = []
+    groups: dict[str, list] = {}
+    try:
+        for spec in layers:
+            src = rasterio.open(spec["raster_path"])
+            datasets.append(src)
+            vmin, vmax = spec.get("vmin"), spec.get("vmax")
+            if stretch == "global" and (vmin is None or vmax is None):
+                gmin, gmax = global_stretch(src)
+                vmin = gmin if vmin is None else vmin
+                vmax = gmax if vmax is None else vmax
+            encoder = TileEncoder(spec.get("cmap", "RdYlGn"), 0.0 if vmin is None else vmin, 1.0 if vmax is None else vmax, fmt=fmt, quality=quality, nodata=src.nodata)
+            groups.setdefault(grid_key(src), []).append((spec["layer"], src, encoder, vmin is None or vmax is None, spec.get("resampling", "bilinear")))
+        for key, members in groups.items():
+            pack = PlanPack(os.path.join(plan_cache_dir, f"tiles-{key}-{tile_size}.npz") if plan_cache_dir else None)
+            _render_tiles(members, sinks, pack, aoi_bounds_latlon, zooms, tile_size, tiles)
+            pack.save()
+    except BaseException:
+        for name in owned:
+            sinks[name].abort()
+        raise
+    finally:
+        for src in datasets:
+            src.close()
+    for name in owned:
+        sinks[name].close()
+    total_s = time.perf_counter() - t0
+    for members in groups.values():
+        for name, _, encoder, _, _ in members:
+            st = encoder.stats()
+            sink = sinks[name]
+            st.update({"path": sink.path, "tiles": sink.tiles, "unique": sink.unique, "total_s": total_s})
+            stats[name] = st
+    return stats
 
 
 def generate_xyz_tiles_from_geotiff(
@@ -29,39 +167,56 @@ def generate_xyz_tiles_from_geotiff(
     vmin: float | None = None,
     vmax: float | None = None,
     tile_size: int = 256,
-) -> None:
+    output: str = "dir",
+    fmt: str = "png",
+    stretch: str = "global",
+    quality: int = 85,
+    sink=None,
+    plan_cache_dir: str | None = None,
+) -> dict:
     """Generate XYZ tiles for a single-band GeoTIFF. Reprojects on the fly to EPSG:3857.
     aoi_bounds_latlon: (minx, miny, maxx, maxy) in EPSG:4326 for tile coverage enumeration.
+    output: "dir" for one file per tile, "mbtiles" for a single deduplicated archive.
+    fmt: "png" (RGBA), "png8" (palette) or "webp"; nodata is transparent and tiles with no
+    valid pixels are not written.
+    stretch: when vmin/vmax are None, "global" uses the 2-98 percentiles of the whole raster
+    so tiles match each other; "tile" stretches every tile on its own.
+    sink: an already open tile sink to add to; the caller closes it (tiles_root/output unused).
+    plan_cache_dir: where per-tile reprojection plans are cached across runs (None: not kept).
+    Returns sink and encoder stats (tiles, unique, bytes, encode_s, skipped_nodata, ...).
     """
-    dst_crs = "EPSG:3857"
-    cmap_fn = plt_colormap(cmap)
-    with rasterio.open(raster_path) as src:
-        with WarpedVRT(src, crs=dst_crs, resampling=Resampling.bilinear) as vrt:
-            for z in zooms:
-                # enumerate tiles covering AOI bbox
-                minx, miny, maxx, maxy = aoi_bounds_latlon
-                for tile in mercantile.tiles(minx, miny, maxx, maxy, [z]):
-                    x, y = tile.x, tile.y
-                    west, south, east, north = tile_bounds_mercator(x, y, z)
-                    window = from_bounds(west, south, east, north, transform=vrt.transform)
-                    out = vrt.read(1, window=window, out_shape=(tile_size, tile_size), resampling=Resampling.bilinear)
-                    arr = out.astype(np.float32)
-                    if vmin is None:
-                        vmin_eff = np.nanpercentile(arr, 2)
-                    else:
-                        vmin_eff = vmin
-                    if vmax is None:
-                        vmax_eff = np.nanpercentile(arr, 98)
-                    else:
-                        vmax_eff = vmax
-                    if vmax_eff == vmin_eff:
-                        vmax_eff = vmin_eff + 1.0
-                    norm = (arr - vmin_eff) / (vmax_eff - vmin_eff)
-                    norm = np.clip(norm, 0, 1)
-                    rgb = (cmap_fn(norm)[..., :3] * 255).astype(np.uint8)
-                    from PIL import Image
-
-                    tile_path = os.path.join(tiles_root, layer, str(z), str(x), f"{y}.png")
-                    ensure_dir(os.path.dirname(tile_path))
-                    Image.fromarray(rgb).save(tile_path)
+    spec = {"raster_path": raster_path, "layer": layer, "cmap": cmap, "vmin": vmin, "vmax": vmax}
+    return generate_xyz_tile_layers(
+        [spec], tiles_root, aoi_bounds_latlon, zooms, tile_size=tile_size, output=output, fmt=fmt,
+        stretch=stretch, quality=quality, sinks={layer: sink} if sink is not None else None, plan_cache_dir=plan_cache_dir,
+    )[layer]
+
 
+def _render_tiles(
+    members: list,
+    sinks: dict,
+    pack,
+    aoi_bounds_latlon: Sequence[float],
+    zooms: Sequence[int],
+    tile_size: int,
+    tiles: Sequence[Tuple[int, int, int]] | None = None,
+) -> None:
+    """Render every tile of layers sharing one grid: one plan and one source window per tile."""
+    src0 = members[0][1]
+    if tiles is None:
+        # enumerate tiles covering AOI bbox
+        minx, miny, maxx, maxy = aoi_bounds_latlon
+        tiles = [(z, t.x, t.y) for z in zooms for t in mercantile.tiles(minx, miny, maxx, maxy, [z])]
+    for z, x, y in tiles:
+        plan = pack.get(f"{z}/{x}/{y}", lambda: tile_plan(src0, x, y, z, tile_size))
+        for name, src, encoder, per_tile_stretch, resampling in members:
+            # NaN outside the source footprint (and for source nodata) so it renders transparent
+            part, window = plan.read(src, resampling=resampling)
+            arr = np.full((tile_size, tile_size), np.nan, dtype=np.float32) if part is None else plan.apply(part, window, method=resampling)
+            if per_tile_stretch and np.isfinite(arr).any():
+                lo, hi = np.nanpercentile(arr, [2, 98])
+                encoder.vmin = float(lo)
+                encoder.vmax = float(hi) if hi > lo else float(lo) + 1.0
+            data = encoder.encode(arr)
+            if data is not None:
+                sinks[name].put(z, x, y, data)
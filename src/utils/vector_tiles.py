@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+
+from .colstore import CURRENT, ColumnarSnapshot, current_snapshot
+from .io import ensure_dir, mark_layer_updated
+from .mvt import DEFAULT_EXTENT, encode_polygon_layer, encode_tile
+
+PARCEL_LAYER = "parcels"
+
+
+def parse_zoom_range(value: str) -> list[int]:
+    """'12-14' -> [12, 13, 14]; '12,14' -> [12, 14]; '' -> []."""
+    value = (value or "").strip()
+    if not value:
+        return []
+    if "-" in value:
+        lo, hi = value.split("-", 1)
+        return list(range(int(lo), int(hi) + 1))
+    return [int(z) for z in value.split(",") if z.strip()]
+
+
+class _ParcelData:
+    """Parcel polygons in EPSG:3857 with an STRtree and per-parcel MVT properties."""
+
+    def __init__(self, parcels_path: str, store_root: str):
+        import geopandas as gpd
+        import shapely
+
+        gdf = gpd.read_file(parcels_path)
+        gdf = gdf.set_crs(4326) if gdf.crs is None else gdf.to_crs(4326)
+        self.bounds = tuple(float(b) for b in gdf.total_bounds)
+        merc = gdf.to_crs(3857)
+        self.geoms = np.asarray(merc.geometry.values, dtype=object)
+        self.tree = shapely.STRtree(self.geoms)
+        self.ids = gdf["id"].to_numpy(dtype=np.int64)
+        self.snapshot = current_snapshot(store_root)
+        self.properties = _parcel_properties(self.ids, self.snapshot)
+
+
+def _parcel_properties(ids: np.ndarray, snapshot_path: Optional[str]) -> dict[str, np.ndarray]:
+    """Prediction attributes per parcel as columns: class, top probability, water flag/anomaly.
+
+    Columns are masked where a parcel has no row in the snapshot.
+    """
+    props: dict[str, np.ndarray] = {"id": ids}
+    if snapshot_path is None:
+        return props
+    snap = ColumnarSnapshot(snapshot_path)
+    rows = snap.rows_for(ids)
+    missing = rows < 0
+    rows = np.where(missing, 0, rows)
+    if snap.rows == 0:
+        return props
+    prob_cols = [c for c in snap.columns if c.startswith("prob_")]
+    if prob_cols:
+        probs = np.column_stack([np.asarray(snap.columns[c][rows], dtype=np.float64) for c in prob_cols])
+        top = np.argmax(probs, axis=1)
+        names = np.array([c[len("prob_"):] for c in prob_cols])
+        props["class"] = np.ma.array(names[top], mask=missing)
+        # Rounded so the per-tile value table stays small
+        props["prob"] = np.ma.array(np.round(probs[np.arange(len(top)), top], 3), mask=missing)
+    if "water_flag" in snap.columns:
+        props["water_flag"] = np.ma.array(np.asarray(snap.columns["water_flag"][rows]).astype(bool), mask=missing)
+    if "water_anom" in snap.columns:
+        anom = np.round(np.asarray(snap.columns["water_anom"][rows], dtype=np.float64), 3)
+        props["water_anom"] = np.ma.array(anom, mask=missing)
+    return props
+
+
+class ParcelTileSource:
+    """Renders parcel predictions as Mapbox Vector Tiles on demand.
+
+    Parcels are loaded once from parcels.gpkg (re-projected to Web Mercator, bulk-indexed
+    in an STRtree) and joined with the latest predictions snapshot. Each tile queries the
+    tree, clips to the tile plus `buffer` pixels, simplifies to `simplify_px` tile units
+    (so low zooms drop vertices and sub-pixel parcels) and encodes. Rendered tiles are
+    kept in an LRU of `cache_size` entries keyed by the data generation; the parcel file
+    and the snapshot pointer are re-checked at most once per `recheck_s`.
+    """
+
+    def __init__(
+        self,
+        parcels_path: str,
+        store_root: str,
+        extent: int = DEFAULT_EXTENT,
+        buffer: int = 64,
+        simplify_px: float = 1.0,
+        cache_size: int = 4096,
+        recheck_s: float = 1.0,
+    ):
+        self.parcels_path = parcels_path
+        self.store_root = store_root
+        self.extent = extent
+        self.buffer = buffer
+        self.simplify_px = simplify_px
+        self.cache_size = cache_size
+        self.recheck_s = recheck_s
+        self._data: Optional[_ParcelData] = None
+        self._generation: Optional[tuple] = None
+        self._checked = 0.0
+        # (generation on disk, when stat'ed) for disk_etag(), which does not load the data
+        self._disk: Optional[tuple] = None
+        self._cache: OrderedDict[tuple, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _current_generation(self) -> Optional[tuple]:
+        try:
+            parcels = os.stat(self.parcels_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        try:
+            pointer = os.stat(os.path.join(self.store_root, CURRENT)).st_mtime_ns
+        except FileNotFoundError:
+            pointer = None
+        return parcels, pointer
+
+    def refresh(self, force: bool = False) -> Optional[_ParcelData]:
+        now = time.monotonic()
+        # Without data, look again every call so the first published run shows up at once
+        if not force and self._data is not None and now - self._checked < self.recheck_s:
+            return self._data
+        self._checked = now
+        gen = self._current_generation()
+        if gen != self._generation or force:
+            with self._lock:
+                self._data = _ParcelData(self.parcels_path, self.store_root) if gen is not None else None
+                self._generation = gen
+                self._cache.clear()
+        return self._data
+
+    @property
+    def etag(self) -> str:
+        return _etag(self._generation or (0, 0))
+
+    def disk_etag(self) -> Optional[str]:
+        """etag of the parcel file and snapshot on disk now, without loading them (None: no parcels).
+
+        Re-stat'ed at most once per `recheck_s`; names the directory of pre-generated tiles.
+        """
+        now = time.monotonic()
+        # Without parcels, look again every call, as refresh() does
+        if self._disk is None or self._disk[0] is None or now - self._disk[1] >= self.recheck_s:
+            self._disk = (self._current_generation(), now)
+        return None if self._disk[0] is None else _etag(self._disk[0])
+
+    def tile(self, z: int, x: int, y: int) -> Optional[bytes]:
+        """Encoded tile bytes (b"" when no parcel touches it), or None without parcel data."""
+        data = self.refresh()
+        if data is None:
+            return None
+        key = (self._generation, z, x, y)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+        body = self._render(data, z, x, y)
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = body
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return body
+
+    def _render(self, data: _ParcelData, z: int, x: int, y: int) -> bytes:
+        import mercantile
+        import shapely
+
+        b = mercantile.xy_bounds(x, y, z)
+        size = b.right - b.left
+        pad = size * self.buffer / self.extent
+        xmin, ymin, xmax, ymax = b.left - pad, b.bottom - pad, b.right + pad, b.top + pad
+        idx = data.tree.query(shapely.box(xmin, ymin, xmax, ymax))
+        if len(idx) == 0:
+            return b""
+        idx.sort()
+        geoms = shapely.clip_by_rect(data.geoms[idx], xmin, ymin, xmax, ymax)
+        if self.simplify_px > 0:
+            geoms = shapely.simplify(geoms, size * self.simplify_px / self.extent, preserve_topology=True)
+        geoms, keep = _polygonal(geoms)
+        if not keep.any():
+            return b""
+        idx = idx[keep]
+        gtype, coords, offsets = shapely.to_ragged_array(geoms[keep])
+        if gtype == shapely.GeometryType.POLYGON:
+            ring_offsets, geom_offsets = offsets
+            polygon_offsets = np.arange(len(geom_offsets))
+        else:
+            ring_offsets, polygon_offsets, geom_offsets = offsets
+        # Web Mercator -> tile pixels (y down)
+        scale = self.extent / size
+        tile_xy = (coords - (b.left, b.top)) * (scale, -scale)
+        props = {k: v[idx] for k, v in data.properties.items()}
+        layer = encode_polygon_layer(
+            PARCEL_LAYER, tile_xy, ring_offsets, polygon_offsets, geom_offsets,
+            ids=data.ids[idx], properties=props, extent=self.extent,
+        )
+        return encode_tile([layer])
+
+    def stats(self) -> dict[str, Any]:
+        return {"cached": len(self._cache), "hits": self.hits, "misses": self.misses, "parcels": len(self._data.ids) if self._data is not None else 0}
+
+
+def _polygonal(geoms: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Reduce clip results to (Multi)Polygons; returns (geoms, mask of non-empty ones)."""
+    import shapely
+
+    types = shapely.get_type_id(geoms)
+    collections = np.flatnonzero(types == shapely.GeometryType.GEOMETRYCOLLECTION)
+    if len(collections):
+        geoms = geoms.copy()
+        for i in collections.tolist():
+            parts = [p for p in shapely.get_parts(geoms[i]) if p.geom_type in ("Polygon", "MultiPolygon")]
+            geoms[i] = shapely.union_all(parts) if parts else shapely.Polygon()
+        types = shapely.get_type_id(geoms)
+    polygonal = (types == shapely.GeometryType.POLYGON) | (types == shapely.GeometryType.MULTIPOLYGON)
+    return geoms, polygonal & ~shapely.is_empty(geoms)
+
+
+def _etag(generation: tuple) -> str:
+    return "-".join(f"{v or 0:x}" for v in generation)
+
+
+def pregenerate_parcel_tiles(source: ParcelTileSource, zooms: list[int], layer_dir: str) -> dict[str, Any]:
+    """Write every non-empty parcel tile for zooms under layer_dir/{etag}/{z}/{x}/{y}.pbf.
+
+    Keyed on the source's etag (parcel file and predictions snapshot), so the route only
+    serves them while those are unchanged; earlier generations are removed.
+    """
+    import mercantile
+
+    t0 = time.perf_counter()
+    data = source.refresh(force=True)
+    shutil.rmtree(layer_dir, ignore_errors=True)
+    out_dir = os.path.join(layer_dir, source.etag)
+    written = 0
+    nbytes = 0
+    if data is not None:
+        for t in mercantile.tiles(*data.bounds, zooms):
+            body = source.tile(t.z, t.x, t.y)
+            if not body:
+                continue
+            d = ensure_dir(os.path.join(out_dir, str(t.z), str(t.x)))
+            with open(os.path.join(d, f"{t.y}.pbf"), "wb") as f:
+                f.write(body)
+            written += 1
+            nbytes += len(body)
+    ensure_dir(out_dir)
+    mark_layer_updated(out_dir)
+    return {"path": out_dir, "tiles": written, "bytes": nbytes, "total_s": time.perf_counter() - t0}
@@ -26,8 +26,14 @@ def save_png(array: np.ndarray, path: str, vmin: float | None = None, vmax: floa
 
 
 def plt_colormap(name: str):
-    import matplotlib.cm as cm
-    return cm.get_cmap(name)
+    import matplotlib
+
+    # matplotlib>=3.9 dropped cm.get_cmap in favour of the colormap registry
+    try:
+        return matplotlib.colormaps[name]
+    except (AttributeError, KeyError):
+        import matplotlib.cm as cm
+        return cm.get_cmap(name)
 
 
 def save_blank_tile(path: str, size: int = 256, color: Tuple[int, int, int] = (220, 220, 220), text: str | None = None) -> None:
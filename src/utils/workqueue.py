@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from .io import ensure_parent
+
+# Job states: pending -> running -> done | failed (running jobs whose lease expired are claimable again)
+STATUSES = ("pending", "running", "done", "failed")
+
+
+@dataclass
+class QueueJob:
+    id: str
+    payload: dict[str, Any]
+    attempts: int
+
+
+class SQLiteQueue:
+    """Work queue in one SQLite file, safe for concurrent worker processes on one host.
+
+    A claim takes a lease of `lease_s`; a job whose worker died is handed out again when
+    its lease expires, up to `max_attempts` claims. SQLite locking is unreliable on
+    network filesystems, so workers on several machines should use the Redis backend.
+    """
+
+    def __init__(self, path: str, name: str = "default", lease_s: float = 900.0, max_attempts: int = 3):
+        ensure_parent(path)
+        self.path = path
+        self.name = name
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+        self._conn = sqlite3.connect(path, timeout=60.0, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT, queue TEXT NOT NULL, id TEXT NOT NULL,"
+            " payload TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'pending', worker TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0, lease_until REAL, result TEXT, error TEXT,"
+            " UNIQUE (queue, id))"
+        )
+
+    def put(self, job_id: str, payload: dict[str, Any]) -> bool:
+        """Enqueue a job; False if a job with this id is already queued (re-planning is idempotent)."""
+        cur = self._conn.execute(
+            "INSERT OR IGNORE INTO jobs (queue, id, payload) VALUES (?, ?, ?)",
+            (self.name, job_id, json.dumps(payload)),
+        )
+        return cur.rowcount == 1
+
+    def claim(self, worker: str) -> Optional[QueueJob]:
+        """Lease the next job; retries go after jobs that have not been tried yet."""
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute(
+                "SELECT seq, id, payload, attempts FROM jobs WHERE queue = ? AND attempts < ?"
+                " AND (status = 'pending' OR (status = 'running' AND lease_until < ?)) ORDER BY attempts, seq LIMIT 1",
+                (self.name, self.max_attempts, now),
+            ).fetchone()
+            if row is None:
+                self._conn.execute("COMMIT")
+                return None
+            seq, job_id, payload, attempts = row
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, attempts = ?, lease_until = ? WHERE seq = ?",
+                (worker, attempts + 1, now + self.lease_s, seq),
+            )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return QueueJob(job_id, json.loads(payload), attempts + 1)
+
+    def complete(self, job_id: str, result: dict[str, Any]) -> None:
+        self._conn.execute(
+            "UPDATE jobs SET status = 'done', result = ?, error = NULL WHERE queue = ? AND id = ?",
+            (json.dumps(result, default=str), self.name, job_id),
+        )
+
+    def fail(self, job_id: str, error: str) -> None:
+        """Record a failure; the job goes back to pending until it has used max_attempts claims."""
+        self._conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, error = ?"
+            " WHERE queue = ? AND id = ?",
+            (self.max_attempts, error, self.name, job_id),
+        )
+
+    def counts(self) -> dict[str, int]:
+        out = dict.fromkeys(STATUSES, 0)
+        for status, n in self._conn.execute("SELECT status, COUNT(*) FROM jobs WHERE queue = ? GROUP BY status", (self.name,)):
+            out[status] = n
+        # Expired leases with no attempts left will never be claimed again
+        out["stalled"] = self._conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE queue = ? AND status = 'running' AND attempts >= ? AND lease_until < ?",
+            (self.name, self.max_attempts, time.time()),
+        ).fetchone()[0]
+        return out
+
+    def jobs(self) -> list[dict[str, Any]]:
+        rows = self._conn.execute(
+            "SELECT id, status, worker, attempts, result, error FROM jobs WHERE queue = ? ORDER BY seq", (self.name,)
+        ).fetchall()
+        return [
+            {"id": i, "status": s, "worker": w, "attempts": a, "result": json.loads(r) if r else None, "error": e}
+            for i, s, w, a, r, e in rows
+        ]
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class RedisQueue:
+    """The same queue on Redis, for workers spread over several machines (needs `redis`).
+
+    Keys under `<name>:`: `pending` (list of ids), `jobs` (id -> payload), `status`,
+    `attempts`, `results`, `errors` (hashes) and `leases` (sorted set of id by expiry).
+    """
+
+    def __init__(self, url: str, name: str = "default", lease_s: float = 900.0, max_attempts: int = 3):
+        import redis
+
+        self.url = url
+        self.name = name
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+        self._r = redis.Redis.from_url(url, decode_responses=True)
+
+    def _key(self, part: str) -> str:
+        return f"{self.name}:{part}"
+
+    def put(self, job_id: str, payload: dict[str, Any]) -> bool:
+        if not self._r.hsetnx(self._key("jobs"), job_id, json.dumps(payload)):
+            return False
+        pipe = self._r.pipeline()
+        pipe.hset(self._key("status"), job_id, "pending")
+        pipe.lpush(self._key("pending"), job_id)
+        pipe.execute()
+        return True
+
+    def _requeue_expired(self) -> None:
+        for job_id in self._r.zrangebyscore(self._key("leases"), 0, time.time()):
+            # ZREM succeeds for exactly one worker, so an expired job is requeued once
+            if self._r.zrem(self._key("leases"), job_id):
+                attempts = int(self._r.hget(self._key("attempts"), job_id) or 0)
+                self._requeue_or_fail(job_id, attempts)
+
+    def _requeue_or_fail(self, job_id: str, attempts: int) -> None:
+        if attempts < self.max_attempts:
+            self._r.hset(self._key("status"), job_id, "pending")
+            self._r.lpush(self._key("pending"), job_id)
+        else:
+            self._r.hset(self._key("status"), job_id, "failed")
+
+    def claim(self, worker: str) -> Optional[QueueJob]:
+        self._requeue_expired()
+        job_id = self._r.rpop(self._key("pending"))
+        if job_id is None:
+            return None
+        pipe = self._r.pipeline()
+        pipe.zadd(self._key("leases"), {job_id: time.time() + self.lease_s})
+        pipe.hset(self._key("status"), job_id, "running")
+        pipe.hset(self._key("workers"), job_id, worker)
+        pipe.hincrby(self._key("attempts"), job_id, 1)
+        pipe.hget(self._key("jobs"), job_id)
+        *_, attempts, payload = pipe.execute()
+        return QueueJob(job_id, json.loads(payload), int(attempts))
+
+    def complete(self, job_id: str, result: dict[str, Any]) -> None:
+        pipe = self._r.pipeline()
+        pipe.zrem(self._key("leases"), job_id)
+        pipe.hset(self._key("results"), job_id, json.dumps(result, default=str))
+        pipe.hset(self._key("status"), job_id, "done")
+        pipe.execute()
+
+    def fail(self, job_id: str, error: str) -> None:
+        if self._r.zrem(self._key("leases"), job_id):
+            self._r.hset(self._key("errors"), job_id, error)
+            self._requeue_or_fail(job_id, int(self._r.hget(self._key("attempts"), job_id) or 0))
+
+    def counts(self) -> dict[str, int]:
+        out = dict.fromkeys(STATUSES, 0)
+        for status in self._r.hvals(self._key("status")):
+            out[status] = out.get(status, 0) + 1
+        out["stalled"] = 0
+        return out
+
+    def jobs(self) -> list[dict[str, Any]]:
+        status = self._r.hgetall(self._key("status"))
+        workers = self._r.hgetall(self._key("workers"))
+        attempts = self._r.hgetall(self._key("attempts"))
+        results = self._r.hgetall(self._key("results"))
+        errors = self._r.hgetall(self._key("errors"))
+        return [
+            {
+                "id": i, "status": s, "worker": workers.get(i), "attempts": int(attempts.get(i, 0)),
+                "result": json.loads(results[i]) if i in results else None, "error": errors.get(i),
+            }
+            for i, s in sorted(status.items())
+        ]
+
+    def close(self) -> None:
+        self._r.close()
+
+
+def open_queue(url: str, name: str = "default", **kwargs: Any):
+    """`redis://host:6379/0` -> RedisQueue; `sqlite:///path/queue.db` or a plain path -> SQLiteQueue."""
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisQueue(url, name=name, **kwargs)
+    path = url[len("sqlite:///"):] if url.startswith("sqlite:///") else url
+    # sqlite:////abs/path keeps its leading slash; sqlite:///rel/path is relative
+    return SQLiteQueue(os.path.abspath(path), name=name, **kwargs)
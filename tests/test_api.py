@@ -1,3 +1,5 @@
+import os
+
 from fastapi.testclient import TestClient
 from src.api.server import app
 
@@ -16,10 +18,253 @@ def test_tile_endpoint_creates_tile():
     assert r.headers["content-type"] == "image/png"
 
 
-def test_report_parcel():
+def _publish_predictions(root):
+    import pandas as pd
+    from src.utils.colstore import write_columnar
+
+    df = pd.DataFrame({
+        "id": [2, 0, 1],
+        "ndvi_p50": [0.1, 0.6, 0.3],
+        "prob_irrigated": [0.1, 0.8, 0.2],
+        "prob_rainfed": [0.9, 0.2, 0.8],
+        "water_flag": [False, True, False],
+    })
+    write_columnar(df, root)
+
+
+def test_report_parcel(tmp_path, monkeypatch):
+    from src.config import settings
+
+    monkeypatch.setattr(settings, "data_dir", str(tmp_path))
+    _publish_predictions(settings.predictions_store_dir)
     client = TestClient(app)
     r = client.get("/report/parcel/1")
     assert r.status_code == 200
     j = r.json()
     assert "png" in j and "metrics" in j
+    m = j["metrics"]
+    assert m["id"] == 1 and m["class"] == "rainfed" and m["water_flag"] is False
+    assert abs(m["features"]["ndvi_p50"] - 0.3) < 1e-9
+    assert client.get("/report/parcel/99").status_code == 404
+
+
+def test_report_parcels_batch(tmp_path, monkeypatch):
+    from src.config import settings
+
+    monkeypatch.setattr(settings, "data_dir", str(tmp_path))
+    _publish_predictions(settings.predictions_store_dir)
+    r = TestClient(app).post("/report/parcels", json={"ids": [0, 2, 7]})
+    assert r.status_code == 200
+    j = r.json()
+    assert [p["id"] for p in j["parcels"]] == [0, 2]
+    assert j["parcels"][0]["water_flag"] is True
+    assert j["missing"] == [7]
+
+
+def test_columnar_categories_past_uint16(tmp_path):
+    import numpy as np
+    import pandas as pd
+    from src.utils.colstore import ColumnarSnapshot, write_columnar
+
+    n = 70_000
+    snap = ColumnarSnapshot(write_columnar(pd.DataFrame({"id": range(n), "village": [f"v{i}" for i in range(n)]}), str(tmp_path)))
+    assert snap.columns["village"].dtype == np.uint32
+    assert snap.value("village", n - 1) == f"v{n - 1}"
+
+
+def test_tile_miss_serves_shared_empty_tile_without_writing(tmp_path, monkeypatch):
+    from src.config import settings
+
+    monkeypatch.setattr(settings, "data_dir", str(tmp_path))
+    client = TestClient(app)
+    r1 = client.get("/tiles/ndvi/5/1/2.png")
+    r2 = client.get("/tiles/ndvi/5/1/3.png")
+    assert r1.status_code == 200 and r1.headers["content-type"] == "image/png"
+    assert r1.content == r2.content
+    assert not (tmp_path / "tiles" / "ndvi" / "5").exists()
+
+
+def test_tile_hit_conditional_get(tmp_path, monkeypatch):
+    from src.config import settings
+    from src.utils.io import mark_layer_updated
+
+    monkeypatch.setattr(settings, "data_dir", str(tmp_path))
+    tile = tmp_path / "tiles" / "ndvi" / "3" / "2" / "1.png"
+    tile.parent.mkdir(parents=True)
+    tile.write_bytes(b"\x89PNG fake")
+    mark_layer_updated(str(tmp_path / "tiles" / "ndvi"))
+    client = TestClient(app)
+    r = client.get("/tiles/ndvi/3/2/1.png")
+    assert r.status_code == 200 and r.content == b"\x89PNG fake"
+    r304 = client.get("/tiles/ndvi/3/2/1.png", headers={"If-None-Match": r.headers["etag"]})
+    assert r304.status_code == 304
+
+
+def test_tile_served_from_mbtiles_archive(tmp_path, monkeypatch):
+    from src.config import settings
+    from src.utils.mbtiles import MBTilesWriter, archive_path
+
+    monkeypatch.setattr(settings, "data_dir", str(tmp_path))
+    with MBTilesWriter(archive_path(settings.tiles_dir, "packed"), name="packed") as w:
+        w.put(4, 3, 2, b"tile-a")
+        w.put(4, 3, 3, b"tile-a")
+        w.put(4, 4, 2, b"tile-b")
+    assert (w.tiles, w.unique) == (3, 2)
+    client = TestClient(app)
+    r = client.get("/tiles/packed/4/3/3.png")
+    assert r.status_code == 200 and r.content == b"tile-a"
+    assert client.get("/tiles/packed/4/3/3.png", headers={"If-None-Match": r.headers["etag"]}).status_code == 304
+    miss = client.get("/tiles/packed/4/9/9.png")
+    assert miss.status_code == 200 and miss.content != b"tile-a"
+
+
+def test_report_village_from_rollups(tmp_path, monkeypatch):
+    import json
+    from src.config import settings
+
+    monkeypatch.setattr(settings, "data_dir", str(tmp_path))
+    path = tmp_path / "features" / "village_rollups.json"
+    path.parent.mkdir(parents=True)
+    path.write_text(json.dumps({"Assagao": {"name": "Assagao", "parcels": 3, "csv": "x.csv", "actions": []}}))
+    client = TestClient(app)
+    r = client.get("/report/village/Assagao")
+    assert r.status_code == 200 and r.json()["summary"]["parcels"] == 3
+    assert client.get("/report/village/Nowhere").status_code == 404
+
+
+def test_parcel_vector_tiles(tmp_path, monkeypatch):
+    import mercantile
+    from src.config import settings
+    from src.pipeline import synthetic_parcel_geoms
+
+    monkeypatch.setattr(settings, "data_dir", str(tmp_path))
+    client = TestClient(app)
+    assert client.get("/mvt/parcels/8/0/0.pbf").status_code == 404  # nothing published yet
+    _publish_predictions(settings.predictions_store_dir)
+    synthetic_parcel_geoms((73.90, 15.30, 74.10, 15.50), 3, 1, n_x=1, n_y=3).to_file(settings.parcels_path, driver="GPKG")
+    t = mercantile.tile(74.0, 15.4, 10)
+    r = client.get(f"/mvt/parcels/{t.z}/{t.x}/{t.y}.pbf")
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/vnd.mapbox-vector-tile"
+    assert b"parcels" in r.content and b"irrigated" in r.content
+    assert client.get(f"/mvt/parcels/{t.z}/{t.x}/{t.y}.pbf", headers={"If-None-Match": r.headers["etag"]}).status_code == 304
+    assert client.get("/mvt/roads/8/0/0.pbf").status_code == 404
+
+
+def test_pregenerated_parcel_tiles_follow_the_data(tmp_path, monkeypatch):
+    import os
+
+    import mercantile
+    from src.api.routes_maps import parcel_tile_source
+    from src.config import settings
+    from src.pipeline import synthetic_parcel_geoms
+    from src.utils.vector_tiles import pregenerate_parcel_tiles
+
+    monkeypatch.setattr(settings, "data_dir", str(tmp_path))
+    _publish_predictions(settings.predictions_store_dir)
+    synthetic_parcel_geoms((73.90, 15.30, 74.10, 15.50), 3, 1, n_x=1, n_y=3).to_file(settings.parcels_path, driver="GPKG")
+    source = parcel_tile_source()
+    monkeypatch.setattr(source, "recheck_s", 0.0)
+    pregenerate_parcel_tiles(source, [10], os.path.join(settings.mvt_dir, "parcels"))
+    t = mercantile.tile(74.0, 15.4, 10)
+    url = f"/mvt/parcels/{t.z}/{t.x}/{t.y}.pbf"
+    client = TestClient(app)
+    rendered = f'-{t.z}-{t.x}-{t.y}"'
+    assert not client.get(url).headers["etag"].endswith(rendered)  # from disk
+    # Parcels edited after pre-generation: those tiles are stale and rendered again instead
+    st = os.stat(settings.parcels_path)
+    os.utime(settings.parcels_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    r = client.get(url)
+    assert r.status_code == 200 and r.headers["etag"].endswith(rendered)
+
+
+def test_point_and_bbox_query(tmp_path, monkeypatch):
+    import numpy as np
+    from src.config import settings
+    from src.pipeline import synthetic_parcel_geoms
+    from src.utils.rasters import write_geotiff
+
+    monkeypatch.setattr(settings, "data_dir", str(tmp_path))
+    bounds = (73.90, 15.30, 74.10, 15.50)
+    (tmp_path / "features").mkdir()
+    synthetic_parcel_geoms(bounds, 4, 4, n_x=2, n_y=2).to_file(settings.parcels_path, driver="GPKG")
+    ndvi = np.arange(16, dtype=np.float32).reshape(4, 4)
+    ndvi[3, 3] = np.nan
+    write_geotiff(ndvi, settings.query_rasters["ndvi"], bounds)
+    client = TestClient(app)
+
+    # Row 0 is north: (lat 15.49, lon 73.91) is pixel (0, 0) in parcel 0
+    r = client.get("/query/point", params={"lat": 15.49, "lon": 73.91})
+    assert r.status_code == 200
+    j = r.json()
+    assert j["parcel_id"] == 0 and j["values"] == {"ndvi": 0.0} and j["report"] == "/report/parcel/0"
+
+    pts = [[74.09, 15.31], [74.06, 15.44], [80.0, 10.0]]
+    res = client.post("/query/points", json={"points": pts}).json()["results"]
+    assert [p["parcel_id"] for p in res] == [3, 1, None]
+    assert res[0]["values"]["ndvi"] is None and res[1]["values"]["ndvi"] == 7.0 and res[2]["values"]["ndvi"] is None
+
+    j = client.get("/query/bbox", params={"bbox": "73.91,15.31,73.99,15.49", "limit": 1}).json()
+    assert j["parcel_count"] == 2 and j["parcels"] == [0] and j["truncated"] is True
+    assert j["stats"]["ndvi"]["count"] == 8
+    assert client.get("/query/bbox", params={"bbox": "1,2,0,3"}).status_code == 422
+    assert client.post("/query/points", json={"points": [[1.0]]}).status_code == 422
+
+
+def test_point_query_closes_replaced_rasters(tmp_path):
+    import numpy as np
+    from src.api.point_query import PointQuery
+    from src.utils.rasters import write_geotiff
+
+    bounds = (73.90, 15.30, 74.10, 15.50)
+    path = str(tmp_path / "ndvi.tif")
+    write_geotiff(np.zeros((4, 4), np.float32), path, bounds)
+    engine = PointQuery(str(tmp_path / "parcels.gpkg"), {"ndvi": path})
+    engine.refresh(force=True)
+    with engine._samplers_in_use() as samplers:
+        old = samplers["ndvi"]
+        write_geotiff(np.ones((4, 4), np.float32), path, bounds)
+        os.utime(path, ns=(old.mtime + 10**9, old.mtime + 10**9))
+        engine.refresh(force=True)
+        # A reader still holding the old sampler can finish with it
+        assert not old.ds.closed and old.sample(np.array([73.91]), np.array([15.49]))[0] == 0.0
+    assert old.ds.closed
+    assert engine.points([73.91], [15.49])["values"]["ndvi"][0] == 1.0
+
+
+def test_layers_and_overlay_served_from_manifest(tmp_path, monkeypatch):
+    import numpy as np
+    from src.config import settings
+    from src.manifest import RunManifest
+    from src.utils.rasters import write_geotiff
+
+    monkeypatch.setattr(settings, "data_dir", str(tmp_path))
+    with TestClient(app) as client:
+        assert client.get("/layers").status_code == 404
+        assert client.get("/overlay/ndvi").status_code == 404
+
+        bounds = (73.90, 15.30, 74.10, 15.50)
+        ndvi = np.linspace(-0.2, 0.8, 100, dtype=np.float32).reshape(10, 10)
+        ndvi[0, 0] = np.nan
+        write_geotiff(ndvi, settings.query_rasters["ndvi"], bounds)
+        manifest = RunManifest("offline", "aoi.geojson", "2024-01-01", "2024-01-31", bounds)
+        with manifest.stage("tiles"):
+            manifest.add_layer("ndvi", raster_path=settings.query_rasters["ndvi"], zooms=[8, 9, 10], tile_stats={"tiles": 5, "bytes": 900},
+                               fmt="png8", cmap="RdYlGn", vmin=-0.2, vmax=0.8, overlay="/static/tiles/overlays/ndvi.png")
+        manifest.save(settings.manifest_path)
+        # /ingest reloads the manifest; without it the cache rechecks the file within a second
+        from src.api.routes_maps import run_manifest
+        run_manifest().get(force=True)
+
+        j = client.get("/layers").json()
+        layer = j["layers"]["ndvi"]
+        assert layer["url"] == "/tiles/ndvi/{z}/{x}/{y}.png"
+        assert (layer["minzoom"], layer["maxzoom"], layer["tiles"]) == (8, 10, 5)
+        assert abs(layer["stats"]["min"] - ndvi[0, 1]) < 1e-6 and abs(layer["stats"]["max"] - 0.8) < 1e-6
+        assert layer["stats"]["valid_fraction"] == 0.99 and layer["stats"]["p2"] < layer["stats"]["p50"] < layer["stats"]["p98"]
+        assert set(j["run"]["timings_s"]) == {"tiles", "total"}
+        assert not (tmp_path / "interim" / "ndvi.tif.aux.xml").exists()
 
+        r = client.get("/overlay/ndvi").json()
+        assert r == {"url": "/static/tiles/overlays/ndvi.png", "bounds": [[15.30, 73.90], [15.50, 74.10]]}
+        assert client.get("/overlay/lst").status_code == 404
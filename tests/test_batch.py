@@ -0,0 +1,50 @@
+import json
+import os
+
+from src.batch import BatchJob, load_jobs, run_batch
+
+AOI = os.path.join("data", "aoi", "goa_demo.geojson")
+
+
+def test_load_jobs_rejects_duplicate_run_names(tmp_path):
+    path = tmp_path / "jobs.json"
+    path.write_text(json.dumps([{"aoi": AOI, "start": "2024-11-01", "end": "2025-03-31"}] * 2))
+    try:
+        load_jobs(str(path))
+    except ValueError as e:
+        assert "goa_demo_2024-11-01_2025-03-31" in str(e)
+    else:
+        raise AssertionError("duplicate run names accepted")
+
+
+def test_batch_runs_are_isolated_and_share_the_model(tmp_path, monkeypatch):
+    import geopandas as gpd
+    from shapely.geometry import box
+    from src.config import settings
+
+    # Village polygons live in the shared data dir, outside every run dir
+    monkeypatch.setattr(settings, "data_dir", str(tmp_path / "data"))
+    os.makedirs(settings.aoi_dir)
+    gpd.GeoDataFrame({"name": ["all_of_goa"]}, geometry=[box(70, 10, 80, 20)], crs=4326).to_file(settings.villages_path, driver="GeoJSON")
+    jobs = [
+        BatchJob(AOI, "2024-11-01", "2025-03-31", name="a"),
+        BatchJob(AOI, "2024-11-01", "2025-03-31", name="b"),
+        BatchJob("missing.geojson", "2024-11-01", "2025-03-31"),
+    ]
+    report = run_batch(
+        jobs, str(tmp_path / "runs"), str(tmp_path / "shared"), workers=2,
+        options={"shape": (32, 32), "parcel_grid": (4, 4)},
+    )
+    assert report["ok"] == 2 and report["failed"] == 1 and report["aois_per_hour"] > 0
+    by_name = {r["name"]: r for r in report["runs"]}
+    assert "error" in by_name["missing_2024-11-01_2025-03-31"]
+    for name in ("a_2024-11-01_2025-03-31", "b_2024-11-01_2025-03-31"):
+        run_dir = tmp_path / "runs" / name
+        assert (run_dir / "features" / "predictions.csv").exists()
+        header = (run_dir / "features" / "predictions.csv").read_text().splitlines()[0].split(",")
+        assert {"mndwi_mean", "water_z_local", "water_anom"} <= set(header)
+        assert (run_dir / "features" / "water_history.npz").exists()
+        assert "all_of_goa" in json.loads((run_dir / "features" / "village_rollups.json").read_text())
+        assert not (run_dir / "models").exists()
+    assert (tmp_path / "shared" / "models" / "irrigate_clf.pkl").exists()
+    assert json.loads((tmp_path / "runs" / "batch_report.json").read_text())["ok"] == 2
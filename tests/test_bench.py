@@ -0,0 +1,73 @@
+from benchmarks.bench_pipeline import run_suite
+from benchmarks.harness import compare, parse_size, parse_zooms
+
+
+def test_parse_helpers():
+    assert parse_size("128") == (128, 128)
+    assert parse_size("64x128") == (64, 128)
+    assert parse_zooms("8-10") == [8, 9, 10]
+    assert parse_zooms("8,11") == [8, 11]
+
+
+def test_run_suite_small(tmp_path):
+    from src.config import settings
+
+    old = settings.data_dir
+    rec = run_suite(str(tmp_path), shape=(64, 64), n_parcels=16, zooms=[8], serve_requests=5)
+    assert settings.data_dir == old
+    out = rec.to_dict()
+    for stage in ("scene", "indices", "zonal_stats", "train", "predict", "mvt_render", "tiling", "tile_serving"):
+        assert stage in out["stages"]
+        assert out["stages"][stage]["best"] >= 0
+    assert out["params"]["parcels"] == 16
+
+
+def test_compare_flags_regression():
+    base = {"stages": {"a": {"best": 1.0}, "b": {"best": 1.0}, "gone": {"best": 1.0}}}
+    cur = {"stages": {"a": {"best": 2.0}, "b": {"best": 0.5}, "new": {"best": 1.0}}}
+    status = {r["stage"]: r["status"] for r in compare(cur, base, tolerance=0.25)}
+    assert status == {"a": "regression", "b": "improvement", "gone": "missing_current", "new": "missing_baseline"}
+
+
+def test_reproject_suite_small(tmp_path):
+    from benchmarks.bench_reproject import run_suite as run_reproject
+
+    out = run_reproject(str(tmp_path), shape=(256, 256), bands=2, layers=2, zooms=[12]).to_dict()["stages"]
+    for stage in ("bands_gdal", "plan_build", "bands_plan", "plan_load_cached", "tiles_warpedvrt", "tiles_plan", "tiles_plan_cached"):
+        assert out[stage]["best"] >= 0
+    assert out["bands_plan"]["extra"]["max_abs_diff_vs_gdal"] < 0.01 * out["bands_plan"]["extra"]["value_range"]
+
+
+def test_anomaly_suite_small(tmp_path):
+    from benchmarks.bench_anomaly import run_suite as run_anomaly
+
+    out = run_anomaly(str(tmp_path), n_parcels=20_000, k=8, periods=3).to_dict()["stages"]
+    assert out["neighbors_cached"]["best"] < out["neighbors_kdtree"]["best"]
+    extra = out["score_total"]["extra"]
+    assert extra["planted_found"] == extra["planted"]
+
+
+def test_zonal_suite_small(tmp_path):
+    from benchmarks.bench_zonal import run_suite as run_zonal
+
+    out = run_zonal(str(tmp_path), shape=(512, 512), parcel_px=16, workers=1, block=128).to_dict()["stages"]
+    for stage in ("windowed_ids", "windowed_polygons", "merge_saved"):
+        extra = out[stage]["extra"]
+        assert extra["ndvi_pct_err"] <= extra["ndvi_pct_bound"] and extra["lst_pct_err"] <= extra["lst_pct_bound"]
+
+
+def test_speckle_suite_small(tmp_path):
+    from benchmarks.bench_speckle import run_suite as run_speckle
+
+    out = run_speckle(str(tmp_path), shape=(256, 384), crop=128, workers=2, block=128).to_dict()["stages"]
+    assert out["lee_crop"]["extra"]["max_abs_diff"] < 1e-5
+    for stage in ("lee_size_21", "scene_lee_w1", "scene_refined_lee_w2"):
+        assert out[stage]["best"] >= 0
+
+
+def test_change_suite_small(tmp_path):
+    from benchmarks.bench_change import run_suite as run_change
+
+    out = run_change(str(tmp_path), shape=(512, 512), block=128, changed_pct=20).to_dict()["stages"]
+    assert out["unchanged"]["extra"]["blocks_changed"] == 0
+    assert out["sparse_change"]["extra"]["blocks_changed"] == 3
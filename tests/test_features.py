@@ -1,4 +1,8 @@
+import os
+from unittest.mock import Mock, patch
+
 import numpy as np
+import pytest
 from src.features.featurize import aggregate_to_parcels
 
 
@@ -17,3 +21,404 @@ def test_aggregate_to_parcels_shapes():
     assert any(c.startswith("ndvi_") for c in df.columns)
     assert any(c.startswith("ndwi_") for c in df.columns)
 
+
+def _rollup_inputs():
+    import geopandas as gpd
+    import pandas as pd
+    from shapely.geometry import box
+    from src.pipeline import synthetic_parcel_geoms
+
+    parcels = synthetic_parcel_geoms((73.9, 15.3, 74.1, 15.5), 64, 64, n_x=4, n_y=4)
+    villages = gpd.GeoDataFrame({"name": ["west", "east"]}, geometry=[box(73.9, 15.3, 74.0, 15.5), box(74.0, 15.3, 74.1, 15.5)], crs=4326)
+    pred = pd.DataFrame({
+        "id": parcels["id"],
+        "prob_fallow": 0.1,
+        "prob_irrigated": [0.8 if i % 4 < 2 else 0.1 for i in parcels["id"]],
+        "prob_rainfed": [0.1 if i % 4 < 2 else 0.8 for i in parcels["id"]],
+        "water_anom": 0.0,
+        "water_flag": False,
+    })
+    return parcels, villages, pred
+
+
+def test_assign_parcels_to_villages():
+    from src.features.rollup import assign_parcels_to_villages
+
+    parcels, villages, _ = _rollup_inputs()
+    v = assign_parcels_to_villages(parcels, villages)
+    assert (v == np.where(parcels["id"] % 4 < 2, 0, 1)).all()
+
+
+def test_village_rollups_incremental(tmp_path):
+    import json
+    from src.features.rollup import update_village_rollups
+
+    parcels, villages, pred = _rollup_inputs()
+    first = update_village_rollups(pred, parcels, villages, str(tmp_path))
+    assert first["incremental"] is False
+    rollups = json.loads((tmp_path / "village_rollups.json").read_text())
+    assert rollups["west"]["parcels"] == 8 and rollups["west"]["class_share"]["irrigated"] == 1.0
+
+    pred.loc[pred["id"] == 2, ["water_flag", "water_anom"]] = [True, 3.0]
+    second = update_village_rollups(pred, parcels, villages, str(tmp_path))
+    assert second["incremental"] is True
+    assert second["changed_parcels"] == 1 and second["changed_villages"] == 1
+    rollups = json.loads((tmp_path / "village_rollups.json").read_text())
+    assert rollups["east"]["anomalies"] == 1 and rollups["west"]["anomalies"] == 0
+    assert rollups["east"]["actions"][0]["id"] == 2
+
+
+def test_village_rollups_new_parcels_and_unsafe_names(tmp_path):
+    import json
+    from src.features.rollup import update_village_rollups
+
+    parcels, villages, pred = _rollup_inputs()
+    villages["name"] = ["../west", "east"]
+    update_village_rollups(pred[pred["id"] != 0], parcels, villages, str(tmp_path))
+    rollups = json.loads((tmp_path / "village_rollups.json").read_text())
+    assert rollups["../west"]["parcels"] == 7
+    # Village names never leave the actions directory
+    assert all(os.path.dirname(r["csv"]) == str(tmp_path / "actions") for r in rollups.values())
+
+    # Parcel 0 gets its first prediction: the incremental update must add it
+    second = update_village_rollups(pred, parcels, villages, str(tmp_path))
+    assert second["incremental"] is True and second["changed_parcels"] == 1
+    rollups = json.loads((tmp_path / "village_rollups.json").read_text())
+    assert rollups["../west"]["parcels"] == 8
+
+
+def _write_dem(path, z, transform, crs="EPSG:32643"):
+    import rasterio
+
+    with rasterio.open(path, "w", driver="GTiff", width=z.shape[1], height=z.shape[0], count=1, dtype="float32", crs=crs, transform=transform) as dst:
+        dst.write(z.astype("float32"), 1)
+
+
+def _write_scene(path, dn, transform, crs="EPSG:32643"):
+    """A Landsat Collection 2 Level-2 ST_B10 band: uint16 DN, 0 = fill."""
+    import rasterio
+
+    with rasterio.open(path, "w", driver="GTiff", width=dn.shape[1], height=dn.shape[0], count=1, dtype="uint16", nodata=0, crs=crs, transform=transform) as dst:
+        dst.write(dn.astype("uint16"), 1)
+
+
+def test_horn_slope_aspect_on_planes():
+    from src.features.terrain import horn_slope_aspect
+
+    cols = np.arange(6, dtype="f4")[None, :].repeat(5, 0)
+    # Rises 1 m per 1 m pixel to the east: 45 degrees, facing west
+    slope, aspect = horn_slope_aspect(cols, 1.0, 1.0)
+    np.testing.assert_allclose(slope, 45.0, atol=1e-4)
+    np.testing.assert_allclose(aspect, 270.0, atol=1e-4)
+    # Rises to the north (row 0): facing south
+    _, aspect = horn_slope_aspect(-np.arange(5, dtype="f4")[:, None].repeat(6, 1), 10.0, 10.0)
+    np.testing.assert_allclose(aspect, 180.0, atol=1e-4)
+    _, aspect = horn_slope_aspect(np.ones((4, 4), "f4"), 1.0, 1.0)
+    assert np.isnan(aspect).all()
+
+
+def test_terrain_blocks_are_seamless_and_cached(tmp_path, monkeypatch):
+    import rasterio
+    from rasterio.transform import from_origin
+    from src.features import terrain
+    from src.utils.rasters import write_geotiff
+
+    rng = np.random.default_rng(0)
+    z = np.cumsum(np.cumsum(rng.normal(size=(70, 90)), 0), 1)
+    z[30:33, 40:44] = np.nan
+    dem = str(tmp_path / "dem.tif")
+    _write_dem(dem, z, from_origin(500000, 1700000, 30, 30))
+    cache = str(tmp_path / "cache")
+
+    # Small blocks on 4 threads must match one whole-raster block
+    blocked = terrain.compute_terrain(dem, str(tmp_path / "a"), tpi_radius=3, block=16, workers=4, cache_dir=str(tmp_path / "c1"))
+    whole = terrain.compute_terrain(dem, str(tmp_path / "b"), tpi_radius=3, block=4096, workers=1, cache_dir=cache)
+    for name in terrain.TERRAIN_LAYERS:
+        with rasterio.open(blocked[name]) as a, rasterio.open(whole[name]) as b:
+            np.testing.assert_array_equal(a.read(1), b.read(1))
+    with rasterio.open(whole["tpi"]) as src:
+        tpi = src.read(1)
+    valid = ~np.isnan(z[5:8, 5:8])
+    ref = z[6, 6] - (np.nansum(z[3:10, 3:10]) - z[6, 6]) / (np.count_nonzero(~np.isnan(z[3:10, 3:10])) - 1)
+    assert valid.all() and abs(tpi[6, 6] - ref) < 1e-3
+
+    # Second run on an unchanged DEM reuses the cache; a target grid is cached too
+    compute_native = Mock(wraps=terrain._compute_native)
+    monkeypatch.setattr(terrain, "_compute_native", compute_native)
+    again = terrain.compute_terrain(dem, str(tmp_path / "c"), tpi_radius=3, cache_dir=cache)
+    assert os.path.exists(again["slope"])
+    like = str(tmp_path / "like.tif")
+    write_geotiff(np.zeros((20, 30), "f4"), like, (500300, 1698500, 502400, 1699700), crs="EPSG:32643")
+    aligned = terrain.compute_terrain(dem, str(tmp_path / "d"), like=like, tpi_radius=3, cache_dir=cache)
+    with rasterio.open(aligned["slope"]) as src, rasterio.open(like) as ref:
+        assert src.shape == ref.shape and src.transform == ref.transform
+        assert np.isfinite(src.read(1)).mean() > 0.9
+    assert compute_native.call_count == 0
+
+
+def test_brightness_temperature_and_emissivity():
+    from src.features.landsat_lst import L8_B10, brightness_temperature, lst_from_bt, ndvi_emissivity
+
+    bt = brightness_temperature(np.array([30000.0, 0.0]), **L8_B10)
+    assert abs(bt[0] - 303.66) < 0.05
+    eps = ndvi_emissivity(np.array([-0.1, 0.1, 0.8], dtype="f4"))
+    np.testing.assert_allclose(eps, [0.991, 0.973, 0.990], atol=1e-6)
+    # Emissivity below 1 means the surface is warmer than it looks
+    assert lst_from_bt(bt[:1], eps[1:2])[0] > bt[0]
+
+
+def test_lst_windowed_read_resampled_and_cached(tmp_path):
+    import rasterio
+    from rasterio.transform import from_origin
+    from src.features.landsat_lst import L2_ST_OFFSET, L2_ST_SCALE, compute_lst
+    from src.utils.rasters import write_geotiff
+    from src.utils.reproject import ReprojectionPlan
+
+    # 30 m Level-2 scene, DN rising 10 per column (about 286-299 K); fill (0) in one corner
+    dn = (40000 + 10 * np.arange(400))[None, :].repeat(300, 0)
+    dn[:20, :20] = 0
+    scene = str(tmp_path / "st_b10.tif")
+    _write_scene(scene, dn, from_origin(400000, 1800000, 30, 30))
+    # 10 m target grid over an interior part of the scene
+    like = str(tmp_path / "ndvi.tif")
+    write_geotiff(np.zeros((60, 90), "f4"), like, (403000, 1795000, 403900, 1795600), crs="EPSG:32643")
+
+    out = compute_lst(scene, like, str(tmp_path / "lst.tif"), cache_dir=str(tmp_path / "cache"))
+    with rasterio.open(out) as src:
+        lst = src.read(1)
+        assert src.shape == (60, 90)
+    x = 403000 + (np.arange(90) + 0.5) * 10
+    expected = (40000 + 10 * ((x - 400000) / 30 - 0.5)) * L2_ST_SCALE + L2_ST_OFFSET
+    np.testing.assert_allclose(lst, np.broadcast_to(expected, lst.shape), rtol=1e-5)
+
+    # The next run over the same scene and grid does not touch the scene
+    with patch.object(ReprojectionPlan, "read", autospec=True, side_effect=ReprojectionPlan.read) as read:
+        again = compute_lst(scene, like, str(tmp_path / "lst2.tif"), cache_dir=str(tmp_path / "cache"))
+    with rasterio.open(again) as src:
+        np.testing.assert_array_equal(src.read(1), lst)
+    assert read.call_count == 0
+
+    # Level-1 mode: brightness temperature corrected with NDVI emissivity on the same grid
+    bt = compute_lst(scene, like, str(tmp_path / "lst_bt.tif"), mode="bt", ndvi_path=like, cache_dir=str(tmp_path / "cache"))
+    with rasterio.open(bt) as src:
+        assert src.shape == (60, 90) and src.is_tiled and np.isfinite(src.read(1)).all()
+
+
+def test_water_anomaly_is_local():
+    import pandas as pd
+    from src.models.water_anomaly import neighbor_table, score_water_anomaly
+
+    # 20x20 parcel grid, 100 m apart: west half dry (-0.4), east half wet (0.4), small noise
+    rng = np.random.default_rng(0)
+    gx, gy = np.meshgrid(np.arange(20) * 100.0, np.arange(20) * 100.0)
+    centroids = pd.DataFrame({"id": np.arange(400), "x": gx.ravel(), "y": gy.ravel()})
+    mndwi = np.where(gx.ravel() < 1000, -0.4, 0.4) + rng.normal(0, 0.01, 400)
+    # Parcel 105 (west side) holds water its dry neighbours do not: unremarkable state-wide
+    mndwi[105] = 0.3
+    df = pd.DataFrame({"id": np.arange(400), "mndwi_mean": mndwi})
+
+    xy = centroids[["x", "y"]].to_numpy()
+    nbrs = neighbor_table(xy, k=8)
+    d = np.hypot(*(xy[nbrs] - xy[:, None]).transpose(2, 0, 1))
+    brute = np.sort(np.hypot(*(xy[None] - xy[:, None]).transpose(2, 0, 1)), axis=1)[:, 1:9]
+    assert not (nbrs == np.arange(400)[:, None]).any()
+    np.testing.assert_allclose(np.sort(d, axis=1), brute)
+
+    local = score_water_anomaly(df, centroids=centroids, k=8)
+    assert local["water_flag"].sum() == 1 and bool(local.loc[105, "water_flag"])
+    assert local["water_z_local"][105] > 10
+    flat = score_water_anomaly(df)
+    assert not flat.loc[105, "water_flag"]
+    # No mndwi_mean: nothing to score
+    assert not score_water_anomaly(df.drop(columns="mndwi_mean"))["water_flag"].any()
+
+
+def test_water_anomaly_history(tmp_path):
+    import pandas as pd
+    from src.models.water_anomaly import WaterHistory, score_water_anomaly
+
+    path = str(tmp_path / "hist.npz")
+    ids = np.arange(5)
+    for i, period in enumerate(["p1", "p2", "p3", "p3"]):
+        hist = WaterHistory.load(path, window=3)
+        out = score_water_anomaly(pd.DataFrame({"id": ids, "mndwi_mean": 0.1 + 0.01 * i}), history=hist, period=period)
+        hist.save(path)
+        assert not out["water_flag"].any()
+    hist = WaterHistory.load(path, window=3)
+    assert hist.periods == ["p1", "p2", "p3"] and np.allclose(hist.values[:, 2], 0.13)
+    # Parcel 3 floods in p4 while the field around it (no centroids: the whole set) stays put
+    vals = np.full(5, 0.12)
+    vals[3] = 0.6
+    out = score_water_anomaly(pd.DataFrame({"id": ids, "mndwi_mean": vals}), history=hist, period="p4")
+    assert out["water_flag"].tolist() == [False, False, False, True, False]
+    assert out["water_z_hist"][3] > 10 and abs(out["water_z_hist"][0]) < 1
+    # A new parcel has no history yet; the oldest period rolls off
+    out = score_water_anomaly(pd.DataFrame({"id": [0, 9], "mndwi_mean": [0.12, 0.12]}), history=hist, period="p5")
+    assert np.isnan(out["water_z_hist"][1]) and hist.periods == ["p3", "p4", "p5"] and 9 in hist.ids
+
+
+def test_zonal_sketch_matches_in_memory_and_merges(tmp_path):
+    import geopandas as gpd
+    import shapely
+    from rasterio.transform import from_origin
+    from src.features.zonal import DEFAULT_BINS, ZonalSketch, zonal_sketch, zonal_stats_windowed
+    from src.utils.rasters import write_cog
+
+    rng = np.random.default_rng(3)
+    h, w, side = 150, 200, 25
+    yy, xx = np.mgrid[0:h, 0:w]
+    ids = (yy // side) * (w // side) + xx // side
+    ids[:, :10] = -1
+    layers = {"ndvi": rng.normal(0.3, 0.2, (h, w)).astype("f4"), "lst": rng.normal(305, 4, (h, w)).astype("f4")}
+    layers["ndvi"][30:40, 30:40] = np.nan
+    transform = from_origin(400000, 1700000, 10, 10)
+    paths = {name: write_cog(arr, str(tmp_path / f"{name}.tif"), "EPSG:32643", transform) for name, arr in layers.items()}
+    write_cog(ids.astype("f4"), str(tmp_path / "ids.tif"), "EPSG:32643", transform, nodata=-1)
+
+    ref = aggregate_to_parcels(ids, layers)
+    got = zonal_stats_windowed(paths, id_raster=str(tmp_path / "ids.tif"), block=64)
+    assert list(got.columns) == list(ref.columns) and list(got["id"]) == list(ref["id"])
+    for name, bound in (("ndvi", 2 / DEFAULT_BINS), ("lst", 100 / DEFAULT_BINS)):
+        np.testing.assert_allclose(got[f"{name}_mean"], ref[f"{name}_mean"], rtol=1e-6)
+        np.testing.assert_allclose(got[f"{name}_std"], ref[f"{name}_std"], rtol=1e-4)
+        for q in ("p50", "p90"):
+            assert np.abs(got[f"{name}_{q}"] - ref[f"{name}_{q}"]).max() <= bound
+
+    # Polygons rasterized per window and a split over two processes give the same rows
+    i = np.unique(ids[ids >= 0])
+    x0 = 400000 + (i % (w // side)) * side * 10
+    y0 = 1700000 - (i // (w // side)) * side * 10
+    boxes = shapely.box(np.maximum(x0, 400000 + 100), y0 - side * 10, x0 + side * 10, y0)
+    parcels = gpd.GeoDataFrame({"id": i}, geometry=boxes, crs="EPSG:32643")
+    np.testing.assert_allclose(zonal_stats_windowed(paths, parcels=parcels, block=64).to_numpy(), got.to_numpy())
+    np.testing.assert_allclose(zonal_stats_windowed(paths, id_raster=str(tmp_path / "ids.tif"), block=64, workers=2).to_numpy(), got.to_numpy())
+
+    # Sketches of two halves, saved and merged, equal the sketch of the whole
+    ranges = {"ndvi": (-1.0, 1.0), "lst": (250.0, 350.0)}
+    for k, sl in enumerate((slice(0, 80), slice(80, h))):
+        ZonalSketch.from_pixels(ids[sl], {n: a[sl] for n, a in layers.items()}, ranges).save(str(tmp_path / f"part{k}.npz"))
+    merged = ZonalSketch.load(str(tmp_path / "part0.npz")).merge([ZonalSketch.load(str(tmp_path / "part1.npz"))])
+    np.testing.assert_allclose(merged.to_frame().to_numpy(), got.to_numpy())
+    whole = zonal_sketch(paths, id_raster=str(tmp_path / "ids.tif"), block=64)
+    np.testing.assert_array_equal(merged.hist["ndvi"][1], whole.hist["ndvi"][1])
+
+
+def test_speckle_filters_are_box_sums_and_keep_edges(tmp_path):
+    from rasterio.transform import from_origin
+    from src.features.radar import DEFAULT_ENL, despeckle, despeckle_geotiff, lee, to_db, to_linear
+    from src.utils.rasters import write_cog
+
+    np.testing.assert_allclose(to_linear(to_db(np.array([1e-3, 0.05, 1.0]))), [1e-3, 0.05, 1.0], rtol=1e-5)
+    assert to_db(np.array([0.0]))[0] == -50.0
+
+    rng = np.random.default_rng(5)
+    clean = np.where(np.arange(160)[None, :] < 80, 0.2, 0.02) * np.ones((120, 1))
+    img = (clean * rng.gamma(DEFAULT_ENL, 1 / DEFAULT_ENL, clean.shape)).astype("f4")
+    img[5:8, 5:8] = np.nan
+
+    # Lee from box sums equals window statistics taken pixel by pixel
+    small = img[:20, :20]
+    got = lee(np.pad(small, 2, constant_values=np.nan), size=5)
+    pad = np.pad(small, 2, constant_values=np.nan)
+    for r, c in ((0, 0), (4, 9), (10, 10), (19, 12)):
+        win = pad[r:r + 5, c:c + 5]
+        mean, var = np.nanmean(win), np.nanvar(win)
+        var_x = max((var - mean * mean / DEFAULT_ENL) / (1 + 1 / DEFAULT_ENL), 0.0)
+        assert abs(got[r, c] - (mean + var_x / var * (small[r, c] - mean))) < 1e-6
+    assert np.isnan(got[6, 6])
+
+    for method in ("lee", "refined_lee"):
+        out = despeckle(img, method, block=32)
+        # Seamless: block size does not change the result
+        np.testing.assert_allclose(out, despeckle(img, method, block=512), atol=1e-7)
+        area = out[20:100, 10:70]
+        assert area.std() / area.mean() < 0.5 * (img[20:100, 10:70].std() / img[20:100, 10:70].mean())
+        assert abs(area.mean() - 0.2) < 0.01
+    # refined Lee keeps the edge: pixels just beside it stay near their own side
+    refined, plain = despeckle(img, "refined_lee"), despeckle(img, "lee")
+    assert np.abs(refined[20:100, 81] - 0.02).mean() < np.abs(plain[20:100, 81] - 0.02).mean()
+
+    # File version on dB input filters in linear power and writes dB back
+    path = write_cog(to_db(img), str(tmp_path / "vv_db.tif"), "EPSG:32643", from_origin(400000, 1700000, 10, 10))
+    out_path = despeckle_geotiff(path, str(tmp_path / "vv_db_f.tif"), "refined_lee", units="db", block=48, workers=2)
+    import rasterio
+
+    with rasterio.open(out_path) as src:
+        np.testing.assert_allclose(src.read(1), to_db(despeckle(to_linear(to_db(img)), "refined_lee")), atol=1e-4)
+
+
+def test_model_from_an_older_feature_schema_is_retrained(tmp_path):
+    import joblib
+    import pandas as pd
+    from src.models.irrigate_clf import FEATURE_SCHEMA, FEATURES, predict, train_or_load
+
+    df = pd.DataFrame(np.random.default_rng(0).uniform(-0.2, 0.8, (40, len(FEATURES))), columns=FEATURES)
+    df.insert(0, "id", np.arange(40))
+    features_csv = str(tmp_path / "features.csv")
+    df.to_csv(features_csv, index=False)
+    # A model saved before vv_vh moved to dB carries no schema
+    os.makedirs(tmp_path / "models")
+    joblib.dump({"model": None, "features": FEATURES}, tmp_path / "models" / "irrigate_clf.pkl")
+    model_path = train_or_load(features_csv, str(tmp_path / "models"))
+    assert joblib.load(model_path)["schema"] == FEATURE_SCHEMA
+    assert len(predict(model_path, features_csv)) == 40
+
+
+def test_change_detection_skips_unchanged_blocks(tmp_path, monkeypatch):
+    import geopandas as gpd
+    import pandas as pd
+    import rasterio
+    import shapely
+    from rasterio.transform import from_origin
+    from src.features import change
+    from src.features.change import detect_changes, render_change_tiles
+    from src.utils.rasters import write_cog
+
+    transform = from_origin(400000, 1700000, 10, 10)
+    rng = np.random.default_rng(4)
+    ndvi = rng.uniform(0.2, 0.6, (200, 300)).astype("f4")
+    path, out = str(tmp_path / "ndvi.tif"), str(tmp_path / "change")
+    parcels = gpd.GeoDataFrame({"id": [0, 1]}, geometry=[shapely.box(400000, 1698000, 401500, 1700000), shapely.box(401500, 1698000, 403000, 1700000)], crs="EPSG:32643")
+    pred = lambda fallow: pd.DataFrame({"id": [0, 1], "prob_fallow": fallow, "prob_irrigated": [0.5, 0.5]})  # noqa: E731
+
+    write_cog(ndvi, path, "EPSG:32643", transform)
+    first = detect_changes({"ndvi": path}, out, pred_df=pred([0.9, 0.1]), parcels=parcels, block=64)
+    assert first["layers"]["ndvi"]["status"] == "baseline" and first["layers"]["ndvi"]["blocks"] == 20
+
+    # Vegetation lost in one corner of parcel 0 and parcel 1 turns fallow
+    ndvi[10:40, 20:50] -= 0.3
+    write_cog(ndvi, path, "EPSG:32643", transform)
+    second = detect_changes({"ndvi": path}, out, pred_df=pred([0.9, 0.8]), parcels=parcels, block=64)
+    layer = second["layers"]["ndvi"]
+    assert layer["status"] == "compared" and layer["blocks_changed"] == 1
+    assert layer["pixels"]["strong_decrease"] == 900 and layer["pixels"]["increase"] == 0
+    with rasterio.open(layer["path"]) as src:
+        cls = src.read(1)
+        assert src.dtypes[0] == "int8" and src.nodata == 0
+    assert (cls[10:40, 20:50] == -2).all() and (cls != 0).sum() == 900
+    table = pd.read_csv(str(tmp_path / "change" / "transitions.csv"))
+    assert table["ndvi_changed_px"].tolist() == [900, 0]
+    assert table["changed"].tolist() == [False, True] and second["transitions"] == {"irrigated->fallow": 1}
+
+    # Only the tiles over the changed block are rendered
+    stats = render_change_tiles(second, str(tmp_path / "tiles"), (73.9, 15.3, 74.0, 15.4), [14])
+    assert 1 <= stats["ndvi_change"]["tiles"] <= 4
+
+    # Nothing changed: every block skipped, snapshot left alone, empty change layer
+    snapshot = tmp_path / "change" / "state" / "ndvi.tif"
+    mtime = snapshot.stat().st_mtime_ns
+    third = detect_changes({"ndvi": path}, out, block=64)
+    assert third["layers"]["ndvi"]["blocks_changed"] == 0 and snapshot.stat().st_mtime_ns == mtime
+    assert render_change_tiles(third, str(tmp_path / "tiles"), (73.9, 15.3, 74.0, 15.4), [14])["ndvi_change"]["tiles"] == 0
+    assert not list((tmp_path / "tiles" / "ndvi_change").glob("14/*/*.png"))
+
+    # A new grid starts a new baseline
+    write_cog(ndvi[:, :250], path, "EPSG:32643", transform)
+    assert detect_changes({"ndvi": path}, out, block=64)["layers"]["ndvi"]["status"] == "baseline"
+
+    # A block that fails to read leaves no scratch file behind
+    monkeypatch.setattr(change, "_read", Mock(side_effect=OSError("unreadable block")))
+    write_cog(ndvi[:, :250] + 0.3, path, "EPSG:32643", transform)
+    with pytest.raises(OSError):
+        detect_changes({"ndvi": path}, out, block=64)
+    assert not list((tmp_path / "change").glob("*.blocks.tif"))
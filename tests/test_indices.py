@@ -1,3 +1,5 @@
+import os
+
 import numpy as np
 from src.utils.indices import ndvi, evi, ndwi, mndwi
 
@@ -19,3 +21,31 @@ def test_ndvi_range():
     assert np.all(v <= 1.0 + 1e-6)
     assert np.all(v >= -1.0 - 1e-6)
 
+
+def test_stac_fallback_writes_mndwi_from_b11(tmp_path, monkeypatch):
+    import sys
+
+    import rasterio
+
+    from src.config import settings
+    from src.ingest import stac_search
+    from src.pipeline import run_stac_pipeline
+    from src.utils.rasters import write_geotiff
+
+    monkeypatch.setattr(settings, "data_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "shared_dir", "")
+    # No stackstac: the main path fails and the single-scene fallback runs
+    monkeypatch.setitem(sys.modules, "stackstac", None)
+    bounds = (73.90, 15.30, 74.10, 15.50)
+    assets = {}
+    for code, dn in {"B02": 500, "B03": 800, "B04": 600, "B08": 3000, "B11": 1500}.items():
+        path = str(tmp_path / f"{code}.tif")
+        write_geotiff(np.full((32, 32), dn, dtype=np.float32), path, bounds)
+        assets[code] = {"href": path}
+    monkeypatch.setattr(stac_search, "cached_items", lambda *a, **k: [{"id": "S2_TEST", "assets": assets}])
+    os.makedirs(settings.interim_dir, exist_ok=True)
+
+    result = run_stac_pipeline("data/aoi/goa_demo.geojson", "2024-01-01", "2024-01-31", zooms=[])
+    assert result["status"] == "ok" and result["fallback"] is True
+    with rasterio.open(settings.query_rasters["mndwi"]) as src:
+        assert np.allclose(src.read(1), (800 - 1500) / (800 + 1500), atol=1e-6)
@@ -0,0 +1,16 @@
+import os
+
+from benchmarks.bench_import import import_once
+
+# Generous default so slow CI hosts pass; tighten via env on tile nodes
+STARTUP_BUDGET_S = float(os.getenv("STARTUP_BUDGET_S", "5.0"))
+
+
+def test_server_import_skips_heavy_stack():
+    res = import_once("src.api.server")
+    assert res["heavy"] == []
+
+
+def test_server_import_within_budget():
+    best = min(import_once("src.api.server")["wall_s"] for _ in range(2))
+    assert best < STARTUP_BUDGET_S
@@ -0,0 +1,398 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from src.utils.tile_encode import TileEncoder
+
+
+def test_encoder_skips_nodata_tiles_and_keeps_transparency():
+    enc = TileEncoder("RdYlGn", -0.2, 0.8, fmt="png")
+    assert enc.encode(np.full((8, 8), np.nan, dtype=np.float32)) is None
+    arr = np.full((8, 8), 0.3, dtype=np.float32)
+    arr[:4] = np.nan
+    im = Image.open(io.BytesIO(enc.encode(arr)))
+    assert im.mode == "RGBA"
+    alpha = np.asarray(im)[..., 3]
+    assert (alpha[:4] == 0).all() and (alpha[4:] == 255).all()
+    assert enc.stats()["skipped_nodata"] == 1 and enc.stats()["encoded"] == 1
+    # Integer sources: their nodata value is transparent like NaN
+    assert TileEncoder("RdYlGn", -2, 2, nodata=0).encode(np.zeros((8, 8), dtype=np.int8)) is None
+
+
+def test_png8_and_webp_encodings():
+    arr = np.linspace(-0.2, 0.8, 64, dtype=np.float32).reshape(8, 8)
+    arr[0, 0] = np.nan
+    png8 = Image.open(io.BytesIO(TileEncoder("RdYlGn", -0.2, 0.8, fmt="png8").encode(arr)))
+    assert png8.mode == "P" and png8.info.get("transparency") == 0
+    webp = Image.open(io.BytesIO(TileEncoder("RdYlGn", -0.2, 0.8, fmt="webp").encode(arr)))
+    assert webp.format == "WEBP"
+
+
+def test_switching_tile_output_drops_the_other_layout(tmp_path):
+    import sqlite3
+
+    from src.utils.rasters import write_geotiff
+    from src.utils.tiles import generate_xyz_tiles_from_geotiff
+
+    bounds = (73.90, 15.30, 74.10, 15.50)
+    path = write_geotiff(np.linspace(0, 1, 64 * 64, dtype=np.float32).reshape(64, 64), str(tmp_path / "a.tif"), bounds)
+    root = tmp_path / "tiles"
+    generate_xyz_tiles_from_geotiff(path, "a", str(root), bounds, [10], cmap="Greys", vmin=0.0, vmax=1.0, output="dir")
+    generate_xyz_tiles_from_geotiff(path, "a", str(root), bounds, [10], cmap="Greys", vmin=0.0, vmax=1.0, output="mbtiles", fmt="png8")
+    assert (root / "a.mbtiles").exists() and not (root / "a").exists()
+    with sqlite3.connect(root / "a.mbtiles") as conn:
+        assert conn.execute("SELECT value FROM metadata WHERE name = 'format'").fetchone() == ("png",)
+    # Back to loose files: the archive would otherwise still be served first
+    generate_xyz_tiles_from_geotiff(path, "a", str(root), bounds, [10], cmap="Greys", vmin=0.0, vmax=1.0, output="dir")
+    assert not (root / "a.mbtiles").exists() and any((root / "a" / "10").rglob("*.png"))
+
+
+def test_directory_tiles_replace_the_previous_run(tmp_path):
+    import rasterio
+    from rasterio.transform import from_bounds
+    from src.utils.tiles import generate_xyz_tiles_from_geotiff
+
+    bounds = (73.90, 15.30, 74.10, 15.50)
+    path = str(tmp_path / "classes.tif")
+    profile = {"driver": "GTiff", "width": 64, "height": 64, "count": 1, "dtype": "int16", "crs": "EPSG:4326",
+               "transform": from_bounds(*bounds, 64, 64), "nodata": -9999}
+    arr = np.full((64, 64), 5, dtype=np.int16)
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(arr, 1)
+    root = tmp_path / "tiles"
+    first = generate_xyz_tiles_from_geotiff(path, "c", str(root), bounds, [12], cmap="Greys", vmin=0, vmax=10)["tiles"]
+    # Next run: the west half is nodata, so its tiles are skipped and must not linger
+    arr[:, :32] = -9999
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(arr, 1)
+    second = generate_xyz_tiles_from_geotiff(path, "c", str(root), bounds, [12], cmap="Greys", vmin=0, vmax=10)["tiles"]
+    assert 0 < second < first
+    assert len(list((root / "c").rglob("*.png"))) == second
+    assert (root / "c" / ".version").exists() and [p.name for p in root.iterdir()] == ["c"]
+
+
+def _decode_mvt(buf):
+    """Minimal MVT reader for tests: {layer: {"extent", "features": [(id, props, geometry)]}}."""
+
+    def varint(b, i):
+        shift = v = 0
+        while True:
+            c = b[i]
+            i += 1
+            v |= (c & 0x7F) << shift
+            shift += 7
+            if c < 0x80:
+                return v, i
+
+    def fields(b):
+        i = 0
+        while i < len(b):
+            key, i = varint(b, i)
+            wt = key & 7
+            if wt == 0:
+                v, i = varint(b, i)
+            elif wt == 1:
+                v, i = b[i:i + 8], i + 8
+            else:
+                n, i = varint(b, i)
+                v, i = b[i:i + n], i + n
+            yield key >> 3, v
+
+    def packed(b):
+        out, i = [], 0
+        while i < len(b):
+            v, i = varint(b, i)
+            out.append(v)
+        return out
+
+    import struct
+
+    layers = {}
+    for f, layer_buf in fields(buf):
+        assert f == 3
+        name, extent, keys, values, feats = None, 4096, [], [], []
+        for lf, v in fields(layer_buf):
+            if lf == 1:
+                name = v.decode()
+            elif lf == 3:
+                keys.append(v.decode())
+            elif lf == 4:
+                (vf, vv), = list(fields(v))
+                values.append({1: lambda x: x.decode(), 3: lambda x: struct.unpack("<d", x)[0], 5: int, 6: lambda x: (x >> 1) ^ -(x & 1), 7: bool}[vf](vv))
+            elif lf == 5:
+                extent = v
+            elif lf == 2:
+                feats.append(dict(fields(v)))
+        decoded = []
+        for ft in feats:
+            tags = packed(ft.get(2, b""))
+            props = {keys[tags[k]]: values[tags[k + 1]] for k in range(0, len(tags), 2)}
+            decoded.append((ft.get(1), props, packed(ft[4])))
+        layers[name] = {"extent": extent, "features": decoded}
+    return layers
+
+
+def test_mvt_layer_orients_rings_and_drops_collapsed_polygons():
+    from src.utils.mvt import encode_polygon_layer, encode_tile
+
+    # Feature 0: counter-clockwise (y down) square with a hole in the same winding;
+    # feature 1: sub-pixel triangle that collapses after rounding
+    coords = np.array([
+        [0, 0], [0, 10], [10, 10], [10, 0], [0, 0],
+        [2, 2], [2, 4], [4, 4], [4, 2], [2, 2],
+        [0, 0], [0.2, 0.1], [0.1, 0.3], [0, 0],
+    ], dtype=float)
+    layer = encode_polygon_layer(
+        "parcels", coords, np.array([0, 5, 10, 14]), np.array([0, 2, 3]), np.array([0, 1, 2]),
+        ids=np.array([7, 8]),
+        properties={
+            "class": np.array(["irrigated", "fallow"]),
+            "prob": np.array([0.75, 0.5]),
+            "water_flag": np.ma.array([True, False], mask=[False, True]),
+            "water_anom": np.array([np.nan, -1.0]),
+            "delta": np.array([-3, 4]),
+        },
+    )
+    tiles = _decode_mvt(encode_tile([layer]))
+    (fid, props, geom), = tiles["parcels"]["features"]
+    assert fid == 7
+    assert props == {"class": "irrigated", "prob": 0.75, "water_flag": True, "delta": -3}
+    # MoveTo(1) + 2, LineTo(3) + 6, ClosePath(1), twice
+    assert geom[0] == 9 and geom[3] == (3 << 3 | 2) and geom[10] == 15 and geom[11] == 9 and len(geom) == 22
+
+    def ring(words):
+        pts, cx, cy = [], 0, 0
+        for dx, dy in zip(words[0::2], words[1::2]):
+            cx += (dx >> 1) ^ -(dx & 1)
+            cy += (dy >> 1) ^ -(dy & 1)
+            pts.append((cx, cy))
+        return pts
+
+    def area2(pts):
+        return sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(pts, pts[1:] + pts[:1]))
+
+    outer = ring(geom[1:3] + geom[4:10])
+    inner = ring([c for c in geom[12:14]] + geom[15:21])
+    inner = [(x + outer[-1][0], y + outer[-1][1]) for x, y in inner]
+    assert area2(outer) > 0 and area2(inner) < 0
+    assert encode_tile([b""]) == b""
+
+
+def test_parcel_tile_source(tmp_path):
+    import mercantile
+    import pandas as pd
+    from src.pipeline import synthetic_parcel_geoms
+    from src.utils.colstore import write_columnar
+    from src.utils.vector_tiles import ParcelTileSource, pregenerate_parcel_tiles
+
+    bounds = (73.90, 15.30, 74.10, 15.50)
+    parcels = synthetic_parcel_geoms(bounds, 64, 64, n_x=4, n_y=4)
+    parcels_path = str(tmp_path / "parcels.gpkg")
+    parcels.to_file(parcels_path, driver="GPKG")
+    store = str(tmp_path / "store")
+    write_columnar(pd.DataFrame({
+        "id": parcels["id"],
+        "prob_irrigated": np.linspace(0.0, 1.0, len(parcels)),
+        "prob_rainfed": np.linspace(1.0, 0.0, len(parcels)),
+        "water_flag": np.arange(len(parcels)) % 2 == 0,
+    }), store)
+
+    src = ParcelTileSource(parcels_path, store, cache_size=8)
+    t = mercantile.tile(74.0, 15.4, 12)
+    tiles = _decode_mvt(src.tile(t.z, t.x, t.y))
+    feats = tiles["parcels"]["features"]
+    assert feats and all(p["class"] in ("irrigated", "rainfed") and "water_flag" in p for _, p, _ in feats)
+    assert src.tile(t.z, t.x, t.y) and src.hits == 1
+    # Low zoom: every parcel lands in one tile; far-away tiles are empty
+    t0 = mercantile.tile(74.0, 15.4, 6)
+    assert len(_decode_mvt(src.tile(t0.z, t0.x, t0.y))["parcels"]["features"]) == len(parcels)
+    assert src.tile(6, 0, 0) == b""
+
+    out = tmp_path / "mvt" / "parcels"
+    stats = pregenerate_parcel_tiles(src, [10, 11], str(out))
+    gen = out / src.disk_etag()
+    assert stats["tiles"] > 0 and stats["path"] == str(gen) and len(list(gen.glob("11/*/*.pbf"))) > 0
+    assert (gen / ".version").exists()
+
+
+def _warp_coords(src_crs, src_transform, dst_crs, dst_transform, dst_shape):
+    """Exact fractional source (row, col) of every destination pixel centre."""
+    from pyproj import Transformer
+
+    h, w = dst_shape
+    py, px = np.mgrid[0:h, 0:w] + 0.5
+    x, y = dst_transform * (px, py)
+    x, y = Transformer.from_crs(dst_crs, src_crs, always_xy=True).transform(x, y)
+    cols, rows = ~src_transform * (x, y)
+    # Pixel-corner convention: centre of source pixel (i, j) sits at (i + 0.5, j + 0.5)
+    return rows - 0.5, cols - 0.5
+
+
+def test_reprojection_plan_matches_gdal_and_is_cached(tmp_path):
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.transform import from_bounds, from_origin
+    from rasterio.warp import reproject
+    from src.utils import reproject as rp
+
+    yy, xx = np.mgrid[0:300, 0:400].astype("f4")
+    bands = np.stack([np.sin(xx / 17) + np.cos(yy / 23), xx / 400 - yy / 300]).astype("f4")
+    src_transform = from_origin(400000, 1700000, 10, 10)
+    dst_transform = from_bounds(74.075, 15.35, 74.095, 15.37, 180, 200)
+    plan = rp.get_plan("EPSG:32643", src_transform, (300, 400), "EPSG:4326", dst_transform, (200, 180), cache_dir=str(tmp_path))
+    got = plan.apply(bands)
+    for band, out in zip(bands, got):
+        ref = np.full((200, 180), np.nan, dtype="f4")
+        reproject(band, ref, src_transform=src_transform, src_crs="EPSG:32643", dst_transform=dst_transform,
+                  dst_crs="EPSG:4326", dst_nodata=np.nan, resampling=Resampling.bilinear)
+        ok = np.isfinite(ref)
+        assert np.isfinite(out[ok]).mean() > 0.99
+        # GDAL's own approximate transformer is allowed 0.125 px, so compare at that tolerance
+        np.testing.assert_allclose(out[ok & np.isfinite(out)], ref[ok & np.isfinite(out)], atol=1e-2)
+    # The lattice approximation stays within max_error source pixels of the exact transform
+    rows, cols = _warp_coords("EPSG:32643", src_transform, "EPSG:4326", dst_transform, (200, 180))
+    assert np.abs(plan.coords()[0] - rows).max() < 0.125 and np.abs(plan.coords()[1] - cols).max() < 0.125
+
+    # A fresh process finds the plan on disk; nearest keeps source values
+    rp._memo.clear()
+    again = rp.get_plan("EPSG:32643", src_transform, (300, 400), "EPSG:4326", dst_transform, (200, 180), cache_dir=str(tmp_path))
+    assert again is not plan and len(list(tmp_path.glob("*.npz"))) == 1
+    np.testing.assert_array_equal(again.apply(bands), got)
+    assert np.isin(again.apply(bands[0], method="nearest")[np.isfinite(got[0])], bands[0]).all()
+
+    # Windowed, decimated source reads land on the same grid as full-resolution ones
+    path = str(tmp_path / "scene.tif")
+    with rasterio.open(path, "w", driver="GTiff", width=400, height=300, count=1, dtype="float32",
+                       crs="EPSG:32643", transform=src_transform) as dst:
+        dst.write(bands[1], 1)
+    coarse = rp.ReprojectionPlan.build("EPSG:32643", src_transform, (300, 400), "EPSG:4326", from_bounds(74.075, 15.35, 74.095, 15.37, 45, 50), (50, 45))
+    with rasterio.open(path) as src:
+        part, window = coarse.read(src)
+    assert coarse.decimation() == 4 and part.shape[0] < window.height
+    full = coarse.apply(bands[1])
+    ok = np.isfinite(full)
+    np.testing.assert_allclose(coarse.apply(part, window)[ok], full[ok], atol=0.02)
+
+
+def test_tile_layers_share_plans(tmp_path):
+    import mercantile
+    from src.utils.rasters import write_geotiff
+    from src.utils.tiles import generate_xyz_tile_layers
+
+    bounds = (73.90, 15.30, 74.10, 15.50)
+    yy, xx = np.mgrid[0:64, 0:64].astype("f4")
+    specs = []
+    for name, arr in (("a", xx / 64), ("b", yy / 64)):
+        path = str(tmp_path / f"{name}.tif")
+        write_geotiff(arr, path, bounds)
+        specs.append({"raster_path": path, "layer": name, "cmap": "Greys", "vmin": 0.0, "vmax": 1.0})
+    cache = tmp_path / "plans"
+    stats = generate_xyz_tile_layers(specs, str(tmp_path / "tiles"), bounds, [10, 11], plan_cache_dir=str(cache))
+    n = len(list(mercantile.tiles(*bounds, [10, 11])))
+    assert stats["a"]["tiles"] == stats["b"]["tiles"] == n
+    packs = list(cache.glob("tiles-*.npz"))
+    assert len(packs) == 1
+    first = (tmp_path / "tiles" / "a" / "11").rglob("*.png").__next__().read_bytes()
+    # Second run: plans come from the pack, tiles are identical
+    generate_xyz_tile_layers(specs, str(tmp_path / "tiles2"), bounds, [10, 11], plan_cache_dir=str(cache))
+    rel = next((tmp_path / "tiles" / "a" / "11").rglob("*.png")).relative_to(tmp_path / "tiles")
+    assert (tmp_path / "tiles2" / rel).read_bytes() == first
+
+
+def test_interim_rasters_are_cogs_read_through_overviews(tmp_path):
+    import rasterio
+    from rasterio.transform import from_bounds
+    from src.utils.rasters import write_geotiff
+    from src.utils.reproject import ReprojectionPlan
+
+    yy, xx = np.mgrid[0:1000, 0:1300].astype("f4")
+    arr = np.sin(xx / 37) * np.cos(yy / 29)
+    arr[:10, :10] = np.nan
+    bounds = (74.0, 15.3, 74.13, 15.4)
+    path = write_geotiff(arr, str(tmp_path / "ndvi.tif"), bounds)
+    with rasterio.open(path) as src:
+        assert src.tags(ns="IMAGE_STRUCTURE")["LAYOUT"] == "COG"
+        assert src.block_shapes[0] == (256, 256) and np.isnan(src.nodata)
+        assert src.overviews(1) == [2, 4, 8]  # halved until one block holds it
+
+        # A destination 4x coarser reads the factor-4 overview's own pixels
+        dst_shape = (125, 160)
+        plan = ReprojectionPlan.build(src.crs, src.transform, src.shape, src.crs, from_bounds(74.02, 15.33, 74.1, 15.38, 160, 125), dst_shape)
+        part, window = plan.read(src, resampling="nearest")
+    with rasterio.open(path, overview_level=1) as ovr:
+        overview = ovr.read(1)
+    oy, ox = overview.shape[0] / 1000, overview.shape[1] / 1300
+    r0, c0 = round(window.row_off * oy), round(window.col_off * ox)
+    np.testing.assert_array_equal(part, overview[r0:r0 + part.shape[0], c0:c0 + part.shape[1]])
+    out = plan.apply(part, window)
+    full = plan.apply(arr)
+    # Average overviews smooth a little; the gridding itself stays aligned
+    assert np.nanmax(np.abs(out - full)) < 0.1
+
+
+def test_plan_memo_and_pack_are_bounded(tmp_path, monkeypatch):
+    from unittest.mock import Mock
+
+    from rasterio.transform import from_bounds, from_origin
+    from src.utils import reproject as rp
+
+    src_transform = from_origin(400000, 1700000, 10, 10)
+
+    def plan(i, build=False):
+        dst = from_bounds(74.075 + i * 1e-4, 15.35, 74.095, 15.37, 90, 100)
+        args = ("EPSG:32643", src_transform, (300, 400), "EPSG:4326", dst, (100, 90))
+        return rp.ReprojectionPlan.build(*args) if build else rp.get_plan(*args)
+
+    # Memo: bounded by bytes, including the gather indices built after a plan is memoised
+    rp._memo.clear()
+    first = plan(0)
+    first.apply(np.zeros((300, 400), dtype=np.float32))
+    assert first._coords is None and first._gather is not None  # coordinates dropped for the gather
+    monkeypatch.setattr(rp, "_MEMO_BYTES", first.nbytes() + 1)
+    plan(1)
+    assert list(rp._memo.values())[-1] is not first and len(rp._memo) == 1
+    rp._memo.clear()
+
+    # Pack: members read on demand; plans used by the latest run kept first under max_bytes
+    path = str(tmp_path / "pack.npz")
+    pack = rp.PlanPack(path)
+    for i in range(4):
+        pack.get(f"p{i}", lambda: plan(i, build=True))
+    pack.save()
+    size = rp._pack_sizes(path)["p0"]
+    pack = rp.PlanPack(path, max_bytes=2 * size)
+    assert pack._zip is None
+    build = Mock()
+    got = pack.get("p1", build)
+    build.assert_not_called()
+    np.testing.assert_array_equal(got.lattice[2], plan(1, build=True).lattice[2])
+    pack.get("p9", lambda: plan(9, build=True))
+    pack.save()
+    assert set(rp._pack_sizes(path)) == {"p1", "p9"}
+
+
+def test_categorical_layer_tiles_use_nearest(tmp_path):
+    import mercantile
+    from rasterio.transform import from_bounds
+    from src.utils.rasters import write_cog
+    from src.utils.tiles import generate_xyz_tile_layers
+
+    bounds = (73.90, 15.30, 74.10, 15.50)
+    cls = np.zeros((64, 64), dtype=np.int8)
+    cls[20, 20], cls[40, 41] = 2, -1  # isolated changes in a nodata (0) background
+    path = str(tmp_path / "ndvi_change.tif")
+    write_cog(cls, path, "EPSG:4326", from_bounds(*bounds, 64, 64), nodata=0, resampling="nearest")
+    spec = {"raster_path": path, "layer": "c", "cmap": "RdYlGn", "vmin": -2, "vmax": 2}
+    zooms = [14]
+    bilinear = generate_xyz_tile_layers([spec], str(tmp_path / "bilinear"), bounds, zooms)["c"]
+    nearest = generate_xyz_tile_layers([{**spec, "resampling": "nearest"}], str(tmp_path / "nearest"), bounds, zooms)["c"]
+    # Bilinear touches the nodata neighbours of every changed pixel and drops them
+    assert bilinear["tiles"] == 0 and nearest["tiles"] >= 2
+    colors = set()
+    for png in (tmp_path / "nearest" / "c").rglob("*.png"):
+        rgba = np.asarray(Image.open(png).convert("RGBA")).reshape(-1, 4)
+        colors |= {tuple(p) for p in rgba[rgba[:, 3] > 0]}
+    # Whole classes only: one colour per changed class, no blends
+    assert len(colors) == 2
+    assert len(list(mercantile.tiles(*bounds, zooms))) > nearest["tiles"]